@@ -14,132 +14,449 @@
 # limitations under the License.
 
 
+import errno
+import json
 import logging
 import os
+import time
 from swift.common.storage_policy import POLICIES
 from swift.common.exceptions import DiskFileDeleted, DiskFileNotExist, \
     DiskFileQuarantined
 from swift.common.utils import replace_partition_in_path, \
-    audit_location_generator, get_logger
+    audit_location_generator, get_logger, listdir, ratelimit_sleep, \
+    dump_recon_cache, ismount
 from swift.obj import diskfile
 
 
-def relink(swift_dir='/etc/swift',
-           devices='/srv/node',
-           skip_mount_check=False,
-           logger=logging.getLogger()):
-    mount_check = not skip_mount_check
-    run = False
-    relinked = errors = 0
-    for policy in POLICIES:
-        policy.object_ring = None  # Ensure it will be reloaded
-        policy.load_ring(swift_dir)
-        part_power = policy.object_ring.part_power
-        next_part_power = policy.object_ring.next_part_power
-        if not next_part_power or next_part_power == part_power:
-            continue
-        logging.info('Relinking files for policy %s under %s',
-                     policy.name, devices)
-        run = True
-        locations = audit_location_generator(
-            devices,
-            diskfile.get_data_dir(policy),
-            mount_check=mount_check)
-        for fname, _, _ in locations:
-            newfname = replace_partition_in_path(fname, next_part_power)
-            try:
-                diskfile.relink_paths(fname, newfname, check_existing=True)
-                relinked += 1
-            except OSError as exc:
-                errors += 1
-                logger.warning("Relinking %s to %s failed: %s",
-                               fname, newfname, exc)
+# progress of each device is checkpointed in a file named
+# <action>.<datadir>.json at the root of the device, e.g. relink.objects.json
+STATE_FILE = '%s.%s.json'
+RECON_CACHE_KEY = 'relinker_progress'
+DEFAULT_STATS_INTERVAL = 300
 
-    if not run:
-        logger.warning("No policy found to increase the partition power.")
-        return 2
-    logging.info('Relinked %d diskfiles (%d errors)', relinked, errors)
-    if errors > 0:
-        return 1
-    return 0
 
+def _state_file_path(device_path, action, datadir):
+    return os.path.join(device_path, STATE_FILE % (action, datadir))
 
-def cleanup(swift_dir='/etc/swift',
-            devices='/srv/node',
-            skip_mount_check=False,
-            logger=logging.getLogger()):
-    mount_check = not skip_mount_check
-    conf = {'devices': devices, 'mount_check': mount_check}
-    diskfile_router = diskfile.DiskFileRouter(conf, get_logger(conf))
-    errors = cleaned_up = 0
-    run = False
-    for policy in POLICIES:
-        policy.object_ring = None  # Ensure it will be reloaded
-        policy.load_ring(swift_dir)
-        part_power = policy.object_ring.part_power
-        next_part_power = policy.object_ring.next_part_power
-        if not next_part_power or next_part_power != part_power:
-            continue
-        logging.info('Cleaning up files for policy %s under %s',
-                     policy.name, devices)
-        run = True
+
+class DeviceProgress(object):
+    """
+    Tracks how far a relink or cleanup has got on one device for one policy.
+
+    Partitions are checkpointed in a state file on the device once every
+    file in them has been dealt with without error, so that a run that is
+    interrupted can skip them when it is restarted. The state file and the
+    progress reported through recon are written at most once every
+    ``stats_interval`` seconds, and when the device is finished.
+
+    :param action: 'relink' or 'cleanup'
+    :param device_path: path to the device
+    :param policy: the storage policy being worked on
+    :param part_power: the ring's current partition power
+    :param next_part_power: the ring's next partition power
+    :param logger: a logger
+    :param recon_cache_file: recon cache file to report progress to, or None
+    :param stats_interval: seconds between checkpoints and progress reports
+    """
+
+    def __init__(self, action, device_path, policy, part_power,
+                 next_part_power, logger, recon_cache_file=None,
+                 stats_interval=DEFAULT_STATS_INTERVAL):
+        self.action = action
+        self.device = os.path.basename(device_path)
+        self.policy = policy
+        self.part_power = part_power
+        self.next_part_power = next_part_power
+        self.logger = logger
+        self.recon_cache_file = recon_cache_file
+        self.stats_interval = stats_interval
+        self.state_file = _state_file_path(
+            device_path, action, diskfile.get_data_dir(policy))
+        self.state = {}
+        self.parts_total = self.parts_done = self.parts_skipped = 0
+        self.files = self.errors = 0
+        self._errors_in_part = 0
+        self.start_time = self._last_report = time.time()
+
+    def load(self):
+        """
+        Read the checkpointed state of the device, ignoring any that was
+        written for a different partition power change.
+        """
+        try:
+            with open(self.state_file) as f:
+                data = json.load(f)
+        except IOError as err:
+            if err.errno != errno.ENOENT:
+                self.logger.warning('Unable to read %s: %s',
+                                    self.state_file, err)
+            return
+        except ValueError as err:
+            self.logger.warning('Unable to read %s: %s',
+                                self.state_file, err)
+            return
+        if (data.get('part_power'), data.get('next_part_power')) == (
+                self.part_power, self.next_part_power):
+            self.state = data.get('state', {})
+
+    def save(self):
+        tmp_file = self.state_file + '.tmp'
+        try:
+            with open(tmp_file, 'w') as f:
+                json.dump({'part_power': self.part_power,
+                           'next_part_power': self.next_part_power,
+                           'state': self.state}, f)
+            os.rename(tmp_file, self.state_file)
+        except (IOError, OSError) as err:
+            self.logger.warning('Unable to write %s: %s',
+                                self.state_file, err)
+
+    def partitions_filter(self, datadir_path, partitions):
+        partitions = [part for part in partitions if part.isdigit()]
+        todo = [part for part in partitions if not self.state.get(part)]
+        self.parts_total = len(partitions)
+        self.parts_done = self.parts_skipped = self.parts_total - len(todo)
+        self.report()
+        return todo
+
+    def file_done(self, success):
+        if success:
+            self.files += 1
+        elif success is not None:
+            self.errors += 1
+            self._errors_in_part += 1
+
+    def partition_done(self, part_path):
+        if not self._errors_in_part:
+            self.state[os.path.basename(part_path)] = True
+        self._errors_in_part = 0
+        self.parts_done += 1
+        if time.time() - self._last_report >= self.stats_interval:
+            self.save()
+            self.report()
+
+    def finish(self):
+        if self.state:
+            self.save()
+        self.report()
+
+    def get_stats(self):
+        now = time.time()
+        elapsed = now - self.start_time
+        parts_walked = self.parts_done - self.parts_skipped
+        if parts_walked:
+            eta = elapsed * (self.parts_total - self.parts_done) / parts_walked
+        else:
+            eta = None
+        return {'action': self.action,
+                'policy': int(self.policy),
+                'parts_total': self.parts_total,
+                'parts_done': self.parts_done,
+                'files': self.files,
+                'errors': self.errors,
+                'files_per_second': self.files / elapsed if elapsed else 0.0,
+                'start_time': self.start_time,
+                'last_update': now,
+                'eta': eta}
+
+    def report(self):
+        self._last_report = time.time()
+        stats = self.get_stats()
+        self.logger.debug(
+            '%(action)s %(device)s: %(parts_done)d/%(parts_total)d partitions,'
+            ' %(files)d files, %(errors)d errors',
+            dict(stats, device=self.device))
+        if self.recon_cache_file:
+            dump_recon_cache({RECON_CACHE_KEY: {self.device: stats}},
+                             self.recon_cache_file, self.logger)
+
+
+class Relinker(object):
+    """
+    Walks the devices of an object server, one worker process per device,
+    to relink or clean up the files of every policy whose partition power is
+    being increased.
+
+    :param swift_dir: path to swift directory
+    :param devices: path to swift device directory
+    :param skip_mount_check: don't check that devices are mounted
+    :param logger: a logger
+    :param workers: number of devices to work on at once; with 1, all
+                    devices are walked in turn by this process
+    :param files_per_second: maximum files to process per second on each
+                             device; 0 means no limit
+    :param recon_cache_path: directory of the recon cache that progress is
+                             reported to, or None not to report progress
+    :param stats_interval: seconds between checkpoints and progress reports
+    """
+
+    def __init__(self, swift_dir='/etc/swift', devices='/srv/node',
+                 skip_mount_check=False, logger=logging.getLogger(),
+                 workers=1, files_per_second=0, recon_cache_path=None,
+                 stats_interval=DEFAULT_STATS_INTERVAL):
+        self.swift_dir = swift_dir
+        self.devices = devices
+        self.mount_check = not skip_mount_check
+        self.logger = logger
+        self.workers = max(1, int(workers))
+        self.files_per_second = float(files_per_second)
+        self.recon_cache_file = None
+        if recon_cache_path:
+            self.recon_cache_file = os.path.join(recon_cache_path,
+                                                 'object.recon')
+        self.stats_interval = float(stats_interval)
+
+    def _walk_device(self, device, action, policy, part_power,
+                     next_part_power, process_file):
+        """
+        Call ``process_file(fname, device, partition)`` for every file of a
+        policy on a device, skipping the partitions that were finished by an
+        earlier run.
+
+        :returns: a tuple of (files processed, errors)
+        """
+        device_path = os.path.join(self.devices, device)
+        if self.mount_check and not ismount(device_path):
+            self.logger.warning('Skipping %s as it is not mounted', device)
+            return 0, 0
+        progress = DeviceProgress(
+            action, device_path, policy, part_power, next_part_power,
+            self.logger, self.recon_cache_file, self.stats_interval)
+        progress.load()
         locations = audit_location_generator(
-            devices,
+            self.devices,
             diskfile.get_data_dir(policy),
-            mount_check=mount_check)
+            mount_check=False,
+            devices_filter=lambda _, devices: [
+                d for d in devices if d == device],
+            partitions_filter=progress.partitions_filter,
+            hook_post_partition=progress.partition_done)
+        running_time = 0
         for fname, device, partition in locations:
-            expected_fname = replace_partition_in_path(fname, part_power)
-            if fname == expected_fname:
+            progress.file_done(process_file(fname, device, partition))
+            running_time = ratelimit_sleep(running_time,
+                                           self.files_per_second)
+        progress.finish()
+        return progress.files, progress.errors
+
+    def _run_workers(self, walk_device):
+        """
+        Call ``walk_device(device)`` for every device, in up to
+        ``workers`` child processes at a time.
+
+        :returns: a tuple of (files processed, errors) over all devices
+        """
+        device_names = sorted(listdir(self.devices))
+        if self.workers == 1 or len(device_names) <= 1:
+            results = [walk_device(device) for device in device_names]
+        else:
+            results = []
+            children = {}
+            while device_names or children:
+                while device_names and len(children) < self.workers:
+                    device = device_names.pop(0)
+                    rfd, wfd = os.pipe()
+                    pid = os.fork()
+                    if pid == 0:
+                        os.close(rfd)
+                        status = 1
+                        try:
+                            os.write(wfd, json.dumps(
+                                walk_device(device)).encode('ascii'))
+                            status = 0
+                        except BaseException:
+                            self.logger.exception(
+                                'Error working on device %s', device)
+                        finally:
+                            os._exit(status)
+                    os.close(wfd)
+                    children[pid] = (device, rfd)
+                pid, status = os.wait()
+                if pid not in children:
+                    continue
+                device, rfd = children.pop(pid)
+                with os.fdopen(rfd, 'rb') as f:
+                    result = f.read()
+                if status or not result:
+                    self.logger.warning(
+                        'Worker for device %s failed (wait status %d)',
+                        device, status)
+                    results.append((0, 1))
+                else:
+                    results.append(json.loads(result.decode('ascii')))
+        return (sum(files for files, _ in results),
+                sum(errors for _, errors in results))
+
+    def _relink_file(self, fname, device, partition, next_part_power):
+        newfname = replace_partition_in_path(fname, next_part_power)
+        try:
+            diskfile.relink_paths(fname, newfname, check_existing=True)
+            if newfname != fname:
+                # the new partition's suffix hash (and hash manifest) must
+                # not be trusted now that it has files the hash didn't see
+                diskfile.invalidate_hash(os.path.dirname(os.path.dirname(
+                    newfname)))
+        except OSError as exc:
+            self.logger.warning("Relinking %s to %s failed: %s",
+                                fname, newfname, exc)
+            return False
+        return True
+
+    def relink(self):
+        run = False
+        relinked = errors = 0
+        for policy in POLICIES:
+            policy.object_ring = None  # Ensure it will be reloaded
+            policy.load_ring(self.swift_dir)
+            part_power = policy.object_ring.part_power
+            next_part_power = policy.object_ring.next_part_power
+            if not next_part_power or next_part_power == part_power:
                 continue
-            # Make sure there is a valid object file in the expected new
-            # location. Note that this could be newer than the original one
-            # (which happens if there is another PUT after partition power
-            # has been increased, but cleanup did not yet run)
-            loc = diskfile.AuditLocation(
-                os.path.dirname(expected_fname), device, partition, policy)
-            diskfile_mgr = diskfile_router[policy]
-            df = diskfile_mgr.get_diskfile_from_audit_location(loc)
-            try:
-                with df.open():
-                    pass
-            except DiskFileQuarantined as exc:
-                logger.warning('ERROR Object %(obj)s failed audit and was'
-                               ' quarantined: %(err)r',
-                               {'obj': loc, 'err': exc})
+            if getattr(policy, 'diskfile_backend', None) == 'slab':
+                # the records of slab volumes cannot be relinked
+                self.logger.error(
+                    'Policy %s uses the slab diskfile backend, which does '
+                    'not support increasing the partition power',
+                    policy.name)
+                run = True
                 errors += 1
                 continue
-            except DiskFileDeleted:
+            logging.info('Relinking files for policy %s under %s',
+                         policy.name, self.devices)
+            run = True
+
+            def process_file(fname, device, partition):
+                return self._relink_file(fname, device, partition,
+                                         next_part_power)
+
+            def walk_device(device):
+                return self._walk_device(
+                    device, 'relink', policy, part_power, next_part_power,
+                    process_file)
+
+            policy_relinked, policy_errors = self._run_workers(walk_device)
+            relinked += policy_relinked
+            errors += policy_errors
+
+        if not run:
+            self.logger.warning(
+                "No policy found to increase the partition power.")
+            return 2
+        logging.info('Relinked %d diskfiles (%d errors)', relinked, errors)
+        if errors > 0:
+            return 1
+        return 0
+
+    def _cleanup_file(self, fname, device, partition, policy, part_power,
+                      diskfile_mgr):
+        expected_fname = replace_partition_in_path(fname, part_power)
+        if fname == expected_fname:
+            return None
+        # Make sure there is a valid object file in the expected new
+        # location. Note that this could be newer than the original one
+        # (which happens if there is another PUT after partition power
+        # has been increased, but cleanup did not yet run)
+        loc = diskfile.AuditLocation(
+            os.path.dirname(expected_fname), device, partition, policy)
+        df = diskfile_mgr.get_diskfile_from_audit_location(loc)
+        try:
+            with df.open():
                 pass
-            except DiskFileNotExist as exc:
-                err = False
-                if policy.policy_type == 'erasure_coding':
-                    # Might be a non-durable fragment - check that there is
-                    # a fragment in the new path. Will be fixed by the
-                    # reconstructor then
-                    if not os.path.isfile(expected_fname):
-                        err = True
-                else:
+        except DiskFileQuarantined as exc:
+            self.logger.warning('ERROR Object %(obj)s failed audit and was'
+                                ' quarantined: %(err)r',
+                                {'obj': loc, 'err': exc})
+            return False
+        except DiskFileDeleted:
+            pass
+        except DiskFileNotExist as exc:
+            err = False
+            if policy.policy_type == 'erasure_coding':
+                # Might be a non-durable fragment - check that there is
+                # a fragment in the new path. Will be fixed by the
+                # reconstructor then
+                if not os.path.isfile(expected_fname):
                     err = True
-                if err:
-                    logger.warning(
-                        'Error cleaning up %s: %r', fname, exc)
-                    errors += 1
-                    continue
-            try:
-                os.remove(fname)
-                cleaned_up += 1
-                logging.debug("Removed %s", fname)
-            except OSError as exc:
-                logger.warning('Error cleaning up %s: %r', fname, exc)
+            else:
+                err = True
+            if err:
+                self.logger.warning(
+                    'Error cleaning up %s: %r', fname, exc)
+                return False
+        try:
+            os.remove(fname)
+            logging.debug("Removed %s", fname)
+            diskfile.invalidate_hash(os.path.dirname(os.path.dirname(fname)))
+        except OSError as exc:
+            self.logger.warning('Error cleaning up %s: %r', fname, exc)
+            return False
+        return True
+
+    def cleanup(self):
+        conf = {'devices': self.devices, 'mount_check': self.mount_check}
+        diskfile_router = diskfile.DiskFileRouter(conf, get_logger(conf))
+        errors = cleaned_up = 0
+        run = False
+        for policy in POLICIES:
+            policy.object_ring = None  # Ensure it will be reloaded
+            policy.load_ring(self.swift_dir)
+            part_power = policy.object_ring.part_power
+            next_part_power = policy.object_ring.next_part_power
+            if not next_part_power or next_part_power != part_power:
+                continue
+            if getattr(policy, 'diskfile_backend', None) == 'slab':
+                # the records of slab volumes cannot be relinked
+                self.logger.error(
+                    'Policy %s uses the slab diskfile backend, which does '
+                    'not support increasing the partition power',
+                    policy.name)
+                run = True
                 errors += 1
+                continue
+            logging.info('Cleaning up files for policy %s under %s',
+                         policy.name, self.devices)
+            run = True
+            diskfile_mgr = diskfile_router[policy]
 
-    if not run:
-        logger.warning("No policy found to increase the partition power.")
-        return 2
-    logging.info('Cleaned up %d diskfiles (%d errors)', cleaned_up, errors)
-    if errors > 0:
-        return 1
-    return 0
+            def process_file(fname, device, partition):
+                return self._cleanup_file(fname, device, partition, policy,
+                                          part_power, diskfile_mgr)
+
+            def walk_device(device):
+                return self._walk_device(
+                    device, 'cleanup', policy, part_power, next_part_power,
+                    process_file)
+
+            policy_cleaned_up, policy_errors = self._run_workers(walk_device)
+            cleaned_up += policy_cleaned_up
+            errors += policy_errors
+
+        if not run:
+            self.logger.warning(
+                "No policy found to increase the partition power.")
+            return 2
+        logging.info('Cleaned up %d diskfiles (%d errors)', cleaned_up, errors)
+        if errors > 0:
+            return 1
+        return 0
+
+
+def relink(swift_dir='/etc/swift',
+           devices='/srv/node',
+           skip_mount_check=False,
+           logger=logging.getLogger(),
+           **kwargs):
+    return Relinker(swift_dir, devices, skip_mount_check, logger,
+                    **kwargs).relink()
+
+
+def cleanup(swift_dir='/etc/swift',
+            devices='/srv/node',
+            skip_mount_check=False,
+            logger=logging.getLogger(),
+            **kwargs):
+    return Relinker(swift_dir, devices, skip_mount_check, logger,
+                    **kwargs).cleanup()
 
 
 def main(args):
@@ -150,10 +467,17 @@ def main(args):
 
     logger = logging.getLogger()
 
+    kwargs = {'workers': args.workers,
+              'files_per_second': args.files_per_second,
+              'recon_cache_path': args.recon_cache_path,
+              'stats_interval': args.stats_interval}
+
     if args.action == 'relink':
         return relink(
-            args.swift_dir, args.devices, args.skip_mount_check, logger)
+            args.swift_dir, args.devices, args.skip_mount_check, logger,
+            **kwargs)
 
     if args.action == 'cleanup':
         return cleanup(
-            args.swift_dir, args.devices, args.skip_mount_check, logger)
+            args.swift_dir, args.devices, args.skip_mount_check, logger,
+            **kwargs)
@@ -75,21 +75,55 @@ addition::
             ]]
     }
 
+Passing ``--timing`` reports how long each rebalance took. To see how the
+builder copes as rings grow, ``--part-powers`` runs the same scenario once
+for each of a comma-separated list of part powers (overriding the scenario's
+``part_power``) and finishes with a summary of the rebalance times and peak
+memory at each size, e.g.::
+
+    swift-ring-builder-analyzer --part-powers 12,14,16 scenario.json
+
+The sizes are always run smallest first; since the largest ring run so far
+dominates the process' memory use, the peak resident memory reported for
+each part power is that of its own run.
 """
 
 import argparse
+import copy
 import json
+import resource
 import sys
+import time
 
 from swift.common.ring import builder
 from swift.common.ring.utils import parse_add_value
 
 
+def _parse_part_powers(value):
+    try:
+        part_powers = sorted(set(int(pp) for pp in value.split(',')))
+    except ValueError as err:
+        raise argparse.ArgumentTypeError("invalid part powers: %s" % err)
+    for part_power in part_powers:
+        if not 1 <= part_power <= 32:
+            raise argparse.ArgumentTypeError(
+                "part powers must be between 1 and 32, but got %d"
+                % part_power)
+    return part_powers
+
+
 ARG_PARSER = argparse.ArgumentParser(
     description='Put the ring builder through its paces')
 ARG_PARSER.add_argument(
     '--check', '-c', action='store_true',
     help="Just check the scenario, don't execute it.")
+ARG_PARSER.add_argument(
+    '--timing', '-t', action='store_true',
+    help="Report how long each rebalance takes.")
+ARG_PARSER.add_argument(
+    '--part-powers', '-p', type=_parse_part_powers,
+    help="Benchmark the scenario at each of these comma-separated part "
+    "powers, instead of its own part_power.")
 ARG_PARSER.add_argument(
     'scenario_path',
     help="Path to the scenario file")
@@ -277,9 +311,12 @@ def parse_scenario(scenario_data):
     return parsed_scenario
 
 
-def run_scenario(scenario):
+def run_scenario(scenario, timing=False):
     """
     Takes a parsed scenario (like from parse_scenario()) and runs it.
+
+    :param timing: if True, report how long each rebalance took
+    :returns: a list of the seconds taken by each rebalance
     """
     seed = scenario['random_seed']
 
@@ -293,6 +330,20 @@ def run_scenario(scenario):
         'save': rb.save,
     }
 
+    rebalance_times = []
+
+    def rebalance():
+        start = time.time()
+        result = rb.rebalance(seed=seed)
+        rebalance_times.append(time.time() - start)
+        rb.pretend_min_part_hours_passed()
+        return result
+
+    def took():
+        if timing:
+            return " (took %.3fs)" % rebalance_times[-1]
+        return ""
+
     for round_index, commands in enumerate(scenario['rounds']):
         print("Round %d" % (round_index + 1))
 
@@ -305,18 +356,16 @@ def run_scenario(scenario):
             command_f(*command)
 
         rebalance_number = 1
-        parts_moved, old_balance, removed_devs = rb.rebalance(seed=seed)
-        rb.pretend_min_part_hours_passed()
+        parts_moved, old_balance, removed_devs = rebalance()
         print("\tRebalance 1: moved %d parts, balance is %.6f, %d removed "
-              "devs" % (parts_moved, old_balance, removed_devs))
+              "devs%s" % (parts_moved, old_balance, removed_devs, took()))
 
         while True:
             rebalance_number += 1
-            parts_moved, new_balance, removed_devs = rb.rebalance(seed=seed)
-            rb.pretend_min_part_hours_passed()
+            parts_moved, new_balance, removed_devs = rebalance()
             print("\tRebalance %d: moved %d parts, balance is %.6f, "
-                  "%d removed devs" % (rebalance_number, parts_moved,
-                                       new_balance, removed_devs))
+                  "%d removed devs%s" % (rebalance_number, parts_moved,
+                                         new_balance, removed_devs, took()))
             if parts_moved == 0 and removed_devs == 0:
                 break
             if abs(new_balance - old_balance) < 1 and not (
@@ -324,6 +373,44 @@ def run_scenario(scenario):
                     new_balance == builder.MAX_BALANCE):
                 break
             old_balance = new_balance
+    return rebalance_times
+
+
+def benchmark_scenario(scenario, part_powers):
+    """
+    Runs a parsed scenario once for each of the given part powers, smallest
+    first, and prints a summary of how the rebalances performed at each.
+
+    :param scenario: a parsed scenario, as from parse_scenario()
+    :param part_powers: a list of part powers to run the scenario at
+    :returns: a list of dicts, one per part power, with the keys
+              part_power, rebalances, total_time, max_time and peak_rss (in
+              KiB)
+    """
+    results = []
+    for part_power in sorted(part_powers):
+        print("Part power %d" % part_power)
+        # run_scenario consumes the commands, so each size gets a copy
+        sized_scenario = copy.deepcopy(scenario)
+        sized_scenario['part_power'] = part_power
+        rebalance_times = run_scenario(sized_scenario, timing=True)
+        results.append({
+            'part_power': part_power,
+            'rebalances': len(rebalance_times),
+            'total_time': sum(rebalance_times),
+            'max_time': max(rebalance_times or [0]),
+            'peak_rss': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        })
+
+    print("%10s %10s %12s %12s %14s" % (
+        'Part power', 'Rebalances', 'Total (s)', 'Slowest (s)',
+        'Peak RSS (MiB)'))
+    for result in results:
+        print("%10d %10d %12.3f %12.3f %14.1f" % (
+            result['part_power'], result['rebalances'],
+            result['total_time'], result['max_time'],
+            result['peak_rss'] / 1024.0))
+    return results
 
 
 def main(argv=None):
@@ -344,6 +431,10 @@ def main(argv=None):
                          (args.scenario_path, err))
         return 1
 
-    if not args.check:
-        run_scenario(scenario)
+    if args.check:
+        return 0
+    if args.part_powers:
+        benchmark_scenario(scenario, args.part_powers)
+    else:
+        run_scenario(scenario, timing=args.timing)
     return 0
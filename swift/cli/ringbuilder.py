@@ -16,6 +16,7 @@
 from __future__ import print_function
 import logging
 
+from array import array
 from collections import defaultdict
 from errno import EEXIST
 from itertools import islice
@@ -35,6 +36,7 @@ from six.moves import input
 from swift.common import exceptions
 from swift.common.ring import RingBuilder, Ring, RingData
 from swift.common.ring.builder import MAX_BALANCE
+from swift.common.ring.ring import mapped_ring_path
 from swift.common.ring.utils import validate_args, \
     validate_and_normalize_ip, build_dev_from_opts, \
     parse_builder_ring_filename_args, parse_search_value, \
@@ -52,6 +54,20 @@ global argv, backup_dir, builder, builder_file, ring_file
 argv = backup_dir = builder = builder_file = ring_file = None
 
 
+def _save_mapped_ring(ring_data, backup_prefix, force=False):
+    """
+    Save an uncompressed, memory-mappable copy of the ring next to the ring
+    file, either because it was asked for or because there is already one
+    there that would otherwise be left stale.
+    """
+    mapped_file = mapped_ring_path(ring_file)
+    if mapped_file and (force or exists(mapped_file)):
+        ring_data.save(
+            pathjoin(backup_dir, backup_prefix + basename(mapped_file)),
+            format_version=2)
+        ring_data.save(mapped_file, format_version=2)
+
+
 def format_device(dev):
     """
     Format a device for display.
@@ -989,10 +1005,12 @@ swift-ring-builder <builder_file> rebalance [options]
             print('-' * 79)
             status = EXIT_WARNING
         ts = time()
-        builder.get_ring().save(
+        ring_data = builder.get_ring()
+        ring_data.save(
             pathjoin(backup_dir, '%d.' % ts + basename(ring_file)))
         builder.save(pathjoin(backup_dir, '%d.' % ts + basename(builder_file)))
-        builder.get_ring().save(ring_file)
+        ring_data.save(ring_file)
+        _save_mapped_ring(ring_data, '%d.' % ts)
         builder.save(builder_file)
         exit(status)
 
@@ -1111,12 +1129,23 @@ swift-ring-builder <builder_file> validate
     @staticmethod
     def write_ring():
         """
-swift-ring-builder <builder_file> write_ring
+swift-ring-builder <builder_file> write_ring [--mapped]
     Just rewrites the distributable ring file. This is done automatically after
     a successful rebalance, so really this is only useful after one or more
     'set_info' calls when no rebalance is needed but you want to send out the
     new device information.
+    With --mapped, an uncompressed <name>.ring.v2 copy of the ring is written
+    as well; servers prefer it over <name>.ring.gz and memory map it, which
+    makes loading large rings much faster. Once written, it is kept up to
+    date by later rebalance and write_ring commands.
         """
+        usage = Commands.write_ring.__doc__.strip()
+        parser = optparse.OptionParser(usage)
+        parser.add_option('-m', '--mapped', action='store_true',
+                          help='Also write an uncompressed, memory-mappable '
+                          'copy of the ring')
+        options, args = parser.parse_args(argv)
+
         if not builder.devs:
             print('Unable to write empty ring.')
             exit(EXIT_ERROR)
@@ -1127,9 +1156,11 @@ swift-ring-builder <builder_file> write_ring
                 print('Warning: Writing a ring with no partition '
                       'assignments but with devices; did you forget to run '
                       '"rebalance"?')
+        ts = time()
         ring_data.save(
-            pathjoin(backup_dir, '%d.' % time() + basename(ring_file)))
+            pathjoin(backup_dir, '%d.' % ts + basename(ring_file)))
         ring_data.save(ring_file)
+        _save_mapped_ring(ring_data, '%d.' % ts, force=options.mapped)
         exit(EXIT_SUCCESS)
 
     @staticmethod
@@ -1167,7 +1198,9 @@ swift-ring-builder <ring_file> write_builder [min_part_hours]
             'devs': ring.devs,
             'devs_changed': False,
             'version': 0,
-            '_replica2part2dev': ring._replica2part2dev_id,
+            # copy any replica tables that were mapped from a v2 ring file
+            '_replica2part2dev': [array('H', part2dev_id) for part2dev_id
+                                  in ring._replica2part2dev_id],
             '_last_part_moves_epoch': None,
             '_last_part_moves': None,
             '_last_part_gather_start': 0,
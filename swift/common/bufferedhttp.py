@@ -17,7 +17,7 @@
 Monkey Patch httplib.HTTPResponse to buffer reads of headers. This can improve
 performance when making large numbers of small HTTP requests.  This module
 also provides helper functions to make HTTP connections using
-BufferedHTTPResponse.
+BufferedHTTPResponse, and a pool of keep-alive connections to backend servers.
 
 .. warning::
 
@@ -26,6 +26,7 @@ BufferedHTTPResponse.
     make all calls through httplib.
 """
 
+from collections import defaultdict
 from swift.common import constraints
 import logging
 import time
@@ -33,7 +34,7 @@ import socket
 
 import eventlet
 from eventlet.green.httplib import CONTINUE, HTTPConnection, HTTPMessage, \
-    HTTPResponse, HTTPSConnection, _UNKNOWN
+    HTTPResponse, HTTPSConnection, HTTPException, _UNKNOWN
 from six.moves.urllib.parse import quote
 import six
 
@@ -183,6 +184,209 @@ class BufferedHTTPConnection(HTTPConnection):
         return response
 
 
+class PooledHTTPResponse(BufferedHTTPResponse):
+    """
+    BufferedHTTPResponse class that returns its connection to the
+    :class:`HTTPConnectionPool` it came from once it has been read to the end.
+    """
+    pooled_connection = None
+
+    def close(self):
+        reusable = (self.pooled_connection is not None and
+                    self.fp is not None and self._real_socket is not None and
+                    self.length == 0 and not self.will_close)
+        BufferedHTTPResponse.close(self)
+        if reusable:
+            conn, self.pooled_connection = self.pooled_connection, None
+            conn.pool.put(conn)
+
+
+class PooledHTTPConnection(BufferedHTTPConnection):
+    """
+    BufferedHTTPConnection class for connections from an
+    :class:`HTTPConnectionPool`.
+
+    If the connection has been reused and the server has closed it while it
+    was idle, the request is sent again on a new connection. Only requests
+    whose body, if any, is sent after the response headers have been read may
+    be made on these connections.
+    """
+    response_class = PooledHTTPResponse
+
+    def __init__(self, pool, key):
+        BufferedHTTPConnection.__init__(self, '%s:%s' % key[:2])
+        self.pool = pool
+        self.pool_key = key
+        self.reused = False
+        self._request = []
+
+    def connect(self):
+        start = time.time()
+        ret = BufferedHTTPConnection.connect(self)
+        self.pool.connected(start)
+        return ret
+
+    def putrequest(self, method, url, skip_host=0, skip_accept_encoding=0):
+        self._request = [('putrequest',
+                          (method, url, skip_host, skip_accept_encoding))]
+        return BufferedHTTPConnection.putrequest(
+            self, method, url, skip_host, skip_accept_encoding)
+
+    def putheader(self, header, *values):
+        self._request.append(('putheader', (header,) + values))
+        return BufferedHTTPConnection.putheader(self, header, *values)
+
+    def _resend(self):
+        self.pool.retried()
+        self.close()
+        self.reused = False
+        for name, args in self._request[:]:
+            getattr(self, name)(*args)
+        BufferedHTTPConnection.endheaders(self)
+
+    def endheaders(self):
+        try:
+            return BufferedHTTPConnection.endheaders(self)
+        except socket.error:
+            if not self.reused:
+                raise
+            self._resend()
+
+    def getresponse(self):
+        try:
+            response = BufferedHTTPConnection.getresponse(self)
+        except (socket.error, HTTPException):
+            if not self.reused:
+                raise
+            self._resend()
+            response = BufferedHTTPConnection.getresponse(self)
+        response.pooled_connection = self
+        return response
+
+
+class HTTPConnectionPool(object):
+    """
+    A pool of idle keep-alive connections to backend servers, kept per
+    (ip, port, device), so that a daemon making many short requests to the
+    same devices does not connect for each of them.
+
+    A connection taken from the pool with :meth:`http_connect` goes back to it
+    when its response has been read to the end; one taken with :meth:`get`
+    must be given back with :meth:`put`.
+
+    :param logger: a logger, to which the pool's hits, misses, retries and
+                   connect times are sent
+    :param max_idle: the most idle connections kept per device
+    :param idle_timeout: the seconds after which an idle connection is closed
+                         rather than reused, which should be less than the
+                         servers' client_timeout
+    """
+
+    def __init__(self, logger, max_idle=1, idle_timeout=20):
+        self.logger = logger
+        self.max_idle = max_idle
+        self.idle_timeout = idle_timeout
+        # (ip, port, device) => [(time returned, connection), ...]
+        self.idle = defaultdict(list)
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.hits = self.misses = self.retries = 0
+        self.connect_time = 0.0
+
+    def connected(self, start):
+        """
+        Record the time a new connection took to connect.
+
+        :param start: the time the connection started to connect
+        """
+        self.connect_time += time.time() - start
+        self.logger.timing_since('conn_pool.connect.timing', start)
+
+    def retried(self):
+        """
+        Record that a reused connection had been closed by the server.
+        """
+        self.retries += 1
+        self.logger.increment('conn_pool.retries')
+
+    def get(self, ipaddr, port, device):
+        """
+        Take an idle connection to a device from the pool, or make a new one
+        if there is none.
+
+        :returns: a PooledHTTPConnection
+        """
+        key = (ipaddr, port, device)
+        idle = self.idle.get(key)
+        now = time.time()
+        while idle:
+            returned, conn = idle.pop()
+            if now - returned < self.idle_timeout:
+                self.hits += 1
+                self.logger.increment('conn_pool.hits')
+                conn.reused = True
+                return conn
+            conn.close()
+        self.misses += 1
+        self.logger.increment('conn_pool.misses')
+        return PooledHTTPConnection(self, key)
+
+    def put(self, conn):
+        """
+        Give a connection back to the pool once its response has been read to
+        the end, or close it if the pool has enough idle connections.
+
+        :param conn: a PooledHTTPConnection taken from this pool
+        """
+        idle = self.idle[conn.pool_key]
+        if conn.sock is None or len(idle) >= self.max_idle:
+            conn.close()
+        else:
+            idle.append((time.time(), conn))
+
+    def close(self):
+        """
+        Close all of the idle connections.
+        """
+        for idle in self.idle.values():
+            for _junk, conn in idle:
+                conn.close()
+        self.idle.clear()
+
+    def http_connect(self, ipaddr, port, device, partition, method, path,
+                     headers=None, query_string=None):
+        """
+        Like :func:`http_connect`, but with a connection from the pool.
+        Requests made this way must not have a body.
+
+        :returns: a PooledHTTPConnection
+        """
+        conn = self.get(ipaddr, port, device)
+        return _send_request(conn, method, _device_path(
+            device, partition, path), headers, query_string)
+
+
+def _device_path(device, partition, path):
+    if isinstance(path, six.text_type):
+        path = path.encode("utf-8")
+    if isinstance(device, six.text_type):
+        device = device.encode("utf-8")
+    return quote('/' + device + '/' + str(partition) + path)
+
+
+def _send_request(conn, method, path, headers, query_string):
+    if query_string:
+        path += '?' + query_string
+    conn.path = path
+    conn.putrequest(method, path, skip_host=(headers and 'Host' in headers))
+    if headers:
+        for header, value in headers.items():
+            conn.putheader(header, str(value))
+    conn.endheaders()
+    return conn
+
+
 def http_connect(ipaddr, port, device, partition, method, path,
                  headers=None, query_string=None, ssl=False):
     """
@@ -201,13 +405,9 @@ def http_connect(ipaddr, port, device, partition, method, path,
     :param ssl: set True if SSL should be used (default: False)
     :returns: HTTPConnection object
     """
-    if isinstance(path, six.text_type):
-        path = path.encode("utf-8")
-    if isinstance(device, six.text_type):
-        device = device.encode("utf-8")
-    path = quote('/' + device + '/' + str(partition) + path)
-    return http_connect_raw(
-        ipaddr, port, method, path, headers, query_string, ssl)
+    return http_connect_raw(ipaddr, port, method,
+                            _device_path(device, partition, path),
+                            headers, query_string, ssl)
 
 
 def http_connect_raw(ipaddr, port, method, path, headers=None,
@@ -232,12 +432,4 @@ def http_connect_raw(ipaddr, port, method, path, headers=None,
         conn = HTTPSConnection('%s:%s' % (ipaddr, port))
     else:
         conn = BufferedHTTPConnection('%s:%s' % (ipaddr, port))
-    if query_string:
-        path += '?' + query_string
-    conn.path = path
-    conn.putrequest(method, path, skip_host=(headers and 'Host' in headers))
-    if headers:
-        for header, value in headers.items():
-            conn.putheader(header, str(value))
-    conn.endheaders()
-    return conn
+    return _send_request(conn, method, path, headers, query_string)
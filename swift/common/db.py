@@ -582,8 +582,17 @@ class DatabaseBroker(object):
             return curs.fetchone()
 
     def put_record(self, record):
+        self.put_records([record])
+
+    def put_records(self, records):
+        """
+        Put records into the DB, all through a single write to the pending
+        file, or merged straight into the DB if the pending file is full.
+
+        :param records: a list of record dicts, as for :meth:`put_record`
+        """
         if self.db_file == ':memory:':
-            self.merge_items([record])
+            self.merge_items(records)
             return
         if not os.path.exists(self.db_file):
             raise DatabaseConnectionError(self.db_file, "DB doesn't exist")
@@ -595,15 +604,16 @@ class DatabaseBroker(object):
                 if err.errno != errno.ENOENT:
                     raise
             if pending_size > PENDING_CAP:
-                self._commit_puts([record])
+                self._commit_puts(list(records))
             else:
                 with open(self.pending_file, 'a+b') as fp:
                     # Colons aren't used in base64 encoding; so they are our
                     # delimiter
-                    fp.write(':')
-                    fp.write(pickle.dumps(
-                        self.make_tuple_for_pickle(record),
-                        protocol=PICKLE_PROTOCOL).encode('base64'))
+                    fp.write(''.join(
+                        ':' + pickle.dumps(
+                            self.make_tuple_for_pickle(record),
+                            protocol=PICKLE_PROTOCOL).encode('base64')
+                        for record in records))
                     fp.flush()
 
     def _commit_puts(self, item_list=None):
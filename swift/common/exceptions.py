@@ -113,6 +113,10 @@ class DeviceUnavailable(SwiftException):
     pass
 
 
+class ThreadPoolDead(SwiftException):
+    pass
+
+
 class InvalidAccountInfo(SwiftException):
     pass
 
@@ -0,0 +1,158 @@
+# Copyright (c) 2010-2012 OpenStack Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+An invertible Bloom lookup table (IBLT) of 16 byte keys, for finding the
+difference between two large sets that mostly overlap by exchanging a table
+sized to the difference rather than the sets.
+
+Each key is added to one cell in each of ``HASH_COUNT`` subtables, which
+count the keys in them and keep the XOR of the keys and of a checksum of
+each key. Subtracting the table of one set from that of another cancels out
+the keys in both, and the keys in only one of them can then be listed by
+repeatedly removing those left alone in a cell, as long as the table has
+enough cells for the size of the difference.
+"""
+
+import base64
+import binascii
+import hashlib
+import struct
+
+HASH_COUNT = 3
+CELL = struct.Struct('!i16s8s')
+
+
+def _key_int(key):
+    return int(binascii.hexlify(key), 16)
+
+
+def _checksum(key_int):
+    return struct.unpack('!Q', hashlib.md5(
+        ('%032x' % key_int).encode('ascii')).digest()[:8])[0]
+
+
+class IBLT(object):
+    """
+    An invertible Bloom lookup table.
+
+    :param cells: the number of cells, which is rounded up to a multiple of
+                  HASH_COUNT
+    """
+
+    def __init__(self, cells):
+        self.subtable_size = max(1, -(-cells // HASH_COUNT))
+        size = self.subtable_size * HASH_COUNT
+        self.counts = [0] * size
+        self.key_sums = [0] * size
+        self.checksums = [0] * size
+
+    def __len__(self):
+        return len(self.counts)
+
+    def _indexes(self, key_int):
+        # keys are digests, so their bits are already well mixed
+        return [i * self.subtable_size +
+                ((key_int >> (32 * i)) & 0xffffffff) % self.subtable_size
+                for i in range(HASH_COUNT)]
+
+    def _add(self, key_int, count):
+        checksum = _checksum(key_int)
+        for i in self._indexes(key_int):
+            self.counts[i] += count
+            self.key_sums[i] ^= key_int
+            self.checksums[i] ^= checksum
+
+    def insert(self, key):
+        """
+        :param key: a 16 byte string, such as an MD5 digest
+        """
+        self._add(_key_int(key), 1)
+
+    def subtract(self, other):
+        """
+        Subtract another table with the same number of cells from this one.
+        """
+        if len(other) != len(self):
+            raise ValueError('Cannot subtract a table of %d cells from one '
+                             'of %d' % (len(other), len(self)))
+        for i in range(len(self)):
+            self.counts[i] -= other.counts[i]
+            self.key_sums[i] ^= other.key_sums[i]
+            self.checksums[i] ^= other.checksums[i]
+
+    def decode(self):
+        """
+        List the keys in the table, which after a subtraction are those in
+        only one of the two sets. This empties the table.
+
+        :returns: a tuple of two lists, the keys that were inserted into this
+                  table but not the subtracted one and the keys that were
+                  inserted into the subtracted table but not this one, or
+                  None if the table has too few cells for them to be listed
+        """
+        inserted = []
+        removed = []
+
+        def is_pure(i):
+            return self.counts[i] in (1, -1) and \
+                _checksum(self.key_sums[i]) == self.checksums[i]
+
+        pure = [i for i in range(len(self)) if is_pure(i)]
+        while pure:
+            i = pure.pop()
+            if not is_pure(i):
+                continue
+            key_int = self.key_sums[i]
+            count = self.counts[i]
+            key = binascii.unhexlify('%032x' % key_int)
+            (inserted if count > 0 else removed).append(key)
+            self._add(key_int, -count)
+            pure.extend(j for j in self._indexes(key_int) if is_pure(j))
+        if any(self.counts) or any(self.key_sums) or any(self.checksums):
+            return None
+        return inserted, removed
+
+    def to_string(self):
+        """
+        :returns: the table, base64 encoded
+        """
+        return base64.b64encode(b''.join(
+            CELL.pack(count, binascii.unhexlify('%032x' % key_sum),
+                      struct.pack('!Q', checksum))
+            for count, key_sum, checksum in zip(
+                self.counts, self.key_sums, self.checksums)))
+
+    @classmethod
+    def from_string(cls, value):
+        """
+        :param value: a table as returned by :meth:`to_string`
+        :returns: an IBLT
+        :raises ValueError: if the value is not such a table
+        """
+        try:
+            raw = base64.b64decode(value)
+        except (TypeError, binascii.Error) as err:
+            raise ValueError('Invalid table: %s' % err)
+        size, rest = divmod(len(raw), CELL.size)
+        if rest or not size or size % HASH_COUNT:
+            raise ValueError('Invalid table length %d' % len(raw))
+        table = cls(size)
+        for i in range(size):
+            count, key_sum, checksum = CELL.unpack_from(raw, i * CELL.size)
+            table.counts[i] = count
+            table.key_sums[i] = _key_int(key_sum)
+            table.checksums[i] = struct.unpack('!Q', checksum)[0]
+        return table
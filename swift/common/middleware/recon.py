@@ -180,6 +180,16 @@ class ReconMiddleware(object):
                                            'expired_last_pass'],
                                           self.object_recon_cache)
 
+    def get_relinker_info(self):
+        """get relinker progress, per device"""
+        return self._from_recon_cache(['relinker_progress'],
+                                      self.object_recon_cache)
+
+    def get_device_concurrency_info(self):
+        """get object server device concurrency stats, per worker"""
+        return self._from_recon_cache(['object_device_concurrency'],
+                                      self.object_recon_cache)
+
     def get_auditor_info(self, recon_type):
         """get auditor info"""
         if recon_type == 'account':
@@ -352,6 +362,10 @@ class ReconMiddleware(object):
             content = self.get_auditor_info(rtype)
         elif rcheck == "expirer" and rtype == 'object':
             content = self.get_expirer_info(rtype)
+        elif rcheck == "relinker":
+            content = self.get_relinker_info()
+        elif rcheck == "device_concurrency":
+            content = self.get_device_concurrency_info()
         elif rcheck == "mounted":
             content = self.get_mounted()
         elif rcheck == "unmounted":
@@ -35,7 +35,8 @@ from time import time
 from swift.common import exceptions
 from swift.common.ring import RingData
 from swift.common.ring.utils import tiers_for_dev, build_tier_tree, \
-    validate_and_normalize_address, validate_replicas_by_tier, pretty_dev
+    validate_and_normalize_address, validate_replicas_by_tier, pretty_dev, \
+    DispersionGraph
 
 # we can't store None's in the replica2part2dev array, so we high-jack
 # the max value for magic to represent the part is not currently
@@ -139,7 +140,7 @@ class RingBuilder(object):
 
         self._last_part_gather_start = 0
 
-        self._dispersion_graph = {}
+        self._dispersion_graph = DispersionGraph()
         self.dispersion = 0.0
         self._remove_devs = []
         self._ring = None
@@ -273,7 +274,8 @@ class RingBuilder(object):
             else:
                 self._last_part_moves = builder['_last_part_moves']
             self._last_part_gather_start = builder['_last_part_gather_start']
-            self._dispersion_graph = builder.get('_dispersion_graph', {})
+            self._dispersion_graph = DispersionGraph.from_dict(
+                builder.get('_dispersion_graph') or {}, self.parts)
             self.dispersion = builder.get('dispersion')
             self._remove_devs = builder['_remove_devs']
             self._id = builder.get('id')
@@ -310,7 +312,7 @@ class RingBuilder(object):
                 '_last_part_moves_epoch': self._last_part_moves_epoch,
                 '_last_part_moves': self._last_part_moves,
                 '_last_part_gather_start': self._last_part_gather_start,
-                '_dispersion_graph': self._dispersion_graph,
+                '_dispersion_graph': self._dispersion_graph.to_dict(),
                 'dispersion': self.dispersion,
                 '_remove_devs': self._remove_devs,
                 'id': self._id}
@@ -573,13 +575,13 @@ class RingBuilder(object):
 
     def _build_dispersion_graph(self, old_replica2part2dev=None):
         """
-        Build a dict of all tiers in the cluster to a list of the number of
-        parts with a replica count at each index.  The values of the dict will
-        be lists of length the maximum whole replica + 1 so that the
-        graph[tier][3] is the number of parts within the tier with 3 replicas
-        and graph [tier][0] is the number of parts not assigned in this tier.
+        Build a DispersionGraph of all tiers in the cluster to the number of
+        parts with a replica count at each index.  Each tier's counts are
+        the maximum whole replica + 1 long so that the graph[tier][3] is the
+        number of parts within the tier with 3 replicas and graph [tier][0]
+        is the number of parts not assigned in this tier.
 
-        i.e.
+        i.e. the graph is like
         {
             <tier>: [
                 <number_of_parts_with_0_replicas>,
@@ -590,6 +592,9 @@ class RingBuilder(object):
             ...
         }
 
+        but with the counts of every tier kept in one array; see
+        :class:`swift.common.ring.utils.DispersionGraph`.
+
         :param old_replica2part2dev: if called from rebalance, the
             old_replica2part2dev can be used to count moved parts.
 
@@ -600,51 +605,76 @@ class RingBuilder(object):
         # Since we're going to loop over every replica of every part we'll
         # also count up changed_parts if old_replica2part2dev is passed in
         old_replica2part2dev = old_replica2part2dev or []
+        replica2part2dev = self._replica2part2dev or []
+        # only the parts held by every replica are considered
+        num_parts = min(len(part2dev) for part2dev in replica2part2dev) \
+            if replica2part2dev else 0
+
         # Compare the partition allocation before and after the rebalance
         # Only changed device ids are taken into account; devices might be
         # "touched" during the rebalance, but actually not really moved
         changed_parts = 0
-
-        int_replicas = int(math.ceil(self.replicas))
+        for rep_id, part2dev in enumerate(replica2part2dev):
+            try:
+                old_part2dev = old_replica2part2dev[rep_id]
+            except IndexError:
+                # the replica count was increased, that actually means the
+                # partition has changed
+                changed_parts += num_parts
+                continue
+            common = min(len(old_part2dev), num_parts)
+            changed_parts += num_parts - common
+            changed_parts += sum(
+                1 for old_dev_id, dev_id in six.moves.zip(
+                    old_part2dev[:common], part2dev[:common])
+                if old_dev_id != dev_id)
+
+        # a part can't have more replicas in a tier than it has replicas,
+        # even if the replica count has been changed since the last rebalance
+        int_replicas = max(int(math.ceil(self.replicas)),
+                           len(replica2part2dev))
         max_allowed_replicas = self._build_max_replicas_by_tier()
         parts_at_risk = 0
 
-        dispersion_graph = {}
+        # number the tiers of every device, so that parts can be counted up
+        # by tier id rather than by tier
+        all_tiers = DispersionGraph(self.parts, int_replicas)
+        tier_ids_by_dev_id = [
+            tuple(all_tiers.add_tier(tier)
+                  for tier in (dev.get('tiers') or tiers_for_dev(dev)))
+            if dev else None
+            for dev in self.devs]
+        tier_depths = [len(tier) for tier in all_tiers.tiers]
+        tier_max_replicas = [max_allowed_replicas[tier]
+                             for tier in all_tiers.tiers]
+        counts = all_tiers.counts
+        width = all_tiers.width
+        # tiers are at most (region, zone, ip_port, device) deep
+        max_tier_depth = 4
+
         # go over all the devices holding each replica part by part
-        for part_id, dev_ids in enumerate(
-                six.moves.zip(*self._replica2part2dev)):
+        for dev_ids in six.moves.zip(*replica2part2dev):
             # count the number of replicas of this part for each tier of each
             # device, some devices may have overlapping tiers!
             replicas_at_tier = defaultdict(int)
-            for rep_id, dev in enumerate(iter(
-                    self.devs[dev_id] for dev_id in dev_ids)):
-                for tier in (dev.get('tiers') or tiers_for_dev(dev)):
-                    replicas_at_tier[tier] += 1
-                # IndexErrors will be raised if the replicas are increased or
-                # decreased, and that actually means the partition has changed
-                try:
-                    old_device = old_replica2part2dev[rep_id][part_id]
-                except IndexError:
-                    changed_parts += 1
-                    continue
-
-                if old_device != dev['id']:
-                    changed_parts += 1
+            for dev_id in dev_ids:
+                for tier_id in tier_ids_by_dev_id[dev_id]:
+                    replicas_at_tier[tier_id] += 1
             # update running totals for each tiers' number of parts with a
             # given replica count
-            part_risk_depth = defaultdict(int)
-            part_risk_depth[0] = 0
-            for tier, replicas in replicas_at_tier.items():
-                if tier not in dispersion_graph:
-                    dispersion_graph[tier] = [self.parts] + [0] * int_replicas
-                dispersion_graph[tier][0] -= 1
-                dispersion_graph[tier][replicas] += 1
-                if replicas > max_allowed_replicas[tier]:
-                    part_risk_depth[len(tier)] += (
-                        replicas - max_allowed_replicas[tier])
+            part_risk_depth = [0] * (max_tier_depth + 1)
+            for tier_id, replicas in replicas_at_tier.items():
+                row = tier_id * width
+                counts[row] -= 1
+                counts[row + replicas] += 1
+                if replicas > tier_max_replicas[tier_id]:
+                    part_risk_depth[tier_depths[tier_id]] += (
+                        replicas - tier_max_replicas[tier_id])
             # count each part-replica once at tier where dispersion is worst
-            parts_at_risk += max(part_risk_depth.values())
-        self._dispersion_graph = dispersion_graph
+            parts_at_risk += max(part_risk_depth)
+
+        # only keep the tiers that have some part assigned to them
+        self._dispersion_graph = all_tiers.compact()
         self.dispersion = 100.0 * parts_at_risk / (self.parts * self.replicas)
         self.version += 1
         return changed_parts
@@ -956,17 +986,20 @@ class RingBuilder(object):
         # choices will skip other replicas of the same partition if possible.
 
         if self._remove_devs:
-            dev_ids = [d['id'] for d in self._remove_devs if d['parts']]
+            dev_ids = set(d['id'] for d in self._remove_devs if d['parts'])
             if dev_ids:
-                for part, replica in self._each_part_replica():
-                    dev_id = self._replica2part2dev[replica][part]
-                    if dev_id in dev_ids:
-                        self._replica2part2dev[replica][part] = NONE_DEV
+                debug = self.logger.isEnabledFor(logging.DEBUG)
+                for replica, part2dev in enumerate(self._replica2part2dev):
+                    for part, dev_id in enumerate(part2dev):
+                        if dev_id not in dev_ids:
+                            continue
+                        part2dev[part] = NONE_DEV
                         self._set_part_moved(part)
                         assign_parts[part].append(replica)
-                        self.logger.debug(
-                            "Gathered %d/%d from dev %d [dev removed]",
-                            part, replica, dev_id)
+                        if debug:
+                            self.logger.debug(
+                                "Gathered %d/%d from dev %d [dev removed]",
+                                part, replica, dev_id)
         removed_devs = 0
         while self._remove_devs:
             remove_dev_id = self._remove_devs.pop()['id']
@@ -1049,28 +1082,32 @@ class RingBuilder(object):
         """
         # Now we gather partitions that are "at risk" because they aren't
         # currently sufficient spread out across the cluster.
-        for part in range(self.parts):
-            if (not self._can_part_move(part)):
+        debug = self.logger.isEnabledFor(logging.DEBUG)
+        can_part_move = self._can_part_move
+        replica2part2dev = self._replica2part2dev
+        devs = self.devs
+        max_replicas = self._replica_plan_bound(replica_plan, 'max')
+        for part, replicas in self._replicas_by_part(range(self.parts)):
+            if (not can_part_move(part)):
                 continue
             # First, add up the count of replicas at each tier for each
             # partition.
+            part_devs = []
             replicas_at_tier = defaultdict(int)
-            for dev in self._devs_for_part(part):
+            for replica in replicas:
+                dev_id = replica2part2dev[replica][part]
+                if dev_id == NONE_DEV:
+                    continue
+                dev = devs[dev_id]
+                part_devs.append((dev, replica))
                 for tier in dev['tiers']:
                     replicas_at_tier[tier] += 1
 
             # Now, look for partitions not yet spread out enough.
-            undispersed_dev_replicas = []
-            for replica in self._replicas_for_part(part):
-                dev_id = self._replica2part2dev[replica][part]
-                if dev_id == NONE_DEV:
-                    continue
-                dev = self.devs[dev_id]
-                if all(replicas_at_tier[tier] <=
-                       replica_plan[tier]['max']
-                       for tier in dev['tiers']):
-                    continue
-                undispersed_dev_replicas.append((dev, replica))
+            undispersed_dev_replicas = [
+                (d, r) for d, r in part_devs
+                if any(replicas_at_tier[tier] > max_replicas[tier]
+                       for tier in d['tiers'])]
 
             if not undispersed_dev_replicas:
                 continue
@@ -1082,16 +1119,17 @@ class RingBuilder(object):
                 # has more than one replica of a part assigned to it - which
                 # would have only been possible on rings built with an older
                 # version of the code
-                if (not self._can_part_move(part) and
+                if (not can_part_move(part) and
                         not replicas_at_tier[dev['tiers'][-1]] > 1):
                     continue
                 dev['parts_wanted'] += 1
                 dev['parts'] -= 1
                 assign_parts[part].append(replica)
-                self.logger.debug(
-                    "Gathered %d/%d from dev %s [dispersion]",
-                    part, replica, pretty_dev(dev))
-                self._replica2part2dev[replica][part] = NONE_DEV
+                if debug:
+                    self.logger.debug(
+                        "Gathered %d/%d from dev %s [dispersion]",
+                        part, replica, pretty_dev(dev))
+                replica2part2dev[replica][part] = NONE_DEV
                 for tier in dev['tiers']:
                     replicas_at_tier[tier] -= 1
                 self._set_part_moved(part)
@@ -1113,22 +1151,27 @@ class RingBuilder(object):
             wanted = max(dev['parts_wanted'], 0)
             for tier in dev['tiers']:
                 parts_wanted_in_tier[tier] += wanted
+        debug = self.logger.isEnabledFor(logging.DEBUG)
+        can_part_move = self._can_part_move
+        replica2part2dev = self._replica2part2dev
+        devs = self.devs
+        min_replicas = self._replica_plan_bound(replica_plan, 'min')
+        max_replicas = self._replica_plan_bound(replica_plan, 'max')
         # Last, we gather partitions from devices that are "overweight" because
         # they have more partitions than their parts_wanted.
-        for offset in range(self.parts):
-            part = (start + offset) % self.parts
-            if (not self._can_part_move(part)):
+        for part, replicas in self._replicas_by_part(self._parts_from(start)):
+            if (not can_part_move(part)):
                 continue
             # For each part we'll look at the devices holding those parts and
             # see if any are overweight, keeping track of replicas_at_tier as
             # we go
             overweight_dev_replica = []
             replicas_at_tier = defaultdict(int)
-            for replica in self._replicas_for_part(part):
-                dev_id = self._replica2part2dev[replica][part]
+            for replica in replicas:
+                dev_id = replica2part2dev[replica][part]
                 if dev_id == NONE_DEV:
                     continue
-                dev = self.devs[dev_id]
+                dev = devs[dev_id]
                 for tier in dev['tiers']:
                     replicas_at_tier[tier] += 1
                 if dev['parts_wanted'] < 0:
@@ -1140,14 +1183,14 @@ class RingBuilder(object):
             overweight_dev_replica.sort(
                 key=lambda dr: dr[0]['parts_wanted'])
             for dev, replica in overweight_dev_replica:
-                if any(replica_plan[tier]['min'] <=
+                if any(min_replicas[tier] <=
                        replicas_at_tier[tier] <
-                       replica_plan[tier]['max']
+                       max_replicas[tier]
                        for tier in dev['tiers']):
                     # we're stuck by replica plan
                     continue
                 for t in reversed(dev['tiers']):
-                    if replicas_at_tier[t] - 1 < replica_plan[t]['min']:
+                    if replicas_at_tier[t] - 1 < min_replicas[t]:
                         # we're stuck at tier t
                         break
                 if sum(parts_wanted_in_tier[c]
@@ -1160,10 +1203,11 @@ class RingBuilder(object):
                 dev['parts_wanted'] += 1
                 dev['parts'] -= 1
                 assign_parts[part].append(replica)
-                self.logger.debug(
-                    "Gathered %d/%d from dev %s [weight disperse]",
-                    part, replica, pretty_dev(dev))
-                self._replica2part2dev[replica][part] = NONE_DEV
+                if debug:
+                    self.logger.debug(
+                        "Gathered %d/%d from dev %s [weight disperse]",
+                        part, replica, pretty_dev(dev))
+                replica2part2dev[replica][part] = NONE_DEV
                 for tier in dev['tiers']:
                     replicas_at_tier[tier] -= 1
                     parts_wanted_in_tier[tier] -= 1
@@ -1210,16 +1254,19 @@ class RingBuilder(object):
         :param assign_parts: the map of partition => [replica] to update
         :param start: offset into self.parts to begin search
         """
-        for offset in range(self.parts):
-            part = (start + offset) % self.parts
-            if (not self._can_part_move(part)):
+        debug = self.logger.isEnabledFor(logging.DEBUG)
+        can_part_move = self._can_part_move
+        replica2part2dev = self._replica2part2dev
+        devs = self.devs
+        for part, replicas in self._replicas_by_part(self._parts_from(start)):
+            if (not can_part_move(part)):
                 continue
             overweight_dev_replica = []
-            for replica in self._replicas_for_part(part):
-                dev_id = self._replica2part2dev[replica][part]
+            for replica in replicas:
+                dev_id = replica2part2dev[replica][part]
                 if dev_id == NONE_DEV:
                     continue
-                dev = self.devs[dev_id]
+                dev = devs[dev_id]
                 if dev['parts_wanted'] < 0:
                     overweight_dev_replica.append((dev, replica))
 
@@ -1236,10 +1283,11 @@ class RingBuilder(object):
             dev['parts_wanted'] += 1
             dev['parts'] -= 1
             assign_parts[part].append(replica)
-            self.logger.debug(
-                "Gathered %d/%d from dev %s [weight forced]",
-                part, replica, pretty_dev(dev))
-            self._replica2part2dev[replica][part] = NONE_DEV
+            if debug:
+                self.logger.debug(
+                    "Gathered %d/%d from dev %s [weight forced]",
+                    part, replica, pretty_dev(dev))
+            replica2part2dev[replica][part] = NONE_DEV
             self._set_part_moved(part)
 
     def _reassign_parts(self, reassign_parts, replica_plan):
@@ -1287,21 +1335,20 @@ class RingBuilder(object):
             sorted((d for d in self._iter_devs() if d['weight']),
                    key=lambda x: x['sort_key'])
 
-        tier2devs = defaultdict(list)
+        # the devices are never re-sorted while reassigning, so the most
+        # wanted device in each tier is always the last one added to it
+        tier2dev = {}
         tier2sort_key = defaultdict(tuple)
-        tier2dev_sort_key = defaultdict(list)
         max_tier_depth = 0
         for dev in available_devs:
             for tier in dev['tiers']:
-                tier2devs[tier].append(dev)  # <-- starts out sorted!
-                tier2dev_sort_key[tier].append(dev['sort_key'])
+                tier2dev[tier] = dev  # <-- starts out sorted!
                 tier2sort_key[tier] = dev['sort_key']
                 if len(tier) > max_tier_depth:
                     max_tier_depth = len(tier)
 
         tier2children_sets = build_tier_tree(available_devs)
         tier2children = defaultdict(list)
-        tier2children_sort_key = {}
         tiers_list = [()]
         depth = 1
         while depth <= max_tier_depth:
@@ -1310,15 +1357,18 @@ class RingBuilder(object):
                 child_tiers = list(tier2children_sets[tier])
                 child_tiers.sort(key=tier2sort_key.__getitem__)
                 tier2children[tier] = child_tiers
-                tier2children_sort_key[tier] = map(
-                    tier2sort_key.__getitem__, child_tiers)
                 new_tiers_list.extend(child_tiers)
             tiers_list = new_tiers_list
             depth += 1
 
+        debug = self.logger.isEnabledFor(logging.DEBUG)
+        replica2part2dev = self._replica2part2dev
+        last_part_moves = self._last_part_moves
+        max_replicas = self._replica_plan_bound(replica_plan, 'max')
+        parts_available = parts_available_in_tier.__getitem__
         for part, replace_replicas in reassign_parts:
             # always update part_moves for min_part_hours
-            self._last_part_moves[part] = 0
+            last_part_moves[part] = 0
             # count up where these replicas be
             replicas_at_tier = defaultdict(int)
             for dev in self._devs_for_part(part):
@@ -1336,8 +1386,7 @@ class RingBuilder(object):
                     # already have their max replicas assigned according
                     # to the replica_plan.
                     candidates = [t for t in tier2children[tier] if
-                                  replicas_at_tier[t] <
-                                  replica_plan[t]['max']]
+                                  replicas_at_tier[t] < max_replicas[t]]
 
                     if not candidates:
                         raise Exception('no home for %s/%s %s' % (
@@ -1345,21 +1394,21 @@ class RingBuilder(object):
                                 replicas_at_tier[t],
                                 replica_plan[t]['max'],
                             ) for t in tier2children[tier]}))
-                    tier = max(candidates, key=lambda t:
-                               parts_available_in_tier[t])
+                    tier = max(candidates, key=parts_available)
 
                     depth += 1
 
-                dev = tier2devs[tier][-1]
+                dev = tier2dev[tier]
                 dev['parts_wanted'] -= 1
                 dev['parts'] += 1
                 for tier in dev['tiers']:
                     parts_available_in_tier[tier] -= 1
                     replicas_at_tier[tier] += 1
 
-                self._replica2part2dev[replica][part] = dev['id']
-                self.logger.debug(
-                    "Placed %d/%d onto dev %s", part, replica, pretty_dev(dev))
+                replica2part2dev[replica][part] = dev['id']
+                if debug:
+                    self.logger.debug("Placed %d/%d onto dev %s",
+                                      part, replica, pretty_dev(dev))
 
         # Just to save memory and keep from accidental reuse.
         for dev in self._iter_devs():
@@ -1647,6 +1696,20 @@ class RingBuilder(object):
         })
         return replica_plan
 
+    @staticmethod
+    def _replica_plan_bound(replica_plan, bound):
+        """
+        Flattens one key of a replica plan into a defaultdict mapping
+        <tier> => replica_plan[tier][bound], which is much cheaper to look up
+        for every part-replica than the nested plan dicts.
+
+        :param replica_plan: a dict of dicts, as returned from
+                             _build_replica_plan
+        :param bound: the key of the plan to use, e.g. 'min' or 'max'
+        """
+        return defaultdict(int, (
+            (tier, plan[bound]) for tier, plan in replica_plan.items()))
+
     def _devs_for_part(self, part):
         """
         Returns a list of devices for a specified partition.
@@ -1676,6 +1739,32 @@ class RingBuilder(object):
                 in enumerate(self._replica2part2dev)
                 if part < len(part2dev)]
 
+    def _replicas_by_part(self, parts):
+        """
+        Generator yielding (part, replicas) pairs for each of the given
+        partitions, where replicas is the list _replicas_for_part would
+        return for the partition.
+
+        Partitions held by every replica all share the same list, so callers
+        must not modify it.
+        """
+        all_replicas = list(range(len(self._replica2part2dev)))
+        whole_parts = min(len(part2dev) for part2dev in
+                          self._replica2part2dev) if all_replicas else 0
+        for part in parts:
+            if part < whole_parts:
+                yield part, all_replicas
+            else:
+                yield part, self._replicas_for_part(part)
+
+    def _parts_from(self, start):
+        """
+        Returns an iterable of every partition in the ring, beginning at
+        start and wrapping around.
+        """
+        start %= self.parts
+        return itertools.chain(range(start, self.parts), range(start))
+
     def _each_part_replica(self):
         """
         Generator yielding every (partition, replica) pair in the ring.
@@ -1720,6 +1809,13 @@ class RingBuilder(object):
         if not hasattr(builder, '_id'):
             builder._id = None
 
+        # really old builder files pickled the builder itself, along with
+        # its dispersion graph (if any) as a dict
+        graph = getattr(builder, '_dispersion_graph', None)
+        if not isinstance(graph, DispersionGraph):
+            builder._dispersion_graph = DispersionGraph.from_dict(
+                graph or {}, builder.parts)
+
         for dev in builder.devs:
             # really old rings didn't have meta keys
             if dev and 'meta' not in dev:
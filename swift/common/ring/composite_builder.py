@@ -91,7 +91,10 @@ rebuilding of the composite ring.
 
 import copy
 import json
+import multiprocessing
 import os
+import random
+import time
 
 from random import shuffle
 
@@ -364,6 +367,72 @@ def check_builder_ids(builders):
         raise ValueError('\n'.join(errors))
 
 
+def _locked_parts(builder):
+    """
+    Returns a bytearray with a non-zero entry for each partition that the
+    given component builder will not currently allow to move, or None if it
+    allows every partition to move.
+    """
+    if not builder.ever_rebalanced:
+        return None
+    return bytearray(0 if builder.can_part_move(part) else 1
+                     for part in range(builder.parts))
+
+
+def _newly_moved_parts(old_bitmap, new_bitmap):
+    """
+    Returns a list of the partitions marked as moved in new_bitmap but not in
+    old_bitmap.
+    """
+    parts = []
+    for byte, (old, new) in enumerate(zip(old_bitmap, new_bitmap)):
+        moved = new & ~old
+        if moved:
+            parts.extend(byte * 8 + bit for bit in range(8)
+                         if moved & (128 >> bit))
+    return parts
+
+
+class _LockedPartsParent(object):
+    """
+    Stands in for the :class:`CompositeRingBuilder` of a component builder
+    that is being rebalanced in a worker process, using a snapshot of which
+    partitions the other component builders would not allow to move.
+    """
+    def __init__(self, cobuilder_locks):
+        self.cobuilder_locks = [locks for locks in cobuilder_locks
+                                if locks is not None]
+        self.builder = None
+
+    def can_part_move(self, part):
+        return (not any(locks[part] for locks in self.cobuilder_locks) and
+                self.builder.can_part_move(part))
+
+
+def _rebalance_component_worker(args):
+    """
+    Rebalances one component builder in a worker process.
+
+    :param args: a tuple of (builder_dict, part_moved_bitmap,
+        cobuilder_locks, seed), where builder_dict is from the component's
+        to_dict() and cobuilder_locks has the :func:`_locked_parts` of each of
+        the other components
+    :return: a tuple of (builder_dict, part_moved_bitmap, rebalance result,
+        seconds taken) for the rebalanced component
+    """
+    builder_dict, part_moved_bitmap, cobuilder_locks, seed = args
+    parent = _LockedPartsParent(cobuilder_locks)
+    builder = CooperativeRingBuilder(1, 1, 1, parent)
+    builder.copy_from(builder_dict)
+    builder._part_moved_bitmap = part_moved_bitmap
+    parent.builder = builder
+    start = time.time()
+    result = builder.rebalance(seed=seed)
+    builder.validate()
+    elapsed = time.time() - start
+    return (builder.to_dict(), builder._part_moved_bitmap, result, elapsed)
+
+
 class CompositeRingBuilder(object):
     """
     Provides facility to create, persist, load, rebalance  and update composite
@@ -616,7 +685,7 @@ class CompositeRingBuilder(object):
         self.components = new_metadata['components']
         return self.ring_data
 
-    def rebalance(self):
+    def rebalance(self, seed=None, workers=1):
         """
         Cooperatively rebalances all component ring builders.
 
@@ -624,6 +693,23 @@ class CompositeRingBuilder(object):
         subsequent call to :meth:`compose` is required to generate updated
         composite :class:`RingData`.
 
+        Component builders are rebalanced one after another, in a random
+        order, so that each may avoid moving partitions that have already
+        been moved by another. With more than one worker the components are
+        instead rebalanced concurrently in a pool of processes, each against
+        a snapshot of the partitions the other components would not allow to
+        move, and their results are then merged back in that same order. A
+        component that moved any partition also moved by a component merged
+        before it is rebalanced again, in this process, against the merged
+        state, so that the outcome is the same as rebalancing the components
+        one after another.
+
+        :param seed: optional value from which the order of the components
+            and the seed for each component's rebalance are derived, making
+            the rebalance repeatable.
+        :param workers: number of processes with which to rebalance component
+            builders concurrently (default is 1, i.e. rebalance them one after
+            another in this process).
         :return: A list of dicts, one per component builder, each having the
             following keys:
 
@@ -633,6 +719,8 @@ class CompositeRingBuilder(object):
             * 'result' maps to the results of the rebalance of that component
               i.e. a tuple of: `(number_of_partitions_altered,
               resulting_balance, number_of_removed_devices)`
+            * 'time' maps to the number of seconds taken to rebalance that
+              component.
 
             The list has the same order as components in the composite ring.
         :raises RingBuilderError: if there is an error while rebalancing any
@@ -642,27 +730,107 @@ class CompositeRingBuilder(object):
         self.update_last_part_moves()
         component_builders = list(zip(self._builder_files, self._builders))
         # don't let the same builder go first each time
-        shuffle(component_builders)
-        results = {}
-        for builder_file, builder in component_builders:
-            try:
-                results[builder] = {
-                    'builder': builder,
-                    'builder_file': builder_file,
-                    'result': builder.rebalance()
-                }
-                builder.validate()
-            except RingBuilderError as err:
-                self._builders = None
-                raise RingBuilderError(
-                    'An error occurred while rebalancing component %s: %s' %
-                    (builder_file, err))
+        if seed is None:
+            shuffle(component_builders)
+            rng = random
+        else:
+            rng = random.Random(seed)
+            rng.shuffle(component_builders)
+        if seed is None and workers <= 1:
+            seeds = [None] * len(component_builders)
+        else:
+            # each component gets its own seed, so that it rebalances the
+            # same whichever process it is rebalanced in
+            seeds = [rng.randint(0, 0xffffffff) for _ in component_builders]
+
+        if workers > 1:
+            results = self._rebalance_concurrently(
+                component_builders, seeds, workers)
+        else:
+            results = {}
+            for (builder_file, builder), component_seed in zip(
+                    component_builders, seeds):
+                results[builder] = self._rebalance_component(
+                    builder_file, builder, component_seed)
 
         for builder_file, builder in component_builders:
             builder.save(builder_file)
         # return results in component order
         return [results[builder] for builder in self._builders]
 
+    def _rebalance_component(self, builder_file, builder, seed=None):
+        start = time.time()
+        try:
+            if seed is None:
+                result = builder.rebalance()
+            else:
+                result = builder.rebalance(seed=seed)
+            builder.validate()
+        except RingBuilderError as err:
+            self._builders = None
+            raise RingBuilderError(
+                'An error occurred while rebalancing component %s: %s' %
+                (builder_file, err))
+        return {
+            'builder': builder,
+            'builder_file': builder_file,
+            'result': result,
+            'time': time.time() - start,
+        }
+
+    def _rebalance_concurrently(self, component_builders, seeds, workers):
+        locks = dict((builder, _locked_parts(builder))
+                     for builder in self._builders)
+        pool = multiprocessing.Pool(min(workers, len(component_builders)))
+        try:
+            pending = []
+            for (builder_file, builder), seed in zip(
+                    component_builders, seeds):
+                cobuilder_locks = [locks[other] for other in self._builders
+                                   if other is not builder]
+                args = (builder.to_dict(), builder._part_moved_bitmap,
+                        cobuilder_locks, seed)
+                pending.append(pool.apply_async(
+                    _rebalance_component_worker, (args,)))
+            pool.close()
+
+            results = {}
+            merged = []
+            for (builder_file, builder), seed, async_result in zip(
+                    component_builders, seeds, pending):
+                try:
+                    (builder_dict, part_moved_bitmap, result,
+                     elapsed) = async_result.get()
+                except RingBuilderError as err:
+                    self._builders = None
+                    raise RingBuilderError(
+                        'An error occurred while rebalancing component %s: '
+                        '%s' % (builder_file, err))
+                moved_parts = _newly_moved_parts(builder._part_moved_bitmap,
+                                                 part_moved_bitmap)
+                if any(locks[other][part]
+                       for other in merged for part in moved_parts):
+                    # a component merged before this one has since moved
+                    # some of the same parts, so this one must rebalance
+                    # again with that knowledge
+                    results[builder] = self._rebalance_component(
+                        builder_file, builder, seed)
+                else:
+                    builder.copy_from(builder_dict)
+                    builder._part_moved_bitmap = part_moved_bitmap
+                    results[builder] = {
+                        'builder': builder,
+                        'builder_file': builder_file,
+                        'result': result,
+                        'time': elapsed,
+                    }
+                locks[builder] = _locked_parts(builder)
+                merged.append(builder)
+        finally:
+            pool.terminate()
+            pool.join()
+        return results
+
     def can_part_move(self, part):
         """
         Check with all component builders that it is ok to move a partition.
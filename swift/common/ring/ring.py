@@ -14,9 +14,11 @@
 # limitations under the License.
 
 import array
+import ctypes
+import mmap
 import six.moves.cPickle as pickle
 import json
-from collections import defaultdict
+from collections import defaultdict, OrderedDict
 from gzip import GzipFile
 from os.path import getmtime
 import struct
@@ -28,6 +30,7 @@ from itertools import chain
 from tempfile import NamedTemporaryFile
 import sys
 
+import six
 from six.moves import range
 
 from swift.common.exceptions import RingLoadError
@@ -35,12 +38,128 @@ from swift.common.utils import hash_path, validate_configuration
 from swift.common.ring.utils import tiers_for_dev
 
 
+_PART_STRUCT = struct.Struct('>I')
+# replica tables in an uncompressed (v2) ring file start on a multiple of
+# this many bytes so that they can be used straight out of a memory map
+V2_ALIGNMENT = 8
+# suffix used for the uncompressed (v2) copy of a <name>.ring.gz ring file
+MAPPED_RING_SUFFIX = '.ring.v2'
+
+
 def calc_replica_count(replica2part2dev_id):
     base = len(replica2part2dev_id) - 1
     extra = 1.0 * len(replica2part2dev_id[-1]) / len(replica2part2dev_id[0])
     return base + extra
 
 
+def mapped_ring_path(ring_path):
+    """
+    Get the path of the uncompressed (v2) ring file that may sit next to a
+    ``<name>.ring.gz`` ring file.
+
+    :param ring_path: path to a ``<name>.ring.gz`` ring file
+    :returns: the path to ``<name>.ring.v2``, or None if ``ring_path`` does
+              not end in ``.ring.gz``
+    """
+    if not ring_path.endswith('.ring.gz'):
+        return None
+    return ring_path[:-len('.ring.gz')] + MAPPED_RING_SUFFIX
+
+
+def _v2_padding(offset):
+    return -offset % V2_ALIGNMENT
+
+
+def _map_part2dev_id(buf, offset, count):
+    """
+    Get a read-only sequence of ``count`` unsigned shorts, starting at
+    ``offset`` in ``buf``, without copying them.
+    """
+    if six.PY2:
+        # py2 memoryviews can't be cast, but ctypes can wrap the map
+        return (ctypes.c_uint16 * count).from_buffer(buf, offset)
+    return memoryview(buf)[offset:offset + 2 * count].cast('H')
+
+
+def _iter_changed_parts(old_part2dev_id, new_part2dev_id, chunk_size=4096):
+    """
+    Yield the partitions whose device differs between two replica tables of
+    the same length. Tables are compared a chunk at a time, so only the
+    chunks that differ are looked at partition by partition.
+    """
+    same_type = type(old_part2dev_id) is type(new_part2dev_id)
+    for start in range(0, len(new_part2dev_id), chunk_size):
+        end = start + chunk_size
+        old_chunk = old_part2dev_id[start:end]
+        new_chunk = new_part2dev_id[start:end]
+        if not same_type:
+            # e.g. an array('H') and a table mapped from a v2 ring file
+            old_chunk = list(old_chunk)
+            new_chunk = list(new_chunk)
+        if old_chunk == new_chunk:
+            continue
+        for part in range(start, min(end, len(new_part2dev_id))):
+            if old_part2dev_id[part] != new_part2dev_id[part]:
+                yield part
+
+
+class _ReadOnlyNode(dict):
+    """
+    A node dict for a primary node of a partition. These are shared between
+    every caller that looks the partition up, so any attempt to change one
+    in place raises a TypeError; ``dict(node)``, ``copy.copy`` and pickling
+    all give a plain dict that can be changed.
+    """
+
+    def _read_only(self, *args, **kwargs):
+        raise TypeError('ring node dicts are shared and cannot be changed, '
+                        'copy them with dict(node) first')
+
+    __setitem__ = __delitem__ = _read_only
+    clear = pop = popitem = setdefault = update = _read_only
+
+    def __reduce__(self):
+        return dict, (dict(self),)
+
+
+class _HandoffSequence(object):
+    """
+    The handoff nodes for one partition, worked out only as far as anybody
+    has asked for them and remembered so that later iterations can replay
+    them instead of walking the ring again.
+
+    :param devs_iter: iterator over the handoff devs for the partition
+    """
+
+    def __init__(self, devs_iter):
+        self._devs_iter = devs_iter
+        self.devs = []
+
+    def __iter__(self):
+        index = 0
+        while True:
+            if index < len(self.devs):
+                yield self.devs[index]
+            elif self._devs_iter is None:
+                return
+            else:
+                try:
+                    dev = next(self._devs_iter)
+                except StopIteration:
+                    self._devs_iter = None
+                    return
+                self.devs.append(dev)
+                yield dev
+            index += 1
+
+
+def _part2dev_id_bytes(part2dev_id):
+    if not isinstance(part2dev_id, array.array):
+        # e.g. a replica table mapped from a v2 ring file
+        part2dev_id = array.array('H', part2dev_id)
+    return part2dev_id.tostring()
+
+
 class RingData(object):
     """Partitioned consistent hashing ring data (used for serialization)."""
 
@@ -95,15 +214,79 @@ class RingData(object):
 
         return ring_dict
 
+    @classmethod
+    def deserialize_v2(cls, fp, metadata_only=False):
+        """
+        Deserialize an uncompressed v2 ring file into a dictionary with
+        `devs`, `part_shift`, and `replica2part2dev_id` keys.
+
+        Rather than being read into memory, the replica tables are mapped
+        read-only from the file, so that every process using the same ring
+        file shares the same pages of the page cache. If the file was written
+        on a machine with a different byte order then the tables are copied
+        and byteswapped instead.
+
+        If the optional kwarg `metadata_only` is True, then the
+        `replica2part2dev_id` is not loaded and that key in the returned
+        dictionary just has the value `[]`.
+
+        :param file fp: An opened file object which has already consumed the
+                        6 bytes of magic and version.
+        :param bool metadata_only: If True, only load `devs` and `part_shift`
+        :returns: A dict containing `devs`, `part_shift`, and
+                  `replica2part2dev_id`
+        """
+        json_len, = struct.unpack('!I', fp.read(4))
+        ring_dict = json.loads(fp.read(json_len).decode('ascii'))
+        ring_dict['replica2part2dev_id'] = []
+
+        if metadata_only:
+            return ring_dict
+
+        byteswap = (ring_dict.get('byteorder', sys.byteorder) != sys.byteorder)
+
+        # ACCESS_COPY rather than ACCESS_READ because ctypes insists on a
+        # writable buffer; nothing ever writes to the map, so the pages stay
+        # shared with the page cache.
+        mapped = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_COPY)
+        offset = 10 + json_len
+        for part_count in ring_dict['replica_lengths']:
+            offset += _v2_padding(offset)
+            if byteswap:
+                part2dev = array.array(
+                    'H', mapped[offset:offset + 2 * part_count])
+                part2dev.byteswap()
+            else:
+                part2dev = _map_part2dev_id(mapped, offset, part_count)
+            ring_dict['replica2part2dev_id'].append(part2dev)
+            offset += 2 * part_count
+
+        return ring_dict
+
     @classmethod
     def load(cls, filename, metadata_only=False):
         """
         Load ring data from a file.
 
+        Both gzipped (v1 or pickled) and uncompressed (v2) ring files are
+        understood; the format is detected from the file contents.
+
         :param filename: Path to a file serialized by the save() method.
         :param bool metadata_only: If True, only load `devs` and `part_shift`.
         :returns: A RingData instance containing the loaded data.
         """
+        with open(filename, 'rb') as fp:
+            if fp.read(4) == b'R1NG':
+                format_version, = struct.unpack('!H', fp.read(2))
+                if format_version != 2:
+                    raise Exception('Unknown uncompressed ring format '
+                                    'version %d' % format_version)
+                ring_data = cls.deserialize_v2(
+                    fp, metadata_only=metadata_only)
+                return RingData(ring_data['replica2part2dev_id'],
+                                ring_data['devs'], ring_data['part_shift'],
+                                ring_data.get('next_part_power'))
+
         gz_file = GzipFile(filename, 'rb')
         # Python 2.6 GzipFile doesn't support BufferedIO
         if hasattr(gz_file, '_checkReadable'):
@@ -130,9 +313,7 @@ class RingData(object):
                                  ring_data.get('next_part_power'))
         return ring_data
 
-    def serialize_v1(self, file_obj):
-        # Write out new-style serialization magic and version:
-        file_obj.write(struct.pack('!4sH', b'R1NG', 1))
+    def _get_json_header(self, format_version):
         ring = self.to_dict()
 
         # Only include next_part_power if it is set in the
@@ -145,29 +326,72 @@ class RingData(object):
         if next_part_power is not None:
             _text['next_part_power'] = next_part_power
 
-        json_text = json.dumps(_text, sort_keys=True,
-                               ensure_ascii=True).encode('ascii')
+        if format_version == 2:
+            # the last replica may not cover every partition
+            _text['replica_lengths'] = [
+                len(part2dev_id)
+                for part2dev_id in ring['replica2part2dev_id']]
+
+        return json.dumps(_text, sort_keys=True,
+                          ensure_ascii=True).encode('ascii')
+
+    def serialize_v1(self, file_obj):
+        # Write out new-style serialization magic and version:
+        file_obj.write(struct.pack('!4sH', b'R1NG', 1))
+        json_text = self._get_json_header(1)
         json_len = len(json_text)
         file_obj.write(struct.pack('!I', json_len))
         file_obj.write(json_text)
-        for part2dev_id in ring['replica2part2dev_id']:
-            file_obj.write(part2dev_id.tostring())
+        for part2dev_id in self._replica2part2dev_id:
+            file_obj.write(_part2dev_id_bytes(part2dev_id))
 
-    def save(self, filename, mtime=1300507380.0):
+    def serialize_v2(self, file_obj):
+        """
+        Write out the uncompressed v2 serialization: the same magic, version
+        and JSON header as v1, followed by each replica table in native byte
+        order, padded so that each table starts on a multiple of
+        ``V2_ALIGNMENT`` bytes from the start of the file.
+        """
+        file_obj.write(struct.pack('!4sH', b'R1NG', 2))
+        json_text = self._get_json_header(2)
+        json_len = len(json_text)
+        file_obj.write(struct.pack('!I', json_len))
+        file_obj.write(json_text)
+        offset = 10 + json_len
+        for part2dev_id in self._replica2part2dev_id:
+            padding = _v2_padding(offset)
+            file_obj.write(b'\x00' * padding)
+            data = _part2dev_id_bytes(part2dev_id)
+            file_obj.write(data)
+            offset += padding + len(data)
+
+    def save(self, filename, mtime=1300507380.0, format_version=1):
         """
         Serialize this RingData instance to disk.
 
         :param filename: File into which this instance should be serialized.
         :param mtime: time used to override mtime for gzip, default or None
                       if the caller wants to include time
+        :param format_version: 1 for a gzipped ring file, 2 for an
+                               uncompressed ring file that can be memory
+                               mapped when it is loaded
         """
         # Override the timestamp so that the same ring data creates
         # the same bytes on disk. This makes a checksum comparison a
         # good way to see if two rings are identical.
         tempf = NamedTemporaryFile(dir=".", prefix=filename, delete=False)
-        gz_file = GzipFile(filename, mode='wb', fileobj=tempf, mtime=mtime)
-        self.serialize_v1(gz_file)
-        gz_file.close()
+        if format_version == 2:
+            self.serialize_v2(tempf)
+        elif format_version == 1:
+            gz_file = GzipFile(filename, mode='wb', fileobj=tempf,
+                               mtime=mtime)
+            self.serialize_v1(gz_file)
+            gz_file.close()
+        else:
+            tempf.close()
+            os.unlink(tempf.name)
+            raise ValueError('Unknown ring format version %r' %
+                             (format_version,))
         tempf.flush()
         os.fsync(tempf.fileno())
         tempf.close()
@@ -185,16 +409,33 @@ class Ring(object):
     """
     Partitioned consistent hashing ring.
 
+    When a changed ring file with the same part power and replica count is
+    reloaded, only what changed is patched in; the partitions whose primary
+    nodes changed, and the ids of devices whose details changed, are then
+    available as ``changed_parts`` and ``changed_dev_ids``. Both are None
+    after a full load.
+
+    If an uncompressed ``<name>.ring.v2`` ring file exists next to the
+    ``<name>.ring.gz`` ring file, and is at least as new, then it is loaded
+    instead; its replica tables are memory mapped rather than read, which
+    makes loading much faster and lets every process on a node share a
+    single copy of them.
+
     :param serialized_path: path to serialized RingData instance
     :param reload_time: time interval in seconds to check for a ring change
     :param ring_name: ring name string (basically specified from policy)
     :param validation_hook: hook point to validate ring configuration ontime
+    :param handoff_cache_size: number of partitions to remember the handoff
+                               nodes of; 0 (the default) disables the cache
 
     :raises RingLoadError: if the loaded ring data violates its constraint
     """
 
+    _handoff_cache_size = 0
+
     def __init__(self, serialized_path, reload_time=15, ring_name=None,
-                 validation_hook=lambda ring_data: None):
+                 validation_hook=lambda ring_data: None,
+                 handoff_cache_size=0):
         # can't use the ring unless HASH_PATH_SUFFIX is set
         validate_configuration()
         if ring_name:
@@ -202,14 +443,37 @@ class Ring(object):
                                                 ring_name + '.ring.gz')
         else:
             self.serialized_path = os.path.join(serialized_path)
+        self._gz_path = self.serialized_path
+        self._mapped_path = mapped_ring_path(self._gz_path)
         self.reload_time = reload_time
         self._validation_hook = validation_hook
         self._reload(force=True)
+        self.handoff_cache_size = handoff_cache_size
+
+    def _get_serialized_path(self):
+        """
+        Pick the ring file to load: the uncompressed ring file if there is
+        one that is no older than the gzipped ring file, else the gzipped
+        ring file.
+        """
+        if self._mapped_path is None:
+            return self._gz_path
+        try:
+            mapped_mtime = getmtime(self._mapped_path)
+        except OSError:
+            return self._gz_path
+        try:
+            if getmtime(self._gz_path) > mapped_mtime:
+                return self._gz_path
+        except OSError:
+            pass
+        return self._mapped_path
 
     def _reload(self, force=False):
         self._rtime = time() + self.reload_time
         if force or self.has_changed():
-            ring_data = RingData.load(self.serialized_path)
+            serialized_path = self._get_serialized_path()
+            ring_data = RingData.load(serialized_path)
 
             try:
                 self._validation_hook(ring_data)
@@ -221,15 +485,16 @@ class Ring(object):
                     # ring data if the new ring data is invalid.
                     return
 
-            self._mtime = getmtime(self.serialized_path)
-            self._devs = ring_data.devs
+            self.serialized_path = serialized_path
+            self._mtime = getmtime(serialized_path)
+            devs = ring_data.devs
             # NOTE(akscram): Replication parameters like replication_ip
             #                and replication_port are required for
             #                replication process. An old replication
             #                ring doesn't contain this parameters into
             #                device. Old-style pickled rings won't have
             #                region information.
-            for dev in self._devs:
+            for dev in devs:
                 if dev:
                     dev.setdefault('region', 1)
                     if 'ip' in dev:
@@ -237,38 +502,107 @@ class Ring(object):
                     if 'port' in dev:
                         dev.setdefault('replication_port', dev['port'])
 
-            self._replica2part2dev_id = ring_data._replica2part2dev_id
-            self._part_shift = ring_data._part_shift
-            self._rebuild_tier_data()
-
-            # Do this now, when we know the data has changed, rather than
-            # doing it on every call to get_more_nodes().
-            #
-            # Since this is to speed up the finding of handoffs, we only
-            # consider devices with at least one partition assigned. This
-            # way, a region, zone, or server with no partitions assigned
-            # does not count toward our totals, thereby keeping the early
-            # bailouts in get_more_nodes() working.
-            dev_ids_with_parts = set()
-            for part2dev_id in self._replica2part2dev_id:
-                for dev_id in part2dev_id:
-                    dev_ids_with_parts.add(dev_id)
-
-            regions = set()
-            zones = set()
-            ips = set()
-            self._num_devs = 0
-            for dev in self._devs:
-                if dev and dev['id'] in dev_ids_with_parts:
-                    regions.add(dev['region'])
-                    zones.add((dev['region'], dev['zone']))
-                    ips.add((dev['region'], dev['zone'], dev['ip']))
-                    self._num_devs += 1
-            self._num_regions = len(regions)
-            self._num_zones = len(zones)
-            self._num_ips = len(ips)
+            if not force and self._has_same_shape(ring_data):
+                self._apply_changes(devs, ring_data._replica2part2dev_id)
+            else:
+                self._devs = devs
+                self._replica2part2dev_id = ring_data._replica2part2dev_id
+                self._part_shift = ring_data._part_shift
+                self._rebuild_tier_data()
+
+                # Do this now, when we know the data has changed, rather
+                # than doing it on every call to get_more_nodes().
+                #
+                # Since this is to speed up the finding of handoffs, we only
+                # consider devices with at least one partition assigned. This
+                # way, a region, zone, or server with no partitions assigned
+                # does not count toward our totals, thereby keeping the early
+                # bailouts in get_more_nodes() working.
+                dev_ids_with_parts = set()
+                for part2dev_id in self._replica2part2dev_id:
+                    dev_ids_with_parts.update(part2dev_id)
+                self._count_devs_with_parts(dev_ids_with_parts)
+                self.changed_parts = None
+                self.changed_dev_ids = None
             self._next_part_power = ring_data.next_part_power
 
+    def _count_devs_with_parts(self, dev_ids_with_parts):
+        self._dev_ids_with_parts = dev_ids_with_parts
+        regions = set()
+        zones = set()
+        ips = set()
+        self._num_devs = 0
+        for dev in self._devs:
+            if dev and dev['id'] in dev_ids_with_parts:
+                regions.add(dev['region'])
+                zones.add((dev['region'], dev['zone']))
+                ips.add((dev['region'], dev['zone'], dev['ip']))
+                self._num_devs += 1
+        self._num_regions = len(regions)
+        self._num_zones = len(zones)
+        self._num_ips = len(ips)
+
+    def _has_same_shape(self, ring_data):
+        """
+        Check whether newly loaded ring data has the same part power and
+        replica tables of the same lengths as the ring data in use, in which
+        case it can be applied as a set of changes.
+        """
+        return (ring_data._part_shift == self._part_shift and
+                [len(part2dev_id)
+                 for part2dev_id in ring_data._replica2part2dev_id] ==
+                [len(part2dev_id)
+                 for part2dev_id in self._replica2part2dev_id])
+
+    def _apply_changes(self, devs, replica2part2dev_id):
+        """
+        Switch to new ring data of the same shape by working out what
+        changed, rather than rebuilding everything derived from the replica
+        tables. The tier data is only rebuilt if devices changed, node dicts
+        for unchanged devices are kept, and the sets of changed partitions
+        and devices are made available as ``changed_parts`` and
+        ``changed_dev_ids``.
+        """
+        old_devs = self._devs
+        changed_dev_ids = set()
+        for dev_id in range(max(len(old_devs), len(devs))):
+            old_dev = old_devs[dev_id] if dev_id < len(old_devs) else None
+            new_dev = devs[dev_id] if dev_id < len(devs) else None
+            if old_dev != new_dev:
+                changed_dev_ids.add(dev_id)
+
+        changed_parts = set()
+        gained_dev_ids = set()
+        lost_dev_ids = set()
+        for old_part2dev_id, new_part2dev_id in zip(
+                self._replica2part2dev_id, replica2part2dev_id):
+            for part in _iter_changed_parts(old_part2dev_id, new_part2dev_id):
+                changed_parts.add(part)
+                lost_dev_ids.add(old_part2dev_id[part])
+                gained_dev_ids.add(new_part2dev_id[part])
+
+        self._devs = devs
+        self._replica2part2dev_id = replica2part2dev_id
+        if changed_dev_ids:
+            indexed_nodes = self._indexed_nodes
+            self._rebuild_tier_data()
+            self._indexed_nodes = dict(
+                (key, node) for key, node in indexed_nodes.items()
+                if key[0] not in changed_dev_ids)
+        else:
+            # the devices are the same, so the tier data still holds, but
+            # the handoffs of any partition may have changed
+            self._handoff_cache = OrderedDict()
+
+        dev_ids_with_parts = self._dev_ids_with_parts | gained_dev_ids
+        for dev_id in lost_dev_ids - gained_dev_ids:
+            if not any(dev_id in part2dev_id
+                       for part2dev_id in replica2part2dev_id):
+                dev_ids_with_parts.discard(dev_id)
+        self._count_devs_with_parts(dev_ids_with_parts)
+        self.changed_parts = frozenset(changed_parts)
+        self.changed_dev_ids = frozenset(changed_dev_ids)
+
     @property
     def next_part_power(self):
         return self._next_part_power
@@ -277,7 +611,26 @@ class Ring(object):
     def part_power(self):
         return 32 - self._part_shift
 
+    @property
+    def handoff_cache_size(self):
+        """
+        Maximum number of partitions whose handoff nodes are cached by
+        :func:`get_more_nodes`; 0 means handoffs are never cached.
+        """
+        return self._handoff_cache_size
+
+    @handoff_cache_size.setter
+    def handoff_cache_size(self, size):
+        self._handoff_cache_size = max(0, int(size))
+        self._handoff_cache = OrderedDict()
+
     def _rebuild_tier_data(self):
+        # node dicts handed out by _get_part_nodes are derived from the
+        # device list, so they must be recreated along with the tier data;
+        # any change to the replica tables can change the handoffs of every
+        # partition, so the handoff cache goes too
+        self._indexed_nodes = {}
+        self._handoff_cache = OrderedDict()
         self.tier2devs = defaultdict(list)
         for dev in self._devs:
             if not dev:
@@ -317,7 +670,24 @@ class Ring(object):
 
         :returns: True if the ring on disk has changed, False otherwise
         """
-        return getmtime(self.serialized_path) != self._mtime
+        serialized_path = self._get_serialized_path()
+        return (serialized_path != self.serialized_path or
+                getmtime(serialized_path) != self._mtime)
+
+    def _get_indexed_node(self, dev_id, index):
+        """
+        Get the node dict for a device at a given offset into a primary node
+        list. The dicts are created once per (device, index) pair and shared
+        between all partitions until the ring is reloaded, so they are read
+        only.
+        """
+        key = (dev_id, index)
+        try:
+            return self._indexed_nodes[key]
+        except KeyError:
+            node = self._indexed_nodes[key] = _ReadOnlyNode(
+                self._devs[dev_id], index=index)
+            return node
 
     def _get_part_nodes(self, part):
         part_nodes = []
@@ -326,9 +696,10 @@ class Ring(object):
             if part < len(r2p2d):
                 dev_id = r2p2d[part]
                 if dev_id not in seen_ids:
-                    part_nodes.append(self.devs[dev_id])
+                    part_nodes.append(
+                        self._get_indexed_node(dev_id, len(part_nodes)))
                     seen_ids.add(dev_id)
-        return [dict(node, index=i) for i, node in enumerate(part_nodes)]
+        return part_nodes
 
     def get_part(self, account, container=None, obj=None):
         """
@@ -345,6 +716,23 @@ class Ring(object):
         part = struct.unpack_from('>I', key)[0] >> self._part_shift
         return part
 
+    def get_parts_many(self, names):
+        """
+        Get the partitions for many account/container/object names at once.
+        The ring is checked for changes only once for the whole batch, so all
+        of the returned partitions are from the same version of the ring.
+
+        :param names: iterable of name tuples, each one of (account,),
+                      (account, container) or (account, container, obj)
+        :returns: list of partition numbers, in the same order as ``names``
+        """
+        if time() > self._rtime:
+            self._reload()
+        part_shift = self._part_shift
+        unpack_from = _PART_STRUCT.unpack_from
+        return [unpack_from(hash_path(*name, raw_digest=True))[0] >> part_shift
+                for name in names]
+
     def get_part_nodes(self, part):
         """
         Get the nodes that are responsible for the partition. If one
@@ -389,10 +777,36 @@ class Ring(object):
         meta    general use 'extra' field; for example: the online date, the
                 hardware description
         ======  ===============================================================
+
+        The node dicts are shared between calls and are read only; callers
+        that need to annotate a node should take a copy first, for example
+        with ``dict(node)``.
         """
         part = self.get_part(account, container, obj)
         return part, self._get_part_nodes(part)
 
+    def get_nodes_many(self, names):
+        """
+        Get the partition and nodes for many account/container/object names
+        at once. This is equivalent to calling :func:`get_nodes` for each
+        name, but the ring is checked for changes only once and names that
+        map to the same partition share the same list of nodes.
+
+        :param names: iterable of name tuples, each one of (account,),
+                      (account, container) or (account, container, obj)
+        :returns: list of (partition, list of node dicts) tuples, in the same
+                  order as ``names``
+
+        See :func:`get_nodes` for a description of the node dicts.
+        """
+        part_nodes = {}
+        results = []
+        for part in self.get_parts_many(names):
+            if part not in part_nodes:
+                part_nodes[part] = self._get_part_nodes(part)
+            results.append((part, part_nodes[part]))
+        return results
+
     def get_more_nodes(self, part):
         """
         Generator to get extra nodes for a partition for hinted handoff.
@@ -402,6 +816,12 @@ class Ring(object):
         will usually keep the same sequences of handoffs even with
         ring changes.
 
+        If the ring was created with a ``handoff_cache_size`` the handoffs
+        of recently used partitions are remembered until the ring is next
+        reloaded. Either way, handoffs are only worked out as they are
+        consumed, so a caller that only wants the first one or two does not
+        pay for a walk of the whole ring.
+
         :param part: partition to get handoff nodes for
         :returns: generator of node dicts
 
@@ -409,6 +829,30 @@ class Ring(object):
         """
         if time() > self._rtime:
             self._reload()
+        if self._handoff_cache_size:
+            handoffs = self._get_cached_handoffs(part)
+        else:
+            handoffs = self._iter_handoffs(part)
+        for dev in handoffs:
+            yield dev
+
+    def _get_cached_handoffs(self, part):
+        """
+        Get the handoff sequence for a partition from the handoff cache,
+        adding it (and evicting the least recently used partitions) if it
+        is not there.
+        """
+        cache = self._handoff_cache
+        try:
+            handoffs = cache.pop(part)
+        except KeyError:
+            handoffs = _HandoffSequence(self._iter_handoffs(part))
+            while len(cache) >= self._handoff_cache_size:
+                cache.popitem(last=False)
+        cache[part] = handoffs
+        return handoffs
+
+    def _iter_handoffs(self, part):
         primary_nodes = self._get_part_nodes(part)
 
         used = set(d['id'] for d in primary_nodes)
@@ -12,6 +12,7 @@
 # implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
+from array import array
 from collections import defaultdict
 import optparse
 import re
@@ -132,6 +133,137 @@ def build_tier_tree(devices):
     return tier2children
 
 
+class DispersionGraph(object):
+    """
+    Counts, for every tier in a ring, the number of partitions having each
+    possible number of replicas in that tier; i.e. for a tier with id
+    ``tier_id``::
+
+        graph.counts[tier_id * graph.width + n]
+
+    is the number of partitions with ``n`` replicas in the tier, and
+    ``graph.counts[tier_id * graph.width]`` is the number of partitions not
+    assigned to the tier at all.
+
+    Each tier is given a numeric id (its index into ``tiers``) and the counts
+    are kept in a single flat array of unsigned ints with a row of ``width``
+    entries per tier, which is much smaller than a list per tier. The map of
+    tier to tier id is only built when a tier is looked up.
+
+    For convenience the graph can also be used like the dict of <tier> =>
+    [<number_of_parts_with_n_replicas>, ...] that it replaces.
+
+    :param parts: the number of partitions in the ring
+    :param max_replicas: the most replicas of a partition any tier may have
+    """
+
+    def __init__(self, parts=0, max_replicas=0):
+        self.parts = parts
+        self.width = max_replicas + 1
+        self.tiers = []
+        self.counts = array('I')
+        self._tier_ids = None
+
+    @property
+    def tier_ids(self):
+        if self._tier_ids is None:
+            self._tier_ids = dict(
+                (tier, tier_id) for tier_id, tier in enumerate(self.tiers))
+        return self._tier_ids
+
+    @classmethod
+    def from_dict(cls, graph_dict, parts=0):
+        """
+        Create a DispersionGraph from a dict of <tier> => [replica counts],
+        as found in older builder files.
+        """
+        if isinstance(graph_dict, cls):
+            graph_dict = graph_dict.to_dict()
+        width = max([len(counts) for counts in graph_dict.values()] or [1])
+        graph = cls(parts, width - 1)
+        for tier, counts in sorted(graph_dict.items()):
+            graph.add_tier(tier, counts)
+        return graph
+
+    def to_dict(self):
+        """
+        Returns the graph as a dict of <tier> => [replica counts].
+        """
+        return dict(self.items())
+
+    def add_tier(self, tier, counts=None):
+        """
+        Adds a tier to the graph, by default with no partitions assigned to
+        it.
+
+        :param tier: a tier tuple
+        :param counts: optional list of the tier's replica counts
+        :returns: the numeric id of the tier
+        """
+        tier_id = self.tier_ids.get(tier)
+        if tier_id is None:
+            tier_id = self.tier_ids[tier] = len(self.tiers)
+            self.tiers.append(tier)
+            self.counts.extend([self.parts] + [0] * (self.width - 1))
+        if counts is not None:
+            row = tier_id * self.width
+            self.counts[row:row + self.width] = array('I', (
+                list(counts) + [0] * self.width)[:self.width])
+        return tier_id
+
+    def compact(self):
+        """
+        Returns a copy of the graph without the tiers that have no partitions
+        assigned to them.
+        """
+        graph = type(self)(self.parts, self.width - 1)
+        for tier_id, tier in enumerate(self.tiers):
+            row = tier_id * self.width
+            if self.counts[row] < self.parts:
+                graph.tiers.append(tier)
+                graph.counts.extend(self.counts[row:row + self.width])
+        return graph
+
+    def replica_counts(self, tier_id):
+        """
+        Returns the list of replica counts of the tier with the given id.
+        """
+        row = tier_id * self.width
+        return self.counts[row:row + self.width].tolist()
+
+    def __getitem__(self, tier):
+        return self.replica_counts(self.tier_ids[tier])
+
+    def __contains__(self, tier):
+        return tier in self.tier_ids
+
+    def __iter__(self):
+        return iter(self.tiers)
+
+    def __len__(self):
+        return len(self.tiers)
+
+    def keys(self):
+        return list(self.tiers)
+
+    def items(self):
+        return [(tier, self.replica_counts(tier_id))
+                for tier_id, tier in enumerate(self.tiers)]
+
+    def __eq__(self, other):
+        if isinstance(other, DispersionGraph):
+            other = other.to_dict()
+        return self.to_dict() == other
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    __hash__ = None
+
+    def __repr__(self):
+        return '%s(%r)' % (type(self).__name__, self.to_dict())
+
+
 def validate_and_normalize_ip(ip):
     """
     Return normalized ip if the ip is a valid ip.
@@ -611,11 +743,15 @@ def dispersion_report(builder, search_filter=None,
                       verbose=False, recalculate=False):
     if recalculate or not builder._dispersion_graph:
         builder._build_dispersion_graph()
+    graph = builder._dispersion_graph
     max_allowed_replicas = builder._build_max_replicas_by_tier()
     worst_tier = None
     max_dispersion = 0.0
     sorted_graph = []
-    for tier, replica_counts in sorted(builder._dispersion_graph.items()):
+    for tier_id in sorted(range(len(graph.tiers)),
+                          key=graph.tiers.__getitem__):
+        tier = graph.tiers[tier_id]
+        replica_counts = graph.replica_counts(tier_id)
         tier_name = get_tier_name(tier, builder)
         if search_filter and not re.match(search_filter, tier_name):
             continue
@@ -14,7 +14,7 @@
 # limitations under the License.
 
 '''
-Bindings to the `tee` and `splice` system calls
+Bindings to the `tee`, `splice` and `sendfile` system calls
 '''
 
 import os
@@ -23,7 +23,7 @@ import six
 import ctypes
 import ctypes.util
 
-__all__ = ['tee', 'splice']
+__all__ = ['tee', 'splice', 'sendfile']
 
 
 c_loff_t = ctypes.c_long
@@ -200,3 +200,79 @@ class Splice(object):
 
 splice = Splice()
 del Splice
+
+
+class Sendfile(object):
+    '''Binding to `sendfile`'''
+
+    __slots__ = '_c_sendfile',
+
+    def __init__(self):
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+
+        try:
+            c_sendfile = libc.sendfile
+        except AttributeError:
+            self._c_sendfile = None
+            return
+
+        c_sendfile.argtypes = [
+            ctypes.c_int,
+            ctypes.c_int,
+            ctypes.POINTER(c_loff_t),
+            ctypes.c_size_t
+        ]
+
+        c_sendfile.restype = c_ssize_t
+
+        def errcheck(result, func, arguments):
+            if result == -1:
+                errno = ctypes.set_errno(0)
+
+                raise IOError(errno, 'sendfile: %s' % os.strerror(errno))
+            else:
+                offset = arguments[2]
+
+                return (
+                    result,
+                    offset.contents.value if offset is not None else None)
+
+        c_sendfile.errcheck = errcheck
+
+        self._c_sendfile = c_sendfile
+
+    def __call__(self, fd_out, fd_in, offset, count):
+        '''See `man 2 sendfile`
+
+        File-descriptors can be file-like objects with a `fileno` method, or
+        integers.
+
+        Returns a tuple of the result of the `sendfile` call, i.e. the number
+        of bytes sent, and the output value of `offset` (or `None` if no
+        offset was given).
+
+        Upon other errors, an `IOError` is raised with the proper `errno` set.
+
+        Note: if you want to pass `NULL` as value for `offset` to the system
+        call, you must pass `None`, *not* 0!
+        '''
+
+        if not self.available:
+            raise EnvironmentError('sendfile not available')
+
+        c_fd_out = getattr(fd_out, 'fileno', lambda: fd_out)()
+        c_fd_in = getattr(fd_in, 'fileno', lambda: fd_in)()
+
+        c_offset = \
+            ctypes.pointer(c_loff_t(offset)) if offset is not None else None
+
+        return self._c_sendfile(c_fd_out, c_fd_in, c_offset, count)
+
+    @property
+    def available(self):
+        '''Availability of `sendfile`'''
+
+        return self._c_sendfile is not None
+
+sendfile = Sendfile()
+del Sendfile
@@ -34,6 +34,7 @@ DEFAULT_POLICY_TYPE = REPL_POLICY = 'replication'
 EC_POLICY = 'erasure_coding'
 
 DEFAULT_EC_OBJECT_SEGMENT_SIZE = 1048576
+DEFAULT_DISKFILE_BACKEND = 'fs'
 
 
 class BindPortsCache(object):
@@ -386,8 +387,37 @@ class StoragePolicy(BaseStoragePolicy):
     Not meant to be instantiated directly; use
     :func:`~swift.common.storage_policy.reload_storage_policies` to load
     POLICIES from ``swift.conf``.
+
+    The ``diskfile_backend`` option selects the on-disk layout used by the
+    object servers for this policy; see
+    :class:`~swift.obj.diskfile.DiskFileRouter`.
     """
 
+    def __init__(self, idx, name='', is_default=False, is_deprecated=False,
+                 object_ring=None, aliases='',
+                 diskfile_backend=DEFAULT_DISKFILE_BACKEND):
+        super(StoragePolicy, self).__init__(
+            idx=idx, name=name, is_default=is_default,
+            is_deprecated=is_deprecated, object_ring=object_ring,
+            aliases=aliases)
+        diskfile_backend = (diskfile_backend or '').strip().lower()
+        if not diskfile_backend:
+            raise PolicyError('Invalid diskfile_backend %r' % diskfile_backend,
+                              self.idx)
+        self.diskfile_backend = diskfile_backend
+
+    @classmethod
+    def _config_options_map(cls):
+        options = super(StoragePolicy, cls)._config_options_map()
+        options['diskfile_backend'] = 'diskfile_backend'
+        return options
+
+    def get_info(self, config=False):
+        info = super(StoragePolicy, self).get_info(config=config)
+        if not config:
+            info.pop('diskfile_backend')
+        return info
+
     @property
     def quorum(self):
         """
@@ -54,6 +54,7 @@ import datetime
 
 import eventlet
 import eventlet.debug
+import eventlet.event
 import eventlet.greenthread
 import eventlet.patcher
 import eventlet.semaphore
@@ -77,6 +78,11 @@ from six.moves.urllib.parse import ParseResult
 from six.moves.urllib.parse import quote as _quote
 from six.moves.urllib.parse import urlparse as stdlib_urlparse
 
+# worker threads and the queues between them and the hub need the real,
+# unpatched, versions of these
+stdlib_queue = eventlet.patcher.original('Queue' if six.PY2 else 'queue')
+stdlib_threading = eventlet.patcher.original('threading')
+
 from swift import gettext_ as _
 import swift.common.exceptions
 from swift.common.http import is_server_error
@@ -97,6 +103,7 @@ SysLogHandler.priority_map['NOTICE'] = 'notice'
 # These are lazily pulled from libc elsewhere
 _sys_fallocate = None
 _posix_fadvise = None
+_libc_syncfs = None
 _libc_socket = None
 _libc_bind = None
 _libc_accept = None
@@ -856,6 +863,36 @@ def fsync_dir(dirpath):
             os.close(dirfd)
 
 
+def syncfs(fd):
+    """
+    Sync all modified data and metadata of the filesystem that contains the
+    given file to disk.
+
+    :param fd: file descriptor of any file or directory on the filesystem
+    :raises OSError: if syncfs() fails or is not available
+    """
+    global _libc_syncfs
+    if _libc_syncfs is None:
+        _libc_syncfs = load_libc_function('syncfs', log_error=False,
+                                          errcheck=True)
+    if _libc_syncfs is noop_libc_function:
+        raise OSError(errno.ENOSYS, 'syncfs() is not available')
+    _libc_syncfs(fd)
+
+
+def _fadvise(fd, offset, length, advice):
+    global _posix_fadvise
+    if _posix_fadvise is None:
+        _posix_fadvise = load_libc_function('posix_fadvise64')
+    ret = _posix_fadvise(fd, ctypes.c_uint64(offset),
+                         ctypes.c_uint64(length), advice)
+    if ret != 0:
+        logging.warning("posix_fadvise64(%(fd)s, %(offset)s, %(length)s, "
+                        "%(advice)s) -> %(ret)s",
+                        {'fd': fd, 'offset': offset, 'length': length,
+                         'advice': advice, 'ret': ret})
+
+
 def drop_buffer_cache(fd, offset, length):
     """
     Drop 'buffer' cache for the given range of the given file.
@@ -864,16 +901,21 @@ def drop_buffer_cache(fd, offset, length):
     :param offset: start offset
     :param length: length
     """
-    global _posix_fadvise
-    if _posix_fadvise is None:
-        _posix_fadvise = load_libc_function('posix_fadvise64')
     # 4 means "POSIX_FADV_DONTNEED"
-    ret = _posix_fadvise(fd, ctypes.c_uint64(offset),
-                         ctypes.c_uint64(length), 4)
-    if ret != 0:
-        logging.warning("posix_fadvise64(%(fd)s, %(offset)s, %(length)s, 4) "
-                        "-> %(ret)s", {'fd': fd, 'offset': offset,
-                                       'length': length, 'ret': ret})
+    _fadvise(fd, offset, length, 4)
+
+
+def readahead_buffer_cache(fd, offset, length):
+    """
+    Ask the kernel to read the given range of the given file into the
+    'buffer' cache, ahead of it being read.
+
+    :param fd: file descriptor
+    :param offset: start offset
+    :param length: length
+    """
+    # 3 means "POSIX_FADV_WILLNEED"
+    _fadvise(fd, offset, length, 3)
 
 
 NORMAL_FORMAT = "%016.05f"
@@ -2756,7 +2798,9 @@ def remove_file(path):
 
 
 def audit_location_generator(devices, datadir, suffix='',
-                             mount_check=True, logger=None):
+                             mount_check=True, logger=None,
+                             devices_filter=None, partitions_filter=None,
+                             hook_post_partition=None):
     """
     Given a devices path and a data directory, yield (path, device,
     partition) for all files in that directory
@@ -2769,10 +2813,19 @@ def audit_location_generator(devices, datadir, suffix='',
     :param mount_check: Flag to check if a mount check should be performed
                     on devices
     :param logger: a logger object
+    :param devices_filter: a callable taking (devices, [list of devices]) as
+                           parameters and returning the devices to walk
+    :param partitions_filter: a callable taking (datadir_path, [list of
+                              parts]) as parameters and returning the
+                              partitions to walk
+    :param hook_post_partition: a callable taking the partition path, called
+                                after a partition has been walked
     """
     device_dir = listdir(devices)
     # randomize devices in case of process restart before sweep completed
     shuffle(device_dir)
+    if devices_filter:
+        device_dir = devices_filter(devices, device_dir)
     for device in device_dir:
         if mount_check and not ismount(os.path.join(devices, device)):
             if logger:
@@ -2787,6 +2840,8 @@ def audit_location_generator(devices, datadir, suffix='',
                 logger.warning(_('Skipping %(datadir)s because %(err)s'),
                                {'datadir': datadir_path, 'err': e})
             continue
+        if partitions_filter:
+            partitions = partitions_filter(datadir_path, partitions)
         for partition in partitions:
             part_path = os.path.join(datadir_path, partition)
             try:
@@ -2816,6 +2871,8 @@ def audit_location_generator(devices, datadir, suffix='',
                             continue
                         path = os.path.join(hash_path, fname)
                         yield path, device, partition
+            if hook_post_partition:
+                hook_post_partition(part_path)
 
 
 def ratelimit_sleep(running_time, max_rate, incr_by=1, rate_buffer=5):
@@ -3768,6 +3825,305 @@ def tpool_reraise(func, *args, **kwargs):
     return resp
 
 
+class ThreadPool(object):
+    """
+    Perform blocking operations in background threads.
+
+    Unlike eventlet's tpool, of which there is one per process, there can be
+    many of these, e.g. one per disk, so that operations on a slow disk only
+    queue up behind each other rather than behind every other operation in
+    the process.
+
+    Call its methods from within greenthreads to green-wait for results
+    without blocking the eventlet hub.
+
+    :param nthreads: the number of worker threads; if less than 1 then
+                     :meth:`run_in_thread` calls its function directly and
+                     :meth:`force_run_in_thread` uses eventlet's tpool
+    """
+
+    def __init__(self, nthreads=2):
+        self.nthreads = nthreads
+        self.queue_depth = 0
+        self.max_queue_depth = 0
+        self.completed = 0
+        self.wait_time = 0.0
+        self._alive = True
+        self._threads = []
+        if nthreads <= 0:
+            return
+        self._run_queue = stdlib_queue.Queue()
+        self._result_queue = stdlib_queue.Queue()
+        # An eventlet Event can only be sent from the hub's own thread, so
+        # each worker puts its results in the result queue and then writes a
+        # byte to a pipe to wake a greenthread in the hub's thread that sends
+        # the results on to the waiting greenthreads.
+        self._rpipe, self._wpipe = os.pipe()
+        flags = fcntl.fcntl(self._rpipe, fcntl.F_GETFL)
+        fcntl.fcntl(self._rpipe, fcntl.F_SETFL, flags | os.O_NONBLOCK)
+        for _junk in range(nthreads):
+            thread = stdlib_threading.Thread(target=self._worker)
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+        eventlet.greenthread.spawn_n(self._consume_results)
+
+    def _worker(self):
+        while True:
+            item = self._run_queue.get()
+            if item is None:
+                break
+            ev, queued_at, func, args, kwargs = item
+            started_at = time.time()
+            try:
+                result = (True, func(*args, **kwargs))
+            except BaseException:
+                result = (False, sys.exc_info())
+            self._result_queue.put((ev, started_at - queued_at) + result)
+            os.write(self._wpipe, b'x')
+
+    def _consume_results(self):
+        while True:
+            try:
+                trampoline(self._rpipe, read=True)
+                data = os.read(self._rpipe, 4096)
+            except OSError as err:
+                if err.errno in (errno.EAGAIN, errno.EINTR):
+                    continue
+                raise
+            while True:
+                try:
+                    ev, wait, success, result = \
+                        self._result_queue.get(block=False)
+                except stdlib_queue.Empty:
+                    break
+                self.queue_depth -= 1
+                self.completed += 1
+                self.wait_time += wait
+                if success:
+                    ev.send(result)
+                else:
+                    ev.send_exception(*result)
+            if not data:
+                # all the workers have exited and closed the pipe
+                os.close(self._rpipe)
+                break
+
+    def _run(self, func, args, kwargs):
+        if not self._alive:
+            raise swift.common.exceptions.ThreadPoolDead()
+        ev = eventlet.event.Event()
+        self.queue_depth += 1
+        self.max_queue_depth = max(self.max_queue_depth, self.queue_depth)
+        self._run_queue.put((ev, time.time(), func, args, kwargs))
+        # only this greenthread waits until the consumer sends the result
+        return ev.wait()
+
+    def run_in_thread(self, func, *args, **kwargs):
+        """
+        Run the given function in a worker thread, or directly if the pool
+        has no threads, and return its result or raise its exception.
+        """
+        if self.nthreads <= 0:
+            if not self._alive:
+                raise swift.common.exceptions.ThreadPoolDead()
+            return func(*args, **kwargs)
+        return self._run(func, args, kwargs)
+
+    def force_run_in_thread(self, func, *args, **kwargs):
+        """
+        Like :meth:`run_in_thread`, but the function is always run in
+        another thread; if the pool has no threads then eventlet's tpool is
+        used. This is for operations, such as fsync, that are too slow to
+        ever run in the hub's thread.
+        """
+        if self.nthreads <= 0:
+            if not self._alive:
+                raise swift.common.exceptions.ThreadPoolDead()
+            return tpool_reraise(func, *args, **kwargs)
+        return self._run(func, args, kwargs)
+
+    def get_stats(self):
+        """
+        :returns: a dict of the number of threads, the number of calls
+                  queued or running (queue_depth) and the most there have
+                  been at once (max_queue_depth), the number of calls
+                  completed and the total time they spent queued (wait_time)
+        """
+        return {'threads': max(self.nthreads, 0),
+                'queue_depth': self.queue_depth,
+                'max_queue_depth': self.max_queue_depth,
+                'completed': self.completed,
+                'wait_time': self.wait_time}
+
+    def terminate(self):
+        """
+        Stop the worker threads once they have finished the calls already
+        queued; calls made after this raise ThreadPoolDead.
+        """
+        if not self._alive:
+            return
+        self._alive = False
+        if self.nthreads <= 0:
+            return
+        for _junk in self._threads:
+            self._run_queue.put(None)
+        for thread in self._threads:
+            thread.join()
+        os.close(self._wpipe)
+
+
+class GroupCommitter(object):
+    """
+    Make the writes of concurrent callers durable in shared sync rounds, or
+    "group commit".
+
+    Callers block, so they must be OS threads, such as the workers of a
+    :class:`ThreadPool`. Each calls :meth:`commit` once its writes have been
+    issued. The first caller of a round waits for up to ``window`` seconds,
+    or until ``max_batch`` callers have joined it, and for the previous
+    round to finish, and then writes back the filesystem of ``path`` once
+    with syncfs() for every caller of the round. :meth:`commit` only returns
+    once the writes of the caller are on disk, just as if it had fsync'ed
+    them itself.
+
+    syncfs() does not report writeback errors through a newly opened
+    descriptor, and only reports them at all on recent kernels, so the round
+    then also fsyncs the files of every caller, through the descriptors
+    their writers still hold, and their directories, each only once. Those
+    fsyncs find nothing left to write, but report any writeback error. Where
+    syncfs() is not available they do all of the writing back. A sync error
+    fails the commits of every caller of the round, even those whose own
+    files synced.
+
+    :param path: a path on the filesystem to sync, e.g. a device's mount
+                 point; it is opened afresh for each round, so that the
+                 device can still be unmounted
+    :param window: the longest time, in seconds, the first caller of a round
+                   waits for others to join it
+    :param max_batch: the number of callers that starts a round without
+                      waiting for the rest of the window
+    """
+
+    class _Round(object):
+
+        def __init__(self):
+            self.members = []
+            self.done = False
+            self.error = None
+
+    def __init__(self, path, window=0.002, max_batch=64):
+        self.path = path
+        self.window = window
+        self.max_batch = max_batch
+        self.rounds = 0
+        self.commits = 0
+        self.max_round_size = 0
+        self.sync_time = 0.0
+        self._use_syncfs = True
+        self._cond = stdlib_threading.Condition()
+        self._gathering = None
+        self._syncing = False
+
+    def commit(self, fds=(), paths=()):
+        """
+        Wait until all writes issued so far by the caller are on disk.
+
+        :param fds: file descriptors of the files written, which must stay
+                    open until this returns
+        :param paths: paths of the directories written
+        :raises OSError: if the writes could not be synced
+        """
+        with self._cond:
+            current = self._gathering
+            if current is None:
+                current = self._gathering = self._Round()
+                leader = True
+            else:
+                leader = False
+            current.members.append((fds, paths))
+            if not leader:
+                if len(current.members) >= self.max_batch:
+                    self._cond.notify_all()
+                while not current.done:
+                    self._cond.wait()
+                if current.error:
+                    raise current.error
+                return
+            deadline = time.time() + self.window
+            while len(current.members) < self.max_batch:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            # while the previous round syncs, more callers join this one
+            while self._syncing:
+                self._cond.wait()
+            self._gathering = None
+            self._syncing = True
+        start = time.time()
+        try:
+            self._sync(current.members)
+        except Exception as err:
+            current.error = err
+        with self._cond:
+            self._syncing = False
+            current.done = True
+            self.rounds += 1
+            self.commits += len(current.members)
+            self.max_round_size = max(self.max_round_size,
+                                      len(current.members))
+            self.sync_time += time.time() - start
+            self._cond.notify_all()
+        if current.error:
+            raise current.error
+
+    def _sync(self, members):
+        if self._use_syncfs:
+            fd = os.open(self.path, os.O_RDONLY)
+            try:
+                syncfs(fd)
+            except OSError as err:
+                if err.errno != errno.ENOSYS:
+                    raise
+                self._use_syncfs = False
+            finally:
+                os.close(fd)
+        # fsync rather than fdatasync, as object metadata is kept in xattrs
+        synced = set()
+        for fds, paths in members:
+            for fd in fds:
+                fsync(fd)
+            for path in paths:
+                if path in synced:
+                    continue
+                synced.add(path)
+                try:
+                    fd = os.open(path, os.O_RDONLY)
+                except OSError as err:
+                    if err.errno == errno.ENOENT:
+                        # removed since, so nothing to sync
+                        continue
+                    raise
+                try:
+                    fsync(fd)
+                finally:
+                    os.close(fd)
+
+    def get_stats(self):
+        """
+        :returns: a dict of the number of sync rounds, the number of commits
+                  they covered, the most commits covered by one round
+                  (max_round_size) and the total time spent syncing
+                  (sync_time)
+        """
+        with self._cond:
+            return {'rounds': self.rounds,
+                    'commits': self.commits,
+                    'max_round_size': self.max_round_size,
+                    'sync_time': self.sync_time}
+
+
 def ismount(path):
     """
     Test whether a path is a mount point. This will catch any
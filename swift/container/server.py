@@ -20,6 +20,7 @@ import traceback
 import math
 from swift import gettext_ as _
 
+import six
 from eventlet import Timeout
 
 import swift.common.db
@@ -525,6 +526,89 @@ class ContainerController(BaseStorageServer):
             ret.status_int = HTTP_NO_CONTENT
         return ret
 
+    def _make_update_record(self, update):
+        """
+        Make the DB record of an object update, as sent in the body of a
+        MERGE request.
+
+        :param update: a dict of the ``op`` (``PUT`` or ``DELETE``), the
+                       ``obj`` name and the ``headers`` of the update, as
+                       they would have been sent in a request of its own
+        :returns: a record dict for :meth:`ContainerBroker.put_records`
+        :raises ValueError: if the update is invalid
+        """
+        try:
+            op, obj = update['op'], update['obj']
+            headers = HeaderKeyDict(update['headers'])
+            timestamp = Timestamp(headers['x-timestamp']).internal
+            policy_index = int(headers.get(
+                'X-Backend-Storage-Policy-Index', 0))
+        except (KeyError, TypeError, ValueError):
+            raise ValueError('Invalid update %r' % (update,))
+        if six.PY2 and isinstance(obj, six.text_type):
+            obj = obj.encode('utf-8')
+        if not obj or not check_utf8(obj):
+            raise ValueError('Invalid object name %r' % (obj,))
+        if POLICIES.get_by_index(policy_index) is None:
+            raise ValueError(
+                'Invalid X-Storage-Policy-Index %r' % policy_index)
+        record = {'name': obj, 'created_at': timestamp,
+                  'storage_policy_index': policy_index,
+                  'ctype_timestamp': None, 'meta_timestamp': None}
+        if op == 'PUT':
+            try:
+                record.update(
+                    size=int(headers['x-size']),
+                    content_type=headers['x-content-type'],
+                    etag=headers['x-etag'], deleted=0,
+                    ctype_timestamp=headers.get('x-content-type-timestamp'),
+                    meta_timestamp=headers.get('x-meta-timestamp'))
+            except (KeyError, TypeError, ValueError):
+                raise ValueError('Invalid update %r' % (update,))
+            if not all(isinstance(record[key], six.string_types)
+                       for key in ('content_type', 'etag')):
+                raise ValueError('Invalid update %r' % (update,))
+        elif op == 'DELETE':
+            record.update(size=0, content_type='application/deleted',
+                          etag='noetag', deleted=1)
+        else:
+            raise ValueError('Invalid op %r' % (op,))
+        return record
+
+    @public
+    @timing_stats()
+    def MERGE(self, req):
+        """
+        Handle HTTP MERGE request: merge a batch of object updates to the
+        container into its DB at once. The body is a JSON list of updates,
+        see :meth:`_make_update_record`. Either all of the updates are
+        merged, or none are.
+        """
+        drive, part, account, container = split_and_validate_path(req, 4)
+        if not check_drive(self.root, drive, self.mount_check):
+            return HTTPInsufficientStorage(drive=drive, request=req)
+        try:
+            updates = json.load(req.environ['wsgi.input'])
+            if not isinstance(updates, list):
+                raise ValueError('Expected a list of updates')
+            records = [self._make_update_record(update)
+                       for update in updates]
+        except ValueError as err:
+            return HTTPBadRequest(body=str(err), content_type='text/plain')
+        broker = self._get_container_broker(drive, part, account, container)
+        if records and \
+                account.startswith(self.auto_create_account_prefix) and \
+                not os.path.exists(broker.db_file):
+            try:
+                broker.initialize(records[0]['created_at'],
+                                  records[0]['storage_policy_index'])
+            except DatabaseAlreadyExists:
+                pass
+        if not os.path.exists(broker.db_file):
+            return HTTPNotFound()
+        broker.put_records(records)
+        return HTTPNoContent(request=req)
+
     @public
     @replication
     @timing_stats(sample_rate=0.01)
@@ -0,0 +1,232 @@
+# Copyright (c) 2010-2012 OpenStack Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+An append-only journal of async updates, the container updates that an
+object server could not make, as an alternative to a pickle file per update
+in the async_pending dirs.
+
+The journal of each storage policy on a device is a dir of numbered segment
+files. Object servers append records to the newest segment, starting a new
+one once it is ``segment_size`` bytes long. The object updater seals the
+journal, so that appends go to a new segment, and then reads the sealed
+segments sequentially, keeps only the newest update of each object, and
+appends the updates that fail again to the journal before it removes the
+sealed segments.
+
+Each record is a header of a magic string, the length of the pickled update
+and its CRC32, followed by the pickled update. A record torn by a crash, or
+otherwise corrupt, is skipped by looking for the magic string of the next.
+"""
+
+import errno
+import os
+import struct
+import zlib
+
+import six.moves.cPickle as pickle
+
+from swift.common.utils import fdatasync, listdir, lock_path
+
+JOURNAL_RECORD_MAGIC = b'SWAJ'
+JOURNAL_RECORD_HEADER = struct.Struct('!4sII')
+JOURNAL_SEGMENT_SUFFIX = '.journal'
+DEFAULT_JOURNAL_SEGMENT_SIZE = 16 * 1024 * 1024
+PICKLE_PROTOCOL = 2
+
+
+def pack_record(ohash, timestamp, update):
+    """
+    Pack an async update into a journal record.
+
+    :param ohash: the hash of the object's path
+    :param timestamp: the internal form of the update's timestamp
+    :param update: the update dict, as written to an async pending file
+    :returns: the record as a byte string
+    """
+    payload = pickle.dumps((ohash, timestamp, update), PICKLE_PROTOCOL)
+    return JOURNAL_RECORD_HEADER.pack(
+        JOURNAL_RECORD_MAGIC, len(payload),
+        zlib.crc32(payload) & 0xffffffff) + payload
+
+
+def iter_payloads(buf, on_error=None):
+    """
+    Iterate over the payloads of the records in a journal segment.
+
+    :param buf: the contents of the segment
+    :param on_error: callable called with the offset of each stretch of
+                     bytes that are skipped because they are not a whole and
+                     valid record
+    :returns: an iterator of the payloads
+    """
+    offset = 0
+    end = len(buf)
+    while offset < end:
+        if end - offset >= JOURNAL_RECORD_HEADER.size:
+            magic, length, crc = JOURNAL_RECORD_HEADER.unpack_from(buf, offset)
+            start = offset + JOURNAL_RECORD_HEADER.size
+            payload = buf[start:start + length]
+            if magic == JOURNAL_RECORD_MAGIC and len(payload) == length and \
+                    zlib.crc32(payload) & 0xffffffff == crc:
+                yield payload
+                offset = start + length
+                continue
+        if on_error:
+            on_error(offset)
+        next_offset = buf.find(JOURNAL_RECORD_MAGIC, offset + 1)
+        offset = end if next_offset < 0 else next_offset
+
+
+def iter_segment(path, on_error=None):
+    """
+    Iterate over the async updates in a journal segment.
+
+    :param path: the path of the segment
+    :param on_error: callable called with the offset of each record that is
+                     skipped because it is torn or corrupt
+    :returns: an iterator of (ohash, timestamp, update) tuples
+    """
+    with open(path, 'rb') as fp:
+        buf = fp.read()
+    for payload in iter_payloads(buf, on_error):
+        try:
+            ohash, timestamp, update = pickle.loads(payload)
+        except Exception:
+            # the CRC matched, so this was written as it is
+            if on_error:
+                on_error(None)
+            continue
+        yield ohash, timestamp, update
+
+
+class AsyncJournal(object):
+    """
+    The journal of the async updates of one storage policy on one device.
+
+    :param path: the dir of the journal's segments
+    :param segment_size: the size at which appends move to a new segment
+    :param lock_timeout: the most seconds to wait for the journal's lock
+    """
+
+    def __init__(self, path, segment_size=DEFAULT_JOURNAL_SEGMENT_SIZE,
+                 lock_timeout=10):
+        self.path = path
+        self.segment_size = segment_size
+        self.lock_timeout = lock_timeout
+        self._fd = None
+        self._seq = None
+
+    def segment_path(self, seq):
+        return os.path.join(self.path, '%016x%s' % (
+            seq, JOURNAL_SEGMENT_SUFFIX))
+
+    def list_segments(self):
+        """
+        :returns: the sorted sequence numbers of the journal's segments
+        """
+        segments = []
+        for name in listdir(self.path):
+            if not name.endswith(JOURNAL_SEGMENT_SUFFIX):
+                continue
+            try:
+                segments.append(int(name[:-len(JOURNAL_SEGMENT_SUFFIX)], 16))
+            except ValueError:
+                continue
+        return sorted(segments)
+
+    def _close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = self._seq = None
+
+    def _current_fd(self):
+        # the caller must hold the journal's lock
+        segments = self.list_segments()
+        if self._fd is not None:
+            stat = os.fstat(self._fd)
+            # move on if the segment is full, has been sealed by a newer one
+            # being started, or has even been removed by the updater, after
+            # which nothing would ever read what is appended to it
+            if stat.st_size >= self.segment_size or not stat.st_nlink or \
+                    not segments or segments[-1] != self._seq:
+                self._close()
+        if self._fd is None:
+            seq = segments[-1] if segments else 0
+            if segments and os.path.getsize(
+                    self.segment_path(seq)) >= self.segment_size:
+                seq += 1
+            self._fd = os.open(self.segment_path(seq),
+                               os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            self._seq = seq
+        return self._fd
+
+    def append(self, ohash, timestamp, update):
+        """
+        Durably append an async update to the journal.
+
+        :param ohash: the hash of the object's path
+        :param timestamp: the internal form of the update's timestamp
+        :param update: the update dict, as written to an async pending file
+        """
+        record = pack_record(ohash, timestamp, update)
+        with lock_path(self.path, self.lock_timeout):
+            fd = self._current_fd()
+            while record:
+                record = record[os.write(fd, record):]
+            fdatasync(fd)
+
+    def seal(self):
+        """
+        Move appends to a new segment, so that the existing segments no
+        longer change.
+
+        :returns: the paths of the sealed segments, oldest first
+        """
+        with lock_path(self.path, self.lock_timeout):
+            segments = self.list_segments()
+            if not segments:
+                return []
+            last = segments[-1]
+            if os.path.getsize(self.segment_path(last)) == 0:
+                # appends are already going to an empty segment
+                segments = segments[:-1]
+            else:
+                os.close(os.open(self.segment_path(last + 1),
+                                 os.O_WRONLY | os.O_CREAT, 0o644))
+        return [self.segment_path(seq) for seq in segments]
+
+    def count_records(self):
+        """
+        :returns: the number of records in the journal's segments
+        """
+        count = 0
+        for seq in self.list_segments():
+            try:
+                with open(self.segment_path(seq), 'rb') as fp:
+                    buf = fp.read()
+            except IOError as err:
+                if err.errno != errno.ENOENT:
+                    raise
+                continue
+            count += sum(1 for _junk in iter_payloads(buf))
+        return count
+
+    def close(self):
+        """
+        Close the segment that appends go to.
+        """
+        with lock_path(self.path, self.lock_timeout):
+            self._close()
@@ -31,12 +31,16 @@ are also not considered part of the backend API.
 """
 
 import six.moves.cPickle as pickle
+import binascii
 import copy
 import errno
 import fcntl
+import importlib
 import json
 import os
 import re
+import stat
+import struct
 import time
 import uuid
 import hashlib
@@ -47,7 +51,7 @@ from os.path import basename, dirname, exists, join, splitext
 from random import shuffle
 from tempfile import mkstemp
 from contextlib import contextmanager
-from collections import defaultdict
+from collections import defaultdict, OrderedDict
 from datetime import timedelta
 
 from eventlet import Timeout
@@ -61,44 +65,89 @@ from swift.common.constraints import check_drive
 from swift.common.request_helpers import is_sys_meta
 from swift.common.utils import mkdirs, Timestamp, \
     storage_directory, hash_path, renamer, fallocate, fsync, fdatasync, \
-    fsync_dir, drop_buffer_cache, lock_path, write_pickle, \
-    config_true_value, listdir, split_path, remove_file, \
+    fsync_dir, drop_buffer_cache, readahead_buffer_cache, lock_path, \
+    write_pickle, config_true_value, listdir, split_path, remove_file, \
     get_md5_socket, F_SETPIPE_SZ, decode_timestamps, encode_timestamps, \
     tpool_reraise, MD5_OF_EMPTY_STRING, link_fd_to_path, o_tmpfile_supported, \
-    O_TMPFILE, makedirs_count, replace_partition_in_path
-from swift.common.splice import splice, tee
+    O_TMPFILE, makedirs_count, replace_partition_in_path, ThreadPool, \
+    GroupCommitter, stdlib_threading
+from swift.common.splice import splice, tee, sendfile
 from swift.common.exceptions import DiskFileQuarantined, DiskFileNotExist, \
     DiskFileCollision, DiskFileNoSpace, DiskFileDeviceUnavailable, \
     DiskFileDeleted, DiskFileError, DiskFileNotOpen, PathNotDir, \
     ReplicationLockTimeout, DiskFileExpired, DiskFileXattrNotSupported, \
     DiskFileBadMetadataChecksum
 from swift.common.swob import multi_range_iterator
+from swift.obj.async_journal import AsyncJournal, \
+    DEFAULT_JOURNAL_SEGMENT_SIZE
 from swift.common.storage_policy import (
     get_policy_string, split_policy_string, PolicyError, POLICIES,
-    REPL_POLICY, EC_POLICY)
+    REPL_POLICY, EC_POLICY, DEFAULT_DISKFILE_BACKEND)
 from functools import partial
 
 
 PICKLE_PROTOCOL = 2
 DEFAULT_RECLAIM_AGE = timedelta(weeks=1).total_seconds()
+DEFAULT_METADATA_CACHE_RACY_WINDOW = 1.0
 HASH_FILE = 'hashes.pkl'
+HASH_BIN_FILE = 'hashes.bin'
 HASH_INVALIDATIONS_FILE = 'hashes.invalid'
+HASH_MANIFEST_FILE = 'hashes.manifest'
+# hashes.bin is a fixed size file with a slot for the md5 of each of the 4096
+# possible suffixes of a partition: a header is followed by a bitmap of the
+# suffixes that are present, a bitmap of the suffixes whose hash is valid and
+# then the slots; an invalidation in place also moves the header's updated
+# time on, so that the file always changes and a racing rehash notices
+HASH_BIN_MAGIC = b'SWHS'
+HASH_BIN_VERSION = 1
+HASH_BIN_HEADER = struct.Struct('!4sBB2xd')
+HASH_BIN_SUFFIXES = 4096
+HASH_BIN_BITMAP_SIZE = HASH_BIN_SUFFIXES // 8
+HASH_BIN_PRESENT_OFFSET = HASH_BIN_HEADER.size
+HASH_BIN_VALID_OFFSET = HASH_BIN_PRESENT_OFFSET + HASH_BIN_BITMAP_SIZE
+HASH_BIN_SLOTS_OFFSET = HASH_BIN_VALID_OFFSET + HASH_BIN_BITMAP_SIZE
+HASH_BIN_SIZE = HASH_BIN_SLOTS_OFFSET + HASH_BIN_SUFFIXES * 16
+# the hash tree of a partition has a level of suffix groups, named by the
+# leading characters of their suffixes, between the partition and its suffixes
+HASH_TREE_GROUP_LEN = 2
 METADATA_KEY = b'user.swift.metadata'
 METADATA_CHECKSUM_KEY = b'user.swift.metadata_checksum'
+# metadata is either pickled or, in the binary format, a header is followed
+# by the NUL separated keys and values
+METADATA_FORMATS = ('pickle', 'binary')
+DEFAULT_METADATA_FORMAT = 'pickle'
+METADATA_BIN_MAGIC = b'SWMD'
+METADATA_BIN_VERSION = 1
+METADATA_BIN_HEADER = struct.Struct('!4sBxH')
 DROP_CACHE_WINDOW = 1024 * 1024
+DEFAULT_HOT_OBJECT_CACHE_SIZE = 256 * 1024 * 1024
+DEFAULT_HOT_OBJECT_TRACKING_SIZE = 100000
+# a read of a data file is sequential, and is read ahead of, once it has
+# read this many disk chunks in a row
+SEQUENTIAL_READ_CHUNKS = 2
 # These are system-set metadata keys that cannot be changed with a POST.
 # They should be lowercase.
 RESERVED_DATAFILE_META = {'content-length', 'deleted', 'etag'}
 DATAFILE_SYSTEM_META = {'x-static-large-object'}
 DATADIR_BASE = 'objects'
 ASYNCDIR_BASE = 'async_pending'
+ASYNC_JOURNAL_BASE = 'async_journal'
 TMP_BASE = 'tmp'
 get_data_dir = partial(get_policy_string, DATADIR_BASE)
 get_async_dir = partial(get_policy_string, ASYNCDIR_BASE)
+get_async_journal_dir = partial(get_policy_string, ASYNC_JOURNAL_BASE)
 get_tmp_dir = partial(get_policy_string, TMP_BASE)
 MIN_TIME_UPDATE_AUDITOR_STATUS = 60
 # This matches rsync tempfiles, like ".<timestamp>.data.Xy095a"
 RE_RSYNC_TEMPFILE = re.compile(r'^\..*\.([a-zA-Z0-9_]){6}$')
+# the order in which the timestamps of an object's on disk files are checked
+# for the timestamps yielded by yield_hashes
+ONDISK_TIMESTAMP_KEYS = (
+    ('ts_meta', 'meta_info', 'timestamp'),
+    ('ts_data', 'data_info', 'timestamp'),
+    ('ts_data', 'ts_info', 'timestamp'),
+    ('ts_ctype', 'ctype_info', 'ctype_timestamp'),
+)
 
 
 def _get_filename(fd):
@@ -151,9 +200,121 @@ def _decode_metadata(metadata):
     return dict(((to_str(k), to_str(v)) for k, v in metadata.items()))
 
 
+def _join_metadata_fields(fields):
+    """
+    Join the keys and values of metadata with NULs.
+
+    :param fields: a list of native or byte strings
+    :returns: the utf-8 encoded joined fields, or None if they could not be
+              joined
+    """
+    try:
+        joined = '\x00'.join(fields)
+    except (TypeError, UnicodeError):
+        return None
+    if isinstance(joined, bytes):
+        return joined
+    try:
+        if six.PY2:
+            return joined.encode('utf8')
+        return joined.encode('utf8', 'surrogateescape')
+    except UnicodeError:
+        return None
+
+
+def _pack_binary_metadata(metadata):
+    """
+    Serialize metadata in the binary format: a header is followed by the
+    keys and then the values of the metadata, separated by NULs, so that
+    encoding and decoding each take a single join or split.
+
+    :param metadata: a dict
+    :returns: the serialized metadata, or None if the metadata has keys or
+              values that are not strings, or that contain a NUL
+    """
+    if len(metadata) > 0xffff:
+        return None
+    fields = list(metadata.keys()) + list(metadata.values())
+    body = _join_metadata_fields(fields)
+    if body is None:
+        # mixed native, unicode and byte strings
+        metadata = _encode_metadata(metadata)
+        fields = list(metadata.keys()) + list(metadata.values())
+        try:
+            body = b'\x00'.join(fields)
+        except TypeError:
+            return None
+    if fields and body.count(b'\x00') != len(fields) - 1:
+        return None
+    return METADATA_BIN_HEADER.pack(
+        METADATA_BIN_MAGIC, METADATA_BIN_VERSION, len(metadata)) + body
+
+
+def _unpack_binary_metadata(metastr):
+    """
+    Deserialize metadata in the binary format.
+
+    :param metastr: the serialized metadata
+    :returns: a dict of native strings
+    :raises ValueError: if the metadata is not valid
+    """
+    try:
+        _magic, version, count = METADATA_BIN_HEADER.unpack_from(metastr)
+    except struct.error as err:
+        raise ValueError('Truncated metadata: %s' % err)
+    if version != METADATA_BIN_VERSION:
+        raise ValueError('Unsupported metadata version %d' % version)
+    body = metastr[METADATA_BIN_HEADER.size:]
+    if not six.PY2:
+        body = body.decode('utf8', 'surrogateescape')
+    fields = body.split('\x00') if count else []
+    if len(fields) != 2 * count or (not count and body):
+        raise ValueError('Metadata has %d fields, expected %d' % (
+            len(fields), 2 * count))
+    return dict(zip(fields[:count], fields[count:]))
+
+
+def serialize_metadata(metadata, metadata_format=DEFAULT_METADATA_FORMAT):
+    """
+    Serialize the metadata of an object file.
+
+    Metadata that the binary format cannot represent, i.e. that has keys or
+    values that are not strings or that contain a NUL, is pickled whatever
+    the format.
+
+    :param metadata: a dict
+    :param metadata_format: one of METADATA_FORMATS
+    :returns: the serialized metadata
+    """
+    if metadata_format == 'binary':
+        metastr = _pack_binary_metadata(metadata)
+        if metastr is not None:
+            return metastr
+    return pickle.dumps(_encode_metadata(metadata), PICKLE_PROTOCOL)
+
+
+def deserialize_metadata(metastr):
+    """
+    Deserialize the metadata of an object file, in any of METADATA_FORMATS.
+
+    :param metastr: the serialized metadata
+    :returns: a dict
+    """
+    if metastr[:len(METADATA_BIN_MAGIC)] == METADATA_BIN_MAGIC:
+        return _unpack_binary_metadata(metastr)
+    if six.PY2:
+        metadata = pickle.loads(metastr)
+    else:
+        metadata = pickle.loads(metastr, encoding='bytes')
+    # strings are utf-8 encoded when written, but have not always been
+    # (see https://bugs.launchpad.net/swift/+bug/1678018) so encode them again
+    # when read
+    return _decode_metadata(metadata)
+
+
 def read_metadata(fd, add_missing_checksum=False):
     """
-    Helper function to read the pickled metadata from an object file.
+    Helper function to read the serialized metadata from an object file.
 
     :param fd: file descriptor or filename to load the metadata from
     :param add_missing_checksum: if set and checksum is missing, add it
@@ -200,24 +361,20 @@ def read_metadata(fd, add_missing_checksum=False):
                 "stored checksum='%s', computed='%s'" % (
                     fd, metadata_checksum, computed_checksum))
 
-    # strings are utf-8 encoded when written, but have not always been
-    # (see https://bugs.launchpad.net/swift/+bug/1678018) so encode them again
-    # when read
-    if six.PY2:
-        metadata = pickle.loads(metadata)
-    else:
-        metadata = pickle.loads(metadata, encoding='bytes')
-    return _decode_metadata(metadata)
+    return deserialize_metadata(metadata)
 
 
-def write_metadata(fd, metadata, xattr_size=65536):
+def write_metadata(fd, metadata, xattr_size=65536,
+                   metadata_format=DEFAULT_METADATA_FORMAT):
     """
-    Helper function to write pickled metadata for an object file.
+    Helper function to write serialized metadata for an object file.
 
     :param fd: file descriptor or filename to write the metadata
     :param metadata: metadata to write
+    :param metadata_format: the format to serialize the metadata in, one of
+                            METADATA_FORMATS
     """
-    metastr = pickle.dumps(_encode_metadata(metadata), PICKLE_PROTOCOL)
+    metastr = serialize_metadata(metadata, metadata_format)
     metastr_md5 = hashlib.md5(metastr).hexdigest().encode('ascii')
     key = 0
     try:
@@ -302,13 +459,117 @@ def quarantine_renamer(device_path, corrupted_file_path):
     return to_dir
 
 
+def _read_binary_hashes(partition_dir):
+    """
+    Read the existing hashes.bin
+
+    :returns: a dict, the suffix hashes (if any), the key 'valid' will be False
+              if hashes.bin is corrupt or cannot be read; or None if
+              hashes.bin does not exist
+    """
+    hashes_file = join(partition_dir, HASH_BIN_FILE)
+    try:
+        fd = os.open(hashes_file, os.O_RDONLY)
+    except OSError as e:
+        if e.errno == errno.ENOENT:
+            return None
+        return {'valid': False}
+    try:
+        chunks = []
+        size = 0
+        while size < HASH_BIN_SIZE:
+            chunk = os.read(fd, HASH_BIN_SIZE - size)
+            if not chunk:
+                break
+            chunks.append(chunk)
+            size += len(chunk)
+        data = b''.join(chunks)
+    except OSError:
+        return {'valid': False}
+    finally:
+        os.close(fd)
+    if len(data) != HASH_BIN_SIZE:
+        return {'valid': False}
+    magic, version, valid, updated = HASH_BIN_HEADER.unpack_from(data)
+    if magic != HASH_BIN_MAGIC or version != HASH_BIN_VERSION:
+        return {'valid': False}
+    hashes = {'valid': bool(valid), 'updated': updated}
+    present = bytearray(data[HASH_BIN_PRESENT_OFFSET:HASH_BIN_VALID_OFFSET])
+    hashed = bytearray(data[HASH_BIN_VALID_OFFSET:HASH_BIN_SLOTS_OFFSET])
+    for byte_index, bits in enumerate(present):
+        if not bits:
+            continue
+        for bit in range(8):
+            if not bits & (1 << bit):
+                continue
+            index = byte_index * 8 + bit
+            suffix = '%03x' % index
+            if hashed[byte_index] & (1 << bit):
+                offset = HASH_BIN_SLOTS_OFFSET + index * 16
+                hash_ = binascii.hexlify(data[offset:offset + 16])
+                if not six.PY2:
+                    hash_ = hash_.decode('ascii')
+                hashes[suffix] = hash_
+            else:
+                hashes[suffix] = None
+    return hashes
+
+
+def _pack_binary_hashes(hashes):
+    """
+    Pack suffix hashes in the hashes.bin format.
+
+    :returns: the packed hashes, or None if any of the hashes cannot be kept
+              in hashes.bin, e.g. the dicts of fragment hashes of an EC policy
+    """
+    buf = bytearray(HASH_BIN_SIZE)
+    HASH_BIN_HEADER.pack_into(buf, 0, HASH_BIN_MAGIC, HASH_BIN_VERSION,
+                              int(bool(hashes['valid'])), hashes['updated'])
+    for suffix, hash_ in hashes.items():
+        if suffix in ('valid', 'updated'):
+            continue
+        if isinstance(suffix, six.binary_type):
+            suffix = suffix.decode('ascii', 'replace')
+        try:
+            index = int(suffix, 16)
+        except (TypeError, ValueError):
+            return None
+        if suffix != '%03x' % index or index >= HASH_BIN_SUFFIXES:
+            return None
+        byte_index, bit = divmod(index, 8)
+        buf[HASH_BIN_PRESENT_OFFSET + byte_index] |= 1 << bit
+        if hash_ is None:
+            continue
+        if not isinstance(hash_, six.string_types) or len(hash_) != 32:
+            return None
+        try:
+            digest = binascii.unhexlify(hash_)
+        except (TypeError, binascii.Error):
+            return None
+        buf[HASH_BIN_VALID_OFFSET + byte_index] |= 1 << bit
+        offset = HASH_BIN_SLOTS_OFFSET + index * 16
+        buf[offset:offset + 16] = digest
+    return bytes(buf)
+
+
+def _unlink_hashes_file(hashes_file):
+    try:
+        os.unlink(hashes_file)
+    except OSError as e:
+        if e.errno != errno.ENOENT:
+            raise
+
+
 def read_hashes(partition_dir):
     """
-    Read the existing hashes.pkl
+    Read the existing hashes.bin, or hashes.pkl if there is no hashes.bin
 
     :returns: a dict, the suffix hashes (if any), the key 'valid' will be False
-              if hashes.pkl is corrupt, cannot be read or does not exist
+              if the hashes file is corrupt, cannot be read or does not exist
     """
+    hashes = _read_binary_hashes(partition_dir)
+    if hashes is not None:
+        return hashes
     hashes_file = join(partition_dir, HASH_FILE)
     hashes = {'valid': False}
     try:
@@ -330,27 +591,41 @@ def read_hashes(partition_dir):
     return hashes
 
 
-def write_hashes(partition_dir, hashes):
+def write_hashes(partition_dir, hashes, binary=False):
     """
-    Write hashes to hashes.pkl
+    Write hashes to hashes.pkl, or to hashes.bin if binary is True and the
+    hashes can be kept in it. Whichever of the two files was not written is
+    removed, so that read_hashes always finds the latest hashes.
 
     The updated key is added to hashes before it is written.
     """
-    hashes_file = join(partition_dir, HASH_FILE)
     # 'valid' key should always be set by the caller; however, if there's a bug
     # setting invalid is most safe
     hashes.setdefault('valid', False)
     hashes['updated'] = time.time()
-    write_pickle(hashes, hashes_file, partition_dir, PICKLE_PROTOCOL)
+    packed = _pack_binary_hashes(hashes) if binary else None
+    if packed is None:
+        write_pickle(hashes, join(partition_dir, HASH_FILE), partition_dir,
+                     PICKLE_PROTOCOL)
+        _unlink_hashes_file(join(partition_dir, HASH_BIN_FILE))
+        return
+    fd, tmppath = mkstemp(dir=partition_dir, suffix='.tmp')
+    with os.fdopen(fd, 'wb') as fo:
+        fo.write(packed)
+        fo.flush()
+        os.fsync(fd)
+        renamer(tmppath, join(partition_dir, HASH_BIN_FILE))
+    _unlink_hashes_file(join(partition_dir, HASH_FILE))
 
 
-def consolidate_hashes(partition_dir):
+def consolidate_hashes(partition_dir, binary=False):
     """
     Take what's in hashes.pkl and hashes.invalid, combine them, write the
     result back to hashes.pkl, and clear out hashes.invalid.
 
     :param partition_dir: absolute path to partition dir containing hashes.pkl
                           and hashes.invalid
+    :param binary: passed to write_hashes
 
     :returns: a dict, the suffix hashes (if any), the key 'valid' will be False
               if hashes.pkl is corrupt, cannot be read or does not exist
@@ -372,7 +647,7 @@ def consolidate_hashes(partition_dir):
                 raise
 
         if found_invalidation_entry:
-            write_hashes(partition_dir, hashes)
+            write_hashes(partition_dir, hashes, binary=binary)
             # Now that all the invalidations are reflected in hashes.pkl, it's
             # safe to clear out the invalidations file.
             with open(invalidations_file, 'wb') as inv_fh:
@@ -381,6 +656,69 @@ def consolidate_hashes(partition_dir):
         return hashes
 
 
+def get_suffix_group(suffix):
+    """
+    :returns: the name of the suffix group that a suffix is in
+    """
+    return suffix[:HASH_TREE_GROUP_LEN]
+
+
+def get_hash_tree(hashes):
+    """
+    Build the upper levels of a partition's hash tree from its suffix hashes,
+    each of which is already the hash of the object hashes in its suffix.
+
+    The hash of a suffix group covers the hashes of its suffixes, and the
+    hash of the partition covers the hashes of its suffix groups, so two
+    partitions whose hashes match need not be compared further, and only the
+    suffixes of groups whose hashes differ need be.
+
+    :param hashes: a dict of suffix => suffix hash, as returned by
+                   :meth:`BaseDiskFileManager.get_hashes`
+    :returns: a tuple of (root, groups) where root is the hash of the
+              partition and groups is a dict of suffix group => group hash
+    """
+    group_md5s = {}
+    for suffix in sorted(hashes):
+        group = get_suffix_group(suffix)
+        if group not in group_md5s:
+            group_md5s[group] = hashlib.md5()
+        group_md5s[group].update(('%s %s\n' % (suffix, hashes[suffix])).encode(
+            'utf-8'))
+    groups = dict((group, md5.hexdigest())
+                  for group, md5 in group_md5s.items())
+    root = hashlib.md5()
+    for group in sorted(groups):
+        root.update(('%s %s\n' % (group, groups[group])).encode('utf-8'))
+    return root.hexdigest(), groups
+
+
+def has_invalidated_hashes(partition_dir):
+    """
+    Check whether any of a partition's suffix hashes have been invalidated,
+    by a change to the suffix, since they were last calculated.
+
+    :param partition_dir: absolute path to a partition dir
+    :returns: True if hashes.invalid is not empty or hashes.bin has a suffix
+              that is present but not valid
+    """
+    try:
+        if os.path.getsize(join(partition_dir, HASH_INVALIDATIONS_FILE)):
+            return True
+    except OSError:
+        pass
+    try:
+        with open(join(partition_dir, HASH_BIN_FILE), 'rb') as fp:
+            bitmaps = bytearray(fp.read(HASH_BIN_SLOTS_OFFSET))
+    except (IOError, OSError):
+        return False
+    if len(bitmaps) != HASH_BIN_SLOTS_OFFSET:
+        return False
+    present = bitmaps[HASH_BIN_PRESENT_OFFSET:HASH_BIN_VALID_OFFSET]
+    valid = bitmaps[HASH_BIN_VALID_OFFSET:HASH_BIN_SLOTS_OFFSET]
+    return any(p & ~v for p, v in zip(present, valid))
+
+
 def invalidate_hash(suffix_dir):
     """
     Invalidates the hash for a suffix_dir in the partition's hashes file.
@@ -394,8 +732,110 @@ def invalidate_hash(suffix_dir):
     invalidations_file = join(partition_dir, HASH_INVALIDATIONS_FILE)
     if not isinstance(suffix, bytes):
         suffix = suffix.encode('utf-8')
-    with lock_path(partition_dir), open(invalidations_file, 'ab') as inv_fh:
-        inv_fh.write(suffix + b"\n")
+    with lock_path(partition_dir):
+        if _invalidate_binary_hash(partition_dir, suffix):
+            return
+        with open(invalidations_file, 'ab') as inv_fh:
+            inv_fh.write(suffix + b"\n")
+
+
+def _invalidate_binary_hash(partition_dir, suffix):
+    """
+    Invalidate the hash of a suffix in place in hashes.bin by marking it
+    present but not valid, and moving on the updated time of its header. The
+    suffix may already be marked invalid, e.g. while it is being rehashed, so
+    without the new updated time the rehash could not tell that it had been
+    invalidated again. The caller must hold the partition's lock.
+
+    :returns: True if the hash was invalidated, False if there is no usable
+              hashes.bin, in which case the invalidation must be recorded in
+              hashes.invalid
+    """
+    try:
+        index = int(suffix, 16)
+    except ValueError:
+        return False
+    if suffix != b'%03x' % index or index >= HASH_BIN_SUFFIXES:
+        return False
+    try:
+        fd = os.open(join(partition_dir, HASH_BIN_FILE), os.O_RDWR)
+    except OSError:
+        return False
+    try:
+        if os.fstat(fd).st_size != HASH_BIN_SIZE:
+            return False
+        byte_index, bit = divmod(index, 8)
+        for offset, set_bit in (
+                (HASH_BIN_PRESENT_OFFSET + byte_index, True),
+                (HASH_BIN_VALID_OFFSET + byte_index, False)):
+            os.lseek(fd, offset, os.SEEK_SET)
+            bits = bytearray(os.read(fd, 1))
+            if set_bit:
+                bits[0] |= 1 << bit
+            else:
+                bits[0] &= ~(1 << bit) & 0xff
+            os.lseek(fd, offset, os.SEEK_SET)
+            os.write(fd, bytes(bits))
+        os.lseek(fd, 0, os.SEEK_SET)
+        header = bytearray(os.read(fd, HASH_BIN_HEADER.size))
+        magic, version, valid, updated = HASH_BIN_HEADER.unpack_from(header)
+        # the updated time must change even if the clock has not moved on
+        HASH_BIN_HEADER.pack_into(header, 0, magic, version, valid,
+                                  max(time.time(), updated + 1e-6))
+        os.lseek(fd, 0, os.SEEK_SET)
+        os.write(fd, bytes(header))
+    finally:
+        os.close(fd)
+    return True
+
+
+def _suffix_hash_key(suffix_hash):
+    """
+    Get a string that identifies a suffix hash, which for EC policies is a
+    dict of hashes keyed by fragment index, so that it can be kept in the
+    hash manifest.
+    """
+    if isinstance(suffix_hash, dict):
+        return ','.join('%s:%s' % item for item in sorted(
+            (str(fi), hsh) for fi, hsh in suffix_hash.items()))
+    return suffix_hash
+
+
+def read_hash_manifest(partition_dir):
+    """
+    Read the hashes.manifest of a partition.
+
+    The manifest maps each suffix to a list of [suffix hash key, object
+    timestamps], where object timestamps maps each object hash in the suffix
+    to a list of [ts_data, ts_meta, ts_ctype, deleted]; the timestamps are
+    internal timestamp strings or None and deleted is True if ts_data is the
+    timestamp of a tombstone.
+
+    :returns: a dict, empty if hashes.manifest cannot be read or does not
+              exist
+    """
+    manifest_file = join(partition_dir, HASH_MANIFEST_FILE)
+    try:
+        with open(manifest_file, 'rb') as manifest_fp:
+            manifest = json.loads(manifest_fp.read().decode('ascii'))
+    except (IOError, OSError, ValueError):
+        return {}
+    if not isinstance(manifest, dict):
+        return {}
+    return manifest
+
+
+def write_hash_manifest(partition_dir, manifest):
+    """
+    Write a partition's hashes.manifest.
+
+    The manifest only ever short-cuts work that could be done by walking the
+    partition, so it is not fsync'd.
+    """
+    fd, tmppath = mkstemp(dir=partition_dir, suffix='.tmp')
+    with os.fdopen(fd, 'wb') as fo:
+        fo.write(json.dumps(manifest, separators=(',', ':')).encode('ascii'))
+    renamer(tmppath, join(partition_dir, HASH_MANIFEST_FILE), fsync=False)
 
 
 def relink_paths(target_path, new_target_path, check_existing=False):
@@ -583,6 +1023,224 @@ def clear_auditor_status(devices, datadir, auditor_type="ALL"):
         remove_file(auditor_status)
 
 
+class MetadataCacheEntry(object):
+    """
+    The files listed in an object's hash dir, and the metadata read from
+    them, as of a given version of the hash dir.
+
+    :param version: the (inode, mtime) of the hash dir the files were listed
+                    from
+    :param files: the list of files in the hash dir
+    """
+    __slots__ = ('version', 'files', 'metadata')
+
+    def __init__(self, version, files):
+        self.version = version
+        self.files = files
+        # file name -> metadata dict
+        self.metadata = {}
+
+
+class MetadataCache(object):
+    """
+    A bounded LRU cache of the files in object hash dirs and of the metadata
+    read from them, so that HEADs, GETs and POSTs of hot objects need neither
+    list the hash dir nor read and unpickle its xattrs.
+
+    Every lookup stats the hash dir; an entry is only used while the inode
+    and mtime of the hash dir are the ones it was listed with. Any file
+    being added to, renamed into or removed from a hash dir changes its
+    mtime. Because file system timestamps are coarse, hash dirs modified in
+    the last ``racy_window`` seconds are not cached, so that a change within
+    the same timestamp tick as a listing cannot go unnoticed.
+
+    :param max_size: the maximum number of hash dirs to cache
+    :param racy_window: hash dirs modified this recently are not cached
+    """
+
+    def __init__(self, max_size,
+                 racy_window=DEFAULT_METADATA_CACHE_RACY_WINDOW):
+        self.max_size = max_size
+        self.racy_window = racy_window
+        self._entries = OrderedDict()
+        self._lock = stdlib_threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get_entry(self, hsh_path, list_files):
+        """
+        Get the cache entry of a hash dir, listing the hash dir if it is not
+        cached or has changed since it was cached.
+
+        :param hsh_path: full path to the hash dir
+        :param list_files: callable taking the hash dir path and returning
+                           the list of files in it
+        :returns: a :class:`MetadataCacheEntry`; metadata read from the files
+                  it lists may be stored in its ``metadata`` attribute
+        :raises OSError: as raised by list_files
+        """
+        try:
+            st = os.stat(hsh_path)
+        except OSError:
+            st = None
+        if st is None or not stat.S_ISDIR(st.st_mode):
+            # let list_files raise the appropriate error
+            with self._lock:
+                self.misses += 1
+                self._entries.pop(hsh_path, None)
+            return MetadataCacheEntry(None, list_files(hsh_path))
+        version = (st.st_ino, st.st_mtime)
+        with self._lock:
+            entry = self._entries.get(hsh_path)
+            if entry is not None and entry.version == version:
+                self.hits += 1
+                self._entries[hsh_path] = self._entries.pop(hsh_path)
+                return entry
+            self.misses += 1
+        entry = MetadataCacheEntry(version, list_files(hsh_path))
+        with self._lock:
+            self._entries.pop(hsh_path, None)
+            if time.time() - st.st_mtime >= self.racy_window:
+                self._entries[hsh_path] = entry
+                while len(self._entries) > self.max_size:
+                    self._entries.popitem(last=False)
+                    self.evictions += 1
+        return entry
+
+    def invalidate(self, hsh_path):
+        """
+        Drop the cache entry of a hash dir, if any.
+
+        :param hsh_path: full path to the hash dir
+        """
+        with self._lock:
+            self._entries.pop(hsh_path, None)
+
+    def get_stats(self):
+        """
+        Get the stats of the cache.
+
+        :returns: a dict with the number of cached hash dirs, the maximum
+                  size, the numbers of hits, misses and evictions, and the
+                  hit ratio
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {'size': len(self._entries),
+                    'max_size': self.max_size,
+                    'hits': self.hits,
+                    'misses': self.misses,
+                    'evictions': self.evictions,
+                    'hit_ratio': float(self.hits) / lookups if lookups else 0}
+
+
+class PageCachePolicy(object):
+    """
+    Decides how the reads of data files use the page cache: whether the
+    data read is kept in it, and how far ahead of a sequential read the
+    kernel is asked to read.
+
+    The reads of the most recently read ``max_tracked`` objects are counted.
+    An object becomes hot once it has been read ``hot_threshold`` times, and
+    the data of hot objects is kept in the page cache whatever their size.
+    Hot objects are kept in LRU order within a budget of ``hot_cache_size``
+    bytes; an object pushed out of the budget has its data dropped from the
+    page cache again the next time it is read.
+
+    :param readahead_size: bytes to read ahead of a sequential read, or 0 to
+                           leave readahead to the kernel
+    :param hot_threshold: reads that make an object hot, or 0 to not count
+                          reads
+    :param hot_cache_size: the most bytes of hot objects to keep cached
+    :param max_tracked: the most objects whose reads are counted
+    """
+
+    def __init__(self, readahead_size=0, hot_threshold=0,
+                 hot_cache_size=DEFAULT_HOT_OBJECT_CACHE_SIZE,
+                 max_tracked=DEFAULT_HOT_OBJECT_TRACKING_SIZE):
+        self.readahead_size = readahead_size
+        self.hot_threshold = hot_threshold
+        self.hot_cache_size = hot_cache_size
+        self.max_tracked = max_tracked
+        # data file -> number of reads
+        self._reads = OrderedDict()
+        # data file -> size, of the hot objects
+        self._hot = OrderedDict()
+        self._hot_bytes = 0
+        self._lock = stdlib_threading.Lock()
+        self.reads = 0
+        self.hot_reads = 0
+        self.promotions = 0
+        self.demotions = 0
+        self.readaheads = 0
+        self.readahead_bytes = 0
+
+    def record_read(self, data_file, size):
+        """
+        Count a read of an object.
+
+        :param data_file: the data file of the object
+        :param size: the size of the object
+        :returns: True if the object is hot, and the data read should be kept
+                  in the page cache
+        """
+        if not self.hot_threshold:
+            return False
+        with self._lock:
+            self.reads += 1
+            count = self._reads.pop(data_file, 0) + 1
+            self._reads[data_file] = count
+            while len(self._reads) > self.max_tracked:
+                self._reads.popitem(last=False)
+            if data_file in self._hot:
+                self._hot[data_file] = self._hot.pop(data_file)
+            elif count >= self.hot_threshold and \
+                    size <= self.hot_cache_size:
+                self._hot[data_file] = size
+                self._hot_bytes += size
+                self.promotions += 1
+                while self._hot_bytes > self.hot_cache_size:
+                    _junk, demoted_size = self._hot.popitem(last=False)
+                    self._hot_bytes -= demoted_size
+                    self.demotions += 1
+            else:
+                return False
+            self.hot_reads += 1
+            return True
+
+    def record_readahead(self, length):
+        """
+        Count a readahead.
+
+        :param length: the number of bytes read ahead
+        """
+        with self._lock:
+            self.readaheads += 1
+            self.readahead_bytes += length
+
+    def get_stats(self):
+        """
+        Get the stats of the policy.
+
+        :returns: a dict with the numbers of tracked and of hot objects, the
+                  bytes of hot objects and their budget, the numbers of
+                  counted and of hot reads, of promotions and demotions, and
+                  the number and bytes of readaheads
+        """
+        with self._lock:
+            return {'tracked': len(self._reads),
+                    'hot_objects': len(self._hot),
+                    'hot_bytes': self._hot_bytes,
+                    'hot_cache_size': self.hot_cache_size,
+                    'reads': self.reads,
+                    'hot_reads': self.hot_reads,
+                    'promotions': self.promotions,
+                    'demotions': self.demotions,
+                    'readaheads': self.readaheads,
+                    'readahead_bytes': self.readahead_bytes}
+
+
 def strip_self(f):
     """
     Wrapper to attach module level functions to base class.
@@ -595,28 +1253,86 @@ def strip_self(f):
 class DiskFileRouter(object):
 
     policy_type_to_manager_cls = {}
+    # managers for a policy's non-default diskfile_backend, keyed by
+    # (policy_type, diskfile_backend)
+    backend_to_manager_cls = {}
+    # modules providing the optional backends; they are only imported when
+    # a policy asks for them
+    backend_modules = {
+        'slab': 'swift.obj.slab_diskfile',
+    }
 
     @classmethod
-    def register(cls, policy_type):
+    def register(cls, policy_type, backend=DEFAULT_DISKFILE_BACKEND):
         """
         Decorator for Storage Policy implementations to register
         their DiskFile implementation.
+
+        :param policy_type: the policy_type served by the manager
+        :param backend: the diskfile_backend served by the manager
         """
+        if backend == DEFAULT_DISKFILE_BACKEND:
+            registry, key = cls.policy_type_to_manager_cls, policy_type
+        else:
+            registry, key = cls.backend_to_manager_cls, (policy_type, backend)
+
         def register_wrapper(diskfile_cls):
-            if policy_type in cls.policy_type_to_manager_cls:
+            if key in registry:
                 raise PolicyError(
                     '%r is already registered for the policy_type %r' % (
-                        cls.policy_type_to_manager_cls[policy_type],
-                        policy_type))
-            cls.policy_type_to_manager_cls[policy_type] = diskfile_cls
+                        registry[key], policy_type))
+            registry[key] = diskfile_cls
             return diskfile_cls
         return register_wrapper
 
+    @classmethod
+    def get_manager_cls(cls, policy):
+        """
+        Find the manager class for a policy's policy_type and
+        diskfile_backend, importing the backend's module if necessary.
+
+        :param policy: the StoragePolicy instance
+        :raises PolicyError: if no manager is registered for the policy
+        """
+        backend = getattr(policy, 'diskfile_backend', DEFAULT_DISKFILE_BACKEND)
+        if backend == DEFAULT_DISKFILE_BACKEND:
+            return cls.policy_type_to_manager_cls[policy.policy_type]
+        key = (policy.policy_type, backend)
+        if key not in cls.backend_to_manager_cls and \
+                backend in cls.backend_modules:
+            importlib.import_module(cls.backend_modules[backend])
+        try:
+            return cls.backend_to_manager_cls[key]
+        except KeyError:
+            raise PolicyError(
+                'No diskfile_backend %r for the policy_type %r' % (
+                    backend, policy.policy_type),
+                index=int(policy))
+
     def __init__(self, *args, **kwargs):
         self.policy_to_manager = {}
+        threadpools = None
+        shared = {'metadata_cache': None, 'cache_policy': None}
         for policy in POLICIES:
-            manager_cls = self.policy_type_to_manager_cls[policy.policy_type]
-            self.policy_to_manager[int(policy)] = manager_cls(*args, **kwargs)
+            manager_cls = self.get_manager_cls(policy)
+            manager = manager_cls(*args, **kwargs)
+            # every policy on a device shares the device's I/O threadpool
+            # and group committer
+            if threadpools is None:
+                threadpools = getattr(manager, 'threadpools', None)
+                group_committers = getattr(manager, 'group_committers', None)
+            elif hasattr(manager, 'threadpools'):
+                manager.threadpools = threadpools
+                manager.group_committers = group_committers
+            # and every policy shares the worker's metadata cache and page
+            # cache policy
+            for attr in shared:
+                if getattr(manager, attr, None) is not None:
+                    if shared[attr] is None:
+                        shared[attr] = getattr(manager, attr)
+                    else:
+                        setattr(manager, attr, shared[attr])
+            self.policy_to_manager[int(policy)] = manager
 
     def __getitem__(self, policy):
         return self.policy_to_manager[int(policy)]
@@ -646,9 +1362,10 @@ class BaseDiskFileManager(object):
     """
 
     diskfile_cls = None  # must be set by subclasses
+    # set by backends whose on-disk layout cannot be rsync'ed
+    replicate_with_ssync = False
 
     invalidate_hash = strip_self(invalidate_hash)
-    consolidate_hashes = strip_self(consolidate_hashes)
     quarantine_renamer = strip_self(quarantine_renamer)
 
     def __init__(self, conf, logger):
@@ -659,6 +1376,50 @@ class BaseDiskFileManager(object):
         self.bytes_per_sync = int(conf.get('mb_per_sync', 512)) * 1024 * 1024
         self.mount_check = config_true_value(conf.get('mount_check', 'true'))
         self.reclaim_age = int(conf.get('reclaim_age', DEFAULT_RECLAIM_AGE))
+        self.hash_manifest = config_true_value(
+            conf.get('hash_manifest', 'false'))
+        self.binary_hashes = config_true_value(
+            conf.get('binary_hashes', 'false'))
+        self.threads_per_disk = int(conf.get('threads_per_disk', '0'))
+        self.threadpools = defaultdict(
+            lambda: ThreadPool(nthreads=self.threads_per_disk))
+        self.group_commit = config_true_value(
+            conf.get('group_commit', 'false'))
+        self.group_commit_window = float(
+            conf.get('group_commit_window', '0.002'))
+        self.group_commit_max_batch = int(
+            conf.get('group_commit_max_batch', '64'))
+        # device path -> GroupCommitter
+        self.group_committers = {}
+        self.metadata_format = conf.get(
+            'metadata_format', DEFAULT_METADATA_FORMAT).strip().lower()
+        if self.metadata_format not in METADATA_FORMATS:
+            raise ValueError('Invalid metadata_format %r, must be one of %s'
+                             % (self.metadata_format,
+                                ', '.join(METADATA_FORMATS)))
+        self.metadata_cache_size = int(conf.get('metadata_cache_size', '0'))
+        self.metadata_cache = None
+        if self.metadata_cache_size > 0:
+            self.metadata_cache = MetadataCache(self.metadata_cache_size)
+        self.readahead_size = int(conf.get('readahead_size', '0'))
+        self.hot_object_threshold = int(
+            conf.get('hot_object_threshold', '0'))
+        self.cache_policy = None
+        if self.readahead_size > 0 or self.hot_object_threshold > 0:
+            self.cache_policy = PageCachePolicy(
+                readahead_size=max(self.readahead_size, 0),
+                hot_threshold=max(self.hot_object_threshold, 0),
+                hot_cache_size=int(conf.get(
+                    'hot_object_cache_size', DEFAULT_HOT_OBJECT_CACHE_SIZE)),
+                max_tracked=int(conf.get(
+                    'hot_object_tracking_size',
+                    DEFAULT_HOT_OBJECT_TRACKING_SIZE)))
+        self.async_journal = config_true_value(
+            conf.get('async_journal', 'false'))
+        self.async_journal_segment_size = int(conf.get(
+            'async_journal_segment_size', DEFAULT_JOURNAL_SEGMENT_SIZE))
+        # journal path -> AsyncJournal
+        self.async_journals = {}
         replication_concurrency_per_device = conf.get(
             'replication_concurrency_per_device')
         replication_one_per_device = conf.get('replication_one_per_device')
@@ -712,6 +1473,9 @@ class BaseDiskFileManager(object):
                 with open('/proc/sys/fs/pipe-max-size') as f:
                     max_pipe_size = int(f.read())
                 self.pipe_size = min(max_pipe_size, self.disk_chunk_size)
+        # ranges of objects are not checked against the ETag, so they can be
+        # sent with sendfile() even where MD5 sockets are not supported
+        self.use_sendfile = conf_wants_splice and sendfile.available
         self.use_linkat = o_tmpfile_supported()
 
     def make_on_disk_filename(self, timestamp, ext=None,
@@ -1023,24 +1787,64 @@ class BaseDiskFileManager(object):
         def is_reclaimable(timestamp):
             return (time.time() - float(timestamp)) > self.reclaim_age
 
-        files = listdir(hsh_path)
+        files = self._list_object_dir(hsh_path)
         files.sort(reverse=True)
         results = self.get_ondisk_files(
             files, hsh_path, verify=False, **kwargs)
         if 'ts_info' in results and is_reclaimable(
                 results['ts_info']['timestamp']):
-            remove_file(join(hsh_path, results['ts_info']['filename']))
+            self._remove_ondisk_file(
+                hsh_path, results['ts_info']['filename'])
             files.remove(results.pop('ts_info')['filename'])
         for file_info in results.get('possible_reclaim', []):
             # stray files are not deleted until reclaim-age
             if is_reclaimable(file_info['timestamp']):
                 results.setdefault('obsolete', []).append(file_info)
         for file_info in results.get('obsolete', []):
-            remove_file(join(hsh_path, file_info['filename']))
+            self._remove_ondisk_file(hsh_path, file_info['filename'])
             files.remove(file_info['filename'])
         results['files'] = files
         return results
 
+    def _list_object_dir(self, hsh_path):
+        """
+        List the on-disk files of an object.
+
+        :param hsh_path: object hash path
+        :returns: a list of file names, empty if the object dir does not exist
+        :raises OSError: for errors other than ENOENT
+        """
+        return listdir(hsh_path)
+
+    def _remove_ondisk_file(self, hsh_path, filename):
+        """
+        Remove one of the on-disk files of an object.
+
+        :param hsh_path: object hash path
+        :param filename: name of the file, as returned by
+                         :meth:`_list_object_dir`
+        """
+        remove_file(join(hsh_path, filename))
+
+    def _list_suffix_dir(self, path):
+        """
+        List the object hashes in a suffix dir.
+
+        :param path: full path to the suffix directory
+        :raises OSError: if the suffix directory cannot be listed
+        """
+        return os.listdir(path)
+
+    def _read_file_metadata(self, source, **kwargs):
+        """
+        Read the metadata of one of the on-disk files of an object.
+
+        :param source: file object, file descriptor or full path of the file
+        :param kwargs: passed on to :func:`read_metadata`
+        :returns: dictionary of metadata
+        """
+        return read_metadata(source, **kwargs)
+
     def _update_suffix_hashes(self, hashes, ondisk_info):
         """
         Applies policy specific updates to the given dict of md5 hashes for
@@ -1052,14 +1856,33 @@ class BaseDiskFileManager(object):
         """
         raise NotImplementedError
 
-    def _hash_suffix_dir(self, path):
+    def _is_reclaimable(self, timestamp):
+        return (time.time() - float(timestamp)) > self.reclaim_age
+
+    def _get_ondisk_timestamps(self, ondisk_info):
+        """
+        Get the timestamps that describe the state of an object, as yielded
+        by :func:`yield_hashes`, from the info returned by
+        :func:`cleanup_ondisk_files`.
+        """
+        timestamps = {}
+        for ts_key, info_key, info_ts_key in ONDISK_TIMESTAMP_KEYS:
+            if info_key in ondisk_info:
+                timestamps[ts_key] = ondisk_info[info_key][info_ts_key]
+        return timestamps
+
+    def _hash_suffix_dir(self, path, ondisk_timestamps=None):
         """
 
         :param path: full path to directory
+        :param ondisk_timestamps: optional dict to be filled with the
+                                  [ts_data, ts_meta, ts_ctype, deleted] of
+                                  each object found, keyed by object hash,
+                                  for the hash manifest
         """
         hashes = defaultdict(hashlib.md5)
         try:
-            path_contents = sorted(os.listdir(path))
+            path_contents = sorted(self._list_suffix_dir(path))
         except OSError as err:
             if err.errno in (errno.ENOTDIR, errno.ENOENT):
                 raise PathNotDir()
@@ -1104,6 +1927,15 @@ class BaseDiskFileManager(object):
             # delegate to subclass for data file related updates...
             self._update_suffix_hashes(hashes, ondisk_info)
 
+            if ondisk_timestamps is not None:
+                timestamps = self._get_ondisk_timestamps(ondisk_info)
+                if 'ts_data' in timestamps:
+                    ondisk_timestamps[hsh] = [
+                        timestamps[key].internal if key in timestamps
+                        else None
+                        for key in ('ts_data', 'ts_meta', 'ts_ctype')] + [
+                        'ts_info' in ondisk_info]
+
             if 'ctype_info' in ondisk_info:
                 # We have a distinct content-type timestamp so update the
                 # hash. As a precaution, append '_ctype' to differentiate this
@@ -1125,16 +1957,81 @@ class BaseDiskFileManager(object):
             raise PathNotDir()
         return hashes
 
-    def _hash_suffix(self, path):
+    def _hash_suffix(self, path, ondisk_timestamps=None):
         """
         Performs reclamation and returns an md5 of all (remaining) files.
 
         :param path: full path to directory
+        :param ondisk_timestamps: optional dict to be filled with the
+                                  timestamps of each object found
         :raises PathNotDir: if given path is not a valid directory
         :raises OSError: for non-ENOTDIR errors
         """
         raise NotImplementedError
 
+    def _update_hash_manifest(self, partition_path, hashes, updates):
+        """
+        Rewrite the hash manifest of a partition to match newly written
+        suffix hashes.
+
+        :param partition_path: path to the partition
+        :param hashes: the suffix hashes that were written to hashes.pkl
+        :param updates: a dict mapping each suffix that was hashed to the
+                        timestamps of its objects
+        """
+        manifest = read_hash_manifest(partition_path)
+        new_manifest = {}
+        for suffix, hash_ in hashes.items():
+            if suffix in ('valid', 'updated') or not hash_:
+                continue
+            hash_key = _suffix_hash_key(hash_)
+            if suffix in updates:
+                new_manifest[suffix] = [hash_key, updates[suffix]]
+            elif manifest.get(suffix, [None])[0] == hash_key:
+                new_manifest[suffix] = manifest[suffix]
+        try:
+            write_hash_manifest(partition_path, new_manifest)
+        except (IOError, OSError):
+            self.logger.warning('Unable to write hash manifest in %r',
+                                partition_path, exc_info=True)
+
+    def _get_valid_hash_manifest(self, partition_path):
+        """
+        Get the object timestamps from the hash manifest of a partition for
+        those suffixes that have not changed since they were last hashed.
+
+        :returns: a dict mapping suffixes to the timestamps of their objects
+        """
+        manifest = read_hash_manifest(partition_path)
+        if not manifest:
+            return {}
+        hashes = read_hashes(partition_path)
+        if not hashes['valid']:
+            return {}
+        invalidations_file = join(partition_path, HASH_INVALIDATIONS_FILE)
+        try:
+            with open(invalidations_file, 'rb') as inv_fh:
+                invalidated = set(line.strip().decode('ascii')
+                                  for line in inv_fh)
+        except (IOError, OSError) as e:
+            if e.errno != errno.ENOENT:
+                return {}
+            invalidated = set()
+        valid = {}
+        for suffix, (hash_key, ondisk_timestamps) in manifest.items():
+            hash_ = hashes.get(suffix)
+            if suffix not in invalidated and hash_ and \
+                    _suffix_hash_key(hash_) == hash_key:
+                valid[suffix] = ondisk_timestamps
+        return valid
+
+    def consolidate_hashes(self, partition_dir):
+        """
+        Consolidate the hashes of a partition, see
+        :func:`consolidate_hashes`.
+        """
+        return consolidate_hashes(partition_dir, binary=self.binary_hashes)
+
     def _get_hashes(self, *args, **kwargs):
         hashed, hashes = self.__get_hashes(*args, **kwargs)
         hashes.pop('updated', None)
@@ -1164,10 +2061,18 @@ class BaseDiskFileManager(object):
         hashes_file = join(partition_path, HASH_FILE)
         modified = False
         orig_hashes = {'valid': False}
+        manifest_updates = None
+        rehash_all = False
 
         if recalculate is None:
             recalculate = []
 
+        if self.hash_manifest:
+            manifest_updates = {}
+            if not exists(join(partition_path, HASH_MANIFEST_FILE)):
+                # every suffix has to be hashed once to build the manifest
+                do_listdir = rehash_all = True
+
         try:
             orig_hashes = self.consolidate_hashes(partition_path)
         except Exception:
@@ -1200,12 +2105,20 @@ class BaseDiskFileManager(object):
                     hashes.setdefault(suff, None)
             modified = True
             self.logger.debug('Run listdir on %s', partition_path)
+        if rehash_all:
+            hashes.update((suffix, None) for suffix in list(hashes)
+                          if len(suffix) == 3)
         hashes.update((suffix, None) for suffix in recalculate)
         for suffix, hash_ in hashes.items():
             if not hash_:
                 suffix_dir = join(partition_path, suffix)
                 try:
-                    hashes[suffix] = self._hash_suffix(suffix_dir)
+                    if manifest_updates is None:
+                        hashes[suffix] = self._hash_suffix(suffix_dir)
+                    else:
+                        ondisk_timestamps = manifest_updates[suffix] = {}
+                        hashes[suffix] = self._hash_suffix(
+                            suffix_dir, ondisk_timestamps=ondisk_timestamps)
                     hashed += 1
                 except PathNotDir:
                     del hashes[suffix]
@@ -1215,7 +2128,11 @@ class BaseDiskFileManager(object):
         if modified:
             with lock_path(partition_path):
                 if read_hashes(partition_path) == orig_hashes:
-                    write_hashes(partition_path, hashes)
+                    write_hashes(partition_path, hashes,
+                                 binary=self.binary_hashes)
+                    if manifest_updates is not None:
+                        self._update_hash_manifest(
+                            partition_path, hashes, manifest_updates)
                     return hashed, hashes
             return self.__get_hashes(device, partition, policy,
                                      recalculate=recalculate,
@@ -1223,6 +2140,67 @@ class BaseDiskFileManager(object):
         else:
             return hashed, hashes
 
+    def get_threadpool_stats(self):
+        """
+        Get the stats of the I/O threadpool of each device that has been
+        used, see :meth:`swift.common.utils.ThreadPool.get_stats`.
+
+        :returns: a dict mapping device names to threadpool stats
+        """
+        return dict((device, pool.get_stats())
+                    for device, pool in self.threadpools.items())
+
+    def get_group_committer(self, device_path):
+        """
+        Get the group committer for the given device, if group commit is
+        enabled.
+
+        :param device_path: full path to the device
+        :returns: a :class:`swift.common.utils.GroupCommitter`, or None
+        """
+        if not self.group_commit:
+            return None
+        try:
+            return self.group_committers[device_path]
+        except KeyError:
+            return self.group_committers.setdefault(
+                device_path, GroupCommitter(
+                    device_path, window=self.group_commit_window,
+                    max_batch=self.group_commit_max_batch))
+
+    def get_group_commit_stats(self):
+        """
+        Get the stats of the group committer of each device that has been
+        written to, see :meth:`swift.common.utils.GroupCommitter.get_stats`.
+
+        :returns: a dict mapping device names to group commit stats
+        """
+        return dict((basename(device_path), committer.get_stats())
+                    for device_path, committer
+                    in list(self.group_committers.items()))
+
+    def get_metadata_cache_stats(self):
+        """
+        Get the stats of the metadata cache, see
+        :meth:`swift.obj.diskfile.MetadataCache.get_stats`.
+
+        :returns: a dict of stats, or None if the cache is disabled
+        """
+        if self.metadata_cache is None:
+            return None
+        return self.metadata_cache.get_stats()
+
+    def get_cache_policy_stats(self):
+        """
+        Get the stats of the page cache policy, see
+        :meth:`swift.obj.diskfile.PageCachePolicy.get_stats`.
+
+        :returns: a dict of stats, or None if the policy is disabled
+        """
+        if self.cache_policy is None:
+            return None
+        return self.cache_policy.get_stats()
+
     def construct_dev_path(self, device):
         """
         Construct the path to a device without checking if it is mounted.
@@ -1279,7 +2257,8 @@ class BaseDiskFileManager(object):
                             timestamp, policy):
         """
         Write data describing a container update notification to a pickle file
-        in the async_pending directory.
+        in the async_pending directory, or append it to the device's async
+        journal if ``async_journal`` is enabled.
 
         :param device: name of target device
         :param account: account name for the object
@@ -1290,10 +2269,15 @@ class BaseDiskFileManager(object):
         :param policy: the StoragePolicy instance
         """
         device_path = self.construct_dev_path(device)
+        ohash = hash_path(account, container, obj)
+        if self.async_journal:
+            self.get_async_journal(device_path, policy).append(
+                ohash, Timestamp(timestamp).internal, data)
+            self.logger.increment('async_pendings')
+            return
         async_dir = os.path.join(device_path, get_async_dir(policy))
         tmp_dir = os.path.join(device_path, get_tmp_dir(policy))
         mkdirs(tmp_dir)
-        ohash = hash_path(account, container, obj)
         write_pickle(
             data,
             os.path.join(async_dir, ohash[-3:], ohash + '-' +
@@ -1301,6 +2285,23 @@ class BaseDiskFileManager(object):
             tmp_dir)
         self.logger.increment('async_pendings')
 
+    def get_async_journal(self, device_path, policy):
+        """
+        Get the async journal of a policy on a device, which keeps the
+        segment that appends go to open between appends.
+
+        :param device_path: the path of the device
+        :param policy: the StoragePolicy instance
+        :returns: an AsyncJournal
+        """
+        journal_path = os.path.join(device_path,
+                                    get_async_journal_dir(policy))
+        journal = self.async_journals.get(journal_path)
+        if journal is None:
+            journal = self.async_journals[journal_path] = AsyncJournal(
+                journal_path, segment_size=self.async_journal_segment_size)
+        return journal
+
     def get_diskfile(self, device, partition, account, container, obj,
                      policy, **kwargs):
         """
@@ -1321,6 +2322,7 @@ class BaseDiskFileManager(object):
                                  partition, account, container, obj,
                                  policy=policy, use_splice=self.use_splice,
                                  pipe_size=self.pipe_size,
+                                 use_sendfile=self.use_sendfile,
                                  use_linkat=self.use_linkat, **kwargs)
 
     def clear_auditor_status(self, policy, auditor_type="ALL"):
@@ -1392,7 +2394,8 @@ class BaseDiskFileManager(object):
         if not filenames:
             raise DiskFileNotExist()
         try:
-            metadata = read_metadata(os.path.join(object_path, filenames[-1]))
+            metadata = self._read_file_metadata(
+                os.path.join(object_path, filenames[-1]))
         except EOFError:
             raise DiskFileNotExist()
         try:
@@ -1478,6 +2481,10 @@ class BaseDiskFileManager(object):
         where timestamps are instances of
         :class:`~swift.common.utils.Timestamp`
 
+        If the hash manifest is enabled, the timestamps of objects in
+        suffixes that have not changed since they were last hashed are read
+        from the partition's manifest rather than from their object dirs.
+
         :param device: name of target device
         :param partition: partition name
         :param policy: the StoragePolicy instance
@@ -1486,43 +2493,70 @@ class BaseDiskFileManager(object):
         dev_path = self.get_dev_path(device)
         if not dev_path:
             raise DiskFileDeviceUnavailable()
+        partition_path = get_part_path(dev_path, policy, partition)
         if suffixes is None:
             suffixes = self.yield_suffixes(device, partition, policy)
         else:
-            partition_path = get_part_path(dev_path, policy, partition)
             suffixes = (
                 (os.path.join(partition_path, suffix), suffix)
                 for suffix in suffixes)
-        key_preference = (
-            ('ts_meta', 'meta_info', 'timestamp'),
-            ('ts_data', 'data_info', 'timestamp'),
-            ('ts_data', 'ts_info', 'timestamp'),
-            ('ts_ctype', 'ctype_info', 'ctype_timestamp'),
-        )
+        manifest = {}
+        if self.hash_manifest and all(
+                value is None for value in kwargs.values()):
+            # the manifest records what an object dir looks like without
+            # any fragment preferences
+            manifest = self._get_valid_hash_manifest(partition_path)
         for suffix_path, suffix in suffixes:
-            for object_hash in self._listdir(suffix_path):
-                object_path = os.path.join(suffix_path, object_hash)
-                try:
-                    results = self.cleanup_ondisk_files(
-                        object_path, **kwargs)
-                    timestamps = {}
-                    for ts_key, info_key, info_ts_key in key_preference:
-                        if info_key not in results:
-                            continue
-                        timestamps[ts_key] = results[info_key][info_ts_key]
-                    if 'ts_data' not in timestamps:
-                        # file sets that do not include a .data or .ts
-                        # file cannot be opened and therefore cannot
-                        # be ssync'd
+            if suffix in manifest:
+                for object_hash, (ts_data, ts_meta, ts_ctype, deleted) in \
+                        manifest[suffix].items():
+                    object_hash = str(object_hash)
+                    if deleted and self._is_reclaimable(ts_data):
+                        # let the object dir be cleaned up
+                        timestamps = self._get_hash_timestamps(
+                            os.path.join(suffix_path, object_hash), **kwargs)
+                        if timestamps:
+                            yield (object_hash, timestamps)
                         continue
+                    timestamps = {'ts_data': Timestamp(ts_data)}
+                    if ts_meta:
+                        timestamps['ts_meta'] = Timestamp(ts_meta)
+                    if ts_ctype:
+                        timestamps['ts_ctype'] = Timestamp(ts_ctype)
+                    yield (object_hash, timestamps)
+                continue
+            for object_hash in self._listdir(suffix_path):
+                timestamps = self._get_hash_timestamps(
+                    os.path.join(suffix_path, object_hash), **kwargs)
+                if timestamps:
                     yield (object_hash, timestamps)
-                except AssertionError as err:
-                    self.logger.debug('Invalid file set in %s (%s)' % (
-                        object_path, err))
-                except DiskFileError as err:
-                    self.logger.debug(
-                        'Invalid diskfile filename in %r (%s)' % (
-                            object_path, err))
+
+    def _get_hash_timestamps(self, object_path, **kwargs):
+        """
+        Clean up an object dir and get the timestamps that describe the
+        state of the object, as yielded by :func:`yield_hashes`.
+
+        :returns: a dict of timestamps, or None if the object dir does not
+                  hold a diskfile that could be opened
+        """
+        try:
+            results = self.cleanup_ondisk_files(object_path, **kwargs)
+        except AssertionError as err:
+            self.logger.debug('Invalid file set in %s (%s)' % (
+                object_path, err))
+            return None
+        except DiskFileError as err:
+            self.logger.debug(
+                'Invalid diskfile filename in %r (%s)' % (
+                    object_path, err))
+            return None
+        timestamps = self._get_ondisk_timestamps(results)
+        if 'ts_data' not in timestamps:
+            # file sets that do not include a .data or .ts
+            # file cannot be opened and therefore cannot
+            # be ssync'd
+            return None
+        return timestamps
 
 
 class BaseDiskFileWriter(object):
@@ -1590,28 +2624,41 @@ class BaseDiskFileWriter(object):
         :returns: the total number of bytes written to an object
         """
 
-        while chunk:
-            written = os.write(self._fd, chunk)
-            self._upload_size += written
-            chunk = chunk[written:]
+        self._diskfile._threadpool.run_in_thread(
+            self._write_entire_chunk, chunk)
 
         # For large files sync every 512MB (by default) written
         diff = self._upload_size - self._last_sync
         if diff >= self._bytes_per_sync:
-            tpool_reraise(fdatasync, self._fd)
+            self._diskfile._threadpool.force_run_in_thread(
+                fdatasync, self._fd)
             drop_buffer_cache(self._fd, self._last_sync, diff)
             self._last_sync = self._upload_size
 
         return self._upload_size
 
+    def _write_entire_chunk(self, chunk):
+        while chunk:
+            written = os.write(self._fd, chunk)
+            self._upload_size += written
+            chunk = chunk[written:]
+
     def _finalize_put(self, metadata, target_path, cleanup):
         # Write the metadata before calling fsync() so that both data and
         # metadata are flushed to disk.
-        write_metadata(self._fd, metadata)
+        write_metadata(self._fd, metadata,
+                       metadata_format=self.manager.metadata_format)
+        committer = self.manager.get_group_committer(
+            self._diskfile._device_path)
         # We call fsync() before calling drop_cache() to lower the amount of
         # redundant work the drop cache code will perform on the pages (now
         # that after fsync the pages will be all clean).
-        fsync(self._fd)
+        if committer:
+            # share the sync with the other writers to the device; the file
+            # must still be on disk before it is renamed into place
+            committer.commit(fds=[self._fd])
+        else:
+            fsync(self._fd)
         # From the Department of the Redundancy Department, make sure we call
         # drop_cache() after fsync() to avoid redundant work (pages all
         # clean).
@@ -1621,11 +2668,18 @@ class BaseDiskFileWriter(object):
         # requests to reference.
         if self._tmppath:
             # It was a named temp file created by mkstemp()
-            renamer(self._tmppath, target_path)
+            renamer(self._tmppath, target_path, fsync=not committer)
         else:
             # It was an unnamed temp file created by open() with O_TMPFILE
             link_fd_to_path(self._fd, target_path,
-                            self._diskfile._dirs_created)
+                            self._diskfile._dirs_created,
+                            fsync=not committer)
+        if committer:
+            # the object, suffix and partition dirs may all have been
+            # created for this object
+            suffix_dir = dirname(self._datadir)
+            committer.commit(paths=[self._datadir, suffix_dir,
+                                    dirname(suffix_dir)])
 
         # Check if the partition power will/has been increased
         new_target_path = None
@@ -1678,7 +2732,8 @@ class BaseDiskFileWriter(object):
         metadata['name'] = self._name
         target_path = join(self._datadir, filename)
 
-        tpool_reraise(self._finalize_put, metadata, target_path, cleanup)
+        self._diskfile._threadpool.force_run_in_thread(
+            self._finalize_put, metadata, target_path, cleanup)
 
     def put(self, metadata):
         """
@@ -1767,11 +2822,14 @@ class BaseDiskFileReader(object):
     :param pipe_size: size of pipe buffer used in zero-copy operations
     :param diskfile: the diskfile creating this DiskFileReader instance
     :param keep_cache: should resulting reads be kept in the buffer cache
+    :param use_sendfile: if true, use zero-copy sendfile() to send ranges of
+                         data
+    :param cache_policy: the :class:`PageCachePolicy` of the reads, if any
     """
     def __init__(self, fp, data_file, obj_size, etag,
                  disk_chunk_size, keep_cache_size, device_path, logger,
                  quarantine_hook, use_splice, pipe_size, diskfile,
-                 keep_cache=False):
+                 keep_cache=False, use_sendfile=False, cache_policy=None):
         # Parameter tracking
         self._fp = fp
         self._data_file = data_file
@@ -1784,12 +2842,18 @@ class BaseDiskFileReader(object):
         self._quarantine_hook = quarantine_hook
         self._use_splice = use_splice
         self._pipe_size = pipe_size
+        self._use_sendfile = use_sendfile
         if keep_cache:
             # Caller suggests we keep this in cache, only do it if the
             # object's size is less than the maximum.
             self._keep_cache = obj_size < keep_cache_size
         else:
             self._keep_cache = False
+        self._cache_policy = cache_policy
+        if cache_policy is not None and \
+                cache_policy.record_read(data_file, obj_size):
+            # hot objects are kept in cache whatever their size
+            self._keep_cache = True
 
         # Internal Attributes
         self._iter_etag = None
@@ -1799,6 +2863,13 @@ class BaseDiskFileReader(object):
         self._md5_of_sent_bytes = None
         self._suppress_file_closing = False
         self._quarantined_dir = None
+        # the ranges, and the multipart parameters, of the ranged response
+        # that swob has asked for
+        self._requested_ranges = None
+        # where the range being iterated over stops, if not at the end
+        self._read_stop = None
+        # the offset up to which the kernel has been asked to read ahead
+        self._readahead_to = 0
 
     @property
     def manager(self):
@@ -1821,11 +2892,18 @@ class BaseDiskFileReader(object):
             self._started_at_0 = False
             self._read_to_eof = False
             self._init_checks()
+            threadpool = self._diskfile._threadpool
+            start = self._fp.tell()
+            stop = self._obj_size if self._read_stop is None \
+                else self._read_stop
             while True:
-                chunk = self._fp.read(self._disk_chunk_size)
+                chunk = threadpool.run_in_thread(
+                    self._fp.read, self._disk_chunk_size)
                 if chunk:
                     self._update_checks(chunk)
                     self._bytes_read += len(chunk)
+                    self._readahead(self._fp.fileno(), start,
+                                    start + self._bytes_read, stop)
                     if self._bytes_read - dropped_cache > DROP_CACHE_WINDOW:
                         self._drop_cache(self._fp.fileno(), dropped_cache,
                                          self._bytes_read - dropped_cache)
@@ -1840,19 +2918,50 @@ class BaseDiskFileReader(object):
             if not self._suppress_file_closing:
                 self.close()
 
+    def _ranges_start_at_0(self):
+        """
+        Returns True if any of the requested ranges starts at the start of
+        the data file. Reads from there are checked like whole-object reads,
+        so they are never sent with sendfile().
+        """
+        return any(not start for start, stop in self._requested_ranges[0])
+
+    def _is_whole_object_range(self):
+        """
+        Returns True if a single range covering the whole data file has been
+        asked for, e.g. by a ``bytes=0-`` GET.
+        """
+        ranges, multipart = self._requested_ranges
+        if multipart is not None or len(ranges) != 1:
+            return False
+        start, stop = ranges[0]
+        return not start and (stop is None or stop >= self._obj_size)
+
     def can_zero_copy_send(self):
-        return self._use_splice
+        if self._requested_ranges is None:
+            return self._use_splice
+        if not self._ranges_start_at_0():
+            return self._use_sendfile
+        # the whole object can still be spliced through an MD5 socket so that
+        # its ETag is checked; other ranges from the start are read in
+        # userspace
+        return self._use_splice and self._is_whole_object_range()
 
     def zero_copy_send(self, wsockfd):
         """
         Does some magic with splice() and tee() to move stuff from disk to
         network without ever touching userspace.
 
+        If a range or ranges of the data file have been asked for, these are
+        sent with sendfile() instead, along with the MIME boundaries of a
+        multi-range response, unless the one range is the whole data file.
+
         :param wsockfd: file descriptor (integer) of the socket out which to
                         send data
         """
-        # Note: if we ever add support for zero-copy ranged GET responses,
-        # we'll have to make this conditional.
+        if self._requested_ranges is not None and \
+                not self._is_whole_object_range():
+            return self._zero_copy_send_ranges(wsockfd)
         self._started_at_0 = True
 
         rfd = self._fp.fileno()
@@ -1882,6 +2991,7 @@ class BaseDiskFileReader(object):
                                      self._bytes_read - dropped_cache)
                     break
                 self._bytes_read += bytes_in_pipe
+                self._readahead(rfd, 0, self._bytes_read, self._obj_size)
 
                 # "Copy" data from pipe A to pipe B (really just some pointer
                 # manipulation in the kernel, not actual copying).
@@ -1946,13 +3056,84 @@ class BaseDiskFileReader(object):
             os.close(md5_sockfd)
             self.close()
 
+    def _zero_copy_send_ranges(self, wsockfd):
+        """
+        Send the requested ranges of the data file with sendfile(). None of
+        the ranges starts at the start of the data file, so they cannot be
+        checked against the ETag and no MD5 socket is needed.
+
+        :param wsockfd: file descriptor (integer) of the socket out which to
+                        send data
+        """
+        ranges, multipart = self._requested_ranges
+        rfd = self._fp.fileno()
+        self._bytes_read = 0
+
+        def send_range(start, stop):
+            if start is None:
+                start = 0
+            if stop is None:
+                stop = self._obj_size
+            dropped_cache = offset = start
+            while offset < stop:
+                try:
+                    sent, offset = sendfile(wsockfd, rfd, offset,
+                                            stop - offset)
+                except IOError as exc:
+                    if exc.errno != errno.EWOULDBLOCK:
+                        raise
+                    trampoline(wsockfd, write=True)
+                    continue
+                if not sent:
+                    raise DiskFileError(
+                        'Data file %s ended at %d, before the end of range '
+                        '%d-%d' % (self._data_file, offset, start, stop))
+                self._bytes_read += sent
+                self._readahead(rfd, start, offset, stop)
+                if offset - dropped_cache > DROP_CACHE_WINDOW:
+                    self._drop_cache(rfd, dropped_cache,
+                                     offset - dropped_cache)
+                    dropped_cache = offset
+            self._drop_cache(rfd, dropped_cache, offset - dropped_cache)
+            return ()
+
+        try:
+            if multipart is None:
+                for start, stop in ranges:
+                    send_range(start, stop)
+            else:
+                content_type, boundary, size = multipart
+                for chunk in multi_range_iterator(
+                        ranges, content_type, boundary, size, send_range):
+                    self._write_to_socket(wsockfd, chunk)
+        finally:
+            self.close()
+
+    def _write_to_socket(self, wsockfd, data):
+        if not isinstance(data, bytes):
+            data = data.encode('ascii')
+        while data:
+            try:
+                written = os.write(wsockfd, data)
+            except (IOError, OSError) as exc:
+                if exc.errno != errno.EWOULDBLOCK:
+                    raise
+                trampoline(wsockfd, write=True)
+            else:
+                data = data[written:]
+
     def app_iter_range(self, start, stop):
         """
         Returns an iterator over the data file for range (start, stop)
 
         """
+        self._requested_ranges = ([(start, stop)], None)
+        return DiskFileRangeIter(self, self._app_iter_range(start, stop))
+
+    def _app_iter_range(self, start, stop):
         if start or start == 0:
             self._fp.seek(start)
+        self._read_stop = stop
         if stop is not None:
             length = stop - start
         else:
@@ -1975,6 +3156,13 @@ class BaseDiskFileReader(object):
         Returns an iterator over the data file for a set of ranges
 
         """
+        if ranges:
+            self._requested_ranges = (
+                ranges, (content_type, boundary, size))
+        return DiskFileRangeIter(self, self._app_iter_ranges(
+            ranges, content_type, boundary, size))
+
+    def _app_iter_ranges(self, ranges, content_type, boundary, size):
         if not ranges:
             yield ''
         else:
@@ -1982,7 +3170,7 @@ class BaseDiskFileReader(object):
                 self._suppress_file_closing = True
                 for chunk in multi_range_iterator(
                         ranges, content_type, boundary, size,
-                        self.app_iter_range):
+                        self._app_iter_range):
                     yield chunk
             finally:
                 self._suppress_file_closing = False
@@ -1997,6 +3185,35 @@ class BaseDiskFileReader(object):
         if not self._keep_cache:
             drop_buffer_cache(fd, offset, length)
 
+    def _readahead(self, fd, start, offset, stop):
+        """
+        Ask the kernel to read ahead of a read of the data file, once the
+        read has proven sequential, whenever it gets within half the
+        readahead size of the data already read ahead.
+
+        :param fd: file descriptor of the data file
+        :param start: the offset the read started at
+        :param offset: the offset the read has got to
+        :param stop: the offset the read stops at
+        """
+        policy = self._cache_policy
+        sequential = SEQUENTIAL_READ_CHUNKS * self._disk_chunk_size
+        if policy is None or not policy.readahead_size or \
+                offset - start < sequential:
+            return
+        if offset + policy.readahead_size // 2 < self._readahead_to:
+            return
+        readahead_from = max(offset, self._readahead_to)
+        readahead_to = min(offset + policy.readahead_size, stop)
+        if readahead_to > readahead_from:
+            self._readahead_cache(fd, readahead_from,
+                                  readahead_to - readahead_from)
+            policy.record_readahead(readahead_to - readahead_from)
+            self._readahead_to = readahead_to
+
+    def _readahead_cache(self, fd, offset, length):
+        readahead_buffer_cache(fd, offset, length)
+
     def _quarantine(self, msg):
         self._quarantined_dir = self.manager.quarantine_renamer(
             self._device_path, self._data_file)
@@ -2044,6 +3261,40 @@ class BaseDiskFileReader(object):
                 fp.close()
 
 
+class DiskFileRangeIter(object):
+    """
+    The iterator over the range or ranges of a data file that a
+    :class:`BaseDiskFileReader` returns to swob for a ranged response. It
+    lets the object server zero-copy send the ranges, as it can the whole
+    object with the reader itself.
+
+    :param reader: the :class:`BaseDiskFileReader` the ranges are read by
+    :param iterator: the iterator over the ranges
+    """
+
+    def __init__(self, reader, iterator):
+        self._reader = reader
+        self._iterator = iterator
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return next(self._iterator)
+
+    next = __next__
+
+    def close(self):
+        self._iterator.close()
+        self._reader.close()
+
+    def can_zero_copy_send(self):
+        return self._reader.can_zero_copy_send()
+
+    def zero_copy_send(self, wsockfd):
+        return self._reader.zero_copy_send(wsockfd)
+
+
 class BaseDiskFile(object):
     """
     Manage object files.
@@ -2071,6 +3322,8 @@ class BaseDiskFile(object):
     :param policy: the StoragePolicy instance
     :param use_splice: if true, use zero-copy splice() to send data
     :param pipe_size: size of pipe buffer used in zero-copy operations
+    :param use_sendfile: if true, use zero-copy sendfile() to send ranges of
+                         data
     :param use_linkat: if True, use open() with linkat() to create obj file
     :param open_expired: if True, open() will not raise a DiskFileExpired if
                          object is expired
@@ -2083,14 +3336,16 @@ class BaseDiskFile(object):
                  account=None, container=None, obj=None, _datadir=None,
                  policy=None, use_splice=False, pipe_size=None,
                  use_linkat=False, open_expired=False, next_part_power=None,
-                 **kwargs):
+                 use_sendfile=False, **kwargs):
         self._manager = mgr
         self._device_path = device_path
+        self._threadpool = mgr.threadpools[basename(device_path)]
         self._logger = mgr.logger
         self._disk_chunk_size = mgr.disk_chunk_size
         self._bytes_per_sync = mgr.bytes_per_sync
         self._use_splice = use_splice
         self._pipe_size = pipe_size
+        self._use_sendfile = use_sendfile
         self._use_linkat = use_linkat
         self._open_expired = open_expired
         # This might look a lttle hacky i.e tracking number of newly created
@@ -2122,6 +3377,7 @@ class BaseDiskFile(object):
         self._fp = None
         self._quarantined_dir = None
         self._content_length = None
+        self._cache_entry = None
         if _datadir:
             self._datadir = _datadir
         else:
@@ -2230,7 +3486,7 @@ class BaseDiskFile(object):
         """
         # First figure out if the data directory exists
         try:
-            files = os.listdir(self._datadir)
+            files = self._list_object_dir()
         except OSError as err:
             if err.errno == errno.ENOTDIR:
                 # If there's a file here instead of a directory, quarantine
@@ -2303,6 +3559,21 @@ class BaseDiskFile(object):
         self._logger.increment('quarantines')
         return DiskFileQuarantined(msg)
 
+    def _list_object_dir(self):
+        """
+        List the files in the object's dir, from the manager's metadata cache
+        if it has one.
+
+        :returns: a list of file names
+        :raises OSError: if the object's dir cannot be listed
+        """
+        cache = self.manager.metadata_cache
+        if cache is None:
+            return self.manager._list_object_dir(self._datadir)
+        self._cache_entry = cache.get_entry(
+            self._datadir, self.manager._list_object_dir)
+        return self._cache_entry.files
+
     def _get_ondisk_files(self, files):
         """
         Determine the on-disk files to use.
@@ -2405,22 +3676,40 @@ class BaseDiskFile(object):
             raise self._quarantine(
                 data_file, "bad metadata content-length value %s" % (
                     self._metadata['Content-Length']))
-        fd = fp.fileno()
         try:
-            statbuf = os.fstat(fd)
+            obj_size = self._get_data_file_size(fp)
         except OSError as err:
             # Quarantine, we can't successfully stat the file.
             raise self._quarantine(data_file, "not stat-able: %s" % err)
-        else:
-            obj_size = statbuf.st_size
         if obj_size != metadata_size:
             raise self._quarantine(
                 data_file, "metadata content-length %s does"
                 " not match actual object size %s" % (
-                    metadata_size, statbuf.st_size))
+                    metadata_size, obj_size))
         self._content_length = obj_size
         return obj_size
 
+    def _get_data_file_size(self, fp):
+        """
+        :param fp: open file pointer of the data file
+        :returns: the size of the data file
+        :raises OSError: if the file cannot be stat'ed
+        """
+        return os.fstat(fp.fileno()).st_size
+
+    def _open_data_file(self, data_file):
+        """
+        :param data_file: on-disk `.data` file to open
+        :returns: an opened data file pointer
+        :raises DiskFileNotExist: if the data file has gone away
+        """
+        try:
+            return open(data_file, 'rb')
+        except IOError as e:
+            if e.errno == errno.ENOENT:
+                raise DiskFileNotExist()
+            raise
+
     def _failsafe_read_metadata(self, source, quarantine_filename=None,
                                 add_missing_checksum=False):
         """
@@ -2435,8 +3724,25 @@ class BaseDiskFile(object):
         :param add_missing_checksum: if True and no metadata checksum is
             present, generate one and write it down
         """
+        entry = self._cache_entry
+        if entry is not None and quarantine_filename and \
+                not add_missing_checksum:
+            filename = basename(quarantine_filename)
+            metadata = entry.metadata.get(filename)
+            if metadata is None:
+                metadata = self._read_metadata_or_quarantine(
+                    source, quarantine_filename)
+                entry.metadata[filename] = metadata
+            # callers modify the metadata they get
+            return dict(metadata)
+        return self._read_metadata_or_quarantine(
+            source, quarantine_filename, add_missing_checksum)
+
+    def _read_metadata_or_quarantine(self, source, quarantine_filename,
+                                     add_missing_checksum=False):
         try:
-            return read_metadata(source, add_missing_checksum)
+            return self.manager._read_file_metadata(
+                source, add_missing_checksum=add_missing_checksum)
         except (DiskFileXattrNotSupported, DiskFileNotExist):
             raise
         except DiskFileBadMetadataChecksum as err:
@@ -2483,12 +3789,7 @@ class BaseDiskFile(object):
         :raises DiskFileError: various exceptions from
                     :func:`swift.obj.diskfile.DiskFile._verify_data_file`
         """
-        try:
-            fp = open(data_file, 'rb')
-        except IOError as e:
-            if e.errno == errno.ENOENT:
-                raise DiskFileNotExist()
-            raise
+        fp = self._open_data_file(data_file)
         self._datafile_metadata = self._failsafe_read_metadata(
             fp, data_file,
             add_missing_checksum=modernize)
@@ -2606,7 +3907,9 @@ class BaseDiskFile(object):
             self._metadata['ETag'], self._disk_chunk_size,
             self._manager.keep_cache_size, self._device_path, self._logger,
             use_splice=self._use_splice, quarantine_hook=_quarantine_hook,
-            pipe_size=self._pipe_size, diskfile=self, keep_cache=keep_cache)
+            pipe_size=self._pipe_size, diskfile=self, keep_cache=keep_cache,
+            use_sendfile=self._use_sendfile,
+            cache_policy=self._manager.cache_policy)
         # At this point the reader object is now responsible for closing
         # the file pointer.
         self._fp = None
@@ -2797,16 +4100,18 @@ class DiskFileManager(BaseDiskFileManager):
             hashes[None].update(
                 file_info['timestamp'].internal + file_info['ext'])
 
-    def _hash_suffix(self, path):
+    def _hash_suffix(self, path, ondisk_timestamps=None):
         """
         Performs reclamation and returns an md5 of all (remaining) files.
 
         :param path: full path to directory
+        :param ondisk_timestamps: optional dict to be filled with the
+                                  timestamps of each object found
         :raises PathNotDir: if given path is not a valid directory
         :raises OSError: for non-ENOTDIR errors
         :returns: md5 of files in suffix
         """
-        hashes = self._hash_suffix_dir(path)
+        hashes = self._hash_suffix_dir(path, ondisk_timestamps)
         return hashes[None].hexdigest()
 
 
@@ -2814,11 +4119,12 @@ class ECDiskFileReader(BaseDiskFileReader):
     def __init__(self, fp, data_file, obj_size, etag,
                  disk_chunk_size, keep_cache_size, device_path, logger,
                  quarantine_hook, use_splice, pipe_size, diskfile,
-                 keep_cache=False):
+                 keep_cache=False, use_sendfile=False, cache_policy=None):
         super(ECDiskFileReader, self).__init__(
             fp, data_file, obj_size, etag,
             disk_chunk_size, keep_cache_size, device_path, logger,
-            quarantine_hook, use_splice, pipe_size, diskfile, keep_cache)
+            quarantine_hook, use_splice, pipe_size, diskfile, keep_cache,
+            use_sendfile, cache_policy)
         self.frag_buf = None
         self.frag_offset = 0
         self.frag_size = self._diskfile.policy.fragment_size
@@ -2834,6 +4140,13 @@ class ECDiskFileReader(BaseDiskFileReader):
         else:
             self.frag_buf = None
 
+    def can_zero_copy_send(self):
+        # the fragments read from the start of the fragment archive are
+        # checked, which can only be done in userspace
+        if self._requested_ranges is not None and self._ranges_start_at_0():
+            return False
+        return super(ECDiskFileReader, self).can_zero_copy_send()
+
     def _check_frag(self, frag):
         if not frag:
             return
@@ -2899,7 +4212,12 @@ class ECDiskFileWriter(BaseDiskFileWriter):
         try:
             try:
                 os.rename(data_file_path, durable_data_file_path)
-                fsync_dir(self._datadir)
+                committer = self.manager.get_group_committer(
+                    self._diskfile._device_path)
+                if committer:
+                    committer.commit(paths=[self._datadir])
+                else:
+                    fsync_dir(self._datadir)
                 if self.next_part_power and \
                         data_file_path != new_data_file_path:
                     try:
@@ -2958,7 +4276,7 @@ class ECDiskFileWriter(BaseDiskFileWriter):
         durable_data_file_path = os.path.join(
             self._datadir, self.manager.make_on_disk_filename(
                 timestamp, '.data', self._diskfile._frag_index, durable=True))
-        tpool_reraise(
+        self._diskfile._threadpool.force_run_in_thread(
             self._finalize_durable, data_file_path, durable_data_file_path)
 
     def put(self, metadata):
@@ -3432,11 +4750,13 @@ class ECDiskFileManager(BaseDiskFileManager):
             file_info = ondisk_info['durable_frag_set'][0]
             hashes[None].update(file_info['timestamp'].internal + '.durable')
 
-    def _hash_suffix(self, path):
+    def _hash_suffix(self, path, ondisk_timestamps=None):
         """
         Performs reclamation and returns an md5 of all (remaining) files.
 
         :param path: full path to directory
+        :param ondisk_timestamps: optional dict to be filled with the
+                                  timestamps of each object found
         :raises PathNotDir: if given path is not a valid directory
         :raises OSError: for non-ENOTDIR errors
         :returns: dict of md5 hex digests
@@ -3445,5 +4765,5 @@ class ECDiskFileManager(BaseDiskFileManager):
         # here we flatten out the hashers hexdigest into a dictionary instead
         # of just returning the one hexdigest for the whole suffix
 
-        hash_per_fi = self._hash_suffix_dir(path)
+        hash_per_fi = self._hash_suffix_dir(path, ondisk_timestamps)
         return dict((fi, md5.hexdigest()) for fi, md5 in hash_per_fi.items())
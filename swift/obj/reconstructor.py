@@ -35,7 +35,7 @@ from swift.common.utils import (
     tpool_reraise, GreenAsyncPile, Timestamp, remove_file,
     load_recon_cache, parse_override_options, distribute_evenly)
 from swift.common.header_key_dict import HeaderKeyDict
-from swift.common.bufferedhttp import http_connect
+from swift.common.bufferedhttp import http_connect, HTTPConnectionPool
 from swift.common.daemon import Daemon
 from swift.common.ring.utils import is_local_device
 from swift.obj.ssync_sender import Sender as ssync_sender
@@ -174,6 +174,18 @@ class ObjectReconstructor(Daemon):
         self.conn_timeout = float(conf.get('conn_timeout', 0.5))
         self.node_timeout = float(conf.get('node_timeout', 10))
         self.network_chunk_size = int(conf.get('network_chunk_size', 65536))
+        self.ssync_pipeline_window = int(
+            conf.get('ssync_pipeline_window', 1))
+        self.ssync_reconcile_ratio = float(
+            conf.get('ssync_reconcile_ratio', 0))
+        # keep-alive connections for REPLICATE and SSYNC requests, kept for
+        # the length of a reconstruction pass
+        self.conn_pool = None
+        conn_pool_size = int(conf.get('conn_pool_size', 0))
+        if conn_pool_size > 0:
+            self.conn_pool = HTTPConnectionPool(
+                self.logger, max_idle=conn_pool_size,
+                idle_timeout=float(conf.get('conn_pool_idle_timeout', 20)))
         self.disk_chunk_size = int(conf.get('disk_chunk_size', 65536))
         self.headers = {
             'Content-Length': '0',
@@ -566,6 +578,15 @@ class ObjectReconstructor(Daemon):
                      'min': self.partition_times[0],
                      'med': self.partition_times[
                          len(self.partition_times) // 2]})
+            if self.conn_pool:
+                pool = self.conn_pool
+                self.logger.info(
+                    '%(hits)d pooled connections reused, %(misses)d opened '
+                    '(avg connect %(connect).2fms), %(retries)d retried',
+                    {'hits': pool.hits, 'misses': pool.misses,
+                     'connect': pool.connect_time * 1000 / pool.misses
+                     if pool.misses else 0,
+                     'retries': pool.retries})
         else:
             self.logger.info(
                 _("Nothing reconstructed for %s seconds."),
@@ -634,14 +655,25 @@ class ObjectReconstructor(Daemon):
                 suffixes.append(suffix)
         return suffixes
 
+    def _http_connect(self, node, partition, method, path, headers):
+        """
+        Make a request to a node's replication server, on a pooled
+        connection if there is a connection pool.
+
+        :returns: an HTTPConnection
+        """
+        connect = self.conn_pool.http_connect if self.conn_pool \
+            else http_connect
+        return connect(node['replication_ip'], node['replication_port'],
+                       node['device'], partition, method, path,
+                       headers=headers)
+
     def rehash_remote(self, node, job, suffixes):
         try:
             with Timeout(self.http_timeout):
-                conn = http_connect(
-                    node['replication_ip'], node['replication_port'],
-                    node['device'], job['partition'], 'REPLICATE',
-                    '/' + '-'.join(sorted(suffixes)),
-                    headers=self.headers)
+                conn = self._http_connect(
+                    node, job['partition'], 'REPLICATE',
+                    '/' + '-'.join(sorted(suffixes)), self.headers)
                 conn.getresponse().read()
         except (Exception, Timeout):
             self.logger.exception(
@@ -664,10 +696,9 @@ class ObjectReconstructor(Daemon):
         remote_suffixes = None
         try:
             with Timeout(self.http_timeout):
-                resp = http_connect(
-                    node['replication_ip'], node['replication_port'],
-                    node['device'], job['partition'], 'REPLICATE',
-                    '', headers=self.headers).getresponse()
+                resp = self._http_connect(
+                    node, job['partition'], 'REPLICATE', '',
+                    self.headers).getresponse()
             if resp.status == HTTP_INSUFFICIENT_STORAGE:
                 self.logger.error(
                     _('%s responded as unmounted'),
@@ -1125,6 +1156,8 @@ class ObjectReconstructor(Daemon):
         self.reconstruction_part_count = 0
         self.last_reconstruction_count = -1
         self.handoffs_remaining = 0
+        if self.conn_pool:
+            self.conn_pool.reset_stats()
 
     def delete_partition(self, path):
         def kill_it(path):
@@ -1174,6 +1207,8 @@ class ObjectReconstructor(Daemon):
         finally:
             stats.kill()
             lockup_detector.kill()
+            if self.conn_pool:
+                self.conn_pool.close()
             self.stats_line()
         if self.handoffs_only:
             if self.handoffs_remaining > 0:
@@ -0,0 +1,177 @@
+# Copyright (c) 2010-2012 OpenStack Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+A persistent queue of the partitions of a storage policy on a device that
+are known to differ from their other replicas, so that the object replicator
+can replicate them before the rest and measure how long they take to
+converge.
+
+Partitions are queued for one of ``REASONS``, most urgent first: a handoff
+partition that should be moved to its primaries, a partition whose primary
+nodes changed when the ring was reloaded, or a partition with suffix hashes
+invalidated by writes. A partition stays queued, across replication passes
+and restarts, until it has been replicated to all of its nodes.
+
+The queue is kept in a JSON file in the policy's data dir, which maps each
+queued partition to its reason and the time it was first queued.
+"""
+
+import errno
+import json
+import os
+import time
+from tempfile import NamedTemporaryFile
+
+from swift.common.utils import renamer
+
+REPLICATION_QUEUE_FILE = 'replication_queue.json'
+HANDOFF = 'handoff'
+REASSIGNED = 'reassigned'
+INVALIDATED = 'invalidated'
+REASONS = (HANDOFF, REASSIGNED, INVALIDATED)
+
+
+class ReplicationQueue(object):
+    """
+    The replication queue of one storage policy on one device.
+
+    :param datadir_path: the policy's data dir on the device
+    :param logger: a logger
+    """
+
+    def __init__(self, datadir_path, logger):
+        self.path = os.path.join(datadir_path, REPLICATION_QUEUE_FILE)
+        self.logger = logger
+        # partition => [reason, time first queued]
+        self.entries = {}
+        self.dirty = False
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, partition):
+        return partition in self.entries
+
+    def load(self):
+        """
+        Load the queue from its file, if it has one.
+        """
+        self.entries = {}
+        self.dirty = False
+        try:
+            with open(self.path, 'rb') as fp:
+                entries = json.loads(fp.read().decode('utf8'))
+        except (IOError, OSError) as err:
+            if err.errno != errno.ENOENT:
+                self.logger.warning('Cannot read %s (%s)', self.path, err)
+            return
+        except ValueError as err:
+            self.logger.warning('Loading JSON from %s failed (%s)',
+                                self.path, err)
+            return
+        if not isinstance(entries, dict):
+            self.logger.warning('Ignoring invalid %s', self.path)
+            return
+        for partition, entry in entries.items():
+            try:
+                reason, since = entry
+                since = float(since)
+            except (TypeError, ValueError):
+                continue
+            if reason in REASONS:
+                self.entries[str(partition)] = [reason, since]
+
+    def save(self):
+        """
+        Write the queue to its file, if it has changed since it was loaded
+        or last saved.
+        """
+        if not self.dirty:
+            return
+        tf = None
+        try:
+            with NamedTemporaryFile(dir=os.path.dirname(self.path),
+                                    delete=False) as tf:
+                tf.write(json.dumps(self.entries, sort_keys=True).encode(
+                    'ascii'))
+            renamer(tf.name, self.path, fsync=False)
+            self.dirty = False
+        except (IOError, OSError) as err:
+            self.logger.warning('Cannot write %s (%s)', self.path, err)
+        finally:
+            if tf is not None:
+                try:
+                    os.unlink(tf.name)
+                except OSError:
+                    pass
+
+    def push(self, partition, reason, now=None):
+        """
+        Queue a partition, or make it more urgent if it is already queued
+        for a less urgent reason.
+
+        :param partition: the partition, as named by its dir
+        :param reason: one of ``REASONS``
+        :param now: the time the partition is first queued at
+        """
+        entry = self.entries.get(partition)
+        if entry is None:
+            self.entries[partition] = [reason, now or time.time()]
+            self.dirty = True
+        elif REASONS.index(reason) < REASONS.index(entry[0]):
+            entry[0] = reason
+            self.dirty = True
+
+    def pop(self, partition):
+        """
+        Take a partition off the queue.
+
+        :returns: the time the partition was first queued, or None if it was
+                  not queued
+        """
+        entry = self.entries.pop(partition, None)
+        if entry is None:
+            return None
+        self.dirty = True
+        return entry[1]
+
+    def retain(self, partitions):
+        """
+        Take the partitions that are not in the given ones off the queue,
+        such as those whose dirs have been removed.
+        """
+        for partition in set(self.entries) - set(partitions):
+            self.pop(partition)
+
+    def get_priority(self, partition):
+        """
+        :returns: a key that sorts queued partitions by the urgency of their
+                  reasons and then by how long they have been queued, or None
+                  if the partition is not queued
+        """
+        entry = self.entries.get(partition)
+        if entry is None:
+            return None
+        return REASONS.index(entry[0]), entry[1]
+
+    def oldest(self):
+        """
+        :returns: the time that the partition queued longest ago was queued,
+                  or None if the queue is empty
+        """
+        if not self.entries:
+            return None
+        return min(since for _junk, since in self.entries.values())
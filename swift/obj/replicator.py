@@ -37,11 +37,14 @@ from swift.common.utils import whataremyips, unlink_older_than, \
     tpool_reraise, config_auto_int_value, storage_directory, \
     load_recon_cache, PrefixLoggerAdapter, parse_override_options, \
     distribute_evenly
-from swift.common.bufferedhttp import http_connect
+from swift.common.bufferedhttp import http_connect, HTTPConnectionPool
 from swift.common.daemon import Daemon
 from swift.common.http import HTTP_OK, HTTP_INSUFFICIENT_STORAGE
 from swift.obj import ssync_sender
-from swift.obj.diskfile import get_data_dir, get_tmp_dir, DiskFileRouter
+from swift.obj.diskfile import get_data_dir, get_tmp_dir, DiskFileRouter, \
+    get_hash_tree, get_suffix_group, has_invalidated_hashes
+from swift.obj.replication_queue import ReplicationQueue, \
+    REPLICATION_QUEUE_FILE, HANDOFF, REASSIGNED, INVALIDATED
 from swift.common.storage_policy import POLICIES, REPL_POLICY
 
 DEFAULT_RSYNC_TIMEOUT = 900
@@ -164,6 +167,19 @@ class ObjectReplicator(Daemon):
         self.node_timeout = float(conf.get('node_timeout', 10))
         self.sync_method = getattr(self, conf.get('sync_method') or 'rsync')
         self.network_chunk_size = int(conf.get('network_chunk_size', 65536))
+        self.ssync_pipeline_window = int(
+            conf.get('ssync_pipeline_window', 1))
+        self.ssync_reconcile_ratio = float(
+            conf.get('ssync_reconcile_ratio', 0))
+        self.hash_tree = config_true_value(conf.get('hash_tree', 'false'))
+        # keep-alive connections for REPLICATE and SSYNC requests, kept for
+        # the length of a replication pass
+        self.conn_pool = None
+        conn_pool_size = int(conf.get('conn_pool_size', 0))
+        if conn_pool_size > 0:
+            self.conn_pool = HTTPConnectionPool(
+                self.logger, max_idle=conn_pool_size,
+                idle_timeout=float(conf.get('conn_pool_idle_timeout', 20)))
         self.default_headers = {
             'Content-Length': '0',
             'user-agent': 'object-replicator %s' % os.getpid()}
@@ -180,6 +196,14 @@ class ObjectReplicator(Daemon):
                                 'normal rebalance')
         self.is_multiprocess_worker = None
         self._df_router = DiskFileRouter(conf, self.logger)
+        # changed_parts of each policy's ring that have been prioritized
+        self._prioritized_changed_parts = {}
+        self.priority_queue = config_true_value(
+            conf.get('priority_queue', 'false'))
+        # the ReplicationQueue of each (device, policy index), and the
+        # seconds that the partitions taken off them this pass were queued
+        self.replication_queues = {}
+        self.convergence_times = []
         self._child_process_reaper_queue = queue.LightQueue()
 
     def _zero_stats(self):
@@ -402,6 +426,10 @@ class ObjectReplicator(Daemon):
         Uses rsync to implement the sync method. This was the first
         sync method in Swift.
         """
+        if self._df_router[job['policy']].replicate_with_ssync:
+            # rsync would overwrite the remote copies of files that are
+            # appended to, such as the volumes of the slab backend
+            return self.ssync(node, job, suffixes)
         if not os.path.exists(job['path']):
             return False, {}
         args = [
@@ -492,11 +520,9 @@ class ObjectReplicator(Daemon):
                         node, job, suffixes, **kwargs)
                     if success:
                         with Timeout(self.http_timeout):
-                            conn = http_connect(
-                                node['replication_ip'],
-                                node['replication_port'],
-                                node['device'], job['partition'], 'REPLICATE',
-                                '/' + '-'.join(suffixes), headers=headers)
+                            conn = self._http_connect(
+                                node, job['partition'], 'REPLICATE',
+                                '/' + '-'.join(suffixes), headers)
                             conn.getresponse().read()
                         if node['region'] != job['region']:
                             synced_remote_regions[node['region']] = viewkeys(
@@ -551,7 +577,9 @@ class ObjectReplicator(Daemon):
                                      target_dev['device'])
                                     for target_dev in job['nodes']])
             stats.success += len(target_devs_info - failure_devs_info)
-            if not handoff_partition_deleted:
+            if handoff_partition_deleted:
+                self._converged(job)
+            else:
                 self.handoffs_remaining += 1
             self.partition_times.append(time.time() - begin)
             self.logger.timing_since('partition.delete.timing', begin)
@@ -579,6 +607,72 @@ class ObjectReplicator(Daemon):
                         suffix_dir)
         return success_paths, error_paths
 
+    def _http_connect(self, node, partition, method, path, headers):
+        """
+        Make a request to a node's replication server, on a pooled
+        connection if there is a connection pool.
+
+        :returns: an HTTPConnection
+        """
+        connect = self.conn_pool.http_connect if self.conn_pool \
+            else http_connect
+        return connect(node['replication_ip'], node['replication_port'],
+                       node['device'], partition, method, path,
+                       headers=headers)
+
+    def _descend_hash_tree(self, node, job, headers, local_hash,
+                           remote_groups):
+        """
+        Get the remote hashes of the suffixes in the suffix groups of a
+        partition's hash tree whose hashes differ from the local ones.
+
+        :param node: the remote node
+        :param job: the replication job
+        :param headers: the headers of REPLICATE requests
+        :param local_hash: a dict of suffix => local suffix hash
+        :param remote_groups: a dict of suffix group => remote group hash
+        :returns: a dict of suffix => remote suffix hash, in which the
+                  suffixes of groups whose hashes match have their local
+                  hashes, or None if the remote hashes could not be got
+        """
+        _junk, local_groups = get_hash_tree(local_hash)
+        groups = [group for group in local_groups
+                  if local_groups[group] != remote_groups.get(group)]
+        remote_hash = dict(
+            (suffix, hash_) for suffix, hash_ in local_hash.items()
+            if get_suffix_group(suffix) not in groups)
+        if not groups:
+            return remote_hash
+        headers = dict(headers)
+        headers['X-Backend-Hash-Tree-Groups'] = '-'.join(sorted(groups))
+        with Timeout(self.http_timeout):
+            resp = self._http_connect(
+                node, job['partition'], 'REPLICATE', '',
+                headers).getresponse()
+            if resp.status != HTTP_OK:
+                self.logger.error(_("Invalid response %(resp)s "
+                                    "from %(ip)s"),
+                                  {'resp': resp.status,
+                                   'ip': node['replication_ip']})
+                return None
+            remote_hash.update(pickle.loads(resp.read()))
+        self.logger.update_stats('suffix.tree_groups', len(groups))
+        return remote_hash
+
+    def _converged(self, job):
+        """
+        Take a partition that has been replicated to all of its nodes off its
+        replication queue, measuring how long it was queued for.
+        """
+        repl_queue = self.replication_queues.get(
+            (job['device'], int(job['policy'])))
+        if repl_queue is None:
+            return
+        since = repl_queue.pop(job['partition'])
+        if since is not None:
+            self.convergence_times.append(time.time() - since)
+            self.logger.timing_since('partition.convergence.timing', since)
+
     def update(self, job):
         """
         High-level method that replicates a single partition.
@@ -620,11 +714,15 @@ class ObjectReplicator(Daemon):
                 if node['region'] in synced_remote_regions:
                     continue
                 try:
+                    replicate_headers = dict(headers)
+                    if self.hash_tree:
+                        local_root, _junk = get_hash_tree(local_hash)
+                        replicate_headers['X-Backend-Hash-Tree-Root'] = \
+                            local_root
                     with Timeout(self.http_timeout):
-                        resp = http_connect(
-                            node['replication_ip'], node['replication_port'],
-                            node['device'], job['partition'], 'REPLICATE',
-                            '', headers=headers).getresponse()
+                        resp = self._http_connect(
+                            node, job['partition'], 'REPLICATE', '',
+                            replicate_headers).getresponse()
                         if resp.status == HTTP_INSUFFICIENT_STORAGE:
                             self.logger.error(
                                 _('%(replication_ip)s/%(device)s '
@@ -641,8 +739,24 @@ class ObjectReplicator(Daemon):
                             failure_devs_info.add((node['replication_ip'],
                                                    node['device']))
                             continue
+                        remote_root = None
+                        if self.hash_tree:
+                            # servers that do not know about hash trees
+                            # return all of their suffix hashes
+                            remote_root = resp.getheader(
+                                'X-Backend-Hash-Tree-Root')
                         remote_hash = pickle.loads(resp.read())
                         del resp
+                    if remote_root is not None:
+                        if remote_root == local_root:
+                            stats.hashmatch += 1
+                            continue
+                        remote_hash = self._descend_hash_tree(
+                            node, job, headers, local_hash, remote_hash)
+                        if remote_hash is None:
+                            failure_devs_info.add((node['replication_ip'],
+                                                   node['device']))
+                            continue
                     suffixes = [suffix for suffix in local_hash if
                                 local_hash[suffix] !=
                                 remote_hash.get(suffix, -1)]
@@ -661,11 +775,9 @@ class ObjectReplicator(Daemon):
                     stats.rsync += 1
                     success, _junk = self.sync(node, job, suffixes)
                     with Timeout(self.http_timeout):
-                        conn = http_connect(
-                            node['replication_ip'], node['replication_port'],
-                            node['device'], job['partition'], 'REPLICATE',
-                            '/' + '-'.join(suffixes),
-                            headers=headers)
+                        conn = self._http_connect(
+                            node, job['partition'], 'REPLICATE',
+                            '/' + '-'.join(suffixes), headers)
                         conn.getresponse().read()
                     if not success:
                         failure_devs_info.add((node['replication_ip'],
@@ -681,6 +793,8 @@ class ObjectReplicator(Daemon):
                     self.logger.exception(_("Error syncing with node: %s") %
                                           node)
             stats.suffix_count += len(local_hash)
+            if not failure_devs_info:
+                self._converged(job)
         except StopIteration:
             self.logger.error('Ran out of handoffs while replicating '
                               'partition %s of policy %d',
@@ -735,6 +849,32 @@ class ObjectReplicator(Daemon):
                      'min': self.partition_times[0],
                      'med': self.partition_times[
                          len(self.partition_times) // 2]})
+            if self.replication_queues:
+                queued = sum(len(repl_queue) for repl_queue in
+                             self.replication_queues.values())
+                oldest = min([repl_queue.oldest() for repl_queue in
+                              self.replication_queues.values()
+                              if len(repl_queue)] or [None])
+                converged = sorted(self.convergence_times)
+                self.logger.info(
+                    '%(queued)d partitions queued (oldest %(oldest).2fs), '
+                    '%(converged)d converged (max %(max).2fs, '
+                    'med %(med).2fs)',
+                    {'queued': queued,
+                     'oldest': time.time() - oldest if oldest else 0,
+                     'converged': len(converged),
+                     'max': converged[-1] if converged else 0,
+                     'med': converged[len(converged) // 2]
+                     if converged else 0})
+            if self.conn_pool:
+                pool = self.conn_pool
+                self.logger.info(
+                    '%(hits)d pooled connections reused, %(misses)d opened '
+                    '(avg connect %(connect).2fms), %(retries)d retried',
+                    {'hits': pool.hits, 'misses': pool.misses,
+                     'connect': pool.connect_time * 1000 / pool.misses
+                     if pool.misses else 0,
+                     'retries': pool.retries})
         else:
             self.logger.info(
                 _("Nothing replicated for %s seconds."),
@@ -749,11 +889,38 @@ class ObjectReplicator(Daemon):
             eventlet.sleep(self.stats_interval)
             self.stats_line()
 
+    def _get_replication_queue(self, device, policy, obj_path):
+        key = (device, int(policy))
+        if key not in self.replication_queues:
+            repl_queue = ReplicationQueue(obj_path, self.logger)
+            repl_queue.load()
+            self.replication_queues[key] = repl_queue
+        return self.replication_queues[key]
+
+    def _queue_job(self, repl_queue, job, changed_parts):
+        """
+        Queue a job's partition if it is known to differ from its other
+        replicas, and set the job's priority.
+        """
+        partition = job['partition']
+        if job['delete']:
+            repl_queue.push(partition, HANDOFF)
+        elif changed_parts and int(partition) in changed_parts:
+            repl_queue.push(partition, REASSIGNED)
+        elif partition not in repl_queue and \
+                has_invalidated_hashes(job['path']):
+            repl_queue.push(partition, INVALIDATED)
+        job['priority'] = repl_queue.get_priority(partition)
+
     def build_replication_jobs(self, policy, ips, override_devices=None,
-                               override_partitions=None):
+                               override_partitions=None, changed_parts=None):
         """
         Helper function for collect_jobs to build jobs for replication
         using replication style storage policy
+
+        :param changed_parts: the partitions reassigned by the last change
+                              to the policy's ring, which are queued with
+                              priority_queue enabled
         """
         jobs = []
         df_mgr = self._df_router[policy]
@@ -793,7 +960,12 @@ class ObjectReplicator(Daemon):
                 except Exception:
                     self.logger.exception('ERROR creating %s' % obj_path)
                 continue
-            for partition in os.listdir(obj_path):
+            repl_queue = None
+            if self.priority_queue:
+                repl_queue = self._get_replication_queue(
+                    local_dev['device'], policy, obj_path)
+            partitions = os.listdir(obj_path)
+            for partition in partitions:
                 if (override_partitions is not None
                         and partition not in override_partitions):
                     continue
@@ -802,6 +974,8 @@ class ObjectReplicator(Daemon):
                         partition.endswith('.json')):
                     # ignore auditor status files
                     continue
+                if partition == REPLICATION_QUEUE_FILE:
+                    continue
 
                 part_nodes = None
                 try:
@@ -810,15 +984,17 @@ class ObjectReplicator(Daemon):
                         int(partition))
                     nodes = [node for node in part_nodes
                              if node['id'] != local_dev['id']]
-                    jobs.append(
-                        dict(path=job_path,
-                             device=local_dev['device'],
-                             obj_path=obj_path,
-                             nodes=nodes,
-                             delete=len(nodes) > len(part_nodes) - 1,
-                             policy=policy,
-                             partition=partition,
-                             region=local_dev['region']))
+                    job = dict(path=job_path,
+                               device=local_dev['device'],
+                               obj_path=obj_path,
+                               nodes=nodes,
+                               delete=len(nodes) > len(part_nodes) - 1,
+                               policy=policy,
+                               partition=partition,
+                               region=local_dev['region'])
+                    if repl_queue is not None:
+                        self._queue_job(repl_queue, job, changed_parts)
+                    jobs.append(job)
                 except ValueError:
                     if part_nodes:
                         local_dev_stats.add_failure_stats(
@@ -832,6 +1008,10 @@ class ObjectReplicator(Daemon):
                              for failure_dev in policy.object_ring.devs
                              if failure_dev])
                     continue
+            if repl_queue is not None:
+                # forget the partitions that are no longer on the device
+                repl_queue.retain(partitions)
+                repl_queue.save()
         if not found_local:
             self.logger.error("Can't find itself in policy with index %d with"
                               " ips %s and with port %s in ring file, not"
@@ -839,6 +1019,20 @@ class ObjectReplicator(Daemon):
                               int(policy), ", ".join(ips), self.port)
         return jobs
 
+    def _get_new_changed_parts(self, policy):
+        """
+        Get the partitions whose primary nodes changed when the policy's ring
+        was last reloaded, unless they have already been prioritized.
+
+        :param policy: the StoragePolicy instance
+        :returns: a set of partitions, or None
+        """
+        changed_parts = getattr(policy.object_ring, 'changed_parts', None)
+        if changed_parts is self._prioritized_changed_parts.get(policy.idx):
+            return None
+        self._prioritized_changed_parts[policy.idx] = changed_parts
+        return changed_parts
+
     def collect_jobs(self, override_devices=None, override_partitions=None,
                      override_policies=None):
         """
@@ -853,6 +1047,7 @@ class ObjectReplicator(Daemon):
             policies will be returned
         """
         jobs = []
+        changed_parts_by_policy = {}
         ips = whataremyips(self.bind_ip)
         for policy in POLICIES:
             # Skip replication if next_part_power is set. In this case
@@ -874,10 +1069,28 @@ class ObjectReplicator(Daemon):
                     continue
                 # ensure rings are loaded for policy
                 self.load_object_ring(policy)
+                changed_parts = self._get_new_changed_parts(policy)
                 jobs += self.build_replication_jobs(
                     policy, ips, override_devices=override_devices,
-                    override_partitions=override_partitions)
+                    override_partitions=override_partitions,
+                    changed_parts=changed_parts)
+                if changed_parts:
+                    self.logger.info(
+                        'Ring for policy %s changed; prioritizing %d '
+                        'reassigned partitions', policy.name,
+                        len(changed_parts))
+                    changed_parts_by_policy[policy.idx] = changed_parts
         random.shuffle(jobs)
+        if changed_parts_by_policy:
+            # Move the parts that were reassigned by the last ring change to
+            # the front of the list
+            jobs.sort(key=lambda job: int(job['partition']) not in
+                      changed_parts_by_policy.get(job['policy'].idx, ()))
+        if self.priority_queue:
+            # Move the queued parts to the front of the list, the most urgent
+            # and longest queued first
+            jobs.sort(key=lambda job: (job.get('priority') is None,
+                                       job.get('priority')))
         if self.handoffs_first:
             # Move the handoff parts to the front of the list
             jobs.sort(key=lambda job: not job['delete'])
@@ -896,6 +1109,9 @@ class ObjectReplicator(Daemon):
         self.my_replication_ips = self._get_my_replication_ips()
         self.all_devs_info = set()
         self.handoffs_remaining = 0
+        self.convergence_times = []
+        if self.conn_pool:
+            self.conn_pool.reset_stats()
 
         stats = eventlet.spawn(self.heartbeat)
         eventlet.sleep()  # Give spawns a cycle
@@ -964,6 +1180,10 @@ class ObjectReplicator(Daemon):
                 _("Exception in top-level replication loop: %s"), err)
         finally:
             stats.kill()
+            for repl_queue in self.replication_queues.values():
+                repl_queue.save()
+            if self.conn_pool:
+                self.conn_pool.close()
             self.stats_line()
 
     def update_recon(self, total, end_time, override_devices):
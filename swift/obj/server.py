@@ -24,18 +24,22 @@ import time
 import traceback
 import socket
 import math
+from collections import defaultdict
+from os.path import join
 from swift import gettext_ as _
 from hashlib import md5
 
 from eventlet import sleep, wsgi, Timeout, tpool
+from eventlet.event import Event
 from eventlet.greenthread import spawn
+from eventlet.semaphore import Semaphore
 
 from swift.common.utils import public, get_logger, \
     config_true_value, timing_stats, replication, \
     normalize_delete_at_timestamp, get_log_line, Timestamp, \
     get_expirer_container, parse_mime_headers, \
     iter_multipart_mime_documents, extract_swift_bytes, safe_json_loads, \
-    config_auto_int_value
+    config_auto_int_value, split_path, dump_recon_cache, load_recon_cache
 from swift.common.bufferedhttp import http_connect
 from swift.common.constraints import check_object_creation, \
     valid_timestamp, check_utf8
@@ -47,6 +51,7 @@ from swift.obj import ssync_receiver
 from swift.common.http import is_success
 from swift.common.base_storage_server import BaseStorageServer
 from swift.common.header_key_dict import HeaderKeyDict
+from swift.common.storage_policy import POLICIES
 from swift.common.request_helpers import get_name_and_placement, \
     is_user_meta, is_sys_or_user_meta, is_object_transient_sysmeta, \
     resolve_etag_is_at_header, is_sys_meta
@@ -55,8 +60,9 @@ from swift.common.swob import HTTPAccepted, HTTPBadRequest, HTTPCreated, \
     HTTPPreconditionFailed, HTTPRequestTimeout, HTTPUnprocessableEntity, \
     HTTPClientDisconnect, HTTPMethodNotAllowed, Request, Response, \
     HTTPInsufficientStorage, HTTPForbidden, HTTPException, HTTPConflict, \
-    HTTPServerError
-from swift.obj.diskfile import RESERVED_DATAFILE_META, DiskFileRouter
+    HTTPServerError, HTTPServiceUnavailable
+from swift.obj.diskfile import RESERVED_DATAFILE_META, DiskFileRouter, \
+    get_hash_tree, get_suffix_group
 
 
 def iter_mime_headers_and_bodies(wsgi_input, mime_boundary, read_chunk_size):
@@ -108,6 +114,136 @@ class EventletPlungerString(str):
         return wsgi.MINIMUM_CHUNK_SIZE + 1
 
 
+class DeviceConcurrencyLimit(object):
+    """
+    Limits the number of client requests that a worker handles at once for
+    one device, and keeps stats of the requests for the device.
+
+    :param limit: the maximum number of requests handled at once
+    """
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.semaphore = Semaphore(limit)
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.waiting = 0
+        self.max_waiting = 0
+        self.requests = 0
+        self.rejected = 0
+        self.wait_time = 0.0
+
+    def acquire(self, timeout):
+        """
+        Wait for a free slot.
+
+        :param timeout: the most seconds to wait for a slot
+        :returns: the seconds waited for a slot, or None if no slot became
+                  free in time
+        """
+        start = time.time()
+        self.waiting += 1
+        self.max_waiting = max(self.max_waiting, self.waiting)
+        try:
+            if timeout > 0:
+                acquired = self.semaphore.acquire(timeout=timeout)
+            else:
+                acquired = self.semaphore.acquire(blocking=False)
+        finally:
+            self.waiting -= 1
+        waited = time.time() - start
+        self.wait_time += waited
+        if not acquired:
+            self.rejected += 1
+            return None
+        self.requests += 1
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        return waited
+
+    def release(self):
+        self.in_flight -= 1
+        self.semaphore.release()
+
+    def get_stats(self):
+        return {'limit': self.limit,
+                'in_flight': self.in_flight,
+                'max_in_flight': self.max_in_flight,
+                'waiting': self.waiting,
+                'max_waiting': self.max_waiting,
+                'requests': self.requests,
+                'rejected': self.rejected,
+                'wait_time': self.wait_time}
+
+
+class ContainerUpdateBatcher(object):
+    """
+    Coalesces the updates that a worker sends to each replica of a container
+    into batches.
+
+    Each caller of :meth:`update` waits for the batch its update joins to be
+    sent. The first caller of a batch waits for up to ``window`` seconds, or
+    until ``max_batch`` updates have joined it, and then sends the batch
+    with ``send_batch``.
+
+    :param send_batch: callable taking the key of a container replica and a
+                       list of updates, and returning True if they were all
+                       merged into the container
+    :param window: the longest time, in seconds, the first caller of a batch
+                   waits for others to join it
+    :param max_batch: the number of updates that sends a batch without
+                      waiting for the rest of the window
+    """
+
+    class _Batch(object):
+
+        def __init__(self):
+            self.updates = []
+            self.full = Event()
+            self.sent = Event()
+
+    def __init__(self, send_batch, window=0.005, max_batch=100):
+        self.send_batch = send_batch
+        self.window = window
+        self.max_batch = max_batch
+        # container replica -> the batch gathering its updates
+        self._gathering = {}
+
+    def update(self, key, update):
+        """
+        Send an update in a batch with other updates to the same container
+        replica.
+
+        :param key: the container replica, e.g. a tuple of its host, device,
+                    partition, account and container
+        :param update: the update
+        :returns: True if the batch the update was sent in succeeded
+        """
+        batch = self._gathering.get(key)
+        leader = batch is None
+        if leader:
+            batch = self._gathering[key] = self._Batch()
+        batch.updates.append(update)
+        if len(batch.updates) >= self.max_batch:
+            # no more updates join a full batch
+            del self._gathering[key]
+            if not leader:
+                batch.full.send()
+        if not leader:
+            return batch.sent.wait()
+        if len(batch.updates) < self.max_batch:
+            with Timeout(self.window, False):
+                batch.full.wait()
+            if self._gathering.get(key) is batch:
+                del self._gathering[key]
+        try:
+            success = self.send_batch(key, batch.updates)
+        except (Exception, Timeout):
+            success = False
+        batch.sent.send(success)
+        return success
+
+
 class ObjectController(BaseStorageServer):
     """Implements the WSGI application for the Swift Object Server."""
 
@@ -134,6 +270,23 @@ class ObjectController(BaseStorageServer):
         self.slow = int(conf.get('slow', 0))
         self.keep_cache_private = \
             config_true_value(conf.get('keep_cache_private', 'false'))
+        self.device_concurrency = int(conf.get('device_concurrency', 0))
+        self.device_concurrency_timeout = float(
+            conf.get('device_concurrency_timeout', 0.5))
+        self.device_limits = {}
+        self.recon_cache_path = conf.get('recon_cache_path',
+                                         '/var/cache/swift')
+        self.rcache = join(self.recon_cache_path, 'object.recon')
+        self.device_stats_interval = float(
+            conf.get('device_stats_interval', 300))
+        self.next_stats_dump = time.time() + self.device_stats_interval
+        self.container_update_batcher = None
+        if config_true_value(conf.get('container_update_batching', 'false')):
+            self.container_update_batcher = ContainerUpdateBatcher(
+                self._send_container_update_batch,
+                window=float(conf.get('container_update_batch_window',
+                                      '0.005')),
+                max_batch=int(conf.get('container_update_max_batch', '100')))
 
         default_allowed_headers = '''
             content-disposition,
@@ -201,6 +354,8 @@ class ObjectController(BaseStorageServer):
             conf.get('replication_failure_threshold') or 100)
         self.replication_failure_ratio = float(
             conf.get('replication_failure_ratio') or 1.0)
+        self.ssync_pipeline_window = int(
+            conf.get('ssync_pipeline_window') or 1)
 
         servers_per_port = int(conf.get('servers_per_port', '0') or 0)
         if servers_per_port:
@@ -268,7 +423,13 @@ class ObjectController(BaseStorageServer):
             self.logger.thread_locals = logger_thread_locals
         headers_out['user-agent'] = 'object-server %s' % os.getpid()
         full_path = '/%s/%s/%s' % (account, container, obj)
-        if all([host, partition, contdevice]):
+        if all([host, partition, contdevice]) and \
+                self.container_update_batcher:
+            if self.container_update_batcher.update(
+                    (host, contdevice, partition, account, container),
+                    {'op': op, 'obj': obj, 'headers': headers_out}):
+                return
+        elif all([host, partition, contdevice]):
             try:
                 with ConnectionTimeout(self.conn_timeout):
                     ip, port = host.rsplit(':', 1)
@@ -298,6 +459,52 @@ class ObjectController(BaseStorageServer):
         self._diskfile_router[policy].pickle_async_update(
             objdevice, account, container, obj, data, timestamp, policy)
 
+    def _send_container_update_batch(self, key, updates):
+        """
+        Send a batch of updates to a container replica in a MERGE request.
+
+        :param key: a tuple of the host, device and partition the container
+                    is on, and of the account and container names
+        :param updates: a list of dicts of the ``op``, the ``obj`` name and
+                        the ``headers`` of each update
+        :returns: True if the container server merged the updates
+        """
+        host, contdevice, partition, account, container = key
+        ip, port = host.rsplit(':', 1)
+        body = json.dumps(updates)
+        headers_out = {
+            'Content-Length': str(len(body)),
+            'Content-Type': 'application/json',
+            'x-trans-id': updates[0]['headers'].get('x-trans-id', '-'),
+            'user-agent': 'object-server %s' % os.getpid()}
+        try:
+            with ConnectionTimeout(self.conn_timeout):
+                conn = http_connect(ip, port, contdevice, partition, 'MERGE',
+                                    '/%s/%s' % (account, container),
+                                    headers_out)
+            with Timeout(self.node_timeout):
+                conn.send(body)
+                response = conn.getresponse()
+                response.read()
+            if is_success(response.status):
+                self.logger.update_stats('container_update_batch.updates',
+                                         len(updates))
+                return True
+            self.logger.error(_(
+                'ERROR Container update batch of %(count)d failed '
+                '(saving for async update later): %(status)d '
+                'response from %(ip)s:%(port)s/%(dev)s'),
+                {'count': len(updates), 'status': response.status,
+                 'ip': ip, 'port': port, 'dev': contdevice})
+        except (Exception, Timeout):
+            self.logger.exception(_(
+                'ERROR container update batch of %(count)d failed with '
+                '%(ip)s:%(port)s/%(dev)s (saving for async update later)'),
+                {'count': len(updates), 'ip': ip, 'port': port,
+                 'dev': contdevice})
+        self.logger.increment('container_update_batch.failures')
+        return False
+
     def container_update(self, op, account, container, obj, request,
                          headers_out, objdevice, policy):
         """
@@ -1117,6 +1324,14 @@ class ObjectController(BaseStorageServer):
         Note that the name REPLICATE is preserved for historical reasons as
         this verb really just returns the hashes information for the specified
         parameters and is used, for example, by both replication and EC.
+
+        A request with an X-Backend-Hash-Tree-Root header, the hash of the
+        partition on the sender, gets the hashes of the suffix groups of the
+        partition instead, or none if the partition's hash matches. A request
+        with an X-Backend-Hash-Tree-Groups header, a dash separated list of
+        suffix groups, gets the hashes of just the suffixes in those groups.
+        Either way the hash of the partition is returned in an
+        X-Backend-Hash-Tree-Root header.
         """
         device, partition, suffix_parts, policy = \
             get_name_and_placement(request, 2, 3, True)
@@ -1127,14 +1342,140 @@ class ObjectController(BaseStorageServer):
         except DiskFileDeviceUnavailable:
             resp = HTTPInsufficientStorage(drive=device, request=request)
         else:
-            resp = Response(body=pickle.dumps(hashes))
+            headers = {}
+            tree_root = request.headers.get('X-Backend-Hash-Tree-Root')
+            tree_groups = request.headers.get('X-Backend-Hash-Tree-Groups')
+            if tree_root is not None or tree_groups is not None:
+                root, groups = get_hash_tree(hashes)
+                headers['X-Backend-Hash-Tree-Root'] = root
+                if tree_groups is not None:
+                    tree_groups = set(tree_groups.split('-'))
+                    hashes = dict(
+                        (suffix, hash_) for suffix, hash_ in hashes.items()
+                        if get_suffix_group(suffix) in tree_groups)
+                elif tree_root == root:
+                    hashes = {}
+                else:
+                    hashes = groups
+            resp = Response(body=pickle.dumps(hashes), headers=headers)
         return resp
 
     @public
     @replication
     @timing_stats(sample_rate=0.1)
     def SSYNC(self, request):
-        return Response(app_iter=ssync_receiver.Receiver(self, request)())
+        return Response(app_iter=ssync_receiver.Receiver(self, request)(),
+                        headers={'X-Backend-Ssync-Reconcile': 'iblt'})
+
+    def _get_device_limit(self, req):
+        """
+        Get the concurrency limit of the device a request is for, if the
+        request is a client request that should be limited.
+
+        A limit is only created for a device that passes the mount check, so
+        that requests for devices that do not exist neither leave limits
+        behind nor have them dumped to the recon cache.
+        """
+        if not self.device_concurrency or \
+                req.method not in ('PUT', 'GET', 'HEAD', 'POST', 'DELETE') or \
+                'X-Backend-Replication' in req.headers:
+            return None
+        try:
+            device = split_path(req.path_info, 1, 5, True)[0]
+        except ValueError:
+            return None
+        limit = self.device_limits.get(device)
+        if limit is None:
+            if not self._diskfile_router[POLICIES.default].get_dev_path(
+                    device):
+                return None
+            limit = self.device_limits[device] = DeviceConcurrencyLimit(
+                self.device_concurrency)
+        return device, limit
+
+    def get_device_stats(self):
+        """
+        Get the concurrency stats, and the I/O threadpool and group commit
+        stats, of each device that has handled requests.
+
+        :returns: a dict mapping device names to dicts of stats
+        """
+        stats = defaultdict(dict)
+        for device, limit in self.device_limits.items():
+            stats[device].update(limit.get_stats())
+        router = getattr(self, '_diskfile_router', None)
+        if router is not None:
+            manager = router[POLICIES.default]
+            get_threadpool_stats = getattr(
+                manager, 'get_threadpool_stats', None)
+            if get_threadpool_stats:
+                for device, pool_stats in get_threadpool_stats().items():
+                    if pool_stats['threads']:
+                        stats[device]['io_threadpool'] = pool_stats
+            get_group_commit_stats = getattr(
+                manager, 'get_group_commit_stats', None)
+            if get_group_commit_stats:
+                for device, commit_stats in get_group_commit_stats().items():
+                    stats[device]['group_commit'] = commit_stats
+        return dict(stats)
+
+    def _get_shared_stats(self, method_name):
+        router = getattr(self, '_diskfile_router', None)
+        if router is None:
+            return None
+        for policy in POLICIES:
+            get_stats = getattr(router[policy], method_name, None)
+            shared_stats = get_stats() if get_stats else None
+            if shared_stats is not None:
+                return shared_stats
+        return None
+
+    def get_metadata_cache_stats(self):
+        """
+        Get the stats of the metadata cache of this worker.
+
+        :returns: a dict of stats, or None if no storage policy uses a
+                  metadata cache
+        """
+        return self._get_shared_stats('get_metadata_cache_stats')
+
+    def get_cache_policy_stats(self):
+        """
+        Get the stats of the page cache policy of this worker.
+
+        :returns: a dict of stats, or None if no storage policy uses a page
+                  cache policy
+        """
+        return self._get_shared_stats('get_cache_policy_stats')
+
+    def _dump_device_stats(self, now):
+        """
+        Dump the device stats, and the metadata cache and page cache policy
+        stats, of this worker to the recon cache, removing those of workers
+        that have not dumped theirs for a while.
+
+        This locks and rewrites the recon cache, so is run in its own
+        greenthread rather than by the request that found it due.
+        """
+        stats = self.get_device_stats()
+        cache_stats = self.get_metadata_cache_stats()
+        policy_stats = self.get_cache_policy_stats()
+        if not stats and not cache_stats and not policy_stats:
+            return
+        worker_stats = {'updated': now, 'devices': stats}
+        if cache_stats:
+            worker_stats['metadata_cache'] = cache_stats
+        if policy_stats:
+            worker_stats['cache_policy'] = policy_stats
+        workers = {str(os.getpid()): worker_stats}
+        existing = load_recon_cache(self.rcache).get(
+            'object_device_concurrency', {})
+        for pid, worker_stats in existing.items():
+            if worker_stats.get('updated', 0) < \
+                    now - 3 * self.device_stats_interval:
+                workers.setdefault(pid, {})
+        dump_recon_cache({'object_device_concurrency': workers},
+                         self.rcache, self.logger)
 
     def __call__(self, env, start_response):
         """WSGI Application entry point for the Swift Object Server."""
@@ -1145,12 +1486,30 @@ class ObjectController(BaseStorageServer):
         if not check_utf8(req.path_info):
             res = HTTPPreconditionFailed(body='Invalid UTF8 or contains NULL')
         else:
+            device_limit = None
             try:
                 # disallow methods which have not been marked 'public'
                 if req.method not in self.allowed_methods:
                     res = HTTPMethodNotAllowed()
                 else:
-                    res = getattr(self, req.method)(req)
+                    device_limit = self._get_device_limit(req)
+                    waited = None
+                    if device_limit:
+                        device, limit = device_limit
+                        waited = limit.acquire(
+                            self.device_concurrency_timeout)
+                        self.logger.timing(
+                            'device_concurrency.%s.wait_timing' % device,
+                            (time.time() - start_time) * 1000)
+                    if device_limit and waited is None:
+                        self.logger.increment(
+                            'device_concurrency.%s.rejected' % device)
+                        device_limit = None
+                        res = HTTPServiceUnavailable(
+                            request=req, headers={'Retry-After': '1'},
+                            body='Too many requests for device')
+                    else:
+                        res = getattr(self, req.method)(req)
             except DiskFileCollision:
                 res = HTTPForbidden(request=req)
             except HTTPException as error_response:
@@ -1160,6 +1519,9 @@ class ObjectController(BaseStorageServer):
                     'ERROR __call__ error with %(method)s'
                     ' %(path)s '), {'method': req.method, 'path': req.path})
                 res = HTTPInternalServerError(body=traceback.format_exc())
+            finally:
+                if device_limit:
+                    device_limit[1].release()
         trans_time = time.time() - start_time
         res.fix_conditional_response()
         if self.log_requests:
@@ -1173,17 +1535,17 @@ class ObjectController(BaseStorageServer):
             slow = self.slow - trans_time
             if slow > 0:
                 sleep(slow)
+        if start_time >= self.next_stats_dump:
+            self.next_stats_dump = start_time + self.device_stats_interval
+            spawn(self._dump_device_stats, start_time)
 
         # To be able to zero-copy send the object, we need a few things.
         # First, we have to be responding successfully to a GET, or else we're
         # not sending the object. Second, we have to be able to extract the
         # socket file descriptor from the WSGI input object. Third, the
-        # diskfile has to support zero-copy send.
-        #
-        # There's a good chance that this could work for 206 responses too,
-        # but the common case is sending the whole object, so we'll start
-        # there.
-        if req.method == 'GET' and res.status_int == 200 and \
+        # diskfile has to support zero-copy send; of a 206 response, that is
+        # of the ranges that fix_conditional_response() asked it for.
+        if req.method == 'GET' and res.status_int in (200, 206) and \
            isinstance(env['wsgi.input'], wsgi.Input):
             app_iter = getattr(res, 'app_iter', None)
             checker = getattr(app_iter, 'can_zero_copy_send', None)
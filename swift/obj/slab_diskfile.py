@@ -0,0 +1,808 @@
+# Copyright (c) 2010-2012 OpenStack Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Small object packing ("slab") DiskFile backend for replicated policies.
+
+Selected per storage policy with ``diskfile_backend = slab`` in
+``swift.conf``. Objects no larger than ``slab_max_object_size``, along with
+all tombstones and fast-POST ``.meta`` files, are appended as records to a
+log-structured volume file, ``slab.vol``, that lives in the suffix directory
+of the object, rather than being written as files in a hash directory of
+their own. Larger objects, and objects of unknown size, are written by the
+standard :class:`~swift.obj.diskfile.DiskFileWriter`.
+
+Every record of a volume holds the name of one on-disk file of an object, in
+the form ``<object hash>/<on-disk filename>``, its serialized metadata and its
+data. A record with an ``unlink`` op removes a file again. The volume is
+indexed by each process that uses it; the index is kept up to date by
+scanning the records appended to the volume since it was last read, so
+several processes can share a volume. Appends are serialized with ``flock``
+on the volume, which also lets a writer truncate the torn tail of an append
+that was interrupted.
+
+The records of a volume are merged with the files found in the hash
+directories of the suffix, so that the rest of the
+:class:`~swift.obj.diskfile.DiskFileManager` machinery -- suffix hashing,
+reclaiming tombstones, auditing and ssync -- sees the same listing of
+object files whichever way they were stored. Volumes are compacted when
+their suffix is rehashed and enough of them is dead.
+
+.. note::
+
+    The suffix (rather than the partition) is the unit of a volume so that
+    suffix hashes, their invalidation and replication work unchanged; rsync
+    cannot merge volumes though, so the object replicator always uses ssync
+    for slab policies. Slab policies do not support increasing the partition
+    power: the relinker refuses them, and objects are written as files
+    while ``next_part_power`` is set.
+"""
+
+import errno
+import fcntl
+import os
+import struct
+import zlib
+from collections import namedtuple, OrderedDict
+from contextlib import contextmanager
+from os.path import basename, dirname, join
+
+import six
+from eventlet import sleep
+
+from swift.common.exceptions import DiskFileBadMetadataChecksum, \
+    DiskFileNotExist, LockTimeout, PathNotDir
+from swift.common.storage_policy import REPL_POLICY
+from swift.common.utils import config_positive_int_value, \
+    drop_buffer_cache, fdatasync, fsync_dir, listdir, mkdirs, \
+    readahead_buffer_cache, remove_file, stdlib_threading, Timestamp
+from swift.obj.diskfile import AuditLocation, DiskFile, DiskFileManager, \
+    DiskFileReader, DiskFileRouter, DiskFileWriter, \
+    DEFAULT_METADATA_FORMAT, deserialize_metadata, quarantine_renamer, \
+    serialize_metadata, write_metadata
+
+SLAB_VOLUME_FILE = 'slab.vol'
+SLAB_COMPACT_SUFFIX = '.compact'
+SLAB_RECORD_MAGIC = b'SWSL'
+# magic, op, name length, metadata length, data length, crc32 of the name
+# and metadata
+SLAB_RECORD_HEADER = struct.Struct('!4sBxHIQI')
+SLAB_PUT = 1
+SLAB_UNLINK = 2
+DEFAULT_SLAB_MAX_OBJECT_SIZE = 16384
+DEFAULT_SLAB_INDEX_CACHE_SIZE = 1024
+# a volume is compacted once this fraction of it, and at least this many
+# bytes, is taken by records that are dead
+SLAB_COMPACT_DEAD_RATIO = 0.5
+SLAB_COMPACT_MIN_DEAD_BYTES = 65536
+# the most seconds to wait for the flock of a volume
+SLAB_LOCK_TIMEOUT = 10
+
+
+SlabRecord = namedtuple('SlabRecord', [
+    'offset', 'length', 'name_len', 'meta_len', 'data_len', 'crc'])
+
+
+def _pread(fd, offset, size):
+    os.lseek(fd, offset, os.SEEK_SET)
+    chunks = []
+    while size > 0:
+        chunk = os.read(fd, size)
+        if not chunk:
+            break
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b''.join(chunks)
+
+
+def _write_all(fd, buf):
+    while buf:
+        written = os.write(fd, buf)
+        buf = buf[written:]
+
+
+def _crc(name, meta):
+    return zlib.crc32(meta, zlib.crc32(name)) & 0xffffffff
+
+
+def pack_record(op, object_hash, filename, metadata=None, data=b'',
+                metadata_format=DEFAULT_METADATA_FORMAT):
+    """
+    Serialize one volume record.
+
+    :param op: SLAB_PUT or SLAB_UNLINK
+    :param object_hash: the hash of the object the file belongs to
+    :param filename: the on-disk filename
+    :param metadata: the file's metadata dict, for SLAB_PUT
+    :param data: the file's contents, for SLAB_PUT
+    :param metadata_format: the format to serialize the metadata in
+    :returns: the record, as a byte string
+    """
+    name = ('%s/%s' % (object_hash, filename)).encode('ascii')
+    if metadata is None:
+        meta = b''
+    else:
+        meta = serialize_metadata(metadata, metadata_format)
+    return b''.join((
+        SLAB_RECORD_HEADER.pack(SLAB_RECORD_MAGIC, op, len(name), len(meta),
+                                len(data), _crc(name, meta)),
+        name, meta, data))
+
+
+class SlabFile(object):
+    """
+    A read-only file object for the data of one record of a volume.
+
+    :param fp: a file object opened on the volume
+    :param record: the :class:`SlabRecord` to read
+    """
+
+    def __init__(self, fp, record):
+        self._fp = fp
+        self.record = record
+        self.data_offset = sum((record.offset, SLAB_RECORD_HEADER.size,
+                                record.name_len, record.meta_len))
+        self.size = record.data_len
+        self._pos = 0
+
+    def read(self, size=-1):
+        remaining = self.size - self._pos
+        if size is None or size < 0 or size > remaining:
+            size = remaining
+        if size <= 0:
+            return b''
+        self._fp.seek(self.data_offset + self._pos)
+        data = self._fp.read(size)
+        self._pos += len(data)
+        return data
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        if whence == os.SEEK_CUR:
+            offset += self._pos
+        elif whence == os.SEEK_END:
+            offset += self.size
+        self._pos = max(0, offset)
+
+    def tell(self):
+        return self._pos
+
+    def fileno(self):
+        return self._fp.fileno()
+
+    def close(self):
+        self._fp.close()
+
+    def read_metadata(self):
+        """
+        :returns: the metadata of the record
+        :raises DiskFileBadMetadataChecksum: if the metadata is corrupt
+        """
+        self._fp.seek(self.record.offset + SLAB_RECORD_HEADER.size)
+        name = self._fp.read(self.record.name_len)
+        meta = self._fp.read(self.record.meta_len)
+        if _crc(name, meta) != self.record.crc:
+            raise DiskFileBadMetadataChecksum(
+                'Metadata checksum mismatch for %s in %s' % (
+                    name, self._fp.name))
+        return deserialize_metadata(meta)
+
+
+class SlabVolume(object):
+    """
+    The index of one volume file, shared by the users of the volume in a
+    process.
+
+    :param path: full path of the volume file
+    :param logger: a logger object
+    """
+
+    def __init__(self, path, logger):
+        self.path = path
+        self.logger = logger
+        self._lock = stdlib_threading.Lock()
+        self._reset(None)
+
+    def _reset(self, inode):
+        self.inode = inode
+        # bytes of the volume that have been indexed
+        self.size = 0
+        # bytes of the volume used by the records of live files
+        self.live_bytes = 0
+        # object hash -> {filename: SlabRecord}
+        self.entries = {}
+
+    def _scan(self, fd, end):
+        """
+        Index the records of the volume from the end of the last scan to the
+        given end of the volume. Scanning stops at a record that is
+        incomplete or corrupt; those can only be found beyond the last
+        complete append, and are truncated by the next append.
+        """
+        pos = self.size
+        while pos + SLAB_RECORD_HEADER.size <= end:
+            header = _pread(fd, pos, SLAB_RECORD_HEADER.size)
+            magic, op, name_len, meta_len, data_len, crc = \
+                SLAB_RECORD_HEADER.unpack(header)
+            length = SLAB_RECORD_HEADER.size + name_len + meta_len + data_len
+            if magic != SLAB_RECORD_MAGIC or pos + length > end or \
+                    op not in (SLAB_PUT, SLAB_UNLINK):
+                break
+            name_and_meta = _pread(fd, pos + SLAB_RECORD_HEADER.size,
+                                   name_len + meta_len)
+            if _crc(name_and_meta[:name_len],
+                    name_and_meta[name_len:]) != crc:
+                break
+            object_hash, filename = \
+                name_and_meta[:name_len].decode('ascii').split('/', 1)
+            files = self.entries.setdefault(object_hash, {})
+            old = files.pop(filename, None)
+            if old:
+                self.live_bytes -= old.length
+            if op == SLAB_PUT:
+                files[filename] = SlabRecord(
+                    pos, length, name_len, meta_len, data_len, crc)
+                self.live_bytes += length
+            elif not files:
+                del self.entries[object_hash]
+            pos += length
+        self.size = pos
+
+    def _sync(self, fd):
+        """
+        Bring the index up to date with the volume open on fd.
+
+        :returns: the size of the volume
+        """
+        st = os.fstat(fd)
+        if st.st_ino != self.inode or st.st_size < self.size:
+            self._reset(st.st_ino)
+        if st.st_size > self.size:
+            self._scan(fd, st.st_size)
+        return st.st_size
+
+    def refresh(self):
+        """
+        Bring the index up to date with the volume.
+
+        :returns: False if the volume does not exist, True otherwise
+        """
+        try:
+            st = os.stat(self.path)
+            if st.st_ino == self.inode and st.st_size == self.size:
+                return True
+            fd = os.open(self.path, os.O_RDONLY)
+        except OSError as err:
+            if err.errno not in (errno.ENOENT, errno.ENOTDIR):
+                raise
+            with self._lock:
+                self._reset(None)
+            return False
+        try:
+            with self._lock:
+                self._sync(fd)
+        finally:
+            os.close(fd)
+        return True
+
+    @contextmanager
+    def _locked(self, create=True):
+        """
+        Open the volume, with an exclusive flock held while in the context.
+        Like :func:`swift.common.utils.lock_file`, the lock is retried
+        without blocking, so that waiting for it does not stall the hub when
+        this is called from it rather than from a disk I/O thread.
+
+        :param create: create the volume if it does not exist
+        :returns: the open file descriptor, or None if the volume does not
+                  exist and create is False
+        :raises LockTimeout: if the lock is not acquired within
+                             ``SLAB_LOCK_TIMEOUT`` seconds
+        """
+        flags = os.O_RDWR | os.O_APPEND
+        while True:
+            created = False
+            try:
+                fd = os.open(self.path, flags)
+            except OSError as err:
+                if err.errno != errno.ENOENT:
+                    raise
+                if not create:
+                    yield None
+                    return
+                mkdirs(dirname(self.path))
+                fd = os.open(self.path, flags | os.O_CREAT)
+                created = True
+            try:
+                with LockTimeout(SLAB_LOCK_TIMEOUT, self.path):
+                    while True:
+                        try:
+                            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                            break
+                        except IOError as err:
+                            if err.errno != errno.EAGAIN:
+                                raise
+                        sleep(0.01)
+                try:
+                    if os.stat(self.path).st_ino != os.fstat(fd).st_ino:
+                        # compacted or removed while we waited for the lock
+                        continue
+                except OSError as err:
+                    if err.errno == errno.ENOENT:
+                        continue
+                    raise
+                if created:
+                    fsync_dir(dirname(self.path))
+                yield fd
+                return
+            finally:
+                os.close(fd)
+
+    def append(self, records, fsync=True, committer=None):
+        """
+        Append records to the volume, creating it if necessary.
+
+        :param records: a list of records as returned by :func:`pack_record`
+        :param fsync: if True, the records are flushed to disk before
+                      returning
+        :param committer: a :class:`swift.common.utils.GroupCommitter` to
+                          flush the records to disk in a round of, once the
+                          volume's lock is released, rather than fsync them
+        """
+        commit_fd = None
+        with self._locked() as fd:
+            with self._lock:
+                size = self._sync(fd)
+                end = self.size
+            if size > end:
+                self.logger.warning(
+                    'Truncating %d bytes at offset %d of %s: incomplete or '
+                    'corrupt record', size - end, end, self.path)
+                os.ftruncate(fd, end)
+            _write_all(fd, b''.join(records))
+            if committer:
+                # the duplicate shares the open file of the write, so the
+                # round's fsync of it reports any writeback error; it shares
+                # the flock too, which is released before the round
+                commit_fd = os.dup(fd)
+            elif fsync:
+                fdatasync(fd)
+            with self._lock:
+                self._sync(fd)
+        if commit_fd is not None:
+            try:
+                fcntl.flock(commit_fd, fcntl.LOCK_UN)
+                committer.commit(fds=[commit_fd])
+            finally:
+                os.close(commit_fd)
+
+    def unlink(self, object_hash, filenames):
+        """
+        Remove files from the volume.
+
+        :param object_hash: the hash of the object the files belong to
+        :param filenames: a list of on-disk filenames
+        """
+        self.append([pack_record(SLAB_UNLINK, object_hash, filename)
+                     for filename in filenames], fsync=False)
+
+    def get_files(self, object_hash):
+        """
+        :returns: a dict mapping on-disk filenames of the object to their
+                  records
+        """
+        return dict(self.entries.get(object_hash, {}))
+
+    def get_hashes(self):
+        """
+        :returns: a list of the hashes of the objects with files in the
+                  volume
+        """
+        return list(self.entries)
+
+    def open_file(self, object_hash, filename):
+        """
+        Open one of the files in the volume.
+
+        :returns: a :class:`SlabFile`, or None if the volume does not have
+                  the file
+        """
+        for _attempt in range(3):
+            if not self.refresh():
+                return None
+            with self._lock:
+                record = self.entries.get(object_hash, {}).get(filename)
+                inode = self.inode
+            if not record:
+                return None
+            try:
+                fp = open(self.path, 'rb')
+            except IOError as err:
+                if err.errno != errno.ENOENT:
+                    raise
+                continue
+            if os.fstat(fp.fileno()).st_ino == inode:
+                return SlabFile(fp, record)
+            # compacted since the index was refreshed
+            fp.close()
+        return None
+
+    def compact(self):
+        """
+        Rewrite the volume with only the records of live files.
+        """
+        tmp_path = self.path + SLAB_COMPACT_SUFFIX
+        with self._locked(create=False) as fd:
+            if fd is None:
+                return
+            with self._lock:
+                self._sync(fd)
+                records = sorted(
+                    (record for files in self.entries.values()
+                     for record in files.values()),
+                    key=lambda record: record.offset)
+            tmp_fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC)
+            try:
+                for record in records:
+                    _write_all(tmp_fd, _pread(fd, record.offset,
+                                              record.length))
+                fdatasync(tmp_fd)
+                os.rename(tmp_path, self.path)
+                fsync_dir(dirname(self.path))
+            except BaseException:
+                remove_file(tmp_path)
+                raise
+            finally:
+                os.close(tmp_fd)
+            with self._lock:
+                self._reset(None)
+        self.refresh()
+
+    def remove(self):
+        """
+        Remove the volume if none of the files in it are live.
+
+        :returns: True if the volume was removed
+        """
+        with self._locked(create=False) as fd:
+            if fd is None:
+                return True
+            with self._lock:
+                self._sync(fd)
+                if self.entries:
+                    return False
+                os.unlink(self.path)
+                self._reset(None)
+        return True
+
+
+class SlabDiskFileReader(DiskFileReader):
+
+    def can_zero_copy_send(self):
+        if isinstance(self._fp, SlabFile):
+            return False
+        return super(SlabDiskFileReader, self).can_zero_copy_send()
+
+    def _drop_cache(self, fd, offset, length):
+        if isinstance(self._fp, SlabFile):
+            if not self._keep_cache:
+                drop_buffer_cache(fd, self._fp.data_offset + offset, length)
+            return
+        super(SlabDiskFileReader, self)._drop_cache(fd, offset, length)
+
+    def _readahead_cache(self, fd, offset, length):
+        if isinstance(self._fp, SlabFile):
+            readahead_buffer_cache(
+                fd, self._fp.data_offset + offset, length)
+            return
+        super(SlabDiskFileReader, self)._readahead_cache(fd, offset, length)
+
+
+class SlabDiskFileWriter(DiskFileWriter):
+    """
+    Buffers the data of a small object and appends it, along with its
+    metadata, to the volume of the object's suffix when it is put.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(SlabDiskFileWriter, self).__init__(*args, **kwargs)
+        self._chunks = []
+
+    def write(self, chunk):
+        """
+        Write a chunk of data. For this implementation the data is kept in
+        memory until the object is put.
+
+        :param chunk: the chunk of data to write as a string object
+
+        :returns: the total number of bytes written to an object
+        """
+        self._chunks.append(chunk)
+        self._upload_size += len(chunk)
+        return self._upload_size
+
+    def _finalize_put(self, metadata, target_path, cleanup):
+        hsh_path, filename = os.path.split(target_path)
+        committer = self.manager.get_group_committer(
+            self._diskfile._device_path)
+        self.manager.invalidate_hash(dirname(self._datadir))
+        volume = self.manager.get_volume(dirname(hsh_path), create=True)
+        record = pack_record(SLAB_PUT, basename(hsh_path), filename,
+                             metadata, b''.join(self._chunks),
+                             metadata_format=self.manager.metadata_format)
+        volume.append([record], committer=committer)
+        self._chunks = []
+        self._put_succeeded = True
+        if cleanup:
+            try:
+                self.manager.cleanup_ondisk_files(self._datadir)
+            except OSError:
+                self.manager.logger.exception(
+                    'Problem cleaning up %s', self._datadir)
+
+
+class SlabDiskFile(DiskFile):
+    reader_cls = SlabDiskFileReader
+
+    def _get_data_file_size(self, fp):
+        if isinstance(fp, SlabFile):
+            return fp.size
+        return super(SlabDiskFile, self)._get_data_file_size(fp)
+
+    def _open_data_file(self, data_file):
+        hsh_path, filename = os.path.split(data_file)
+        volume = self.manager.get_volume(dirname(hsh_path))
+        if volume:
+            fp = volume.open_file(basename(hsh_path), filename)
+            if fp:
+                return fp
+        return super(SlabDiskFile, self)._open_data_file(data_file)
+
+    @contextmanager
+    def create(self, size=None):
+        """
+        Context manager to create a file. Objects of a known size no larger
+        than ``slab_max_object_size`` are appended to the volume of their
+        suffix, others are created as files, see
+        :meth:`swift.obj.diskfile.BaseDiskFile.create`. While the partition
+        power is being increased, all objects are created as files, which
+        are linked into their next partition; volume records cannot be.
+
+        :param size: optional initial size of file to explicitly allocate on
+                     disk
+        :raises DiskFileNoSpace: if a size is specified and allocation fails
+        """
+        if size is None or size > self.manager.slab_max_object_size or \
+                self.next_part_power:
+            with super(SlabDiskFile, self).create(size) as dfw:
+                yield dfw
+            return
+        yield SlabDiskFileWriter(self._name, self._datadir, None, None,
+                                 bytes_per_sync=self._bytes_per_sync,
+                                 diskfile=self,
+                                 next_part_power=self.next_part_power)
+
+    def write_metadata(self, metadata):
+        """
+        Write a block of metadata to an object, as a record of the volume of
+        its suffix.
+
+        :param metadata: dictionary of metadata to be associated with the
+                         object
+        """
+        with self.create(size=0) as writer:
+            writer._extension = '.meta'
+            writer.put(metadata)
+
+    def delete(self, timestamp):
+        """
+        Delete the object, by appending a tombstone to the volume of its
+        suffix.
+
+        :param timestamp: timestamp to compare with each file
+        """
+        with self.create(size=0) as deleter:
+            deleter._extension = '.ts'
+            deleter.put({'X-Timestamp': Timestamp(timestamp).internal})
+
+
+@DiskFileRouter.register(REPL_POLICY, backend='slab')
+class SlabDiskFileManager(DiskFileManager):
+    """
+    DiskFileManager of the slab backend.
+
+    In addition to the options of
+    :class:`~swift.obj.diskfile.DiskFileManager`:
+
+    :param conf: caller provided configuration object; uses
+                 ``slab_max_object_size``, the largest object that is stored
+                 in a volume, and ``slab_index_cache_size``, the number of
+                 volume indexes that are kept in memory
+    :param logger: caller provided logger
+    """
+    diskfile_cls = SlabDiskFile
+    replicate_with_ssync = True
+
+    def __init__(self, conf, logger):
+        super(SlabDiskFileManager, self).__init__(conf, logger)
+        self.slab_max_object_size = int(conf.get(
+            'slab_max_object_size', DEFAULT_SLAB_MAX_OBJECT_SIZE))
+        self.slab_index_cache_size = config_positive_int_value(conf.get(
+            'slab_index_cache_size', DEFAULT_SLAB_INDEX_CACHE_SIZE))
+        self._volumes = OrderedDict()
+        self._volumes_lock = stdlib_threading.Lock()
+        # objects are listed from the volume indexes, there are no hash dirs
+        # to validate a metadata cache against
+        self.metadata_cache = None
+
+    def get_volume(self, suffix_path, create=False):
+        """
+        Get the index of the volume of a suffix.
+
+        :param suffix_path: full path to the suffix directory
+        :param create: if True, return the index even if the volume does not
+                       exist yet, so that it can be appended to
+        :returns: a :class:`SlabVolume`, or None if the volume does not exist
+                  and create is False
+        """
+        path = join(suffix_path, SLAB_VOLUME_FILE)
+        with self._volumes_lock:
+            volume = self._volumes.pop(path, None)
+            if volume is None:
+                volume = SlabVolume(path, self.logger)
+            self._volumes[path] = volume
+            while len(self._volumes) > self.slab_index_cache_size:
+                self._volumes.popitem(last=False)
+        if create or volume.refresh():
+            return volume
+        return None
+
+    def _with_volume_hashes(self, suffix_path, names):
+        """
+        Replace the volume, if any, in a listing of a suffix dir with the
+        hashes of the objects that have files in the volume.
+        """
+        if SLAB_VOLUME_FILE not in names:
+            return names
+        names = [name for name in names
+                 if not name.startswith(SLAB_VOLUME_FILE)]
+        volume = self.get_volume(suffix_path)
+        if volume:
+            listed = set(names)
+            names.extend(hsh for hsh in volume.get_hashes()
+                         if hsh not in listed)
+        return names
+
+    def _list_suffix_dir(self, path):
+        return self._with_volume_hashes(
+            path, super(SlabDiskFileManager, self)._list_suffix_dir(path))
+
+    def _listdir(self, path):
+        return self._with_volume_hashes(
+            path, super(SlabDiskFileManager, self)._listdir(path))
+
+    def _list_object_dir(self, hsh_path):
+        files = listdir(hsh_path)
+        volume = self.get_volume(dirname(hsh_path))
+        if volume:
+            files.extend(filename
+                         for filename in volume.get_files(basename(hsh_path))
+                         if filename not in files)
+        return files
+
+    def _remove_ondisk_file(self, hsh_path, filename):
+        volume = self.get_volume(dirname(hsh_path))
+        if volume and filename in volume.get_files(basename(hsh_path)):
+            volume.unlink(basename(hsh_path), [filename])
+        remove_file(join(hsh_path, filename))
+
+    def _read_file_metadata(self, source, **kwargs):
+        if isinstance(source, SlabFile):
+            return source.read_metadata()
+        if isinstance(source, six.string_types):
+            hsh_path, filename = os.path.split(source)
+            volume = self.get_volume(dirname(hsh_path))
+            fp = volume.open_file(basename(hsh_path), filename) \
+                if volume else None
+            if fp:
+                try:
+                    return fp.read_metadata()
+                finally:
+                    fp.close()
+        return super(SlabDiskFileManager, self)._read_file_metadata(
+            source, **kwargs)
+
+    def _hash_suffix_dir(self, path, ondisk_timestamps=None):
+        hashes = super(SlabDiskFileManager, self)._hash_suffix_dir(
+            path, ondisk_timestamps)
+        # the suffix has been cleaned up; compact or remove its volume
+        volume = self.get_volume(path)
+        if not volume:
+            return hashes
+        if volume.remove():
+            try:
+                os.rmdir(path)
+            except OSError:
+                pass
+            else:
+                # as with an emptied suffix dir in the base implementation
+                raise PathNotDir()
+        else:
+            dead_bytes = volume.size - volume.live_bytes
+            if dead_bytes >= SLAB_COMPACT_MIN_DEAD_BYTES and \
+                    dead_bytes >= volume.size * SLAB_COMPACT_DEAD_RATIO:
+                volume.compact()
+                self.logger.increment('slab.compactions')
+        return hashes
+
+    def object_audit_location_generator(self, policy, device_dirs=None,
+                                        auditor_type="ALL"):
+        locations = super(
+            SlabDiskFileManager, self).object_audit_location_generator(
+                policy, device_dirs=device_dirs, auditor_type=auditor_type)
+        for location in locations:
+            if basename(location.path) == SLAB_VOLUME_FILE:
+                suffix_path = dirname(location.path)
+                volume = self.get_volume(suffix_path)
+                if not volume:
+                    continue
+                for hsh in volume.get_hashes():
+                    hsh_path = join(suffix_path, hsh)
+                    # objects with a hash dir are listed on their own
+                    if not os.path.isdir(hsh_path):
+                        yield AuditLocation(hsh_path, location.device,
+                                            location.partition,
+                                            location.policy)
+            elif not basename(location.path).startswith(SLAB_VOLUME_FILE):
+                yield location
+
+    def quarantine_renamer(self, device_path, corrupted_file_path):
+        """
+        Quarantine an object dir, first writing the object's files in the
+        volume of its suffix out to the object dir so that they are
+        quarantined with it.
+
+        :param device_path: The path to the device the corrupted file is on.
+        :param corrupted_file_path: The path to the file you want quarantined.
+
+        :returns: path (str) of directory the file was moved to
+        :raises OSError: re-raises non errno.EEXIST / errno.ENOTEMPTY
+                         exceptions from rename
+        """
+        hsh_path = dirname(corrupted_file_path)
+        object_hash = basename(hsh_path)
+        volume = self.get_volume(dirname(hsh_path))
+        filenames = volume.get_files(object_hash) if volume else {}
+        for filename in filenames:
+            fp = volume.open_file(object_hash, filename)
+            if not fp:
+                continue
+            try:
+                mkdirs(hsh_path)
+                with open(join(hsh_path, filename), 'wb') as f:
+                    f.write(fp.read())
+                    try:
+                        write_metadata(
+                            f.fileno(), fp.read_metadata(),
+                            metadata_format=self.metadata_format)
+                    except DiskFileBadMetadataChecksum:
+                        pass
+            except (DiskFileNotExist, IOError, OSError) as err:
+                self.logger.warning('Unable to copy %s of %s out of %s: %s',
+                                    filename, object_hash, volume.path, err)
+            finally:
+                fp.close()
+        if filenames:
+            volume.unlink(object_hash, list(filenames))
+        return quarantine_renamer(device_path, corrupted_file_path)
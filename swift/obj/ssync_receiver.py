@@ -13,8 +13,12 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import binascii
 
 import eventlet.greenio
+from eventlet import GreenPool
+from eventlet.event import Event
+from eventlet.queue import LightQueue
 from six.moves import urllib
 
 from swift.common import exceptions
@@ -22,7 +26,9 @@ from swift.common import http
 from swift.common import swob
 from swift.common import utils
 from swift.common import request_helpers
+from swift.common.iblt import IBLT
 from swift.common.utils import Timestamp
+from swift.obj.ssync_sender import reconcile_key
 
 
 def decode_missing(line):
@@ -117,6 +123,17 @@ class Receiver(object):
         3. Updates: Sender sends the object information requested.
 
         4. Close down: Release semaphore lock, etc.
+
+    A sender may offer to pipeline the updates with an
+    ``X-Backend-Ssync-Pipeline-Window`` header. If the object-server.conf
+    [object-server] ssync_pipeline_window setting allows it too, the updates
+    are applied concurrently and acknowledged one by one; see
+    :py:meth:`pipelined_updates`.
+
+    The SSYNC response has an ``X-Backend-Ssync-Reconcile: iblt`` header to
+    tell the sender that it may narrow down the list it sends in the missing
+    check by first reconciling it with the receiver's; see
+    :py:meth:`reconcile`.
     """
 
     def __init__(self, app, request):
@@ -125,6 +142,7 @@ class Receiver(object):
         self.device = None
         self.partition = None
         self.fp = None
+        self.pipeline_window = 1
         # We default to dropping the connection in case there is any exception
         # raised during processing because otherwise the sender could send for
         # quite some time before realizing it was all in vain.
@@ -239,6 +257,16 @@ class Receiver(object):
                 raise swob.HTTPBadRequest(
                     'Frag-Index (%s) != Node-Index (%s)' % (
                         self.frag_index, self.node_index))
+        if self.request.headers.get('X-Backend-Ssync-Pipeline-Window'):
+            try:
+                window = int(
+                    self.request.headers['X-Backend-Ssync-Pipeline-Window'])
+            except ValueError:
+                raise swob.HTTPBadRequest(
+                    'Invalid X-Backend-Ssync-Pipeline-Window %r' %
+                    self.request.headers['X-Backend-Ssync-Pipeline-Window'])
+            self.pipeline_window = max(
+                1, min(window, self.app.ssync_pipeline_window))
         utils.validate_device_partition(self.device, self.partition)
         self.diskfile_mgr = self.app._diskfile_router[self.policy]
         if not self.diskfile_mgr.get_dev_path(self.device):
@@ -325,7 +353,8 @@ class Receiver(object):
             3. Sender sends `:MISSING_CHECK: END`.
 
             4. Receiver gets `:MISSING_CHECK: END`, responds with
-               `:MISSING_CHECK: START`, followed by the list of
+               `:MISSING_CHECK: START` (`:MISSING_CHECK: START window=<n>`
+               if the updates will be pipelined), followed by the list of
                <wanted_hash> specifiers it collected as being wanted
                (one per line), `:MISSING_CHECK: END`, and flushes any
                buffers.
@@ -346,6 +375,13 @@ class Receiver(object):
         with exceptions.MessageTimeout(
                 self.app.client_timeout, 'missing_check start'):
             line = self.fp.readline(self.app.network_chunk_size)
+        # the sender tries again with a larger table if one is too small
+        while line.strip() == ':RECONCILE: START':
+            for data in self.reconcile():
+                yield data
+            with exceptions.MessageTimeout(
+                    self.app.client_timeout, 'missing_check start'):
+                line = self.fp.readline(self.app.network_chunk_size)
         if line.strip() != ':MISSING_CHECK: START':
             raise Exception(
                 'Looking for :MISSING_CHECK: START got %r' % line[:1024])
@@ -359,12 +395,84 @@ class Receiver(object):
             want = self._check_missing(line)
             if want:
                 object_hashes.append(want)
-        yield ':MISSING_CHECK: START\r\n'
+        if self.pipeline_window > 1:
+            yield ':MISSING_CHECK: START window=%d\r\n' % self.pipeline_window
+        else:
+            yield ':MISSING_CHECK: START\r\n'
         if object_hashes:
             yield '\r\n'.join(object_hashes)
         yield '\r\n'
         yield ':MISSING_CHECK: END\r\n'
 
+    def reconcile(self):
+        """
+        Handles the receiver-side of the optional RECONCILE step of a SSYNC
+        request, which comes before the MISSING_CHECK step and lets the
+        sender leave out of its list the objects that the receiver already
+        has the same timestamps of.
+
+        Rather than its list, the sender sends an invertible Bloom lookup
+        table (see :py:mod:`swift.common.iblt`) of it, sized to an estimate of
+        the difference, which is much smaller when the lists mostly agree.
+        The receiver subtracts a table of its own list from it and decodes
+        what remains, if it can, into the entries that are only in the
+        sender's list. The entries of the lists are keyed by
+        :py:func:`~swift.obj.ssync_sender.reconcile_key`.
+
+        The process is generally:
+
+            1. Sender sends `:RECONCILE: START`, `suffixes <suffix> ...`
+               lines with the suffixes being synced, `table <base64>` lines
+               that join up to its table, and `:RECONCILE: END`.
+
+            2. Receiver lists the objects in the suffixes, as the sender
+               does, and if it can decode the difference of the tables,
+               responds with `:RECONCILE: START`, the hex keys of the entries
+               only in the sender's list (one per line) and
+               `:RECONCILE: END`. Otherwise it responds with
+               `:RECONCILE: FAILED`.
+
+            3. Sender goes on to the MISSING_CHECK step, sending only the
+               entries it got back. If the receiver failed, the sender may
+               first go back to step 1 with a larger table, and otherwise
+               sends all of its entries.
+
+        Entries that are only in the receiver's list, such as newer
+        versions of objects, are left to the missing check, so that their
+        comparison is the same as if the whole list had been sent.
+        """
+        suffixes = []
+        table = []
+        while True:
+            with exceptions.MessageTimeout(
+                    self.app.client_timeout, 'reconcile line'):
+                line = self.fp.readline(self.app.network_chunk_size)
+            if not line or line.strip() == ':RECONCILE: END':
+                break
+            parts = line.split()
+            if parts and parts[0] == 'suffixes':
+                suffixes.extend(parts[1:])
+            elif parts and parts[0] == 'table':
+                table.extend(parts[1:])
+            elif parts:
+                raise Exception('Unexpected reconcile line %r' % line[:1024])
+        remote = IBLT.from_string(''.join(table))
+        local = IBLT(len(remote))
+        for object_hash, timestamps in self.diskfile_mgr.yield_hashes(
+                self.device, self.partition, self.policy, suffixes,
+                frag_index=self.frag_index):
+            local.insert(reconcile_key(object_hash, timestamps))
+        remote.subtract(local)
+        difference = remote.decode()
+        if difference is None:
+            yield ':RECONCILE: FAILED\r\n'
+            return
+        yield ':RECONCILE: START\r\n'
+        if difference[0]:
+            yield '\r\n'.join(binascii.hexlify(key) for key in difference[0])
+        yield '\r\n'
+        yield ':RECONCILE: END\r\n'
+
     def updates(self):
         """
         Handles the UPDATES step of an SSYNC request.
@@ -408,6 +516,10 @@ class Receiver(object):
             line = self.fp.readline(self.app.network_chunk_size)
         if line.strip() != ':UPDATES: START':
             raise Exception('Looking for :UPDATES: START got %r' % line[:1024])
+        if self.pipeline_window > 1:
+            for data in self.pipelined_updates():
+                yield data
+            return
         successes = 0
         failures = 0
         while True:
@@ -416,87 +528,14 @@ class Receiver(object):
                 line = self.fp.readline(self.app.network_chunk_size)
             if not line or line.strip() == ':UPDATES: END':
                 break
-            # Read first line METHOD PATH of subrequest.
-            method, path = line.strip().split(' ', 1)
-            subreq = swob.Request.blank(
-                '/%s/%s%s' % (self.device, self.partition, path),
-                environ={'REQUEST_METHOD': method})
-            # Read header lines.
-            content_length = None
-            replication_headers = []
-            while True:
-                with exceptions.MessageTimeout(self.app.client_timeout):
-                    line = self.fp.readline(self.app.network_chunk_size)
-                if not line:
-                    raise Exception(
-                        'Got no headers for %s %s' % (method, path))
-                line = line.strip()
-                if not line:
-                    break
-                header, value = line.split(':', 1)
-                header = header.strip().lower()
-                value = value.strip()
-                subreq.headers[header] = value
-                if header != 'etag':
-                    # make sure ssync doesn't cause 'Etag' to be added to
-                    # obj metadata in addition to 'ETag' which object server
-                    # sets (note capitalization)
-                    replication_headers.append(header)
-                if header == 'content-length':
-                    content_length = int(value)
-            # Establish subrequest body, if needed.
-            if method in ('DELETE', 'POST'):
-                if content_length not in (None, 0):
-                    raise Exception(
-                        '%s subrequest with content-length %s'
-                        % (method, path))
-            elif method == 'PUT':
-                if content_length is None:
-                    raise Exception(
-                        'No content-length sent for %s %s' % (method, path))
-
-                def subreq_iter():
-                    left = content_length
-                    while left > 0:
-                        with exceptions.MessageTimeout(
-                                self.app.client_timeout,
-                                'updates content'):
-                            chunk = self.fp.read(
-                                min(left, self.app.network_chunk_size))
-                        if not chunk:
-                            raise exceptions.ChunkReadError(
-                                'Early termination for %s %s' % (method, path))
-                        left -= len(chunk)
-                        yield chunk
-                subreq.environ['wsgi.input'] = utils.FileLikeIter(
-                    subreq_iter())
-            else:
-                raise Exception('Invalid subrequest method %s' % method)
-            subreq.headers['X-Backend-Storage-Policy-Index'] = int(self.policy)
-            subreq.headers['X-Backend-Replication'] = 'True'
-            if self.node_index is not None:
-                # primary node should not 409 if it has a non-primary fragment
-                subreq.headers['X-Backend-Ssync-Frag-Index'] = self.node_index
-            if replication_headers:
-                subreq.headers['X-Backend-Replication-Headers'] = \
-                    ' '.join(replication_headers)
+            subreq, _junk, _junk = self._read_subrequest(line)
             # Route subrequest and translate response.
             resp = subreq.get_response(self.app)
-            if http.is_success(resp.status_int) or \
-                    resp.status_int == http.HTTP_NOT_FOUND:
+            if self._is_success(resp.status_int, subreq):
                 successes += 1
             else:
-                self.app.logger.warning(
-                    'ssync subrequest failed with %s: %s %s' %
-                    (resp.status_int, method, subreq.path))
                 failures += 1
-            if failures >= self.app.replication_failure_threshold and (
-                    not successes or
-                    float(failures) / successes >
-                    self.app.replication_failure_ratio):
-                raise Exception(
-                    'Too many %d failures to %d successes' %
-                    (failures, successes))
+            self._check_failures(successes, failures)
             # The subreq may have failed, but we want to read the rest of the
             # body from the remote side so we can continue on with the next
             # subreq.
@@ -508,3 +547,198 @@ class Receiver(object):
                 (failures, successes))
         yield ':UPDATES: START\r\n'
         yield ':UPDATES: END\r\n'
+
+    def pipelined_updates(self):
+        """
+        Handles the UPDATES step of an SSYNC request whose updates are
+        pipelined, once `:UPDATES: START` has been read.
+
+        The subrequests are routed to the object server as in
+        :py:meth:`updates`, but each in its own greenthread, so that up to
+        ``pipeline_window`` of them are applied at once while the next ones
+        are read. The subrequests for one object are applied in the order
+        they were sent.
+
+        The receiver sends `:UPDATES: START` straight away, then an
+        `:ACK: <status> <method> <path>` line as each subrequest completes,
+        and `:UPDATES: END` once it has read `:UPDATES: END` and
+        acknowledged every subrequest. The sender keeps no more than
+        ``pipeline_window`` subrequests unacknowledged, so the receiver only
+        waits for one to complete when that many are; the sender learns
+        from the acknowledgements which updates failed, so failures do not
+        end the request unless there are too many of them.
+        """
+        pool = GreenPool(self.pipeline_window)
+        completed = LightQueue()
+        # path => Event sent when the last subrequest for it completes
+        applying = {}
+        counts = {'successes': 0, 'failures': 0}
+
+        def apply_subrequest(subreq, path, body_done, previous, finished):
+            try:
+                if previous is not None:
+                    previous.wait()
+                resp = subreq.get_response(self.app)
+                status = resp.status_int
+            except Exception:
+                self.app.logger.exception(
+                    '%s/%s/%s EXCEPTION in ssync.Receiver subrequest %s %s' %
+                    (self.request.remote_addr, self.device, self.partition,
+                     subreq.method, path))
+                status = http.HTTP_INTERNAL_SERVER_ERROR
+            finally:
+                if not body_done.ready():
+                    # the rest of the body is left for the reader to skip
+                    body_done.send(False)
+            finished.send()
+            completed.put((status, subreq, path, finished))
+
+        def ack():
+            status, subreq, path, finished = completed.get()
+            if applying.get(path) is finished:
+                del applying[path]
+            if self._is_success(status, subreq):
+                counts['successes'] += 1
+            else:
+                counts['failures'] += 1
+            self._check_failures(counts['successes'], counts['failures'])
+            return ':ACK: %d %s %s\r\n' % (status, subreq.method, path)
+
+        unacked = 0
+        try:
+            yield ':UPDATES: START\r\n'
+            while True:
+                while completed.qsize() or unacked >= self.pipeline_window:
+                    yield ack()
+                    unacked -= 1
+                with exceptions.MessageTimeout(
+                        self.app.client_timeout, 'updates line'):
+                    line = self.fp.readline(self.app.network_chunk_size)
+                if not line or line.strip() == ':UPDATES: END':
+                    break
+                subreq, path, body_done = self._read_subrequest(line)
+                finished = Event()
+                pool.spawn(apply_subrequest, subreq, path, body_done,
+                           applying.get(path), finished)
+                applying[path] = finished
+                unacked += 1
+                # The body has to be read before the next subreq, even if
+                # the subreq failed without reading it.
+                if not body_done.wait():
+                    for junk in subreq.environ['wsgi.input']:
+                        pass
+            while unacked:
+                yield ack()
+                unacked -= 1
+            yield ':UPDATES: END\r\n'
+        finally:
+            pool.waitall()
+
+    def _read_subrequest(self, line):
+        """
+        Reads the header lines of a subrequest, after its first
+        `METHOD PATH` line, and sets up the reading of its body.
+
+        :param line: the first line of the subrequest
+        :returns: a tuple of (subreq, path, body_done) where subreq is the
+                  swob.Request to route to the object server, path is the
+                  path as sent, and body_done is an Event that is sent True
+                  once the whole body has been read
+        """
+        # Read first line METHOD PATH of subrequest.
+        method, path = line.strip().split(' ', 1)
+        subreq = swob.Request.blank(
+            '/%s/%s%s' % (self.device, self.partition, path),
+            environ={'REQUEST_METHOD': method})
+        body_done = Event()
+        # Read header lines.
+        content_length = None
+        replication_headers = []
+        while True:
+            with exceptions.MessageTimeout(self.app.client_timeout):
+                line = self.fp.readline(self.app.network_chunk_size)
+            if not line:
+                raise Exception(
+                    'Got no headers for %s %s' % (method, path))
+            line = line.strip()
+            if not line:
+                break
+            header, value = line.split(':', 1)
+            header = header.strip().lower()
+            value = value.strip()
+            subreq.headers[header] = value
+            if header != 'etag':
+                # make sure ssync doesn't cause 'Etag' to be added to
+                # obj metadata in addition to 'ETag' which object server
+                # sets (note capitalization)
+                replication_headers.append(header)
+            if header == 'content-length':
+                content_length = int(value)
+        # Establish subrequest body, if needed.
+        if method in ('DELETE', 'POST'):
+            if content_length not in (None, 0):
+                raise Exception(
+                    '%s subrequest with content-length %s'
+                    % (method, path))
+            body_done.send(True)
+        elif method == 'PUT':
+            if content_length is None:
+                raise Exception(
+                    'No content-length sent for %s %s' % (method, path))
+            if not content_length:
+                body_done.send(True)
+
+            def subreq_iter():
+                left = content_length
+                while left > 0:
+                    with exceptions.MessageTimeout(
+                            self.app.client_timeout,
+                            'updates content'):
+                        chunk = self.fp.read(
+                            min(left, self.app.network_chunk_size))
+                    if not chunk:
+                        raise exceptions.ChunkReadError(
+                            'Early termination for %s %s' % (method, path))
+                    left -= len(chunk)
+                    if not left and not body_done.ready():
+                        body_done.send(True)
+                    yield chunk
+            subreq.environ['wsgi.input'] = utils.FileLikeIter(
+                subreq_iter())
+        else:
+            raise Exception('Invalid subrequest method %s' % method)
+        subreq.headers['X-Backend-Storage-Policy-Index'] = int(self.policy)
+        subreq.headers['X-Backend-Replication'] = 'True'
+        if self.node_index is not None:
+            # primary node should not 409 if it has a non-primary fragment
+            subreq.headers['X-Backend-Ssync-Frag-Index'] = self.node_index
+        if replication_headers:
+            subreq.headers['X-Backend-Replication-Headers'] = \
+                ' '.join(replication_headers)
+        return subreq, path, body_done
+
+    def _is_success(self, status, subreq):
+        """
+        Whether a subrequest that got the given status succeeded, logging a
+        warning if it did not.
+        """
+        if http.is_success(status) or status == http.HTTP_NOT_FOUND:
+            return True
+        self.app.logger.warning(
+            'ssync subrequest failed with %s: %s %s' %
+            (status, subreq.method, subreq.path))
+        return False
+
+    def _check_failures(self, successes, failures):
+        """
+        Raises an Exception if there have been too many failures, as
+        configured by replication_failure_threshold and
+        replication_failure_ratio.
+        """
+        if failures >= self.app.replication_failure_threshold and (
+                not successes or
+                float(failures) / successes >
+                self.app.replication_failure_ratio):
+            raise Exception(
+                'Too many %d failures to %d successes' %
+                (failures, successes))
@@ -13,12 +13,26 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import binascii
+import hashlib
+
 import six
 from six.moves import urllib
 
 from swift.common import bufferedhttp
 from swift.common import exceptions
 from swift.common import http
+from swift.common.iblt import IBLT
+
+# the fewest cells of a table; partitions with no more objects than the
+# cells of their table send their whole list instead of reconciling it
+RECONCILE_MIN_CELLS = 64
+# a table that is too small to list the difference is sent once more, with
+# this many times the cells, before the whole list is sent instead
+RECONCILE_RETRY_FACTOR = 4
+# the most suffixes or base64 characters of the table sent on one line
+RECONCILE_LINE_ITEMS = 256
+RECONCILE_LINE_CHARS = 4096
 
 
 def encode_missing(object_hash, ts_data, ts_meta=None, ts_ctype=None):
@@ -43,6 +57,19 @@ def encode_missing(object_hash, ts_data, ts_meta=None, ts_ctype=None):
     return msg
 
 
+def reconcile_key(object_hash, timestamps):
+    """
+    Returns the key that represents an object hash and its timestamps in the
+    tables exchanged by the RECONCILE step of an SSYNC request, which is the
+    MD5 digest of the object's missing_check line.
+
+    :param object_hash: the object hash
+    :param timestamps: a dict of timestamps, as yielded by
+                       :meth:`~swift.obj.diskfile.BaseDiskFileManager.yield_hashes`
+    """
+    return hashlib.md5(encode_missing(object_hash, **timestamps)).digest()
+
+
 def decode_wanted(parts):
     """
     Parse missing_check line parts to determine which parts of local
@@ -99,6 +126,14 @@ class Sender(object):
         # be sync'ed; each entry maps an object hash => dict of wanted parts
         self.send_map = {}
         self.failures = 0
+        # the most subrequests that may be unacknowledged when the receiver
+        # has agreed to pipeline the updates, and the (method, path) of those
+        # that are
+        self.pipeline_window = 1
+        self.unacked = set()
+        # whether the UPDATES step has ended, after which the connection can
+        # go back to the daemon's connection pool
+        self.updates_done = False
 
     def __call__(self):
         """
@@ -173,9 +208,14 @@ class Sender(object):
         """
         with exceptions.MessageTimeout(
                 self.daemon.conn_timeout, 'connect send'):
-            self.connection = bufferedhttp.BufferedHTTPConnection(
-                '%s:%s' % (self.node['replication_ip'],
-                           self.node['replication_port']))
+            if self.daemon.conn_pool:
+                self.connection = self.daemon.conn_pool.get(
+                    self.node['replication_ip'],
+                    self.node['replication_port'], self.node['device'])
+            else:
+                self.connection = bufferedhttp.BufferedHTTPConnection(
+                    '%s:%s' % (self.node['replication_ip'],
+                               self.node['replication_port']))
             self.connection.putrequest('SSYNC', '/%s/%s' % (
                 self.node['device'], self.job['partition']))
             self.connection.putheader('Transfer-Encoding', 'chunked')
@@ -197,6 +237,9 @@ class Sender(object):
             # a revert job to a handoff will not have a node index
             self.connection.putheader('X-Backend-Ssync-Node-Index',
                                       self.node.get('index', ''))
+            if self.daemon.ssync_pipeline_window > 1:
+                self.connection.putheader('X-Backend-Ssync-Pipeline-Window',
+                                          self.daemon.ssync_pipeline_window)
             self.connection.endheaders()
         with exceptions.MessageTimeout(
                 self.daemon.node_timeout, 'connect receive'):
@@ -260,15 +303,22 @@ class Sender(object):
         Full documentation of this can be found at
         :py:meth:`.Receiver.missing_check`.
         """
+        hash_gen = None
+        if self.remote_check_objs is None and \
+                self.daemon.ssync_reconcile_ratio > 0 and \
+                self.response.getheader(
+                    'X-Backend-Ssync-Reconcile') == 'iblt':
+            hash_gen = self.reconcile()
         # First, send our list.
         with exceptions.MessageTimeout(
                 self.daemon.node_timeout, 'missing_check start'):
             msg = ':MISSING_CHECK: START\r\n'
             self.connection.send('%x\r\n%s\r\n' % (len(msg), msg))
-        hash_gen = self.df_mgr.yield_hashes(
-            self.job['device'], self.job['partition'],
-            self.job['policy'], self.suffixes,
-            frag_index=self.job.get('frag_index'))
+        if hash_gen is None:
+            hash_gen = self.df_mgr.yield_hashes(
+                self.job['device'], self.job['partition'],
+                self.job['policy'], self.suffixes,
+                frag_index=self.job.get('frag_index'))
         if self.remote_check_objs is not None:
             hash_gen = six.moves.filter(
                 lambda objhash_timestamps:
@@ -295,6 +345,12 @@ class Sender(object):
             line = line.strip()
             if line == ':MISSING_CHECK: START':
                 break
+            elif line.startswith(':MISSING_CHECK: START '):
+                # the receiver will pipeline the updates
+                for param in line.split()[2:]:
+                    if param.startswith('window='):
+                        self.pipeline_window = int(param[len('window='):])
+                break
             elif line:
                 raise exceptions.ReplicationException(
                     'Unexpected response: %r' % line[:1024])
@@ -311,13 +367,122 @@ class Sender(object):
             if parts:
                 self.send_map[parts[0]] = decode_wanted(parts[1:])
 
+    def reconcile(self):
+        """
+        Handles the sender-side of the optional RECONCILE step of a SSYNC
+        request, which narrows down the list sent by the MISSING_CHECK step.
+
+        Full documentation of this can be found at
+        :py:meth:`.Receiver.reconcile`.
+
+        The table is sized to an estimate of the difference rather than to
+        the number of objects: every suffix being synced has changed, so
+        ``ssync_reconcile_ratio`` cells are allowed for each suffix. A table
+        that turns out to be too small is sent once more, with
+        ``RECONCILE_RETRY_FACTOR`` times the cells. No table is sent with as
+        many cells as there are objects, as it would be no smaller than the
+        list.
+
+        :returns: a list of the (object_hash, timestamps) of the objects in
+                  the suffixes being synced that the receiver may be missing,
+                  which are all of them if the partition is too small to
+                  reconcile or the receiver could not list the differences
+        """
+        entries = []
+        keys = {}
+        for object_hash, timestamps in self.df_mgr.yield_hashes(
+                self.job['device'], self.job['partition'],
+                self.job['policy'], self.suffixes,
+                frag_index=self.job.get('frag_index')):
+            self.available_map[object_hash] = timestamps
+            entries.append((object_hash, timestamps))
+            keys[reconcile_key(object_hash, timestamps)] = entries[-1]
+        cells = max(RECONCILE_MIN_CELLS, int(
+            len(self.suffixes) * self.daemon.ssync_reconcile_ratio))
+        for _junk in range(2):
+            if cells >= len(entries):
+                break
+            differing = self._reconcile_table(keys, cells)
+            if differing is not None:
+                return differing
+            self.daemon.logger.debug(
+                '%s:%s/%s/%s could not reconcile %d objects with %d '
+                'cells', self.node.get('replication_ip'),
+                self.node.get('replication_port'),
+                self.node.get('device'), self.job.get('partition'),
+                len(entries), cells)
+            cells *= RECONCILE_RETRY_FACTOR
+        return entries
+
+    def _reconcile_table(self, keys, cells):
+        """
+        Send a table of the keys of the objects being synced, and read back
+        the keys that only the sender has.
+
+        :param keys: a dict mapping the keys to the (object_hash, timestamps)
+                     of their objects
+        :param cells: the number of cells of the table
+        :returns: a list of the (object_hash, timestamps) of the objects that
+                  the receiver may be missing, or None if the table was too
+                  small for the receiver to list them
+        """
+        table = IBLT(cells)
+        for key in keys:
+            table.insert(key)
+        table = table.to_string()
+        suffixes = list(self.suffixes)
+        lines = [':RECONCILE: START']
+        for i in range(0, len(suffixes), RECONCILE_LINE_ITEMS):
+            lines.append('suffixes %s' % ' '.join(
+                suffixes[i:i + RECONCILE_LINE_ITEMS]))
+        for i in range(0, len(table), RECONCILE_LINE_CHARS):
+            lines.append('table %s' % table[i:i + RECONCILE_LINE_CHARS])
+        lines.append(':RECONCILE: END')
+        for line in lines:
+            with exceptions.MessageTimeout(
+                    self.daemon.node_timeout, 'reconcile send line'):
+                msg = '%s\r\n' % line
+                self.connection.send('%x\r\n%s\r\n' % (len(msg), msg))
+        while True:
+            with exceptions.MessageTimeout(
+                    self.daemon.http_timeout, 'reconcile start wait'):
+                line = self.readline()
+            if not line:
+                raise exceptions.ReplicationException('Early disconnect')
+            line = line.strip()
+            if line == ':RECONCILE: FAILED':
+                return None
+            elif line == ':RECONCILE: START':
+                break
+            elif line:
+                raise exceptions.ReplicationException(
+                    'Unexpected response: %r' % line[:1024])
+        differing = []
+        while True:
+            with exceptions.MessageTimeout(
+                    self.daemon.http_timeout, 'reconcile line wait'):
+                line = self.readline()
+            if not line:
+                raise exceptions.ReplicationException('Early disconnect')
+            line = line.strip()
+            if line == ':RECONCILE: END':
+                break
+            if line:
+                try:
+                    differing.append(keys[binascii.unhexlify(line)])
+                except (KeyError, TypeError, binascii.Error):
+                    raise exceptions.ReplicationException(
+                        'Unexpected response: %r' % line[:1024])
+        return differing
+
     def updates(self):
         """
         Handles the sender-side of the UPDATES step of an SSYNC
         request.
 
         Full documentation of this can be found at
-        :py:meth:`.Receiver.updates`.
+        :py:meth:`.Receiver.updates` and, for pipelined updates,
+        :py:meth:`.Receiver.pipelined_updates`.
         """
         # First, send all our subrequests based on the send_map.
         with exceptions.MessageTimeout(
@@ -361,6 +526,15 @@ class Sender(object):
                 self.daemon.node_timeout, 'updates end'):
             msg = ':UPDATES: END\r\n'
             self.connection.send('%x\r\n%s\r\n' % (len(msg), msg))
+        if self.pipeline_window > 1:
+            # Read the rest of the acknowledgements.
+            while self.read_ack():
+                pass
+            if self.unacked:
+                raise exceptions.ReplicationException(
+                    '%d subrequests not acknowledged' % len(self.unacked))
+            self.updates_done = True
+            return
         # Now, read their response for any issues.
         while True:
             with exceptions.MessageTimeout(
@@ -386,22 +560,77 @@ class Sender(object):
             elif line:
                 raise exceptions.ReplicationException(
                     'Unexpected response: %r' % line[:1024])
+        self.updates_done = True
+
+    def read_ack(self):
+        """
+        Reads a line of the response to pipelined updates, which is either
+        `:UPDATES: START`, the acknowledgement of a subrequest or
+        `:UPDATES: END`. Failed subrequests are logged and counted in
+        ``failures``.
+
+        :returns: False once `:UPDATES: END` has been read, else True
+        """
+        with exceptions.MessageTimeout(
+                self.daemon.http_timeout, 'updates ack wait'):
+            line = self.readline()
+        if not line:
+            raise exceptions.ReplicationException('Early disconnect')
+        line = line.strip()
+        if line == ':UPDATES: END':
+            return False
+        if not line or line == ':UPDATES: START':
+            return True
+        try:
+            ack, status, method, url_path = line.split(' ', 3)
+            status = int(status)
+        except ValueError:
+            ack = None
+        if ack != ':ACK:' or (method, url_path) not in self.unacked:
+            raise exceptions.ReplicationException(
+                'Unexpected response: %r' % line[:1024])
+        self.unacked.remove((method, url_path))
+        if not (http.is_success(status) or status == http.HTTP_NOT_FOUND):
+            self.failures += 1
+            self.daemon.logger.warning(
+                '%s:%s/%s/%s ssync subrequest failed with %s: %s %s',
+                self.node.get('replication_ip'),
+                self.node.get('replication_port'), self.node.get('device'),
+                self.job.get('partition'), status, method, url_path)
+        return True
+
+    def wait_for_window(self):
+        """
+        Reads acknowledgements until another subrequest may be sent, when
+        the updates are pipelined.
+        """
+        while self.pipeline_window > 1 and \
+                len(self.unacked) >= self.pipeline_window:
+            if not self.read_ack():
+                raise exceptions.ReplicationException('Early :UPDATES: END')
+
+    def _sent(self, method, url_path):
+        if self.pipeline_window > 1:
+            self.unacked.add((method, url_path))
 
     def send_delete(self, url_path, timestamp):
         """
         Sends a DELETE subrequest with the given information.
         """
+        self.wait_for_window()
         msg = ['DELETE ' + url_path, 'X-Timestamp: ' + timestamp.internal]
         msg = '\r\n'.join(msg) + '\r\n\r\n'
         with exceptions.MessageTimeout(
                 self.daemon.node_timeout, 'send_delete'):
             self.connection.send('%x\r\n%s\r\n' % (len(msg), msg))
+        self._sent('DELETE', url_path)
 
     def send_put(self, url_path, df):
         """
         Sends a PUT subrequest for the url_path using the source df
         (DiskFile) and content_length.
         """
+        self.wait_for_window()
         msg = ['PUT ' + url_path, 'Content-Length: ' + str(df.content_length)]
         # Sorted to make it easier to test.
         for key, value in sorted(df.get_datafile_metadata().items()):
@@ -425,12 +654,14 @@ class Sender(object):
             # etag in a footer of this subrequest, but that is not supported.
             raise exceptions.ReplicationException(
                 'Sent data length does not match content-length')
+        self._sent('PUT', url_path)
 
     def send_post(self, url_path, df):
         metadata = df.get_metafile_metadata()
         if metadata is None:
             return
 
+        self.wait_for_window()
         msg = ['POST ' + url_path]
         # Sorted to make it easier to test.
         for key, value in sorted(metadata.items()):
@@ -438,18 +669,42 @@ class Sender(object):
         msg = '\r\n'.join(msg) + '\r\n\r\n'
         with exceptions.MessageTimeout(self.daemon.node_timeout, 'send_post'):
             self.connection.send('%x\r\n%s\r\n' % (len(msg), msg))
+        self._sent('POST', url_path)
 
     def disconnect(self):
         """
         Closes down the connection to the object server once done
-        with the SSYNC request.
+        with the SSYNC request, or gives it back to the daemon's
+        connection pool if the request ended normally.
         """
         if not self.connection:
             return
+        reusable = False
         try:
             with exceptions.MessageTimeout(
                     self.daemon.node_timeout, 'disconnect'):
                 self.connection.send('0\r\n\r\n')
+                if self.daemon.conn_pool and self.updates_done:
+                    reusable = self.finish_response()
         except (Exception, exceptions.Timeout):
             pass  # We're okay with the above failing.
-        self.connection.close()
+        if reusable:
+            self.daemon.conn_pool.put(self.connection)
+        else:
+            self.connection.close()
+
+    def finish_response(self):
+        """
+        Reads the end of the SSYNC response, which the receiver sends once
+        it has read the end of the request.
+
+        :returns: True if the response ended where expected, so that the
+                  connection may be reused
+        """
+        if self.readline() or self.response_chunk_left != -1:
+            return False
+        # the blank line that ends the chunked response
+        if self.response.fp.readline() != '\r\n':
+            return False
+        self.response.close()
+        return True
@@ -25,14 +25,16 @@ from eventlet import spawn, Timeout
 
 from swift.common.bufferedhttp import http_connect
 from swift.common.constraints import check_drive
-from swift.common.exceptions import ConnectionTimeout
+from swift.common.exceptions import ConnectionTimeout, LockTimeout
 from swift.common.ring import Ring
 from swift.common.utils import get_logger, renamer, write_pickle, \
     dump_recon_cache, config_true_value, ratelimit_sleep, eventlet_monkey_patch
 from swift.common.daemon import Daemon
 from swift.common.header_key_dict import HeaderKeyDict
 from swift.common.storage_policy import split_policy_string, PolicyError
-from swift.obj.diskfile import get_tmp_dir, ASYNCDIR_BASE
+from swift.obj.async_journal import AsyncJournal, iter_segment, \
+    DEFAULT_JOURNAL_SEGMENT_SIZE
+from swift.obj.diskfile import get_tmp_dir, ASYNCDIR_BASE, ASYNC_JOURNAL_BASE
 from swift.common.http import is_success, HTTP_INTERNAL_SERVER_ERROR
 
 
@@ -108,6 +110,8 @@ class ObjectUpdater(Daemon):
         self.recon_cache_path = conf.get('recon_cache_path',
                                          '/var/cache/swift')
         self.rcache = os.path.join(self.recon_cache_path, 'object.recon')
+        self.async_journal_segment_size = int(conf.get(
+            'async_journal_segment_size', DEFAULT_JOURNAL_SEGMENT_SIZE))
         self.stats = SweepStats()
 
     def _listdir(self, path):
@@ -207,13 +211,13 @@ class ObjectUpdater(Daemon):
         self.logger.info("Object update sweep starting on %s (pid: %d)",
                          device, my_pid)
 
-        # loop through async pending dirs for all policies
+        # loop through async pending and journal dirs for all policies
         for asyncdir in self._listdir(device):
             # we only care about directories
             async_pending = os.path.join(device, asyncdir)
             if not os.path.isdir(async_pending):
                 continue
-            if not asyncdir.startswith(ASYNCDIR_BASE):
+            if not asyncdir.startswith((ASYNCDIR_BASE, ASYNC_JOURNAL_BASE)):
                 # skip stuff like "accounts", "containers", etc.
                 continue
             try:
@@ -225,7 +229,12 @@ class ObjectUpdater(Daemon):
                                       'to a valid policy (%(error)s)') % {
                                     'directory': asyncdir, 'error': e})
                 continue
-            for prefix in self._listdir(async_pending):
+            if base == ASYNC_JOURNAL_BASE:
+                self.journal_sweep(async_pending, device, policy)
+                prefixes = []
+            else:
+                prefixes = self._listdir(async_pending)
+            for prefix in prefixes:
                 prefix_path = os.path.join(async_pending, prefix)
                 if not os.path.isdir(prefix_path):
                     continue
@@ -290,6 +299,61 @@ class ObjectUpdater(Daemon):
                  'unlinks': sweep_totals.unlinks,
                  'errors': sweep_totals.errors})
 
+    def journal_sweep(self, journal_path, device, policy):
+        """
+        Seal an async journal and send the newest update of each object in
+        its sealed segments, which are read sequentially. Updates that fail
+        are appended to the journal again, so that the sealed segments can
+        be removed.
+
+        :param journal_path: path to the async journal
+        :param device: path to device
+        :param policy: storage policy of the journal's updates
+        """
+        journal = AsyncJournal(journal_path,
+                               segment_size=self.async_journal_segment_size)
+        try:
+            segments = journal.seal()
+            # the newest timestamp of the updates of each object
+            newest = {}
+            for segment in segments:
+                for obj_hash, timestamp, _junk in iter_segment(segment):
+                    if timestamp > newest.get(obj_hash, ''):
+                        newest[obj_hash] = timestamp
+            for segment in segments:
+                def on_error(offset):
+                    self.stats.errors += 1
+                    self.logger.increment('errors')
+                    self.logger.error(
+                        _('ERROR corrupt async journal record in %(path)s '
+                          'at offset %(offset)s'),
+                        {'path': segment, 'offset': offset})
+
+                for obj_hash, timestamp, update in iter_segment(
+                        segment, on_error):
+                    if newest.get(obj_hash) != timestamp:
+                        # superseded, or already sent from an older segment
+                        self.stats.unlinks += 1
+                        self.logger.increment('unlinks')
+                        continue
+                    del newest[obj_hash]
+                    if self.send_update(update, policy, segment):
+                        self.stats.unlinks += 1
+                        self.logger.increment('unlinks')
+                    else:
+                        journal.append(obj_hash, timestamp, update)
+                    self.objects_running_time = ratelimit_sleep(
+                        self.objects_running_time,
+                        self.max_objects_per_second)
+                os.unlink(segment)
+        except (Exception, LockTimeout):
+            self.stats.errors += 1
+            self.logger.increment('errors')
+            self.logger.exception(
+                _('ERROR processing async journal %s'), journal_path)
+        finally:
+            journal.close()
+
     def process_object_update(self, update_path, device, policy):
         """
         Process the object information to be updated and update.
@@ -309,6 +373,25 @@ class ObjectUpdater(Daemon):
                                        os.path.basename(update_path))
             renamer(update_path, target_path, fsync=False)
             return
+        successes = list(update.get('successes', []))
+        if self.send_update(update, policy, update_path):
+            self.stats.unlinks += 1
+            self.logger.increment('unlinks')
+            os.unlink(update_path)
+        elif update.get('successes', []) != successes:
+            write_pickle(update, update_path, os.path.join(
+                device, get_tmp_dir(policy)))
+
+    def send_update(self, update, policy, update_path):
+        """
+        Send an async update to the container replicas that do not have it
+        yet, adding the ids of those that take it to its ``successes``.
+
+        :param update: the update dict
+        :param policy: storage policy of object update
+        :param update_path: path to the file the update was read from
+        :returns: True if all the container replicas have the update
+        """
         successes = update.get('successes', [])
         part, nodes = self.get_container_ring().get_nodes(
             update['account'], update['container'])
@@ -322,12 +405,10 @@ class ObjectUpdater(Daemon):
                         node, part, update['op'], obj, headers_out)
                   for node in nodes if node['id'] not in successes]
         success = True
-        new_successes = False
         for event in events:
             event_success, node_id = event.wait()
             if event_success is True:
                 successes.append(node_id)
-                new_successes = True
             else:
                 success = False
         if success:
@@ -335,18 +416,13 @@ class ObjectUpdater(Daemon):
             self.logger.increment('successes')
             self.logger.debug('Update sent for %(obj)s %(path)s',
                               {'obj': obj, 'path': update_path})
-            self.stats.unlinks += 1
-            self.logger.increment('unlinks')
-            os.unlink(update_path)
         else:
             self.stats.failures += 1
             self.logger.increment('failures')
             self.logger.debug('Update failed for %(obj)s %(path)s',
                               {'obj': obj, 'path': update_path})
-            if new_successes:
-                update['successes'] = successes
-                write_pickle(update, update_path, os.path.join(
-                    device, get_tmp_dir(policy)))
+            update['successes'] = successes
+        return success
 
     def object_update(self, node, part, op, obj, headers_out):
         """
@@ -204,6 +204,11 @@ class Application(object):
         # ensure rings are loaded for all configured storage policies
         for policy in POLICIES:
             policy.load_ring(swift_dir)
+        self.handoff_cache_size = int(conf.get('handoff_cache_size', 0))
+        if self.handoff_cache_size > 0:
+            for ring in [self.account_ring, self.container_ring] + [
+                    policy.object_ring for policy in POLICIES]:
+                ring.handoff_cache_size = self.handoff_cache_size
         self.obj_controller_router = ObjectControllerRouter()
         self.memcache = memcache
         mimetypes.init(mimetypes.knownfiles +
@@ -343,6 +343,7 @@ class FabricatedRing(Ring):
         for p in range(2 ** self.part_power):
             for r in range(self.replicas):
                 self._replica2part2dev_id[r][p] = next(dev_ids)
+        self._rebuild_tier_data()
 
 
 class FakeMemcache(object):
@@ -12,6 +12,8 @@
 # limitations under the License.
 
 import binascii
+import json
+import mock
 import os
 import shutil
 import struct
@@ -96,6 +98,199 @@ class TestRelinker(unittest.TestCase):
         stat_new = os.stat(self.expected_file)
         self.assertEqual(stat_old.st_ino, stat_new.st_ino)
 
+    def _add_device(self, device):
+        objdir = os.path.join(self.devices, device, 'objects',
+                              os.path.relpath(self.objdir, self.objects))
+        os.makedirs(objdir)
+        os.link(self.objname, os.path.join(objdir, self.object_fname))
+        return os.path.join(self.devices, device, 'objects',
+                            os.path.relpath(self.expected_file, self.objects))
+
+    def _load_state(self, action, device='sda1'):
+        with open(os.path.join(self.devices, device,
+                               '%s.objects.json' % action)) as f:
+            return json.load(f)
+
+    def _use_slab_policy(self):
+        storage_policy._POLICIES = StoragePolicyCollection([
+            StoragePolicy(0, 'platin', True, diskfile_backend='slab')])
+
+    def test_relink_slab_policy(self):
+        self._use_slab_policy()
+        self.rb.prepare_increase_partition_power()
+        self._save_ring()
+        self.assertEqual(1, relinker.relink(
+            self.testdir, self.devices, True, self.logger))
+        self.assertFalse(os.path.exists(self.expected_file))
+        self.assertEqual(
+            ['Policy platin uses the slab diskfile backend, which does not '
+             'support increasing the partition power'],
+            self.logger.get_lines_for_level('error'))
+
+    def test_cleanup_slab_policy(self):
+        self._use_slab_policy()
+        self._common_test_cleanup()
+        self.assertEqual(1, relinker.cleanup(
+            self.testdir, self.devices, True, self.logger))
+        self.assertTrue(os.path.isfile(self.objname))
+        self.assertEqual(
+            ['Policy platin uses the slab diskfile backend, which does not '
+             'support increasing the partition power'],
+            self.logger.get_lines_for_level('error'))
+
+    def test_relink_workers(self):
+        self.rb.prepare_increase_partition_power()
+        self._save_ring()
+        expected_files = [self.expected_file] + [
+            self._add_device(device) for device in ('sdb1', 'sdc1')]
+        self.assertEqual(0, relinker.relink(
+            self.testdir, self.devices, True, workers=2))
+        for expected_file in expected_files:
+            self.assertTrue(os.path.isfile(expected_file))
+            self.assertEqual(os.stat(self.objname).st_ino,
+                             os.stat(expected_file).st_ino)
+
+    def test_relink_worker_failure(self):
+        self.rb.prepare_increase_partition_power()
+        self._save_ring()
+        expected_file = self._add_device('sdb1')
+
+        real_relink_paths = relinker.diskfile.relink_paths
+
+        def fake_relink_paths(fname, newfname, check_existing=False):
+            if '/sdb1/' in fname:
+                os._exit(3)
+            real_relink_paths(fname, newfname, check_existing)
+
+        with mock.patch('swift.cli.relinker.diskfile.relink_paths',
+                        fake_relink_paths):
+            self.assertEqual(1, relinker.relink(
+                self.testdir, self.devices, True, self.logger, workers=2))
+        self.assertEqual(['Worker for device sdb1 failed (wait status 768)'],
+                         self.logger.get_lines_for_level('warning'))
+        self.assertTrue(os.path.isfile(self.expected_file))
+        self.assertFalse(os.path.exists(expected_file))
+
+    def test_relink_checkpoints(self):
+        self.rb.prepare_increase_partition_power()
+        self._save_ring()
+        part = os.path.basename(os.path.dirname(os.path.dirname(
+            self.objdir)))
+        self.assertEqual(0, relinker.relink(
+            self.testdir, self.devices, True, stats_interval=0))
+        self.assertTrue(os.path.isfile(self.expected_file))
+        self.assertEqual({'part_power': 8, 'next_part_power': 9,
+                          'state': {part: True}},
+                         self._load_state('relink'))
+
+        # a partition that has been relinked is skipped when run again
+        os.unlink(self.expected_file)
+        with mock.patch('swift.cli.relinker.diskfile.relink_paths') as mocked:
+            self.assertEqual(0, relinker.relink(
+                self.testdir, self.devices, True))
+        self.assertFalse(mocked.called)
+
+        # ... unless the state was saved for another part power change
+        state = self._load_state('relink')
+        state['next_part_power'] = 10
+        with open(os.path.join(self.devices, 'sda1',
+                               'relink.objects.json'), 'w') as f:
+            json.dump(state, f)
+        self.assertEqual(0, relinker.relink(
+            self.testdir, self.devices, True))
+        self.assertTrue(os.path.isfile(self.expected_file))
+
+    def test_relink_errors_are_not_checkpointed(self):
+        self.rb.prepare_increase_partition_power()
+        self._save_ring()
+        with mock.patch('swift.cli.relinker.diskfile.relink_paths',
+                        side_effect=OSError('kaboom')):
+            self.assertEqual(1, relinker.relink(
+                self.testdir, self.devices, True, self.logger,
+                stats_interval=0))
+        self.assertEqual({}, self._load_state('relink')['state'])
+        self.assertEqual(['Relinking %s to %s failed: kaboom' % (
+            self.objname, self.expected_file)],
+            self.logger.get_lines_for_level('warning'))
+        # so it is tried again next time
+        self.assertEqual(0, relinker.relink(
+            self.testdir, self.devices, True, stats_interval=0))
+        self.assertTrue(os.path.isfile(self.expected_file))
+
+    def test_relink_files_per_second(self):
+        self.rb.prepare_increase_partition_power()
+        self._save_ring()
+        with mock.patch('swift.cli.relinker.ratelimit_sleep',
+                        return_value=0) as mock_sleep:
+            self.assertEqual(0, relinker.relink(
+                self.testdir, self.devices, True, files_per_second=5))
+        self.assertEqual([mock.call(0, 5.0)], mock_sleep.call_args_list)
+
+    def test_relink_skips_unmounted_devices(self):
+        self.rb.prepare_increase_partition_power()
+        self._save_ring()
+        with mock.patch('swift.cli.relinker.ismount', return_value=False):
+            self.assertEqual(0, relinker.relink(
+                self.testdir, self.devices, False, self.logger))
+        self.assertFalse(os.path.exists(self.expected_file))
+        self.assertEqual(['Skipping sda1 as it is not mounted'],
+                         self.logger.get_lines_for_level('warning'))
+
+    def test_relink_recon_progress(self):
+        self.rb.prepare_increase_partition_power()
+        self._save_ring()
+        with mock.patch('swift.cli.relinker.time.time',
+                        side_effect=[100.0] + [110.0] * 10):
+            self.assertEqual(0, relinker.relink(
+                self.testdir, self.devices, True,
+                recon_cache_path=self.testdir))
+        with open(os.path.join(self.testdir, 'object.recon')) as f:
+            recon = json.load(f)
+        self.assertEqual({'sda1': {
+            'action': 'relink',
+            'policy': 0,
+            'parts_total': 1,
+            'parts_done': 1,
+            'files': 1,
+            'errors': 0,
+            'files_per_second': 0.1,
+            'start_time': 100.0,
+            'last_update': 110.0,
+            'eta': 0.0,
+        }}, recon['relinker_progress'])
+
+    def test_device_progress_eta(self):
+        progress = relinker.DeviceProgress(
+            'relink', os.path.join(self.devices, 'sda1'), POLICIES[0], 8, 9,
+            self.logger)
+        progress.state = {'1': True}
+        self.assertEqual(['2', '3', '4'], progress.partitions_filter(
+            self.objects, ['1', '2', '3', '4', 'auditor_status.json']))
+        progress.start_time = 100.0
+        with mock.patch('swift.cli.relinker.time.time', return_value=110.0):
+            stats = progress.get_stats()
+        # nothing walked yet, so there's no estimate
+        self.assertEqual((4, 1, None), (
+            stats['parts_total'], stats['parts_done'], stats['eta']))
+        progress.file_done(True)
+        progress.partition_done(os.path.join(self.objects, '2'))
+        progress.file_done(False)
+        progress.partition_done(os.path.join(self.objects, '3'))
+        with mock.patch('swift.cli.relinker.time.time', return_value=110.0):
+            stats = progress.get_stats()
+        self.assertEqual((3, 1, 1, 5.0), (
+            stats['parts_done'], stats['files'], stats['errors'],
+            stats['eta']))
+        self.assertEqual({'1': True, '2': True}, progress.state)
+
+    def test_relink_invalidates_new_suffix(self):
+        self.rb.prepare_increase_partition_power()
+        self._save_ring()
+        self.assertEqual(0, relinker.relink(self.testdir, self.devices, True))
+        with open(os.path.join(self.objects, str(self.next_part),
+                               'hashes.invalid')) as f:
+            self.assertEqual([self._hash[-3:]], f.read().splitlines())
+
     def _common_test_cleanup(self, relink=True):
         # Create a ring that has prev_part_power set
         self.rb.prepare_increase_partition_power()
@@ -120,6 +315,13 @@ class TestRelinker(unittest.TestCase):
         self.assertFalse(os.path.isfile(
             os.path.join(self.objdir, self.object_fname)))
 
+    def test_cleanup_invalidates_old_suffix(self):
+        self._common_test_cleanup()
+        self.assertEqual(0, relinker.cleanup(self.testdir, self.devices, True))
+        with open(os.path.join(os.path.dirname(os.path.dirname(self.objdir)),
+                               'hashes.invalid')) as f:
+            self.assertEqual([self._hash[-3:]], f.read().splitlines())
+
     def test_cleanup_not_yet_relinked(self):
         self._common_test_cleanup(relink=False)
         self.assertEqual(1, relinker.cleanup(self.testdir, self.devices, True))
@@ -160,6 +362,17 @@ class TestRelinker(unittest.TestCase):
             0, relinker.cleanup(self.testdir, self.devices, True, self.logger))
         self.assertEqual(self.logger.get_lines_for_level('warning'), [])
 
+    def test_cleanup_checkpoints(self):
+        self._common_test_cleanup()
+        self.assertEqual(0, relinker.cleanup(
+            self.testdir, self.devices, True, workers=2, stats_interval=0))
+        self.assertFalse(os.path.isfile(self.objname))
+        state = self._load_state('cleanup')
+        self.assertEqual((9, 9), (state['part_power'],
+                                  state['next_part_power']))
+        self.assertEqual(sorted(os.listdir(self.objects)),
+                         sorted(state['state']))
+
     def test_cleanup_quarantined(self):
         self._common_test_cleanup()
         # Pretend the object in the new place got corrupted
@@ -21,7 +21,8 @@ from six import StringIO
 import unittest
 from test.unit import with_tempdir
 
-from swift.cli.ring_builder_analyzer import parse_scenario, run_scenario
+from swift.cli.ring_builder_analyzer import parse_scenario, run_scenario, \
+    benchmark_scenario, main
 
 
 class TestRunScenario(unittest.TestCase):
@@ -49,6 +50,71 @@ class TestRunScenario(unittest.TestCase):
         self.assertIn('Rebalance', fake_stdout.getvalue())
         self.assertTrue(os.path.exists(builder_path))
 
+    def _small_scenario(self):
+        return {
+            'replicas': 3, 'part_power': 8, 'random_seed': 123, 'overload': 0,
+            'rounds': [[['add', 'r1z2-3.4.5.6:7/sda8', 100],
+                        ['add', 'z2-3.4.5.6:7/sda9', 200],
+                        ['add', 'z2-3.4.5.6:7/sda10', 200],
+                        ['add', 'z2-3.4.5.6:7/sda11', 200]],
+                       [['set_weight', 0, 150]],
+                       [['remove', 1]]]}
+
+    def test_timing(self):
+        parsed = parse_scenario(json.dumps(self._small_scenario()))
+        fake_stdout = StringIO()
+        with mock.patch('sys.stdout', fake_stdout):
+            rebalance_times = run_scenario(parsed, timing=True)
+        lines = [l for l in fake_stdout.getvalue().splitlines()
+                 if 'Rebalance' in l]
+        self.assertEqual(len(rebalance_times), len(lines))
+        for line in lines:
+            self.assertIn('(took ', line)
+
+        parsed = parse_scenario(json.dumps(self._small_scenario()))
+        fake_stdout = StringIO()
+        with mock.patch('sys.stdout', fake_stdout):
+            self.assertEqual(len(rebalance_times), len(run_scenario(parsed)))
+        self.assertNotIn('took', fake_stdout.getvalue())
+
+    def test_benchmark_scenario(self):
+        parsed = parse_scenario(json.dumps(self._small_scenario()))
+        fake_stdout = StringIO()
+        with mock.patch('sys.stdout', fake_stdout):
+            results = benchmark_scenario(parsed, [8, 6])
+        self.assertEqual([6, 8], [r['part_power'] for r in results])
+        for result in results:
+            self.assertGreater(result['rebalances'], 0)
+            self.assertGreaterEqual(result['total_time'], result['max_time'])
+            self.assertGreater(result['peak_rss'], 0)
+        output = fake_stdout.getvalue()
+        self.assertIn('Part power 6', output)
+        self.assertIn('Part power 8', output)
+        self.assertIn('Peak RSS (MiB)', output)
+        # the parsed scenario is left alone, so it can be run again
+        self.assertEqual(parse_scenario(json.dumps(self._small_scenario())),
+                         parsed)
+
+    @with_tempdir
+    def test_main_part_powers(self, tempdir):
+        scenario_path = os.path.join(tempdir, 'scenario.json')
+        with open(scenario_path, 'w') as f:
+            json.dump(self._small_scenario(), f)
+
+        fake_stdout = StringIO()
+        with mock.patch('sys.stdout', fake_stdout):
+            self.assertEqual(0, main(['--part-powers', '7,6', scenario_path]))
+        output = fake_stdout.getvalue()
+        self.assertLess(output.index('Part power 6'),
+                        output.index('Part power 7'))
+
+        for bad in ('6,x', '0', '33'):
+            fake_stderr = StringIO()
+            with mock.patch('sys.stderr', fake_stderr):
+                with self.assertRaises(SystemExit):
+                    main(['--part-powers', bad, scenario_path])
+            self.assertIn('part powers', fake_stderr.getvalue())
+
 
 class TestParseScenario(unittest.TestCase):
     def test_good(self):
@@ -30,7 +30,7 @@ import time
 from swift.cli import ringbuilder
 from swift.cli.ringbuilder import EXIT_SUCCESS, EXIT_WARNING, EXIT_ERROR
 from swift.common import exceptions
-from swift.common.ring import RingBuilder
+from swift.common.ring import RingBuilder, RingData
 
 from test.unit import Timeout
 
@@ -2194,6 +2194,70 @@ class TestCommands(unittest.TestCase, RunSwiftRingBuilderMixin):
         argv = ["", self.tmpfile, "write_ring"]
         self.assertSystemExit(EXIT_SUCCESS, ringbuilder.main, argv)
 
+    def test_write_ring_mapped(self):
+        self.create_sample_ring()
+        argv = ["", self.tmpfile, "rebalance"]
+        self.assertSystemExit(EXIT_SUCCESS, ringbuilder.main, argv)
+        ring_file = self.tmpfile + '.ring.gz'
+        mapped_file = self.tmpfile + '.ring.v2'
+        self.assertFalse(os.path.exists(mapped_file))
+
+        argv = ["", self.tmpfile, "write_ring", "--mapped"]
+        self.assertSystemExit(EXIT_SUCCESS, ringbuilder.main, argv)
+        self.assertTrue(os.path.exists(mapped_file))
+        ring_data = RingData.load(ring_file)
+        mapped_data = RingData.load(mapped_file)
+        self.assertEqual(ring_data.devs, mapped_data.devs)
+        self.assertEqual(
+            [list(part2dev_id)
+             for part2dev_id in ring_data._replica2part2dev_id],
+            [list(part2dev_id)
+             for part2dev_id in mapped_data._replica2part2dev_id])
+        backup_dir = os.path.join(self.tmpdir, 'backups')
+        self.assertEqual(1, len([
+            f for f in os.listdir(backup_dir) if f.endswith('.ring.v2')]))
+
+        # once there is a mapped ring, rebalance keeps it up to date
+        argv = ["", self.tmpfile, "set_weight", "--id", "0", "2.0"]
+        self.assertSystemExit(EXIT_SUCCESS, ringbuilder.main, argv)
+        argv = ["", self.tmpfile, "pretend_min_part_hours_passed"]
+        self.assertSystemExit(EXIT_SUCCESS, ringbuilder.main, argv)
+        argv = ["", self.tmpfile, "rebalance", "--force"]
+        self.assertRaises(SystemExit, ringbuilder.main, argv)
+        ring_data = RingData.load(ring_file)
+        mapped_data = RingData.load(mapped_file)
+        self.assertEqual(ring_data.devs, mapped_data.devs)
+        self.assertEqual(
+            [list(part2dev_id)
+             for part2dev_id in ring_data._replica2part2dev_id],
+            [list(part2dev_id)
+             for part2dev_id in mapped_data._replica2part2dev_id])
+
+    def test_write_ring_without_mapped(self):
+        self.create_sample_ring()
+        argv = ["", self.tmpfile, "rebalance"]
+        self.assertSystemExit(EXIT_SUCCESS, ringbuilder.main, argv)
+        argv = ["", self.tmpfile, "write_ring"]
+        self.assertSystemExit(EXIT_SUCCESS, ringbuilder.main, argv)
+        self.assertFalse(os.path.exists(self.tmpfile + '.ring.v2'))
+
+    def test_write_builder_from_mapped_ring(self):
+        self.create_sample_ring()
+        argv = ["", self.tmpfile, "rebalance"]
+        self.assertSystemExit(EXIT_SUCCESS, ringbuilder.main, argv)
+        argv = ["", self.tmpfile, "write_ring", "--mapped"]
+        self.assertSystemExit(EXIT_SUCCESS, ringbuilder.main, argv)
+        orig_builder = RingBuilder.load(self.tmpfile)
+        os.remove(self.tmpfile)  # loses file...
+
+        # the mapped ring is newer so it is the one that gets loaded
+        ring_file = self.tmpfile + '.ring.gz'
+        argv = ["", ring_file, "write_builder", "24"]
+        self.assertIsNone(ringbuilder.main(argv))
+        builder = RingBuilder.load(self.tmpfile + '.builder')
+        self.assertEqual(orig_builder._replica2part2dev,
+                         builder._replica2part2dev)
+
     def test_write_empty_ring(self):
         ring = RingBuilder(6, 3, 1)
         ring.save(self.tmpfile)
@@ -380,7 +380,7 @@ class TestListEndpoints(unittest.TestCase):
             with mock.patch(patch_path, mock_get_container_info):
                 resp = req.get_response(self.list_endpoints)
             part, nodes = policy.object_ring.get_nodes('a', 'c', 'o1')
-            [node.update({'part': part}) for node in nodes]
+            nodes = [dict(node, part=part) for node in nodes]
             path = 'http://%(ip)s:%(port)s/%(device)s/%(part)s/a/c/o1'
             expected = {
                 'headers': {
@@ -166,6 +166,12 @@ class FakeRecon(object):
         self.fake_expirer_rtype = recon_type
         return {'expirertest': "1"}
 
+    def fake_relinker(self):
+        return {'relinkertest': "1"}
+
+    def fake_device_concurrency(self):
+        return {'devconcurrencytest': "1"}
+
     def fake_mounted(self):
         return {'mountedtest': "1"}
 
@@ -796,6 +802,30 @@ class TestReconSuccess(TestCase):
                             '/var/cache/swift/object.recon'), {})])
         self.assertEqual(rv, from_cache_response)
 
+    def test_get_relinker_info(self):
+        from_cache_response = {'relinker_progress': {
+            'sda1': {'action': 'relink', 'parts_done': 3, 'parts_total': 4,
+                     'eta': 10.0}}}
+        self.fakecache.fakeout_calls = []
+        self.fakecache.fakeout = from_cache_response
+        rv = self.app.get_relinker_info()
+        self.assertEqual(self.fakecache.fakeout_calls,
+                         [((['relinker_progress'],
+                            '/var/cache/swift/object.recon'), {})])
+        self.assertEqual(rv, from_cache_response)
+
+    def test_get_device_concurrency_info(self):
+        from_cache_response = {'object_device_concurrency': {
+            '1234': {'updated': 1.5, 'devices': {
+                'sda1': {'limit': 4, 'in_flight': 1, 'rejected': 2}}}}}
+        self.fakecache.fakeout_calls = []
+        self.fakecache.fakeout = from_cache_response
+        rv = self.app.get_device_concurrency_info()
+        self.assertEqual(self.fakecache.fakeout_calls,
+                         [((['object_device_concurrency'],
+                            '/var/cache/swift/object.recon'), {})])
+        self.assertEqual(rv, from_cache_response)
+
     def test_get_auditor_info_account(self):
         from_cache_response = {"account_auditor_pass_completed": 0.24,
                                "account_audits_failed": 0,
@@ -1127,6 +1157,9 @@ class TestReconMiddleware(unittest.TestCase):
         self.app.get_auditor_info = self.frecon.fake_auditor
         self.app.get_updater_info = self.frecon.fake_updater
         self.app.get_expirer_info = self.frecon.fake_expirer
+        self.app.get_relinker_info = self.frecon.fake_relinker
+        self.app.get_device_concurrency_info = \
+            self.frecon.fake_device_concurrency
         self.app.get_mounted = self.frecon.fake_mounted
         self.app.get_unmounted = self.frecon.fake_unmounted
         self.app.get_diskusage = self.frecon.fake_diskusage
@@ -1370,6 +1403,20 @@ class TestReconMiddleware(unittest.TestCase):
         resp = self.app(req.environ, start_response)
         self.assertEqual(resp, get_driveaudit_resp)
 
+    def test_recon_get_relinker(self):
+        get_relinker_resp = ['{"relinkertest": "1"}']
+        req = Request.blank('/recon/relinker',
+                            environ={'REQUEST_METHOD': 'GET'})
+        resp = self.app(req.environ, start_response)
+        self.assertEqual(resp, get_relinker_resp)
+
+    def test_recon_get_device_concurrency(self):
+        get_device_concurrency_resp = ['{"devconcurrencytest": "1"}']
+        req = Request.blank('/recon/device_concurrency',
+                            environ={'REQUEST_METHOD': 'GET'})
+        resp = self.app(req.environ, start_response)
+        self.assertEqual(resp, get_device_concurrency_resp)
+
     def test_recon_get_time(self):
         get_time_resp = ['{"timetest": "1"}']
         req = Request.blank('/recon/time',
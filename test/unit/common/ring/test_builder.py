@@ -2961,6 +2961,110 @@ class TestRingBuilder(unittest.TestCase):
         self.assertEqual(8, rb.next_part_power)
         self.assertEqual(rb.version, old_version + 2)
 
+    def test_dispersion_graph_save_load(self):
+        rb = ring.RingBuilder(6, 3, 1)
+        for i in range(4):
+            rb.add_dev({'id': i, 'region': 0, 'zone': i, 'weight': 1,
+                        'ip': '127.0.0.1', 'port': 10000 + i,
+                        'device': 'sda'})
+        rb.rebalance(seed=1)
+        self.assertIsInstance(rb._dispersion_graph, utils.DispersionGraph)
+        expected = rb._dispersion_graph.to_dict()
+        self.assertEqual([0, 0, 0, 64], expected[(0,)])
+        # builder files hold the graph as a plain dict
+        self.assertEqual(expected, rb.to_dict()['_dispersion_graph'])
+
+        builder_file = os.path.join(self.testdir, 'test_save.builder')
+        rb.save(builder_file)
+        loaded = ring.RingBuilder.load(builder_file)
+        self.assertIsInstance(loaded._dispersion_graph,
+                              utils.DispersionGraph)
+        self.assertEqual(expected, loaded._dispersion_graph)
+
+        # really old builder files pickled the builder, with a dict graph
+        del rb.logger  # logger type cannot be pickled
+        rb._dispersion_graph = expected
+        with open(builder_file, 'wb') as f:
+            pickle.dump(rb, f, protocol=2)
+        loaded = ring.RingBuilder.load(builder_file)
+        self.assertIsInstance(loaded._dispersion_graph,
+                              utils.DispersionGraph)
+        self.assertEqual(expected, loaded._dispersion_graph)
+
+        # ...or none at all
+        del rb._dispersion_graph
+        with open(builder_file, 'wb') as f:
+            pickle.dump(rb, f, protocol=2)
+        loaded = ring.RingBuilder.load(builder_file)
+        self.assertEqual({}, loaded._dispersion_graph)
+
+    def test_replicas_by_part(self):
+        rb = ring.RingBuilder(4, 2.25, 1)
+        for i in range(3):
+            rb.add_dev({'id': i, 'region': 0, 'zone': i, 'weight': 1,
+                        'ip': '127.0.0.1', 'port': 10000 + i,
+                        'device': 'sda'})
+        rb.rebalance(seed=1)
+        self.assertEqual([16, 16, 4],
+                         [len(p2d) for p2d in rb._replica2part2dev])
+        for part, replicas in rb._replicas_by_part(range(rb.parts)):
+            self.assertEqual(rb._replicas_for_part(part), replicas)
+        self.assertEqual(
+            [(15, [0, 1]), (0, [0, 1, 2])],
+            list(rb._replicas_by_part([15, 0])))
+
+    def test_parts_from(self):
+        rb = ring.RingBuilder(3, 3, 1)
+        self.assertEqual(list(range(8)), list(rb._parts_from(0)))
+        self.assertEqual([5, 6, 7, 0, 1, 2, 3, 4], list(rb._parts_from(5)))
+        self.assertEqual([1, 2, 3, 4, 5, 6, 7, 0], list(rb._parts_from(9)))
+
+    def test_replica_plan_bound(self):
+        rb = ring.RingBuilder(8, 3, 1)
+        for i in range(4):
+            rb.add_dev({'id': i, 'region': 0, 'zone': i % 2, 'weight': 1,
+                        'ip': '127.0.0.%d' % i, 'port': 10000,
+                        'device': 'sda'})
+        for dev in rb._iter_devs():
+            dev['tiers'] = utils.tiers_for_dev(dev)
+        replica_plan = rb._build_replica_plan()
+        max_replicas = rb._replica_plan_bound(replica_plan, 'max')
+        min_replicas = rb._replica_plan_bound(replica_plan, 'min')
+        for tier, plan in replica_plan.items():
+            self.assertEqual(plan['max'], max_replicas[tier])
+            self.assertEqual(plan['min'], min_replicas[tier])
+        # tiers missing from the plan have no room, just like in the plan
+        self.assertEqual(0, max_replicas[(1, 1)])
+        self.assertEqual(0, replica_plan[(1, 1)]['max'])
+
+    def test_changed_parts_with_replica_count_changes(self):
+        rb = ring.RingBuilder(6, 3, 0)
+        for i in range(6):
+            rb.add_dev({'id': i, 'region': 0, 'zone': i % 3, 'weight': 1,
+                        'ip': '127.0.0.%d' % i, 'port': 10000,
+                        'device': 'sda'})
+        rb.rebalance(seed=1)
+        old_replica2part2dev = copy.deepcopy(rb._replica2part2dev)
+
+        # nothing moved
+        self.assertEqual(0, rb._build_dispersion_graph(old_replica2part2dev))
+        # every part-replica is new
+        self.assertEqual(3 * 64, rb._build_dispersion_graph())
+
+        # dropping a whole replica doesn't count the removed part-replicas
+        rb._replica2part2dev = old_replica2part2dev[:2]
+        self.assertEqual(0, rb._build_dispersion_graph(old_replica2part2dev))
+
+        # only parts held by every replica are counted, and replicas the
+        # old assignment doesn't have all count as moved
+        rb.replicas = 3.25
+        rb._replica2part2dev = copy.deepcopy(old_replica2part2dev)
+        rb._replica2part2dev.append(array('H', [0] * 16))
+        rb._replica2part2dev[0][0] = 5 - rb._replica2part2dev[0][0]
+        rb._replica2part2dev[1][20] = 5 - rb._replica2part2dev[1][20]
+        self.assertEqual(16 + 1, rb._build_dispersion_graph(
+            old_replica2part2dev))
+
 
 class TestGetRequiredOverload(unittest.TestCase):
 
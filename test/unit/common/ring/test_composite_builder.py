@@ -1279,6 +1279,116 @@ class TestCooperativeRingBuilder(BaseTestCompositeBuilder):
         self._check_rebalance_cobuilders_calls(1)
         self._check_rebalance_cobuilders_calls(0)
 
+    @mock.patch('swift.common.ring.builder.time')
+    def _check_concurrent_rebalance_matches_serial(
+            self, min_part_hours, mock_time):
+        mock_time.return_value = now = int(time.time())
+        builder_files = []
+        cb = CompositeRingBuilder()
+        for i in (1, 2, 3):
+            b = self._make_coop_builder(i, cb, min_part_hours=min_part_hours)
+            fname = os.path.join(self.tmpdir, 'builder_%s.builder' % i)
+            b.save(fname)
+            builder_files.append(fname)
+        builder_files, builders = cb.load_components(builder_files)
+        cb.rebalance(seed=1)
+        for builder, builder_file in zip(builders, builder_files):
+            self.add_dev(builder)
+            builder.save(builder_file)
+        # jump forwards min_part_hours
+        mock_time.return_value = now + min_part_hours * 3600
+
+        def do_rebalance(workers):
+            # each rebalance starts from a copy of the same builder files
+            files = []
+            for builder_file in builder_files:
+                fname = '%s.%s' % (builder_file, workers)
+                shutil.copy(builder_file, fname)
+                files.append(fname)
+            cb = CompositeRingBuilder(files)
+            orig_func = CompositeRingBuilder._rebalance_component
+            with mock.patch.object(
+                    CompositeRingBuilder, '_rebalance_component',
+                    autospec=True, side_effect=orig_func) as mock_func:
+                results = cb.rebalance(seed=5, workers=workers)
+            self.assertEqual(files, [r['builder_file'] for r in results])
+            for result in results:
+                self.assertGreaterEqual(result['time'], 0)
+            return (results, [RingBuilder.load(f).to_dict() for f in files],
+                    mock_func.call_count)
+
+        serial_results, serial_builders, serial_calls = do_rebalance(1)
+        self.assertEqual(3, serial_calls)
+        results, rebalanced_builders, calls = do_rebalance(3)
+        # the components all moved the same parts in the first round, so
+        # some of them have to rebalance again after the components before
+        # them were merged...
+        self.assertGreater(calls, 0)
+        self.assertLess(calls, 3)
+        # ...and the outcome is just the same as rebalancing them in turn
+        self.assertEqual([r['result'] for r in serial_results],
+                         [r['result'] for r in results])
+        for expected, actual in zip(serial_builders, rebalanced_builders):
+            for key in ('devs', '_replica2part2dev', '_last_part_moves',
+                        '_last_part_gather_start', 'version'):
+                self.assertEqual(expected[key], actual[key])
+
+        # seeded rebalances are repeatable
+        again_results, again_builders, _ = do_rebalance(1)
+        self.assertEqual([r['result'] for r in serial_results],
+                         [r['result'] for r in again_results])
+        self.assertEqual(
+            [rb['_replica2part2dev'] for rb in serial_builders],
+            [rb['_replica2part2dev'] for rb in again_builders])
+
+    def test_concurrent_rebalance_matches_serial(self):
+        self._check_concurrent_rebalance_matches_serial(1)
+        self._check_concurrent_rebalance_matches_serial(0)
+
+    def test_concurrent_rebalance_without_conflicts(self):
+        # nothing stops components rebalancing for the first time, so none
+        # of them need to rebalance again
+        cb = CompositeRingBuilder()
+        builder_files = []
+        for i in (1, 2):
+            b = self._make_coop_builder(i, cb)
+            fname = os.path.join(self.tmpdir, 'builder_%s.builder' % i)
+            b.save(fname)
+            builder_files.append(fname)
+        cb = CompositeRingBuilder(builder_files)
+        with mock.patch.object(CompositeRingBuilder,
+                               '_rebalance_component') as mock_func:
+            results = cb.rebalance(workers=2)
+        self.assertFalse(mock_func.called)
+        self.assertEqual(builder_files,
+                         [r['builder_file'] for r in results])
+        for result in results:
+            self.assertEqual((768, 0.0, 0), result['result'])
+            self.assertIs(cb, result['builder'].parent_builder)
+        rebalanced = [RingBuilder.load(f) for f in builder_files]
+        for builder in rebalanced:
+            builder.validate()
+            self.assertEqual([256, 256, 256],
+                             self._partition_counts(builder))
+
+    def test_concurrent_rebalance_errors(self):
+        cb = CompositeRingBuilder()
+        builder_files = []
+        for i in (1, 2):
+            b = self._make_coop_builder(i, cb)
+            fname = os.path.join(self.tmpdir, 'builder_%s.builder' % i)
+            b.save(fname)
+            builder_files.append(fname)
+        cb = CompositeRingBuilder(builder_files)
+        with mock.patch('swift.common.ring.RingBuilder.validate',
+                        side_effect=RingBuilderError('test')):
+            with self.assertRaises(RingBuilderError) as cm:
+                cb.rebalance(seed=7, workers=2)
+        self.assertIn('An error occurred while rebalancing component',
+                      str(cm.exception))
+        self.assertIn('test', str(cm.exception))
+        self.assertIsNone(cb._builders)
+
     def test_save_then_load(self):
         cb = CompositeRingBuilder()
         coop_rb = self._make_coop_builder(1, cb, rebalance=True)
@@ -19,6 +19,7 @@ import six.moves.cPickle as pickle
 import os
 import unittest
 import stat
+import struct
 from contextlib import closing
 from gzip import GzipFile
 from tempfile import mkdtemp
@@ -135,6 +136,113 @@ class TestRingData(unittest.TestCase):
         rd2 = ring.RingData.load(ring_fname)
         self.assert_ring_data_equal(rd1, rd2)
 
+    def assert_mapped_ring_data_equal(self, rd_expected, rd_got):
+        self.assertEqual(
+            [list(part2dev_id)
+             for part2dev_id in rd_expected._replica2part2dev_id],
+            [list(part2dev_id) for part2dev_id in rd_got._replica2part2dev_id])
+        self.assertEqual(rd_expected.devs, rd_got.devs)
+        self.assertEqual(rd_expected._part_shift, rd_got._part_shift)
+        self.assertEqual(rd_expected.next_part_power, rd_got.next_part_power)
+
+    def test_roundtrip_serialization_v2(self):
+        ring_fname = os.path.join(self.testdir, 'foo.ring.v2')
+        rd = ring.RingData(
+            [array.array('H', [0, 1, 0, 1]), array.array('H', [0, 1, 0, 1]),
+             array.array('H', [1, 0])],
+            [{'id': 0, 'zone': 0}, {'id': 1, 'zone': 1}], 30,
+            next_part_power=3)
+        rd.save(ring_fname, format_version=2)
+        with open(ring_fname, 'rb') as fp:
+            self.assertEqual(b'R1NG\x00\x02', fp.read(6))
+        meta_only = ring.RingData.load(ring_fname, metadata_only=True)
+        self.assertEqual([
+            {'id': 0, 'zone': 0, 'region': 1},
+            {'id': 1, 'zone': 1, 'region': 1},
+        ], meta_only.devs)
+        self.assertEqual([], meta_only._replica2part2dev_id)
+        rd2 = ring.RingData.load(ring_fname)
+        self.assert_mapped_ring_data_equal(rd, rd2)
+        self.assertEqual(2.5, rd2.replica_count)
+        # the replica tables aren't copied into arrays
+        for part2dev_id in rd2._replica2part2dev_id:
+            self.assertNotIsInstance(part2dev_id, array.array)
+
+        # a mapped ring can be saved again in either format
+        ring_fname2 = os.path.join(self.testdir, 'foo2.ring.gz')
+        rd2.save(ring_fname2)
+        self.assert_ring_data_equal(rd, ring.RingData.load(ring_fname2))
+        ring_fname2 = os.path.join(self.testdir, 'foo2.ring.v2')
+        rd2.save(ring_fname2, format_version=2)
+        self.assert_mapped_ring_data_equal(
+            rd, ring.RingData.load(ring_fname2))
+
+    def test_v2_replica_tables_are_aligned(self):
+        ring_fname = os.path.join(self.testdir, 'foo.ring.v2')
+        for devs in ([{'id': 0, 'zone': 0}],
+                     [{'id': 0, 'zone': 0, 'meta': 'x'}],
+                     [{'id': 0, 'zone': 0, 'meta': 'xyz'}]):
+            rd = ring.RingData(
+                [array.array('H', [0, 0, 0]), array.array('H', [0, 0, 0])],
+                devs, 30)
+            rd.save(ring_fname, format_version=2)
+            with open(ring_fname, 'rb') as fp:
+                data = fp.read()
+            header_len = 10 + struct.unpack('!I', data[6:10])[0]
+            table_len = 2 * 3
+            first = header_len + (-header_len % ring.ring.V2_ALIGNMENT)
+            second = first + table_len + (
+                -(first + table_len) % ring.ring.V2_ALIGNMENT)
+            self.assertEqual(0, first % 8)
+            self.assertEqual(0, second % 8)
+            self.assertEqual(second + table_len, len(data))
+            self.assert_mapped_ring_data_equal(
+                rd, ring.RingData.load(ring_fname))
+
+    def test_byteswapped_serialization_v2(self):
+        ring_fname = os.path.join(self.testdir, 'foo.ring.v2')
+        data = [array.array('H', [0, 1, 0, 1]), array.array('H', [0, 1, 0, 1])]
+        swapped_data = copy.deepcopy(data)
+        for x in swapped_data:
+            x.byteswap()
+
+        with mock.patch.object(sys, 'byteorder',
+                               'big' if sys.byteorder == 'little'
+                               else 'little'):
+            rds = ring.RingData(swapped_data,
+                                [{'id': 0, 'zone': 0}, {'id': 1, 'zone': 1}],
+                                30)
+            rds.save(ring_fname, format_version=2)
+
+        rd1 = ring.RingData(data, [{'id': 0, 'zone': 0}, {'id': 1, 'zone': 1}],
+                            30)
+        rd2 = ring.RingData.load(ring_fname)
+        # byteswapped tables have to be copied
+        self.assert_ring_data_equal(rd1, rd2)
+
+    def test_save_unknown_format_version(self):
+        ring_fname = os.path.join(self.testdir, 'foo.ring.gz')
+        rd = ring.RingData(
+            [array.array('H', [0, 1, 0, 1])], [{'id': 0, 'zone': 0}], 30)
+        with self.assertRaises(ValueError):
+            rd.save(ring_fname, format_version=3)
+        self.assertEqual([], os.listdir(self.testdir))
+
+    def test_load_unknown_uncompressed_format_version(self):
+        ring_fname = os.path.join(self.testdir, 'foo.ring.v2')
+        with open(ring_fname, 'wb') as fp:
+            fp.write(struct.pack('!4sH', b'R1NG', 1))
+        with self.assertRaises(Exception) as cm:
+            ring.RingData.load(ring_fname)
+        self.assertIn('Unknown uncompressed ring format version 1',
+                      str(cm.exception))
+
+    def test_mapped_ring_path(self):
+        self.assertEqual('/etc/swift/object.ring.v2',
+                         ring.ring.mapped_ring_path(
+                             '/etc/swift/object.ring.gz'))
+        self.assertIsNone(ring.ring.mapped_ring_path('/etc/swift/object'))
+
     def test_deterministic_serialization(self):
         """
         Two identical rings should produce identical .gz files on disk.
@@ -311,6 +419,121 @@ class TestRing(TestRingBase):
         self.assertEqual(len(self.ring.devs), 9)
         self.assertNotEqual(self.ring._mtime, orig_mtime)
 
+    def _save_and_reload(self, replica2part2dev_id=None, devs=None,
+                         part_shift=None):
+        ring.RingData(
+            replica2part2dev_id or self.intended_replica2part2dev_id,
+            devs or self.intended_devs,
+            part_shift or self.intended_part_shift).save(self.testgz)
+        os.utime(self.testgz, (time() + 60, time() + 60))
+        self.ring._reload()
+
+    def test_reload_full_load(self):
+        self.assertIsNone(self.ring.changed_parts)
+        self.assertIsNone(self.ring.changed_dev_ids)
+        # a different replica count means a full load
+        self._save_and_reload(self.intended_replica2part2dev_id[:2])
+        self.assertEqual(2, self.ring.replica_count)
+        self.assertIsNone(self.ring.changed_parts)
+        self.assertIsNone(self.ring.changed_dev_ids)
+        # as does a different part power
+        self._save_and_reload(
+            [array.array('H', [0, 1]), array.array('H', [3, 4])],
+            part_shift=31)
+        self.assertEqual(2, self.ring.partition_count)
+        self.assertIsNone(self.ring.changed_parts)
+        self.assertIsNone(self.ring.changed_dev_ids)
+
+    def test_reload_applies_changes(self):
+        orig_nodes = {part: self.ring.get_part_nodes(part)
+                      for part in range(4)}
+        self.assertEqual(4, self.ring._num_devs)
+        self.assertEqual(2, self.ring._num_zones)
+        new_replica2part2dev_id = copy.deepcopy(
+            self.intended_replica2part2dev_id)
+        new_replica2part2dev_id[2][1] = 3
+        new_replica2part2dev_id[2][3] = 3
+        orig_tier2devs = self.ring.tier2devs
+        with mock.patch.object(self.ring, '_rebuild_tier_data') as mock_rtd:
+            self._save_and_reload(new_replica2part2dev_id)
+        # only the assignments changed, so the tier data is kept
+        self.assertFalse(mock_rtd.called)
+        self.assertIs(orig_tier2devs, self.ring.tier2devs)
+        self.assertEqual(frozenset([1, 3]), self.ring.changed_parts)
+        self.assertEqual(frozenset(), self.ring.changed_dev_ids)
+        self.assertEqual(new_replica2part2dev_id,
+                         self.ring._replica2part2dev_id)
+        self.assertFalse(self.ring.has_changed())
+        # unchanged partitions get the very same node dicts
+        for part in (0, 2):
+            nodes = self.ring.get_part_nodes(part)
+            self.assertEqual(orig_nodes[part], nodes)
+            for orig_node, node in zip(orig_nodes[part], nodes):
+                self.assertIs(orig_node, node)
+        self.assertEqual([dict(self.intended_devs[1], index=0),
+                          dict(self.intended_devs[3], index=1)],
+                         self.ring.get_part_nodes(1))
+        # dev 4 no longer has any parts, which get_more_nodes needs to know
+        self.assertEqual(3, self.ring._num_devs)
+        self.assertEqual(2, self.ring._num_zones)
+        self.assertEqual(2, self.ring._num_ips)
+        self.assertEqual([self.intended_devs[0]],
+                         list(self.ring.get_more_nodes(1)))
+
+        # and it comes back again
+        self._save_and_reload()
+        self.assertEqual(frozenset([1, 3]), self.ring.changed_parts)
+        self.assertEqual(4, self.ring._num_devs)
+        self.assertEqual(3, self.ring._num_ips)
+
+    def test_reload_applies_device_changes(self):
+        orig_nodes = self.ring.get_part_nodes(0)
+        devs = copy.deepcopy(self.intended_devs)
+        devs[0]['ip'] = '10.9.9.9'
+        devs[2] = {'id': 2, 'region': 0, 'zone': 5, 'weight': 1.0,
+                   'ip': '10.1.5.1', 'port': 6200}
+        devs.append({'id': 5, 'region': 1, 'zone': 1, 'weight': 1.0,
+                     'ip': '10.1.5.2', 'port': 6200})
+        self._save_and_reload(devs=devs)
+        self.assertEqual(frozenset(), self.ring.changed_parts)
+        self.assertEqual(frozenset([0, 2, 5]), self.ring.changed_dev_ids)
+        nodes = self.ring.get_part_nodes(0)
+        self.assertEqual('10.9.9.9', nodes[0]['ip'])
+        self.assertIsNot(orig_nodes[0], nodes[0])
+        self.assertIs(orig_nodes[1], nodes[1])
+        self.assertEqual(6, len(self.ring.devs))
+        self.assertIn((0, 5), self.ring.tier2devs)
+        # the new devices don't have parts yet
+        self.assertEqual(4, self.ring._num_devs)
+
+    def test_reload_applies_changes_to_mapped_ring(self):
+        mapped_path = os.path.join(self.testdir, 'whatever.ring.v2')
+        os.utime(self.testgz, (time() - 300, time() - 300))
+        new_replica2part2dev_id = copy.deepcopy(
+            self.intended_replica2part2dev_id)
+        new_replica2part2dev_id[0][2] = 1
+        ring.RingData(
+            new_replica2part2dev_id, self.intended_devs,
+            self.intended_part_shift).save(mapped_path, format_version=2)
+        self.ring._reload()
+        self.assertEqual(mapped_path, self.ring.serialized_path)
+        self.assertEqual(frozenset([2]), self.ring.changed_parts)
+
+    def test_iter_changed_parts(self):
+        old = array.array('H', range(10000))
+        new = array.array('H', range(10000))
+        new[1] = 7
+        new[5000] = 7
+        new[9999] = 7
+        self.assertEqual([1, 5000, 9999], list(
+            ring.ring._iter_changed_parts(old, new)))
+        self.assertEqual([1, 5000, 9999], list(
+            ring.ring._iter_changed_parts(old, new, chunk_size=3)))
+        self.assertEqual([1, 5000, 9999], list(
+            ring.ring._iter_changed_parts(old, list(new))))
+        self.assertEqual([], list(
+            ring.ring._iter_changed_parts(new, list(new))))
+
     def test_reload_without_replication(self):
         replication_less_devs = [{'id': 0, 'region': 0, 'zone': 0,
                                   'weight': 1.0, 'ip': '10.1.1.1',
@@ -404,6 +627,65 @@ class TestRing(TestRingBase):
             ring_name='without_replication_or_region')
         self.assertEqual(self.ring.devs, intended_devs)
 
+    def test_loads_mapped_ring(self):
+        mapped_path = os.path.join(self.testdir, 'whatever.ring.v2')
+        ring.RingData(
+            self.intended_replica2part2dev_id,
+            self.intended_devs, self.intended_part_shift).save(
+                mapped_path, format_version=2)
+        os.utime(self.testgz, (time() - 300, time() - 300))
+        r = ring.Ring(self.testdir, ring_name='whatever')
+        self.assertEqual(mapped_path, r.serialized_path)
+        for part2dev_id in r._replica2part2dev_id:
+            self.assertNotIsInstance(part2dev_id, array.array)
+        self.assertEqual(
+            [list(part2dev_id)
+             for part2dev_id in self.intended_replica2part2dev_id],
+            [list(part2dev_id) for part2dev_id in r._replica2part2dev_id])
+        self.assertEqual(r.devs, self.intended_devs)
+        self.assertEqual(3, r.replica_count)
+        self.assertEqual(4, r.partition_count)
+        self.assertFalse(r.has_changed())
+        for name in ('a', 'a4', 'aa'):
+            self.assertEqual(self.ring.get_nodes(name), r.get_nodes(name))
+        part = r.get_part('a')
+        self.assertEqual(list(self.ring.get_more_nodes(part)),
+                         list(r.get_more_nodes(part)))
+
+    def test_ignores_stale_mapped_ring(self):
+        mapped_path = os.path.join(self.testdir, 'whatever.ring.v2')
+        ring.RingData(
+            self.intended_replica2part2dev_id,
+            self.intended_devs, self.intended_part_shift).save(
+                mapped_path, format_version=2)
+        os.utime(mapped_path, (time() - 300, time() - 300))
+        r = ring.Ring(self.testdir, ring_name='whatever')
+        self.assertEqual(self.testgz, r.serialized_path)
+        self.assertFalse(r.has_changed())
+
+        # once the mapped ring is refreshed, it is picked up
+        os.utime(mapped_path, (time() + 60, time() + 60))
+        self.assertTrue(r.has_changed())
+        r._reload()
+        self.assertEqual(mapped_path, r.serialized_path)
+        self.assertFalse(r.has_changed())
+
+        # and if it goes away again, the gzipped ring is used
+        os.unlink(mapped_path)
+        self.assertTrue(r.has_changed())
+        r._reload()
+        self.assertEqual(self.testgz, r.serialized_path)
+
+    def test_loads_mapped_ring_by_path(self):
+        mapped_path = os.path.join(self.testdir, 'whatever.ring.v2')
+        ring.RingData(
+            self.intended_replica2part2dev_id,
+            self.intended_devs, self.intended_part_shift).save(
+                mapped_path, format_version=2)
+        r = ring.Ring(mapped_path)
+        self.assertEqual(mapped_path, r.serialized_path)
+        self.assertEqual(self.ring.get_nodes('a'), r.get_nodes('a'))
+
     def test_get_part(self):
         part1 = self.ring.get_part('a')
         nodes1 = self.ring.get_part_nodes(part1)
@@ -415,6 +697,86 @@ class TestRing(TestRingBase):
         part, nodes = self.ring.get_nodes('a')
         self.assertEqual(nodes, self.ring.get_part_nodes(part))
 
+    def test_get_part_nodes_shares_node_dicts(self):
+        nodes1 = self.ring.get_part_nodes(0)
+        nodes2 = self.ring.get_part_nodes(2)
+        self.assertEqual(nodes1, nodes2)
+        self.assertIsNot(nodes1, nodes2)
+        for node1, node2 in zip(nodes1, nodes2):
+            self.assertIs(node1, node2)
+        # a different index for the same device gets a different dict
+        self.ring._replica2part2dev_id[0][2] = 3
+        self.ring._replica2part2dev_id[1][2] = 3
+        self.ring._replica2part2dev_id[2][2] = 0
+        nodes3 = self.ring.get_part_nodes(2)
+        self.assertEqual(nodes3, [
+            dict(self.intended_devs[3], index=0),
+            dict(self.intended_devs[0], index=1)])
+        self.assertIsNot(nodes3[1], nodes1[0])
+
+    def test_get_part_nodes_read_only(self):
+        part, nodes = self.ring.get_nodes('a')
+        node = nodes[0]
+        orig = dict(node)
+        for change in (lambda: node.__setitem__('device', 'sdz'),
+                       lambda: node.__delitem__('device'),
+                       lambda: node.update(device='sdz'),
+                       lambda: node.setdefault('extra', 1),
+                       lambda: node.pop('device'),
+                       node.popitem, node.clear):
+            self.assertRaises(TypeError, change)
+        self.assertEqual(orig, node)
+        self.assertEqual(nodes, self.ring.get_part_nodes(part))
+        # copies can be changed
+        for node_copy in (dict(node), copy.copy(node), copy.deepcopy(node),
+                          pickle.loads(pickle.dumps(node))):
+            self.assertEqual(orig, node_copy)
+            node_copy['device'] = 'sdz'
+            self.assertEqual(orig, node)
+
+    def test_get_part_nodes_after_reload(self):
+        os.utime(self.testgz, (time() - 300, time() - 300))
+        self.ring = ring.Ring(self.testdir, reload_time=0.001,
+                              ring_name='whatever')
+        orig_nodes = self.ring.get_part_nodes(0)
+        self.intended_devs[0]['ip'] = '10.9.9.9'
+        ring.RingData(
+            self.intended_replica2part2dev_id,
+            self.intended_devs, self.intended_part_shift).save(self.testgz)
+        sleep(0.1)
+        nodes = self.ring.get_part_nodes(0)
+        self.assertEqual('10.1.1.1', orig_nodes[0]['ip'])
+        self.assertEqual('10.9.9.9', nodes[0]['ip'])
+
+    def test_get_parts_many(self):
+        names = [('a',), ('a4',), ('a', 'c0'), ('a', 'c3'),
+                 ('a', 'c', 'o1'), ('a', 'c', 'o2')]
+        self.assertEqual([0, 1, 3, 2, 1, 2], self.ring.get_parts_many(names))
+        self.assertEqual([self.ring.get_part(*name) for name in names],
+                         self.ring.get_parts_many(names))
+        self.assertEqual([], self.ring.get_parts_many([]))
+        # generators are fine too
+        self.assertEqual([0, 3], self.ring.get_parts_many(
+            name for name in [('a',), ('a', 'c0')]))
+
+    def test_get_parts_many_reloads_once(self):
+        with mock.patch.object(self.ring, '_reload') as mock_reload:
+            self.ring._rtime = 0
+            self.ring.get_parts_many([('a',), ('a', 'c'), ('a', 'c', 'o')])
+        self.assertEqual([mock.call()], mock_reload.mock_calls)
+
+    def test_get_nodes_many(self):
+        names = [('a',), ('a4',), ('a', 'c0'), ('a', 'c', 'o5'),
+                 ('a', 'c', 'o2')]
+        results = self.ring.get_nodes_many(names)
+        self.assertEqual([self.ring.get_nodes(*name) for name in names],
+                         results)
+        self.assertEqual([0, 1, 3, 0, 2], [part for part, _ in results])
+        # names in the same partition share the node list
+        self.assertIs(results[0][1], results[3][1])
+        self.assertIsNot(results[0][1], results[4][1])
+        self.assertEqual([], self.ring.get_nodes_many([]))
+
     def test_get_nodes(self):
         # Yes, these tests are deliberately very fragile. We want to make sure
         # that if someones changes the results the ring produces, they know it.
@@ -955,6 +1317,90 @@ class TestRing(TestRingBase):
         self.assertEqual(sum(histogram.get(x, 0) for x in range(50, 100)), 0,
                          histogram)
 
+    def _make_handoff_ring(self, **kwargs):
+        rb = ring.RingBuilder(6, 3, 1)
+        for zone in range(1, 5):
+            for server in range(1, 3):
+                for device in range(1, 3):
+                    rb.add_dev({'region': 1, 'zone': zone, 'weight': 1.0,
+                                'ip': '10.1.%d.%d' % (zone, server),
+                                'port': 6200, 'device': 'd%d' % device})
+        rb.rebalance(seed=1)
+        rb.get_ring().save(self.testgz)
+        return ring.Ring(self.testdir, ring_name='whatever', **kwargs)
+
+    def test_get_more_nodes_cached(self):
+        uncached = self._make_handoff_ring()
+        r = self._make_handoff_ring(handoff_cache_size=4)
+        self.assertEqual(0, uncached.handoff_cache_size)
+        self.assertEqual(4, r.handoff_cache_size)
+        for part in range(r.partition_count):
+            expected = list(uncached.get_more_nodes(part))
+            self.assertEqual(13, len(expected))
+            self.assertEqual(expected, list(r.get_more_nodes(part)))
+            # second time around comes from the cache
+            with mock.patch.object(r, '_iter_handoffs') as mock_iter:
+                self.assertEqual(expected, list(r.get_more_nodes(part)))
+            self.assertFalse(mock_iter.called)
+        self.assertFalse(uncached._handoff_cache)
+
+    def test_get_more_nodes_cache_is_lru(self):
+        r = self._make_handoff_ring(handoff_cache_size=2)
+        for part in (0, 1):
+            next(r.get_more_nodes(part))
+        self.assertEqual([0, 1], list(r._handoff_cache))
+        next(r.get_more_nodes(0))
+        self.assertEqual([1, 0], list(r._handoff_cache))
+        next(r.get_more_nodes(2))
+        self.assertEqual([0, 2], list(r._handoff_cache))
+        # shrinking the cache empties it
+        r.handoff_cache_size = 1
+        self.assertFalse(r._handoff_cache)
+        for part in (3, 4):
+            next(r.get_more_nodes(part))
+        self.assertEqual([4], list(r._handoff_cache))
+
+    def test_get_more_nodes_cache_is_lazy(self):
+        uncached = self._make_handoff_ring()
+        r = self._make_handoff_ring(handoff_cache_size=4)
+        expected = list(uncached.get_more_nodes(7))
+        first = r.get_more_nodes(7)
+        self.assertEqual(expected[0], next(first))
+        self.assertEqual(expected[:1], r._handoff_cache[7].devs)
+        # another walk replays what is known and carries on from there
+        second = r.get_more_nodes(7)
+        self.assertEqual(expected[:3],
+                         [next(second), next(second), next(second)])
+        self.assertEqual(expected[:3], r._handoff_cache[7].devs)
+        # ... while the first picks up where the second left off
+        self.assertEqual(expected[1:], list(first))
+        self.assertEqual(expected, r._handoff_cache[7].devs)
+        self.assertEqual(expected[3:], list(second))
+
+    def test_get_more_nodes_cache_emptied_on_reload(self):
+        r = self._make_handoff_ring(handoff_cache_size=4)
+        list(r.get_more_nodes(0))
+        self.assertEqual([0], list(r._handoff_cache))
+        # a reload that changes nothing still drops the cache
+        os.utime(self.testgz, (time() + 60, time() + 60))
+        r._reload()
+        self.assertFalse(r._handoff_cache)
+        self.assertEqual(4, r.handoff_cache_size)
+
+        # and handoffs after a reload reflect the new ring
+        list(r.get_more_nodes(0))
+        devs = [dict(dev) for dev in r.devs]
+        devs[-1]['ip'] = '10.9.9.9'
+        ring.RingData(r._replica2part2dev_id, devs,
+                      r._part_shift).save(self.testgz)
+        os.utime(self.testgz, (time() + 120, time() + 120))
+        r._reload()
+        self.assertFalse(r._handoff_cache)
+        handoffs = list(r.get_more_nodes(0))
+        uncached = ring.Ring(self.testdir, ring_name='whatever')
+        self.assertEqual(list(uncached.get_more_nodes(0)), handoffs)
+        self.assertIn('10.9.9.9', [dev['ip'] for dev in handoffs])
+
 
 if __name__ == '__main__':
     unittest.main()
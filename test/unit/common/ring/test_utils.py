@@ -30,7 +30,8 @@ from swift.common.ring.utils import (tiers_for_dev, build_tier_tree,
                                      parse_builder_ring_filename_args,
                                      build_dev_from_opts, dispersion_report,
                                      parse_address, get_tier_name, pretty_dev,
-                                     validate_replicas_by_tier)
+                                     validate_replicas_by_tier,
+                                     DispersionGraph)
 
 
 class TestUtils(unittest.TestCase):
@@ -785,6 +786,45 @@ class TestUtils(unittest.TestCase):
         self.assertEqual(expected, get_tier_name(tiers_for_dev(dev)[-1], rb))
         self.assertEqual(expected, pretty_dev(dev))
 
+    def test_dispersion_graph(self):
+        graph = DispersionGraph(8, 3)
+        self.assertEqual(4, graph.width)
+        self.assertFalse(graph)
+        self.assertEqual(0, graph.add_tier((1,)))
+        self.assertEqual(1, graph.add_tier((1, 2), [0, 2, 6]))
+        self.assertEqual(0, graph.add_tier((1,)))
+        self.assertEqual(2, len(graph))
+        self.assertEqual([(1,), (1, 2)], graph.tiers)
+        self.assertEqual([8, 0, 0, 0, 0, 2, 6, 0], graph.counts.tolist())
+        self.assertEqual([8, 0, 0, 0], graph[(1,)])
+        self.assertEqual([0, 2, 6, 0], graph.replica_counts(1))
+        self.assertIn((1, 2), graph)
+        self.assertNotIn((2,), graph)
+        self.assertRaises(KeyError, graph.__getitem__, (2,))
+        self.assertEqual([(1,), (1, 2)], list(graph))
+        self.assertEqual({(1,): [8, 0, 0, 0], (1, 2): [0, 2, 6, 0]},
+                         graph.to_dict())
+        self.assertEqual(graph, graph.to_dict())
+        self.assertNotEqual(graph, {})
+
+        # only tiers with some part assigned are kept when compacted
+        compacted = graph.compact()
+        self.assertEqual([(1, 2)], compacted.tiers)
+        self.assertEqual([0, 2, 6, 0], compacted[(1, 2)])
+        self.assertEqual(8, compacted.parts)
+        self.assertEqual(graph.width, compacted.width)
+
+    def test_dispersion_graph_from_dict(self):
+        graph_dict = {(1,): [0, 0, 4], (1, 2): [2, 2, 0]}
+        graph = DispersionGraph.from_dict(graph_dict, 4)
+        self.assertEqual(3, graph.width)
+        self.assertEqual(graph_dict, graph.to_dict())
+        self.assertEqual(graph, DispersionGraph.from_dict(graph))
+        self.assertIsNot(graph, DispersionGraph.from_dict(graph))
+        empty = DispersionGraph.from_dict({}, 4)
+        self.assertFalse(empty)
+        self.assertEqual({}, empty.to_dict())
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -24,6 +24,7 @@ from eventlet import spawn, Timeout
 from swift.common import bufferedhttp
 
 from test import listen_zero
+from test.unit import debug_logger
 
 
 class MockHTTPSConnection(object):
@@ -97,6 +98,94 @@ class TestBufferedHTTP(unittest.TestCase):
                 if err:
                     raise Exception(err)
 
+    def test_connection_pool(self):
+        bindsock = listen_zero()
+        port = bindsock.getsockname()[1]
+        logger = debug_logger()
+        pool = bufferedhttp.HTTPConnectionPool(logger, max_idle=1)
+
+        def serve():
+            request_lines = []
+            try:
+                with Timeout(3):
+                    # the server closes the first connection after two
+                    # requests, as it would one that had been idle too long
+                    for count in (2, 1):
+                        sock, addr = bindsock.accept()
+                        fp = sock.makefile()
+                        for i in range(count):
+                            request_lines.append(fp.readline())
+                            line = fp.readline()
+                            while line and line != '\r\n':
+                                line = fp.readline()
+                            fp.write('HTTP/1.1 200 OK\r\n'
+                                     'Content-Length: 2\r\n\r\nOK')
+                            fp.flush()
+                        fp.close()
+                        sock.close()
+            except BaseException as err:
+                return err
+            return request_lines
+
+        event = spawn(serve)
+        conns = []
+        try:
+            with Timeout(3):
+                for i in range(3):
+                    conn = pool.http_connect('127.0.0.1', port, 'dev', 1,
+                                             'REPLICATE', '/abc')
+                    resp = conn.getresponse()
+                    self.assertEqual(200, resp.status)
+                    self.assertEqual('OK', resp.read())
+                    conns.append(conn)
+        finally:
+            request_lines = event.wait()
+            if isinstance(request_lines, BaseException):
+                raise Exception(request_lines)
+        self.assertEqual(['REPLICATE /dev/1/abc HTTP/1.1\r\n'] * 3,
+                         request_lines)
+        self.assertIs(conns[0], conns[1])
+        self.assertIs(conns[0], conns[2])
+        self.assertEqual((2, 1, 1), (pool.hits, pool.misses, pool.retries))
+        self.assertEqual({'conn_pool.hits': 2, 'conn_pool.misses': 1,
+                          'conn_pool.retries': 1},
+                         logger.get_increment_counts())
+        self.assertEqual(2, len(logger.log_dict['timing_since']))
+        self.assertEqual([conns[0]], [
+            idle for _junk, idle in pool.idle['127.0.0.1', port, 'dev']])
+        pool.close()
+        self.assertIsNone(conns[0].sock)
+        self.assertFalse(pool.idle)
+
+    def test_connection_pool_idle(self):
+        pool = bufferedhttp.HTTPConnectionPool(
+            debug_logger(), max_idle=1, idle_timeout=10)
+        conns = [pool.get('1.2.3.4', 6200, 'sda') for i in range(3)]
+        for conn in conns[:2]:
+            conn.sock = mock.MagicMock()
+        with mock.patch('swift.common.bufferedhttp.time.time',
+                        return_value=100):
+            pool.put(conns[0])
+            # the pool is full ...
+            pool.put(conns[1])
+            # ... and a closed connection is not kept
+            pool.put(conns[2])
+        self.assertIsNone(conns[1].sock)
+        self.assertEqual([(100, conns[0])], pool.idle['1.2.3.4', 6200, 'sda'])
+        self.assertIsNot(conns[0], pool.get('1.2.3.4', 6200, 'sdb'))
+        with mock.patch('swift.common.bufferedhttp.time.time',
+                        return_value=105):
+            self.assertIs(conns[0], pool.get('1.2.3.4', 6200, 'sda'))
+            self.assertTrue(conns[0].reused)
+            pool.put(conns[0])
+        with mock.patch('swift.common.bufferedhttp.time.time',
+                        return_value=115):
+            conn = pool.get('1.2.3.4', 6200, 'sda')
+        self.assertIsNot(conns[0], conn)
+        self.assertFalse(conn.reused)
+        self.assertIsNone(conns[0].sock)
+        self.assertEqual((1, 5), (pool.hits, pool.misses))
+
     def test_nonstr_header_values(self):
         with mock.patch('swift.common.bufferedhttp.HTTPSConnection',
                         MockHTTPSConnection):
@@ -0,0 +1,76 @@
+# Copyright (c) 2010-2012 OpenStack Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import hashlib
+import unittest
+
+from swift.common.iblt import IBLT, HASH_COUNT
+
+
+def make_keys(start, stop):
+    return [hashlib.md5(str(i).encode('ascii')).digest()
+            for i in range(start, stop)]
+
+
+class TestIBLT(unittest.TestCase):
+
+    def _table(self, cells, keys):
+        table = IBLT(cells)
+        for key in keys:
+            table.insert(key)
+        return table
+
+    def test_cells_rounded_up(self):
+        self.assertEqual(HASH_COUNT, len(IBLT(1)))
+        self.assertEqual(3 * HASH_COUNT, len(IBLT(3 * HASH_COUNT - 1)))
+
+    def test_decode_difference(self):
+        local = self._table(60, make_keys(0, 1000))
+        remote = self._table(60, make_keys(10, 1005))
+        local.subtract(remote)
+        inserted, removed = local.decode()
+        self.assertEqual(sorted(make_keys(0, 10)), sorted(inserted))
+        self.assertEqual(sorted(make_keys(1000, 1005)), sorted(removed))
+
+    def test_decode_same_sets(self):
+        local = self._table(30, make_keys(0, 100))
+        local.subtract(self._table(30, make_keys(0, 100)))
+        self.assertEqual(([], []), local.decode())
+
+    def test_decode_too_few_cells(self):
+        local = self._table(30, make_keys(0, 200))
+        local.subtract(IBLT(30))
+        self.assertIsNone(local.decode())
+
+    def test_subtract_different_size(self):
+        with self.assertRaises(ValueError):
+            IBLT(30).subtract(IBLT(60))
+
+    def test_string_round_trip(self):
+        table = self._table(30, make_keys(0, 100))
+        copy = IBLT.from_string(table.to_string())
+        self.assertEqual(len(table), len(copy))
+        self.assertEqual(table.counts, copy.counts)
+        self.assertEqual(table.key_sums, copy.key_sums)
+        self.assertEqual(table.checksums, copy.checksums)
+
+    def test_from_string_invalid(self):
+        for value in ('junk', 'a' * 41, '!!!!'):
+            with self.assertRaises(ValueError):
+                IBLT.from_string(value)
+
+
+if __name__ == '__main__':
+    unittest.main()
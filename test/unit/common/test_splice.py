@@ -27,7 +27,7 @@ import re
 import mock
 import six
 
-from swift.common.splice import splice, tee
+from swift.common.splice import splice, tee, sendfile
 
 LOGGER = logging.getLogger(__name__)
 
@@ -321,3 +321,99 @@ class TestTee(unittest.TestCase):
 
         mock_cdll.assert_called_once_with(libc_name, use_errno=True)
         self.assertTrue(libc.tee_retrieved)
+
+
+class TestSendfile(unittest.TestCase):
+    '''Tests for `sendfile`'''
+
+    def setUp(self):
+        if not sendfile.available:
+            raise unittest.SkipTest('sendfile not available')
+
+    @mock.patch('swift.common.splice.sendfile._c_sendfile', None)
+    def test_available(self):
+        '''Test `available` attribute correctness'''
+
+        self.assertFalse(sendfile.available)
+
+    def test_sendfile_file_to_pipe(self):
+        '''Test `sendfile` from a file to a pipe'''
+
+        with NamedTemporaryFile() as fd:
+            with pipe() as (pa, pb):
+                fd.write(b'abcdef')
+                fd.seek(0, os.SEEK_SET)
+
+                res = sendfile(pb, fd, None, 2)
+                self.assertEqual(res, (2, None))
+                self.assertEqual(os.lseek(fd.fileno(), 0, os.SEEK_CUR), 2)
+
+                # with an offset, the file position isn't changed
+                res = sendfile(pb, fd, 3, 3)
+                self.assertEqual(res, (3, 6))
+                self.assertEqual(os.lseek(fd.fileno(), 0, os.SEEK_CUR), 2)
+
+                self.assertEqual(os.read(pa, 5), b'abdef')
+
+    @mock.patch.object(sendfile, '_c_sendfile')
+    def test_fileno(self, mock_sendfile):
+        '''Test handling of file-descriptors'''
+
+        with pipe() as (pa, pb):
+            sendfile(pb, pa, None, 3)
+            self.assertEqual(mock_sendfile.call_args, ((pb, pa, None, 3), {}))
+
+            mock_sendfile.reset_mock()
+
+            sendfile(os.fdopen(pb, 'w'), os.fdopen(pa, 'r'), None, 3)
+            self.assertEqual(mock_sendfile.call_args, ((pb, pa, None, 3), {}))
+
+    def test_errno(self):
+        '''Test handling of failures'''
+
+        # Invoke EBADF by using a read-only FD as fd_out
+        with open('/dev/null', 'r') as fd:
+            err = errno.EBADF
+            msg = r'\[Errno %d\] sendfile: %s' % (err, os.strerror(err))
+            try:
+                sendfile(fd, fd, None, 3)
+            except IOError as e:
+                self.assertTrue(re.match(msg, str(e)))
+            else:
+                self.fail('Expected IOError was not raised')
+
+        self.assertEqual(ctypes.get_errno(), 0)
+
+    @mock.patch('swift.common.splice.sendfile._c_sendfile', None)
+    def test_unavailable(self):
+        '''Test exception when unavailable'''
+
+        self.assertRaises(EnvironmentError, sendfile, 1, 2, None, 2)
+
+    def test_unavailable_in_libc(self):
+        '''Test `available` attribute when `libc` has no `sendfile`'''
+
+        class LibC(object):
+            '''A fake `libc` object tracking `sendfile` attribute access'''
+
+            def __init__(self):
+                self.sendfile_retrieved = False
+
+            @property
+            def sendfile(self):
+                self.sendfile_retrieved = True
+                raise AttributeError
+
+        libc = LibC()
+        mock_cdll = mock.Mock(return_value=libc)
+
+        with mock.patch('ctypes.CDLL', new=mock_cdll):
+            # Force re-construction of a `Sendfile` instance
+            # Something you're not supposed to do in actual code
+            new_sendfile = type(sendfile)()
+            self.assertFalse(new_sendfile.available)
+
+        libc_name = ctypes.util.find_library('c')
+
+        mock_cdll.assert_called_once_with(libc_name, use_errno=True)
+        self.assertTrue(libc.sendfile_retrieved)
@@ -326,6 +326,39 @@ class TestStoragePolicies(unittest.TestCase):
         self.assertRaisesWithMessage(PolicyError, 'Invalid type',
                                      BogusStoragePolicy, 1, 'one')
 
+    def test_diskfile_backend(self):
+        self.assertEqual('fs', StoragePolicy(0, 'zero').diskfile_backend)
+        policy = StoragePolicy(1, 'one', diskfile_backend=' Slab ')
+        self.assertEqual('slab', policy.diskfile_backend)
+        self.assertRaisesWithMessage(PolicyError, 'Invalid diskfile_backend',
+                                     StoragePolicy, 2, 'two',
+                                     diskfile_backend='')
+
+        conf = self._conf("""
+        [storage-policy:0]
+        name = zero
+        default = yes
+        [storage-policy:1]
+        name = one
+        diskfile_backend = slab
+        """)
+        policies = parse_storage_policies(conf)
+        self.assertEqual('fs', policies[0].diskfile_backend)
+        self.assertEqual('slab', policies[1].diskfile_backend)
+
+        # only replication policies have a choice of backend
+        bad_conf = self._conf("""
+        [storage-policy:0]
+        name = zero
+        policy_type = erasure_coding
+        ec_type = %(ec_type)s
+        ec_num_data_fragments = 10
+        ec_num_parity_fragments = 4
+        diskfile_backend = slab
+        """ % {'ec_type': DEFAULT_TEST_EC_TYPE})
+        self.assertRaisesWithMessage(PolicyError, 'Invalid option',
+                                     parse_storage_policies, bad_conf)
+
     def test_policies_type_attribute(self):
         test_policies = [
             StoragePolicy(0, 'zero', is_default=True),
@@ -1348,7 +1381,8 @@ class TestStoragePolicies(unittest.TestCase):
                 'aliases': 'zero',
                 'default': True,
                 'deprecated': False,
-                'policy_type': REPL_POLICY
+                'policy_type': REPL_POLICY,
+                'diskfile_backend': 'fs',
             },
             (0, False): {
                 'name': 'zero',
@@ -1361,7 +1395,8 @@ class TestStoragePolicies(unittest.TestCase):
                 'aliases': 'one, tahi, uno',
                 'default': False,
                 'deprecated': True,
-                'policy_type': REPL_POLICY
+                'policy_type': REPL_POLICY,
+                'diskfile_backend': 'fs',
             },
             (1, False): {
                 'name': 'one',
@@ -64,7 +64,7 @@ from uuid import uuid4
 
 from swift.common.exceptions import Timeout, MessageTimeout, \
     ConnectionTimeout, LockTimeout, ReplicationLockTimeout, \
-    MimeInvalid
+    MimeInvalid, ThreadPoolDead
 from swift.common import utils
 from swift.common.utils import is_valid_ip, is_valid_ipv4, is_valid_ipv6, \
     set_swift_dir
@@ -2076,6 +2076,22 @@ class TestUtils(unittest.TestCase):
                           utils.load_libc_function, 'some_not_real_function',
                           fail_if_missing=True)
 
+    def test_fadvise_buffer_cache(self):
+        calls = []
+
+        def fake_fadvise(fd, offset, length, advice):
+            calls.append((fd, offset.value, length.value, advice))
+            return 0 if advice == 4 else 22
+
+        with mock.patch('swift.common.utils._posix_fadvise', fake_fadvise), \
+                mock.patch('swift.common.utils.logging') as mock_logging:
+            utils.drop_buffer_cache(7, 0, 1024)
+            self.assertFalse(mock_logging.warning.called)
+            utils.readahead_buffer_cache(7, 1024, 2048)
+        self.assertEqual([(7, 0, 1024, 4), (7, 1024, 2048, 3)], calls)
+        self.assertEqual(1, mock_logging.warning.call_count)
+        self.assertEqual(22, mock_logging.warning.call_args[0][1]['ret'])
+
     def test_readconf(self):
         conf = '''[section1]
 foo = bar
@@ -5708,6 +5724,50 @@ class TestAuditLocationGenerator(unittest.TestCase):
             self.assertEqual(list(locations),
                              [(obj_path, "drive", "partition2")])
 
+    def test_filters_and_hooks(self):
+        with temptree([]) as tmpdir:
+            expected_objs = []
+            for drive in ('drive1', 'drive2'):
+                for part in ('1', '2', '3'):
+                    hash_path = os.path.join(
+                        tmpdir, drive, "data", part, "suffix", "hash")
+                    os.makedirs(hash_path)
+                    obj_path = os.path.join(hash_path, "obj.dat")
+                    with open(obj_path, "w"):
+                        pass
+                    if drive == 'drive2' and part != '2':
+                        expected_objs.append((obj_path, drive, part))
+            filtered = []
+            walked = []
+
+            def devices_filter(devices, device_dir):
+                self.assertEqual(tmpdir, devices)
+                self.assertEqual(['drive1', 'drive2'], sorted(device_dir))
+                return ['drive2']
+
+            def partitions_filter(datadir_path, partitions):
+                filtered.append(datadir_path)
+                return sorted(part for part in partitions if part != '2')
+
+            def hook_post_partition(part_path):
+                # every file of the partition has already been yielded
+                self.assertEqual(os.path.basename(part_path),
+                                 got_objs[-1][2])
+                walked.append(part_path)
+
+            got_objs = []
+            for location in utils.audit_location_generator(
+                    tmpdir, "data", mount_check=False,
+                    devices_filter=devices_filter,
+                    partitions_filter=partitions_filter,
+                    hook_post_partition=hook_post_partition):
+                got_objs.append(location)
+            self.assertEqual(expected_objs, got_objs)
+            datadir_path = os.path.join(tmpdir, 'drive2', 'data')
+            self.assertEqual([datadir_path], filtered)
+            self.assertEqual([os.path.join(datadir_path, '1'),
+                              os.path.join(datadir_path, '3')], walked)
+
 
 class TestGreenAsyncPile(unittest.TestCase):
     def test_runs_everything(self):
@@ -6448,6 +6508,242 @@ name = %s
         self.assertIsNotNone(POLICIES.get_by_name(self.policy_name))
 
 
+class TestThreadPool(unittest.TestCase):
+
+    def setUp(self):
+        self.pool = None
+
+    def tearDown(self):
+        if self.pool:
+            self.pool.terminate()
+
+    def _thread_id(self):
+        return utils.stdlib_threading.current_thread().ident
+
+    def test_run_in_thread(self):
+        self.pool = utils.ThreadPool(nthreads=2)
+        my_id = self._thread_id()
+        other_id = self.pool.run_in_thread(self._thread_id)
+        self.assertNotEqual(my_id, other_id)
+        self.assertNotEqual(my_id, self.pool.force_run_in_thread(
+            self._thread_id))
+        self.assertEqual(3, self.pool.run_in_thread(
+            lambda a, b=0: a + b, 1, b=2))
+
+    def test_exception_reraised(self):
+        self.pool = utils.ThreadPool(nthreads=1)
+
+        def explode():
+            raise ValueError('kaboom')
+
+        with self.assertRaises(ValueError) as caught:
+            self.pool.run_in_thread(explode)
+        self.assertEqual('kaboom', str(caught.exception))
+        with self.assertRaises(ValueError):
+            self.pool.force_run_in_thread(explode)
+        # the pool still works
+        self.assertEqual(1, self.pool.run_in_thread(lambda: 1))
+
+    def test_does_not_block_hub(self):
+        self.pool = utils.ThreadPool(nthreads=1)
+        started = utils.stdlib_threading.Event()
+        release = utils.stdlib_threading.Event()
+        log = []
+
+        def slow_call():
+            started.set()
+            release.wait()
+            log.append('slow')
+            return 'done'
+
+        def other_greenthread():
+            # the hub is free to run this while slow_call blocks a thread
+            while not started.is_set():
+                eventlet.sleep(0.001)
+            log.append('other')
+            release.set()
+
+        eventlet.spawn(other_greenthread)
+        self.assertEqual('done', self.pool.run_in_thread(slow_call))
+        self.assertEqual(['other', 'slow'], log)
+
+    def test_stats(self):
+        self.pool = utils.ThreadPool(nthreads=1)
+        self.assertEqual({'threads': 1, 'queue_depth': 0,
+                          'max_queue_depth': 0, 'completed': 0,
+                          'wait_time': 0.0}, self.pool.get_stats())
+        release = utils.stdlib_threading.Event()
+        pile = eventlet.GreenPile()
+        for _ in range(3):
+            pile.spawn(self.pool.run_in_thread, release.wait, 5)
+        eventlet.sleep(0)
+        self.assertEqual(3, self.pool.get_stats()['queue_depth'])
+        release.set()
+        list(pile)
+        stats = self.pool.get_stats()
+        self.assertEqual(0, stats['queue_depth'])
+        self.assertEqual(3, stats['max_queue_depth'])
+        self.assertEqual(3, stats['completed'])
+        self.assertGreaterEqual(stats['wait_time'], 0)
+
+    def test_no_threads(self):
+        self.pool = utils.ThreadPool(nthreads=0)
+        my_id = self._thread_id()
+        self.assertEqual(my_id, self.pool.run_in_thread(self._thread_id))
+        with mock.patch('swift.common.utils.tpool_reraise',
+                        return_value='tpooled') as mock_tpool:
+            self.assertEqual('tpooled', self.pool.force_run_in_thread(
+                self._thread_id))
+        mock_tpool.assert_called_once_with(self._thread_id)
+        self.assertEqual({'threads': 0, 'queue_depth': 0,
+                          'max_queue_depth': 0, 'completed': 0,
+                          'wait_time': 0.0}, self.pool.get_stats())
+
+    def test_terminate(self):
+        for nthreads in (0, 2):
+            pool = utils.ThreadPool(nthreads=nthreads)
+            self.assertEqual(1, pool.run_in_thread(lambda: 1))
+            pool.terminate()
+            pool.terminate()
+            self.assertRaises(ThreadPoolDead, pool.run_in_thread, lambda: 1)
+            self.assertRaises(ThreadPoolDead, pool.force_run_in_thread,
+                              lambda: 1)
+
+
+class TestGroupCommitter(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = mkdtemp()
+
+    def tearDown(self):
+        rmtree(self.tempdir, ignore_errors=True)
+
+    def _commit_in_threads(self, committer, nthreads, **kwargs):
+        errors = []
+
+        def commit():
+            try:
+                committer.commit(**kwargs)
+            except Exception as err:
+                errors.append(err)
+
+        threads = [utils.stdlib_threading.Thread(target=commit)
+                   for _junk in range(nthreads)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return errors
+
+    def test_commit(self):
+        committer = utils.GroupCommitter(self.tempdir, window=0)
+        with mock.patch('swift.common.utils.syncfs') as mock_syncfs, \
+                mock.patch('swift.common.utils.fsync') as mock_fsync:
+            committer.commit(fds=[10])
+            committer.commit(fds=[11])
+        # a syncfs per round, then the fds that report writeback errors
+        self.assertEqual(2, mock_syncfs.call_count)
+        self.assertEqual([mock.call(10), mock.call(11)],
+                         mock_fsync.call_args_list)
+        self.assertEqual({'rounds': 2, 'commits': 2, 'max_round_size': 1},
+                         dict((k, v) for k, v in committer.get_stats().items()
+                              if k != 'sync_time'))
+
+    def test_concurrent_commits_share_a_round(self):
+        # the window is long enough that only a full batch starts the round
+        committer = utils.GroupCommitter(self.tempdir, window=30,
+                                         max_batch=4)
+        synced = []
+
+        def fake_fsync(fd):
+            synced.append(os.fstat(fd).st_ino)
+
+        with mock.patch('swift.common.utils.syncfs') as mock_syncfs, \
+                mock.patch('swift.common.utils.fsync', fake_fsync):
+            self.assertEqual([], self._commit_in_threads(
+                committer, 4, paths=[self.tempdir]))
+        self.assertEqual(1, mock_syncfs.call_count)
+        # the directory of every member was synced once
+        self.assertEqual([os.stat(self.tempdir).st_ino], synced)
+        stats = committer.get_stats()
+        self.assertEqual(1, stats['rounds'])
+        self.assertEqual(4, stats['commits'])
+        self.assertEqual(4, stats['max_round_size'])
+
+    def test_commit_waits_for_running_round(self):
+        committer = utils.GroupCommitter(self.tempdir, window=0)
+        syncing = utils.stdlib_threading.Event()
+        release = utils.stdlib_threading.Event()
+        calls = []
+
+        def slow_syncfs(fd):
+            calls.append(fd)
+            if len(calls) == 1:
+                syncing.set()
+                release.wait(5)
+
+        with mock.patch('swift.common.utils.syncfs', slow_syncfs):
+            first = utils.stdlib_threading.Thread(target=committer.commit)
+            first.start()
+            self.assertTrue(syncing.wait(5))
+            # a commit made while a round syncs needs a round of its own
+            second = utils.stdlib_threading.Thread(target=committer.commit)
+            second.start()
+            release.set()
+            first.join()
+            second.join()
+        self.assertEqual(2, len(calls))
+        self.assertEqual(2, committer.get_stats()['rounds'])
+
+    def test_sync_error_raised_to_every_member(self):
+        for patch_name in ('syncfs', 'fsync'):
+            committer = utils.GroupCommitter(self.tempdir, window=30,
+                                             max_batch=3)
+            with mock.patch('swift.common.utils.syncfs'), \
+                    mock.patch('swift.common.utils.' + patch_name,
+                               side_effect=OSError(errno.EIO, 'EIO')):
+                errors = self._commit_in_threads(committer, 3, fds=[10])
+            self.assertEqual(3, len(errors))
+            for err in errors:
+                self.assertEqual(errno.EIO, err.errno)
+
+    def test_commit_syncs_writers_fds(self):
+        committer = utils.GroupCommitter(self.tempdir, window=0)
+        path = os.path.join(self.tempdir, 'file')
+        with open(path, 'w') as f:
+            with mock.patch('swift.common.utils.syncfs'), \
+                    mock.patch('swift.common.utils.fsync') as mock_fsync, \
+                    mock.patch('swift.common.utils.os.open',
+                               side_effect=os.open) as mock_open:
+                committer.commit(fds=[f.fileno()],
+                                 paths=[self.tempdir, self.tempdir,
+                                        os.path.join(self.tempdir, 'gone')])
+                committer.commit(fds=[f.fileno()])
+            fd = f.fileno()
+        # the writer's fd, the directory once, then the fd of the second
+        # commit; only the device and the directories are opened by the
+        # committer
+        self.assertEqual(3, mock_fsync.call_count)
+        self.assertEqual(fd, mock_fsync.call_args_list[0][0][0])
+        self.assertEqual(fd, mock_fsync.call_args_list[2][0][0])
+        self.assertEqual([self.tempdir, self.tempdir,
+                          os.path.join(self.tempdir, 'gone'), self.tempdir],
+                         [c[0][0] for c in mock_open.call_args_list])
+
+    def test_commit_without_syncfs(self):
+        committer = utils.GroupCommitter(self.tempdir, window=0)
+        with mock.patch('swift.common.utils.syncfs',
+                        side_effect=OSError(errno.ENOSYS, 'ENOSYS')) \
+                as mock_syncfs, \
+                mock.patch('swift.common.utils.fsync') as mock_fsync:
+            committer.commit(fds=[10])
+            committer.commit(fds=[11])
+        # syncfs is not tried again, and the fsyncs do all the work
+        self.assertEqual(1, mock_syncfs.call_count)
+        self.assertEqual([mock.call(10), mock.call(11)],
+                         mock_fsync.call_args_list)
+
+
 class TestPipeMutex(unittest.TestCase):
     def setUp(self):
         self.mutex = utils.PipeMutex()
@@ -30,7 +30,8 @@ import json
 
 from swift.container.backend import ContainerBroker, \
     update_new_item_from_existing
-from swift.common.utils import Timestamp, encode_timestamps
+from swift.common.utils import Timestamp, encode_timestamps, \
+    lock_parent_directory
 from swift.common.storage_policy import POLICIES
 
 import mock
@@ -541,6 +542,38 @@ class TestContainerBroker(unittest.TestCase):
         self.assertEqual(record, read_items[0])
         self.assertTrue(os.path.getsize(broker.pending_file) == 0)
 
+    @with_tempdir
+    def test_put_records(self, tempdir):
+        db_path = os.path.join(tempdir, 'container.db')
+        broker = ContainerBroker(db_path, account='a', container='c')
+        broker.initialize(time(), 0)
+        records = [{'name': 'obj%d' % i,
+                    'created_at': Timestamp(1234567890 + i).internal,
+                    'size': i,
+                    'content_type': 'text/plain',
+                    'etag': 'hash_test',
+                    'deleted': 0,
+                    'storage_policy_index': 0,
+                    'ctype_timestamp': None,
+                    'meta_timestamp': None} for i in range(3)]
+        with mock.patch('swift.common.db.lock_parent_directory',
+                        side_effect=lock_parent_directory) as mock_lock:
+            broker.put_records([dict(record) for record in records])
+        # all of the records are written under one lock
+        self.assertEqual(1, mock_lock.call_count)
+        with open(broker.pending_file) as fp:
+            self.assertEqual(3, fp.read().count(':'))
+        self.assertEqual(['obj0', 'obj1', 'obj2'],
+                         [row[0] for row in broker.list_objects_iter(
+                             10, '', None, None, '')])
+
+        # a full pending file is committed along with the records
+        broker.put_records([dict(records[0], name='obj3')])
+        with mock.patch('swift.common.db.PENDING_CAP', 0):
+            broker.put_records([dict(records[0], name='obj4')])
+        self.assertEqual(0, os.path.getsize(broker.pending_file))
+        self.assertEqual(5, broker.get_info()['object_count'])
+
     def _assert_db_row(self, broker, name, timestamp, size, content_type, hash,
                        deleted=0):
         with broker.get() as conn:
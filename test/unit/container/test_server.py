@@ -336,10 +336,10 @@ class TestContainerController(unittest.TestCase):
         req.content_length = 0
         resp = server_handler.OPTIONS(req)
         self.assertEqual(200, resp.status_int)
-        for verb in 'OPTIONS GET POST PUT DELETE HEAD REPLICATE'.split():
+        for verb in 'OPTIONS GET POST PUT DELETE HEAD REPLICATE MERGE'.split():
             self.assertTrue(
                 verb in resp.headers['Allow'].split(', '))
-        self.assertEqual(len(resp.headers['Allow'].split(', ')), 7)
+        self.assertEqual(len(resp.headers['Allow'].split(', ')), 8)
         self.assertEqual(resp.headers['Server'],
                          (self.controller.server_type + '/' + swift_version))
 
@@ -1606,6 +1606,84 @@ class TestContainerController(unittest.TestCase):
         resp = req.get_response(self.controller)
         self.assertEqual(resp.status_int, 404)
 
+    def _merge(self, path, updates):
+        req = Request.blank(path, method='MERGE', body=json.dumps(updates))
+        return req.get_response(self.controller)
+
+    def test_MERGE(self):
+        req = Request.blank(
+            '/sda1/p/a/c', method='PUT', headers={
+                'X-Timestamp': Timestamp(1).internal})
+        self.assertEqual(201, req.get_response(self.controller).status_int)
+        policy_index = str(int(POLICIES.default))
+        updates = [{'op': 'PUT', 'obj': 'o%d' % i, 'headers': {
+            'X-Timestamp': Timestamp(2).internal, 'X-Size': str(i),
+            'X-Content-Type': 'text/plain', 'X-Etag': 'etag%d' % i,
+            'X-Backend-Storage-Policy-Index': policy_index}}
+            for i in range(3)]
+        updates.append({'op': 'PUT', 'obj': u'\N{SNOWMAN}', 'headers': {
+            'X-Timestamp': Timestamp(2).internal, 'X-Size': '10',
+            'X-Content-Type': 'text/plain', 'X-Etag': 'x',
+            'X-Content-Type-Timestamp': Timestamp(2).internal,
+            'X-Meta-Timestamp': Timestamp(3).internal,
+            'X-Backend-Storage-Policy-Index': policy_index}})
+        resp = self._merge('/sda1/p/a/c', updates)
+        self.assertEqual(204, resp.status_int)
+        resp = self._merge('/sda1/p/a/c', [
+            {'op': 'DELETE', 'obj': 'o1', 'headers': {
+                'X-Timestamp': Timestamp(3).internal,
+                'X-Backend-Storage-Policy-Index': policy_index}}])
+        self.assertEqual(204, resp.status_int)
+
+        req = Request.blank('/sda1/p/a/c', method='GET',
+                            query_string='format=json')
+        resp = req.get_response(self.controller)
+        self.assertEqual('3', resp.headers['X-Container-Object-Count'])
+        self.assertEqual('12', resp.headers['X-Container-Bytes-Used'])
+        listing = json.loads(resp.body)
+        self.assertEqual([u'o0', u'o2', u'\N{SNOWMAN}'],
+                         [item['name'] for item in listing])
+        self.assertEqual('etag2', listing[1]['hash'])
+        self.assertEqual(Timestamp(3).isoformat,
+                         listing[2]['last_modified'])
+
+    def test_MERGE_errors(self):
+        update = {'op': 'PUT', 'obj': 'o', 'headers': {
+            'X-Timestamp': Timestamp(2).internal, 'X-Size': '1',
+            'X-Content-Type': 'text/plain', 'X-Etag': 'x'}}
+        self.assertEqual(404, self._merge('/sda1/p/a/c', [update]).status_int)
+        req = Request.blank(
+            '/sda1/p/a/c', method='PUT', headers={
+                'X-Timestamp': Timestamp(1).internal})
+        self.assertEqual(201, req.get_response(self.controller).status_int)
+        bad_headers = [{'X-Timestamp': 'bad'}, {'X-Size': 'bad'},
+                       {'X-Etag': None},
+                       {'X-Backend-Storage-Policy-Index': '99'}]
+        bad_updates = [dict(update, op='POST'), dict(update, obj=''),
+                       dict(update, obj=None), {'op': 'PUT'}, 'o'] + [
+            dict(update, headers=dict(update['headers'], **headers))
+            for headers in bad_headers]
+        for bad_update in bad_updates:
+            resp = self._merge('/sda1/p/a/c', [update, bad_update])
+            self.assertEqual(400, resp.status_int, bad_update)
+        req = Request.blank('/sda1/p/a/c', method='MERGE', body='[')
+        self.assertEqual(400, req.get_response(self.controller).status_int)
+        self.assertEqual(400, self._merge('/sda1/p/a/c', {}).status_int)
+        # none of the updates of a bad batch are merged
+        req = Request.blank('/sda1/p/a/c', method='HEAD')
+        resp = req.get_response(self.controller)
+        self.assertEqual('0', resp.headers['X-Container-Object-Count'])
+
+    def test_MERGE_auto_create(self):
+        update = {'op': 'PUT', 'obj': 'o', 'headers': {
+            'X-Timestamp': Timestamp(2).internal, 'X-Size': '1',
+            'X-Content-Type': 'text/plain', 'X-Etag': 'x'}}
+        self.assertEqual(404, self._merge('/sda1/p/a/c', [update]).status_int)
+        self.assertEqual(204, self._merge('/sda1/p/.a/c', [update]).status_int)
+        req = Request.blank('/sda1/p/.a/c', method='HEAD')
+        resp = req.get_response(self.controller)
+        self.assertEqual('1', resp.headers['X-Container-Object-Count'])
+
     def test_object_update_with_offset(self):
         ts = (Timestamp(t).internal for t in
               itertools.count(int(time.time())))
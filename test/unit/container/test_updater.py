@@ -219,6 +219,8 @@ class TestContainerUpdater(unittest.TestCase):
         for dev in cu.get_account_ring().devs:
             if dev is not None:
                 dev['port'] = bindsock.getsockname()[1]
+        # node dicts are cached by the ring, so refresh them
+        cu.get_account_ring()._rebuild_tier_data()
         cu.run_once()
         for event in spawned.wait():
             err = event.wait()
@@ -290,6 +292,8 @@ class TestContainerUpdater(unittest.TestCase):
         for dev in cu.get_account_ring().devs:
             if dev is not None:
                 dev['port'] = bindsock.getsockname()[1]
+        # node dicts are cached by the ring, so refresh them
+        cu.get_account_ring()._rebuild_tier_data()
         cu.run_once()
         for event in spawned.wait():
             err = event.wait()
@@ -0,0 +1,151 @@
+# Copyright (c) 2010-2012 OpenStack Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import unittest
+from shutil import rmtree
+from tempfile import mkdtemp
+
+from swift.common.utils import Timestamp
+from swift.obj.async_journal import AsyncJournal, iter_segment, \
+    iter_payloads, pack_record, JOURNAL_RECORD_HEADER
+
+
+class TestAsyncJournal(unittest.TestCase):
+
+    def setUp(self):
+        self.testdir = mkdtemp()
+        self.path = os.path.join(self.testdir, 'async_journal')
+        self.journal = AsyncJournal(self.path, segment_size=1024)
+
+    def tearDown(self):
+        self.journal.close()
+        rmtree(self.testdir, ignore_errors=True)
+
+    def _append(self, count, journal=None):
+        journal = journal or self.journal
+        records = []
+        for i in range(count):
+            record = ('%032x' % i, Timestamp(i).internal,
+                      {'op': 'PUT', 'obj': 'o%d' % i})
+            journal.append(*record)
+            records.append(record)
+        return records
+
+    def test_append_and_seal(self):
+        self.assertEqual([], self.journal.seal())
+        records = self._append(3)
+        self.assertEqual([0], self.journal.list_segments())
+        self.assertEqual(3, self.journal.count_records())
+
+        segments = self.journal.seal()
+        self.assertEqual([self.journal.segment_path(0)], segments)
+        self.assertEqual(records, list(iter_segment(segments[0])))
+        # appends go to the new, empty segment, which is not sealed until
+        # something has been appended to it
+        self.assertEqual([0, 1], self.journal.list_segments())
+        self.assertEqual(segments, self.journal.seal())
+        more = self._append(1)
+        os.unlink(segments[0])
+        segments = self.journal.seal()
+        self.assertEqual([self.journal.segment_path(1)], segments)
+        self.assertEqual(more, list(iter_segment(segments[0])))
+
+    def test_seal_with_other_appender(self):
+        other = AsyncJournal(self.path, segment_size=1024)
+        try:
+            records = self._append(1, other)
+            segments = self.journal.seal()
+            more = self._append(1, other)
+        finally:
+            other.close()
+        self.assertEqual(records, list(iter_segment(segments[0])))
+        self.assertEqual([0, 1], self.journal.list_segments())
+        self.assertEqual(more, list(iter_segment(
+            self.journal.segment_path(1))))
+
+    def test_append_after_segments_removed(self):
+        # a worker keeps the fd of segment 0 open while the updater seals and
+        # removes it, and then segment 1, which another worker appended to
+        appender = AsyncJournal(self.path, segment_size=1024)
+        other = AsyncJournal(self.path, segment_size=1024)
+
+        def sweep():
+            records = []
+            for segment in self.journal.seal():
+                records.extend(iter_segment(segment))
+                os.unlink(segment)
+            return records
+
+        def record(ohash):
+            return (ohash, Timestamp(1).internal, {'op': 'PUT', 'obj': 'o'})
+
+        try:
+            appender.append(*record('h1'))
+            self.assertEqual([record('h1')], sweep())
+            other.append(*record('h2'))
+            self.assertEqual([record('h2')], sweep())
+            # the update is not appended to the removed segment 0
+            appender.append(*record('h3'))
+        finally:
+            appender.close()
+            other.close()
+        self.assertEqual([record('h3')], sweep())
+
+    def test_segment_rotation(self):
+        record_size = len(pack_record(*self._append(1)[0]))
+        self._append(1024 // record_size + 2)
+        segments = self.journal.list_segments()
+        self.assertEqual([0, 1], segments)
+        self.assertGreaterEqual(
+            os.path.getsize(self.journal.segment_path(0)), 1024)
+        self.assertLess(
+            os.path.getsize(self.journal.segment_path(1)), 1024)
+        self.assertEqual(1024 // record_size + 3,
+                         self.journal.count_records())
+
+    def test_list_segments_ignores_other_files(self):
+        self._append(1)
+        for name in ('.lock', 'junk.journal', 'notes'):
+            with open(os.path.join(self.path, name), 'w'):
+                pass
+        self.assertEqual([0], self.journal.list_segments())
+
+    def test_torn_and_corrupt_records_are_skipped(self):
+        records = self._append(3)
+        segment = self.journal.segment_path(0)
+        with open(segment, 'rb') as fp:
+            buf = fp.read()
+        record_size = len(buf) // 3
+        # corrupt the payload of the second record and tear the third
+        corrupt = bytearray(buf)
+        corrupt[record_size + JOURNAL_RECORD_HEADER.size] ^= 0xff
+        with open(segment, 'wb') as fp:
+            fp.write(bytes(corrupt[:-1]) + pack_record(*records[0]))
+        errors = []
+        self.assertEqual([records[0], records[0]],
+                         list(iter_segment(segment, errors.append)))
+        self.assertEqual([record_size, 2 * record_size], errors)
+        self.assertEqual(2, self.journal.count_records())
+
+    def test_iter_payloads_of_garbage(self):
+        errors = []
+        self.assertEqual([], list(iter_payloads(b'garbage', errors.append)))
+        self.assertEqual([0], errors)
+        self.assertEqual([], list(iter_payloads(b'')))
+
+
+if __name__ == '__main__':
+    unittest.main()
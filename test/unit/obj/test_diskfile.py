@@ -40,6 +40,7 @@ from gzip import GzipFile
 import pyeclib.ec_iface
 
 from eventlet import hubs, timeout, tpool
+from swift.obj.async_journal import iter_segment
 from swift.obj.diskfile import MD5_OF_EMPTY_STRING, update_auditor_status
 from test.unit import (mock as unit_mock, temptree, mock_check_drive,
                        patch_policies, debug_logger, EMPTY_ETAG,
@@ -51,7 +52,7 @@ from swift.common import utils
 from swift.common.utils import hash_path, mkdirs, Timestamp, \
     encode_timestamps, O_TMPFILE
 from swift.common import ring
-from swift.common.splice import splice
+from swift.common.splice import splice, sendfile
 from swift.common.exceptions import DiskFileNotExist, DiskFileQuarantined, \
     DiskFileDeviceUnavailable, DiskFileDeleted, DiskFileNotOpen, \
     DiskFileError, ReplicationLockTimeout, DiskFileCollision, \
@@ -342,6 +343,99 @@ class TestDiskFileModuleMethods(unittest.TestCase):
         # check that read_metadata converts binary_type
         check_metadata()
 
+    def test_write_read_binary_metadata(self):
+        path = os.path.join(self.testdir, str(uuid.uuid4()))
+        metadata = {'name': '/a/c/o',
+                    'Content-Length': '99',
+                    u'X-Object-Meta-Strange': u'should be bytes',
+                    b'X-Object-Meta-x\xff': b'not utf8 \xff',
+                    u'X-Object-Meta-y\xe8': u'not ascii \xe8',
+                    'X-Object-Meta-Empty': ''}
+        expected = {b'name': b'/a/c/o',
+                    b'Content-Length': b'99',
+                    b'X-Object-Meta-Strange': b'should be bytes',
+                    b'X-Object-Meta-x\xff': b'not utf8 \xff',
+                    b'X-Object-Meta-y\xc3\xa8': b'not ascii \xc3\xa8',
+                    b'X-Object-Meta-Empty': b''}
+        with open(path, 'wb') as fd:
+            diskfile.write_metadata(fd, metadata, metadata_format='binary')
+        metastr = xattr.getxattr(path, diskfile.METADATA_KEY)
+        self.assertTrue(metastr.startswith(diskfile.METADATA_BIN_MAGIC))
+        with open(path, 'rb') as fd:
+            self.assertEqual(expected, diskfile.read_metadata(fd))
+
+        # legacy pickled metadata is read alongside
+        with open(path, 'wb') as fd:
+            diskfile.write_metadata(fd, metadata)
+        metastr = xattr.getxattr(path, diskfile.METADATA_KEY)
+        self.assertFalse(metastr.startswith(diskfile.METADATA_BIN_MAGIC))
+        self.assertEqual(expected, diskfile.read_metadata(path))
+
+        # metadata spanning several xattrs
+        metadata['X-Object-Meta-Big'] = 'x' * 300
+        with open(path, 'wb') as fd:
+            diskfile.write_metadata(fd, metadata, xattr_size=100,
+                                    metadata_format='binary')
+        expected[b'X-Object-Meta-Big'] = b'x' * 300
+        self.assertEqual(expected, diskfile.read_metadata(path))
+
+    def test_serialize_binary_metadata(self):
+        metadata = {'name': '/a/c/o', 'X-Timestamp': '1234567890.12345'}
+        metastr = diskfile.serialize_metadata(metadata, 'binary')
+        self.assertEqual(diskfile.METADATA_BIN_HEADER.size +
+                         len('name/a/c/oX-Timestamp1234567890.12345') + 3,
+                         len(metastr))
+        self.assertEqual(metadata, diskfile.deserialize_metadata(metastr))
+        self.assertEqual(metadata, diskfile.deserialize_metadata(
+            diskfile.serialize_metadata(metadata)))
+        self.assertEqual({}, diskfile.deserialize_metadata(
+            diskfile.serialize_metadata({}, 'binary')))
+
+        # values that are not strings, or that contain NULs, are pickled
+        for value in (99, 'nul\x00'):
+            metadata['X-Object-Meta-Odd'] = value
+            metastr = diskfile.serialize_metadata(metadata, 'binary')
+            self.assertFalse(metastr.startswith(diskfile.METADATA_BIN_MAGIC))
+            self.assertEqual(metadata, diskfile.deserialize_metadata(metastr))
+
+    def test_deserialize_bad_binary_metadata(self):
+        metastr = diskfile.serialize_metadata({'name': '/a/c/o'}, 'binary')
+        empty = diskfile.serialize_metadata({}, 'binary')
+        for bad in (metastr + b'\x00x', metastr[:6], empty + b'x',
+                    metastr[:4] + b'\x02' + metastr[5:]):
+            self.assertRaises(ValueError, diskfile.deserialize_metadata, bad)
+
+    def test_metadata_format_option(self):
+        self.assertEqual('pickle', self.df_mgr.metadata_format)
+        self.conf['metadata_format'] = ' Binary '
+        df_mgr = diskfile.DiskFileManager(self.conf, logger=self.logger)
+        self.assertEqual('binary', df_mgr.metadata_format)
+        self.conf['metadata_format'] = 'json'
+        with self.assertRaises(ValueError) as cm:
+            diskfile.DiskFileManager(self.conf, logger=self.logger)
+        self.assertIn("Invalid metadata_format 'json'", str(cm.exception))
+
+    def test_get_hash_tree(self):
+        hashes = {'abc': 'a' * 32, 'abd': 'b' * 32, 'def': 'c' * 32}
+        root, groups = diskfile.get_hash_tree(hashes)
+        self.assertEqual(['ab', 'de'], sorted(groups))
+        self.assertEqual((root, groups),
+                         diskfile.get_hash_tree(dict(hashes)))
+        # a change to a suffix only changes its group and the root
+        changed_root, changed_groups = diskfile.get_hash_tree(
+            dict(hashes, abd='d' * 32))
+        self.assertNotEqual(root, changed_root)
+        self.assertNotEqual(groups['ab'], changed_groups['ab'])
+        self.assertEqual(groups['de'], changed_groups['de'])
+        # as does a new suffix
+        added_root, added_groups = diskfile.get_hash_tree(
+            dict(hashes, abe='a' * 32))
+        self.assertNotEqual(root, added_root)
+        self.assertNotEqual(groups['ab'], added_groups['ab'])
+        self.assertEqual(groups['de'], added_groups['de'])
+        self.assertEqual((md5().hexdigest(), {}),
+                         diskfile.get_hash_tree({}))
+
 
 @patch_policies
 class TestObjectAuditLocationGenerator(unittest.TestCase):
@@ -661,6 +755,135 @@ class TestDiskFileRouter(unittest.TestCase):
                 self.assertTrue(isinstance(manager, TestDiskFileManager))
 
 
+class TestMetadataCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = mkdtemp()
+        self.listed = []
+
+    def tearDown(self):
+        rmtree(self.tmpdir, ignore_errors=True)
+
+    def _make_hash_dir(self, name, age=10):
+        hsh_path = os.path.join(self.tmpdir, name)
+        mkdirs(hsh_path)
+        then = time() - age
+        os.utime(hsh_path, (then, then))
+        return hsh_path
+
+    def _list_files(self, hsh_path):
+        self.listed.append(hsh_path)
+        return os.listdir(hsh_path)
+
+    def test_get_entry(self):
+        cache = diskfile.MetadataCache(10)
+        hsh_path = self._make_hash_dir('abc')
+        entry = cache.get_entry(hsh_path, self._list_files)
+        self.assertEqual([], entry.files)
+        entry.metadata['t.data'] = {'X-Timestamp': 't'}
+        self.assertIs(entry, cache.get_entry(hsh_path, self._list_files))
+        self.assertEqual([hsh_path], self.listed)
+        self.assertEqual({'size': 1, 'max_size': 10, 'hits': 1, 'misses': 1,
+                          'evictions': 0, 'hit_ratio': 0.5},
+                         cache.get_stats())
+
+        # a file added to the hash dir invalidates the entry
+        with open(os.path.join(hsh_path, 't.data'), 'w'):
+            pass
+        then = time() - 5
+        os.utime(hsh_path, (then, then))
+        entry = cache.get_entry(hsh_path, self._list_files)
+        self.assertEqual(['t.data'], entry.files)
+        self.assertEqual({}, entry.metadata)
+        self.assertEqual([hsh_path] * 2, self.listed)
+
+        cache.invalidate(hsh_path)
+        cache.get_entry(hsh_path, self._list_files)
+        self.assertEqual([hsh_path] * 3, self.listed)
+
+    def test_recently_modified_hash_dir_not_cached(self):
+        cache = diskfile.MetadataCache(10)
+        hsh_path = self._make_hash_dir('abc', age=0)
+        cache.get_entry(hsh_path, self._list_files)
+        cache.get_entry(hsh_path, self._list_files)
+        self.assertEqual([hsh_path] * 2, self.listed)
+        self.assertEqual(0, cache.get_stats()['size'])
+
+    def test_missing_hash_dir(self):
+        cache = diskfile.MetadataCache(10)
+        hsh_path = os.path.join(self.tmpdir, 'missing')
+        with self.assertRaises(OSError) as cm:
+            cache.get_entry(hsh_path, self._list_files)
+        self.assertEqual(errno.ENOENT, cm.exception.errno)
+        # a file where the hash dir should be is listed, to raise ENOTDIR
+        with open(hsh_path, 'w'):
+            pass
+        with self.assertRaises(OSError) as cm:
+            cache.get_entry(hsh_path, self._list_files)
+        self.assertEqual(errno.ENOTDIR, cm.exception.errno)
+        self.assertEqual(0, cache.get_stats()['size'])
+        self.assertEqual(2, cache.get_stats()['misses'])
+
+    def test_size_limit(self):
+        cache = diskfile.MetadataCache(2)
+        paths = [self._make_hash_dir(name) for name in 'abc']
+        for hsh_path in paths[:2]:
+            cache.get_entry(hsh_path, self._list_files)
+        # the least recently used entry is evicted
+        cache.get_entry(paths[0], self._list_files)
+        cache.get_entry(paths[2], self._list_files)
+        self.assertEqual(2, cache.get_stats()['size'])
+        self.assertEqual(1, cache.get_stats()['evictions'])
+        del self.listed[:]
+        cache.get_entry(paths[0], self._list_files)
+        cache.get_entry(paths[1], self._list_files)
+        self.assertEqual([paths[1]], self.listed)
+
+
+class TestPageCachePolicy(unittest.TestCase):
+
+    def test_hot_objects(self):
+        policy = diskfile.PageCachePolicy(hot_threshold=2, hot_cache_size=10)
+        self.assertFalse(policy.record_read('a', 4))
+        self.assertTrue(policy.record_read('a', 4))
+        self.assertTrue(policy.record_read('a', 4))
+        # too big for the budget
+        self.assertFalse(policy.record_read('b', 11))
+        self.assertFalse(policy.record_read('b', 11))
+        self.assertFalse(policy.record_read('c', 8))
+        # the least recently read hot object is demoted to make room
+        self.assertTrue(policy.record_read('c', 8))
+        self.assertEqual({'tracked': 3, 'hot_objects': 1, 'hot_bytes': 8,
+                          'hot_cache_size': 10, 'reads': 7, 'hot_reads': 3,
+                          'promotions': 2, 'demotions': 1, 'readaheads': 0,
+                          'readahead_bytes': 0},
+                         policy.get_stats())
+        # and is promoted again when it is next read
+        self.assertTrue(policy.record_read('a', 4))
+        self.assertEqual((1, 4, 3, 2), tuple(
+            policy.get_stats()[key] for key in
+            ('hot_objects', 'hot_bytes', 'promotions', 'demotions')))
+
+    def test_max_tracked(self):
+        policy = diskfile.PageCachePolicy(hot_threshold=2, max_tracked=2)
+        for data_file in 'abc':
+            self.assertFalse(policy.record_read(data_file, 1))
+        self.assertEqual(2, policy.get_stats()['tracked'])
+        # the reads of the least recently read object are forgotten
+        self.assertFalse(policy.record_read('a', 1))
+        self.assertTrue(policy.record_read('c', 1))
+
+    def test_reads_not_counted(self):
+        policy = diskfile.PageCachePolicy(readahead_size=4096)
+        self.assertFalse(policy.record_read('a', 1))
+        self.assertFalse(policy.record_read('a', 1))
+        policy.record_readahead(4096)
+        stats = policy.get_stats()
+        self.assertEqual((0, 0), (stats['tracked'], stats['reads']))
+        self.assertEqual((1, 4096),
+                         (stats['readaheads'], stats['readahead_bytes']))
+
+
 class BaseDiskFileTestMixin(object):
     """
     Bag of helpers that are useful in the per-policy DiskFile test classes,
@@ -971,6 +1194,33 @@ class DiskFileManagerMixin(BaseDiskFileTestMixin):
                                   os.path.join(dp, 'tmp'))
         self.df_mgr.logger.increment.assert_called_with('async_pendings')
 
+    def test_pickle_async_update_journal(self):
+        conf = dict(async_journal='true', **self.conf)
+        df_mgr = self.mgr_cls(conf, self.logger)
+        df_mgr.logger.increment = mock.MagicMock()
+        ts = Timestamp(10000.0).internal
+        with mock.patch('swift.obj.diskfile.write_pickle') as wp:
+            for obj in ('o', 'p'):
+                df_mgr.pickle_async_update(self.existing_device,
+                                           'a', 'c', obj,
+                                           dict(a=1, b=2), ts, POLICIES[1])
+        self.assertFalse(wp.called)
+        df_mgr.logger.increment.assert_called_with('async_pendings')
+        dp = self.df_mgr.construct_dev_path(self.existing_device)
+        journal_path = os.path.join(
+            dp, diskfile.get_async_journal_dir(POLICIES[1]))
+        journal = df_mgr.get_async_journal(dp, POLICIES[1])
+        self.assertEqual(journal_path, journal.path)
+        self.assertIs(journal, df_mgr.get_async_journal(dp, POLICIES[1]))
+        self.assertEqual(2, journal.count_records())
+        segments = journal.seal()
+        self.assertEqual(1, len(segments))
+        self.assertEqual(
+            [(diskfile.hash_path('a', 'c', 'o'), ts, {'a': 1, 'b': 2}),
+             (diskfile.hash_path('a', 'c', 'p'), ts, {'a': 1, 'b': 2})],
+            list(iter_segment(segments[0])))
+        journal.close()
+
     def test_object_audit_location_generator(self):
         locations = list(
             self.df_mgr.object_audit_location_generator(POLICIES[0]))
@@ -3539,6 +3789,160 @@ class DiskFileMixin(BaseDiskFileTestMixin):
         df.unit_test_len = fsize
         return df
 
+    def test_threads_per_disk(self):
+        self.assertEqual(0, self.df_mgr.threads_per_disk)
+        df = self._simple_get_diskfile()
+        self.assertEqual(0, df._threadpool.nthreads)
+
+        self.conf['threads_per_disk'] = '2'
+        self.conf['disk_chunk_size'] = '4'
+        self.df_router = diskfile.DiskFileRouter(self.conf, self.logger)
+        self.df_mgr = self.df_router[POLICIES.default]
+        self.addCleanup(lambda: [pool.terminate() for pool in
+                                 self.df_mgr.threadpools.values()])
+        self.assertEqual(2, self.df_mgr.threads_per_disk)
+        main_thread = utils.stdlib_threading.current_thread().ident
+        io_threads = set()
+
+        def checking_write(fd, chunk):
+            io_threads.add(utils.stdlib_threading.current_thread().ident)
+            return os_write(fd, chunk)
+
+        os_write = os.write
+        with mock.patch('swift.obj.diskfile.os.write', checking_write):
+            df, data = self._create_test_file(b'x' * 10)
+        self.assertTrue(io_threads)
+        self.assertNotIn(main_thread, io_threads)
+        # the same pool is used for every diskfile on the device...
+        pool = self.df_mgr.threadpools[self.existing_device]
+        self.assertIs(pool, df._threadpool)
+        self.assertIs(pool, self._simple_get_diskfile(obj='o2')._threadpool)
+        for policy in POLICIES:
+            self.assertIs(pool, self.df_router[policy].threadpools[
+                self.existing_device])
+        stats = self.df_mgr.get_threadpool_stats()
+        self.assertEqual([self.existing_device], list(stats))
+        # ...which wrote and finalized the object
+        completed = stats[self.existing_device]['completed']
+        self.assertGreaterEqual(completed, 2)
+        self.assertEqual(0, stats[self.existing_device]['queue_depth'])
+        self.assertEqual(data, b''.join(df.reader()))
+        stats = self.df_mgr.get_threadpool_stats()[self.existing_device]
+        # each chunk read, and the final empty read, used the pool
+        self.assertEqual(completed + (len(data) + 3) // 4 + 1,
+                         stats['completed'])
+
+    def test_group_commit(self):
+        self.assertFalse(self.df_mgr.group_commit)
+        self.assertIsNone(self.df_mgr.get_group_committer(self.testdir))
+
+        self.conf['group_commit'] = 'true'
+        self.conf['group_commit_window'] = '0'
+        self.df_router = diskfile.DiskFileRouter(self.conf, self.logger)
+        self.df_mgr = self.df_router[POLICIES.default]
+        with mock.patch('swift.common.utils.syncfs') as mock_syncfs, \
+                mock.patch('swift.common.utils.fsync') as mock_round_fsync, \
+                mock.patch('swift.obj.diskfile.fsync') as mock_fsync, \
+                mock.patch('swift.obj.diskfile.fsync_dir') as mock_dir, \
+                mock.patch('swift.common.utils.fsync_dir') as mock_utils_dir:
+            df, data = self._create_test_file(b'x' * 10)
+        # the file and its dirs were only synced in group commit rounds
+        self.assertFalse(mock_fsync.called)
+        self.assertFalse(mock_dir.called)
+        self.assertFalse(mock_utils_dir.called)
+        # before and after the rename, and after the durable rename of EC
+        rounds = 3 if df.policy.policy_type == EC_POLICY else 2
+        self.assertEqual(rounds, mock_syncfs.call_count)
+        # the file, then the object, suffix and partition dirs, then the
+        # object dir again after the durable rename of EC
+        self.assertEqual(rounds + 2, mock_round_fsync.call_count)
+        stats = self.df_mgr.get_group_commit_stats()
+        self.assertEqual([self.existing_device], list(stats))
+        self.assertEqual(rounds, stats[self.existing_device]['rounds'])
+        # every policy on a device shares its committer
+        committer = self.df_mgr.get_group_committer(df._device_path)
+        for policy in POLICIES:
+            self.assertIs(committer, self.df_router[
+                policy].get_group_committer(df._device_path))
+        self.assertEqual(data, b''.join(df.reader()))
+
+    def test_binary_metadata_format(self):
+        df, data = self._create_test_file(b'x' * 10, timestamp=self.ts())
+        old_files = os.listdir(df._datadir)
+        self.conf['metadata_format'] = 'binary'
+        self.df_router = diskfile.DiskFileRouter(self.conf, self.logger)
+        df = self._simple_get_diskfile()
+        # existing files keep their pickled metadata, new ones are binary
+        df.write_metadata({'X-Timestamp': self.ts().internal,
+                           'X-Object-Meta-Foo': 'bar'})
+        for filename in os.listdir(df._datadir):
+            metastr = xattr.getxattr(os.path.join(df._datadir, filename),
+                                     diskfile.METADATA_KEY)
+            self.assertEqual(
+                filename not in old_files,
+                metastr.startswith(diskfile.METADATA_BIN_MAGIC), filename)
+        df = self._simple_get_diskfile()
+        with df.open():
+            self.assertEqual('bar', df.get_metadata()['X-Object-Meta-Foo'])
+            self.assertEqual(data, b''.join(df.reader()))
+
+    def test_metadata_cache(self):
+        self.assertIsNone(self.df_mgr.metadata_cache)
+        self.assertIsNone(self.df_mgr.get_metadata_cache_stats())
+
+        self.conf['metadata_cache_size'] = '10'
+        self.df_router = diskfile.DiskFileRouter(self.conf, self.logger)
+        self.df_mgr = self.df_router[POLICIES.default]
+        cache = self.df_mgr.metadata_cache
+        for policy in POLICIES:
+            self.assertIs(cache, self.df_router[policy].metadata_cache)
+
+        ts = self.ts()
+        df, data = self._create_test_file(
+            b'x' * 10, timestamp=ts, metadata={'X-Object-Meta-A': 'a'})
+        expected = self._simple_get_diskfile().read_metadata()
+        # the hash dir has only just been modified
+        self.assertEqual(0, cache.get_stats()['size'])
+
+        def age_hash_dir():
+            then = time() - 10
+            os.utime(df._datadir, (then, then))
+
+        age_hash_dir()
+        self.assertEqual(expected, self._simple_get_diskfile().read_metadata())
+        mgr_cls = self.df_mgr.__class__
+        with mock.patch.object(mgr_cls, '_list_object_dir') as mock_list, \
+                mock.patch.object(mgr_cls, '_read_file_metadata') as mock_read:
+            df = self._simple_get_diskfile()
+            with df.open():
+                self.assertEqual(expected, df.get_metadata())
+                self.assertEqual(data, b''.join(df.reader()))
+        self.assertFalse(mock_list.called)
+        self.assertFalse(mock_read.called)
+        stats = self.df_mgr.get_metadata_cache_stats()
+        self.assertEqual(1, stats['size'])
+        self.assertEqual(1, stats['hits'])
+
+        # a POST is seen once its .meta file is in the hash dir
+        df.write_metadata({'X-Timestamp': self.ts().internal,
+                           'X-Object-Meta-B': 'b'})
+        age_hash_dir()
+        metadata = self._simple_get_diskfile().read_metadata()
+        self.assertEqual('b', metadata['X-Object-Meta-B'])
+        self.assertNotIn('X-Object-Meta-A', metadata)
+        # cached metadata is not changed by what callers do with theirs
+        metadata.clear()
+        df = self._simple_get_diskfile()
+        self.assertEqual('b', df.read_metadata()['X-Object-Meta-B'])
+        self.assertNotIn('name', df.get_metafile_metadata())
+        self.assertEqual(2, self.df_mgr.get_metadata_cache_stats()['hits'])
+
+        # and a DELETE once the tombstone is
+        df.delete(self.ts())
+        age_hash_dir()
+        self.assertRaises(DiskFileDeleted,
+                          self._simple_get_diskfile().read_metadata)
+
     def test_keep_cache(self):
         df = self._get_open_disk_file(fsize=65)
         with mock.patch("swift.obj.diskfile.drop_buffer_cache") as foo:
@@ -3564,6 +3968,56 @@ class DiskFileMixin(BaseDiskFileTestMixin):
                 pass
             self.assertTrue(goo.called)
 
+    def test_hot_object_kept_in_cache(self):
+        self.conf['hot_object_threshold'] = '2'
+        self._get_open_disk_file(fsize=50 * 1024, csize=256)
+        policy = self.df_router[POLICIES.legacy].cache_policy
+        # the object is too big for keep_cache_size, but is kept in cache
+        # from its second read on
+        for expect_dropped in (True, False, False):
+            df = self._simple_get_diskfile(policy=POLICIES.legacy)
+            with df.open(), \
+                    mock.patch("swift.obj.diskfile.drop_buffer_cache") as dbc:
+                for _ in df.reader(keep_cache=True):
+                    pass
+            self.assertEqual(expect_dropped, dbc.called)
+        stats = policy.get_stats()
+        self.assertEqual(3, stats['reads'])
+        self.assertEqual(2, stats['hot_reads'])
+        self.assertEqual(1, stats['hot_objects'])
+
+    def test_readahead(self):
+        self.conf['readahead_size'] = '4096'
+        df = self._get_open_disk_file(fsize=50 * 1024, csize=256)
+        with mock.patch("swift.obj.diskfile.readahead_buffer_cache") as rbc:
+            data = b''.join(df.reader())
+        size = len(data)
+        # reads are read ahead of once they have read two chunks in a row,
+        # and then whenever they are within half the readahead size of the
+        # data read ahead
+        self.assertEqual(mock.call(mock.ANY, 512, 4096), rbc.call_args_list[0])
+        self.assertEqual(mock.call(mock.ANY, 4608, min(2048, size - 4608)),
+                         rbc.call_args_list[1])
+        readahead = [(offset, length) for _fd, offset, length in
+                     (c[0] for c in rbc.call_args_list)]
+        self.assertEqual(size, readahead[-1][0] + readahead[-1][1])
+        self.assertEqual(size - 512, sum(length for _o, length in readahead))
+        stats = self.df_router[POLICIES.legacy].get_cache_policy_stats()
+        self.assertEqual(len(readahead), stats['readaheads'])
+        self.assertEqual(size - 512, stats['readahead_bytes'])
+
+        # a short range is not read ahead of, nor is data beyond its end
+        df = self._simple_get_diskfile(policy=POLICIES.legacy)
+        with df.open(), \
+                mock.patch("swift.obj.diskfile.readahead_buffer_cache") as rbc:
+            b''.join(df.reader().app_iter_range(1000, 1300))
+            self.assertFalse(rbc.called)
+            df = self._simple_get_diskfile(policy=POLICIES.legacy)
+            df.open()
+            b''.join(df.reader().app_iter_range(1000, 3000))
+        self.assertEqual([mock.call(mock.ANY, 1512, 1488)],
+                         rbc.call_args_list)
+
     def test_quarantine_valids(self):
 
         def verify(*args, **kwargs):
@@ -4839,6 +5293,112 @@ class DiskFileMixin(BaseDiskFileTestMixin):
                             mock_trampoline:
                         _run_test()
 
+    def _zero_copy_send_ranges(self, reader):
+        with tempfile.TemporaryFile() as out:
+            reader.zero_copy_send(out.fileno())
+            out.seek(0)
+            return out.read()
+
+    def test_zero_copy_send_ranges(self):
+        if not sendfile.available:
+            raise unittest.SkipTest("sendfile support is missing")
+        self.conf['splice'] = 'on'
+        data = ''.join(chr(ord('a') + i % 26) for i in range(10000))
+        df = self._get_open_disk_file(data=data, csize=4096)
+        # the whole object is only zero-copied if it can be checked
+        reader = df.reader()
+        self.assertEqual(df._use_splice, reader.can_zero_copy_send())
+        reader.close()
+
+        size = os.path.getsize(df._data_file)
+        df.open()
+        reader = df.reader()
+        expected = b''.join(reader.app_iter_range(10, size - 10))
+        df.open()
+        reader = df.reader()
+        reader.app_iter_range(10, size - 10)
+        self.assertTrue(reader.can_zero_copy_send())
+        with mock.patch.object(reader, 'close',
+                               side_effect=reader.close) as mock_close:
+            self.assertEqual(expected, self._zero_copy_send_ranges(reader))
+        self.assertTrue(mock_close.called)
+        self.assertEqual(size - 20, reader._bytes_read)
+
+        ranges = [(5, 10), (100, 200), (size - 1000, size)]
+        args = (ranges, 'text/plain', 'deadbeef', size)
+        df.open()
+        expected = b''.join(df.reader().app_iter_ranges(*args))
+        df.open()
+        reader = df.reader()
+        reader.app_iter_ranges(*args)
+        self.assertTrue(reader.can_zero_copy_send())
+        with mock.patch('swift.obj.diskfile.DROP_CACHE_WINDOW', 50), \
+                mock.patch('swift.obj.diskfile.drop_buffer_cache') as dbc:
+            self.assertEqual(expected, self._zero_copy_send_ranges(reader))
+        self.assertIn('--deadbeef--', expected)
+        # cache is dropped as the ranges are sent
+        self.assertGreater(len(dbc.mock_calls), len(ranges))
+
+    def test_zero_copy_send_ranges_blocks(self):
+        if not sendfile.available:
+            raise unittest.SkipTest("sendfile support is missing")
+        self.conf['splice'] = 'on'
+        df = self._get_open_disk_file(fsize=1000)
+        reader = df.reader()
+        reader.app_iter_ranges([(5, 10), (20, 30)], 'text/plain', 'b', 1000)
+        calls = []
+
+        def fake_sendfile(fd_out, fd_in, offset, count):
+            calls.append(offset)
+            if len(calls) == 1:
+                raise IOError(errno.EWOULDBLOCK,
+                              os.strerror(errno.EWOULDBLOCK))
+            return sendfile(fd_out, fd_in, offset, count)
+
+        with mock.patch('swift.obj.diskfile.sendfile', fake_sendfile), \
+                mock.patch('swift.obj.diskfile.trampoline') as mock_tramp:
+            with tempfile.TemporaryFile() as out:
+                reader.zero_copy_send(out.fileno())
+                out.seek(0)
+                self.assertIn(b'Content-Range: bytes 20-29/1000', out.read())
+        self.assertEqual([5, 5, 20], calls)
+        mock_tramp.assert_called_once_with(mock.ANY, write=True)
+
+    def test_zero_copy_send_ranges_from_start(self):
+        if not sendfile.available:
+            raise unittest.SkipTest("sendfile support is missing")
+        self.conf['splice'] = 'on'
+        df = self._get_open_disk_file(fsize=1000)
+        size = os.path.getsize(df._data_file)
+        # the whole object is spliced, if it can be, so that it is checked
+        reader = df.reader()
+        reader.app_iter_range(0, size)
+        self.assertTrue(reader._is_whole_object_range())
+        self.assertEqual(
+            df._use_splice and df.policy.policy_type != EC_POLICY,
+            reader.can_zero_copy_send())
+        reader.close()
+        # other ranges from the start are read in userspace
+        for ranges in ([(0, 10)], [(0, 10), (20, 30)], [(0, size)]):
+            df.open()
+            reader = df.reader()
+            reader.app_iter_ranges(ranges, 'text/plain', 'b', size)
+            self.assertFalse(reader._is_whole_object_range())
+            self.assertFalse(reader.can_zero_copy_send())
+            reader.close()
+
+    def test_zero_copy_send_ranges_short_file(self):
+        if not sendfile.available:
+            raise unittest.SkipTest("sendfile support is missing")
+        self.conf['splice'] = 'on'
+        df = self._get_open_disk_file(fsize=1000)
+        reader = df.reader()
+        size = os.fstat(reader._fp.fileno()).st_size
+        reader.app_iter_range(size - 10, size + 10)
+        with self.assertRaises(DiskFileError) as cm:
+            self._zero_copy_send_ranges(reader)
+        self.assertIn('ended at %d' % size, str(cm.exception))
+
     def test_create_unlink_cleanup_DiskFileNoSpace(self):
         # Test cleanup when DiskFileNoSpace() is raised.
         df = self.df_mgr.get_diskfile(self.existing_device, '0', 'abc', '123',
@@ -5825,6 +6385,24 @@ class TestECDiskFile(DiskFileMixin, unittest.TestCase):
                                df_data[corruption_length:-10])
         do_test(corrupted_frag_body, len(df_data), len(corrupted_frag_body))
 
+    def test_reader_quarantines_corrupted_ec_archive_range_from_start(self):
+        policy = POLICIES.default
+        df, df_data = self._create_test_file('x' * policy.ec_segment_size,
+                                             timestamp=self.ts())
+        write_diskfile(df, self.ts(), ' ' * 64 + df_data[64:])
+        df.open()
+        reader = df.reader()
+        reader._use_splice = reader._use_sendfile = True
+        it = reader.app_iter_range(0, len(df_data))
+        # the fragments are checked as they are read in userspace
+        self.assertFalse(reader.can_zero_copy_send())
+        with self.assertRaises(DiskFileQuarantined) as cm:
+            ''.join(it)
+        self.assertEqual('Invalid EC metadata at offset 0x0',
+                         cm.exception.message)
+        with self.assertRaises(DiskFileNotExist):
+            df.open()
+
     def test_reader_ec_exception_causes_quarantine(self):
         policy = POLICIES.default
 
@@ -6349,6 +6927,35 @@ class TestSuffixHashes(unittest.TestCase):
             with open(inv_file) as f:
                 self.assertEqual('', f.read().strip('\n'))
 
+    def test_has_invalidated_hashes(self):
+        conf = dict(self.conf, binary_hashes='true')
+        df_router = diskfile.DiskFileRouter(conf, self.logger)
+        for policy in self.iter_policies():
+            df_mgr = df_router[policy]
+            part_path = os.path.join(self.devices, 'sda1',
+                                     diskfile.get_data_dir(policy), '0')
+            # a partition that does not exist has nothing invalidated
+            self.assertFalse(diskfile.has_invalidated_hashes(part_path))
+            df = df_mgr.get_diskfile('sda1', '0', 'a', 'c', 'o',
+                                     policy=policy)
+            df.delete(self.ts())
+            # the suffix is invalidated in hashes.invalid ...
+            self.assertTrue(diskfile.has_invalidated_hashes(part_path))
+            df_mgr.get_hashes('sda1', '0', [], policy)
+            self.assertFalse(diskfile.has_invalidated_hashes(part_path))
+            if policy.policy_type == EC_POLICY:
+                # fragment hashes do not fit in hashes.bin
+                continue
+            df.delete(self.ts())
+            # ... or in hashes.bin once that exists
+            self.assertTrue(os.path.exists(
+                os.path.join(part_path, diskfile.HASH_BIN_FILE)))
+            self.assertEqual(0, os.path.getsize(os.path.join(
+                part_path, diskfile.HASH_INVALIDATIONS_FILE)))
+            self.assertTrue(diskfile.has_invalidated_hashes(part_path))
+            df_mgr.get_hashes('sda1', '0', [], policy)
+            self.assertFalse(diskfile.has_invalidated_hashes(part_path))
+
     def test_invalidate_hash_empty_file_exists(self):
         for policy in self.iter_policies():
             df_mgr = self.df_router[policy]
@@ -8004,6 +8611,277 @@ class TestSuffixHashes(unittest.TestCase):
                  '003': 'fake', '004': 'fake'},  # not modifed
             ])
 
+    def _make_manifest_objects(self, df_mgr, policy):
+        # a data file with newer meta/content-type, a tombstone and, in
+        # another suffix, a data file
+        part_path = os.path.join(self.devices, 'sda1',
+                                 diskfile.get_data_dir(policy), '0')
+        datadirs = []
+        for obj in ('o1', 'o2', 'o3'):
+            df = df_mgr.get_diskfile('sda1', '0', 'a', 'c', obj,
+                                     policy=policy)
+            os.makedirs(df._datadir)
+            datadirs.append(df._datadir)
+        ts_data, ts_ctype, ts_meta, ts_tomb, ts_other = [
+            self.ts() for _ in range(5)]
+        for datadir, filenames in zip(datadirs, [
+                [_make_datafilename(ts_data, policy, frag_index=2,
+                                    durable=True),
+                 _make_metafilename(ts_meta, ts_ctype)],
+                [ts_tomb.internal + '.ts'],
+                [_make_datafilename(ts_other, policy, frag_index=2,
+                                    durable=True)]]):
+            for filename in filenames:
+                open(os.path.join(datadir, filename), 'wb').close()
+        expected = {
+            os.path.basename(datadirs[0]): {
+                'ts_data': ts_data, 'ts_meta': ts_meta,
+                'ts_ctype': ts_ctype},
+            os.path.basename(datadirs[1]): {'ts_data': ts_tomb},
+            os.path.basename(datadirs[2]): {'ts_data': ts_other},
+        }
+        return part_path, datadirs, expected
+
+    def test_hash_manifest_disabled_by_default(self):
+        for policy in self.iter_policies():
+            df_mgr = self.df_router[policy]
+            self.assertFalse(df_mgr.hash_manifest)
+            part_path, _, _ = self._make_manifest_objects(df_mgr, policy)
+            df_mgr.get_hashes('sda1', '0', [], policy)
+            self.assertFalse(os.path.exists(os.path.join(
+                part_path, diskfile.HASH_MANIFEST_FILE)))
+
+    def test_yield_hashes_from_hash_manifest(self):
+        conf = dict(self.conf, hash_manifest='true')
+        df_router = diskfile.DiskFileRouter(conf, self.logger)
+        for policy in self.iter_policies():
+            df_mgr = df_router[policy]
+            self.assertTrue(df_mgr.hash_manifest)
+            part_path, datadirs, expected = self._make_manifest_objects(
+                df_mgr, policy)
+            hashes = df_mgr.get_hashes('sda1', '0', [], policy)
+            manifest = diskfile.read_hash_manifest(part_path)
+            self.assertEqual(sorted(hashes), sorted(manifest))
+            self.assertEqual(3, sum(len(objects)
+                                    for _, objects in manifest.values()))
+
+            # no object or suffix dir needs to be listed any more...
+            real_listdir = os.listdir
+
+            def mock_listdir(path):
+                self.assertFalse(path.startswith(part_path + os.sep),
+                                 'Unexpected listdir of %r' % path)
+                return real_listdir(path)
+
+            with mock.patch('os.listdir', mock_listdir):
+                self.assertEqual(expected, dict(df_mgr.yield_hashes(
+                    'sda1', '0', policy)))
+                suffix = os.path.basename(os.path.dirname(datadirs[2]))
+                self.assertEqual(
+                    {os.path.basename(datadirs[2]):
+                     expected[os.path.basename(datadirs[2])]},
+                    dict(df_mgr.yield_hashes('sda1', '0', policy,
+                                             suffixes=[suffix])))
+
+            # ...which gives the same answer as a walk of the partition
+            self.assertEqual(expected, dict(
+                self.df_router[policy].yield_hashes('sda1', '0', policy)))
+
+            # yielding a specific fragment index needs a walk
+            if policy.policy_type == EC_POLICY:
+                with mock.patch('os.listdir', mock_listdir):
+                    self.assertRaises(AssertionError, list,
+                                      df_mgr.yield_hashes(
+                                          'sda1', '0', policy,
+                                          frag_index=2))
+
+    def test_hash_manifest_ignores_changed_suffixes(self):
+        conf = dict(self.conf, hash_manifest='true')
+        df_router = diskfile.DiskFileRouter(conf, self.logger)
+        for policy in self.iter_policies():
+            df_mgr = df_router[policy]
+            part_path, datadirs, expected = self._make_manifest_objects(
+                df_mgr, policy)
+            df_mgr.get_hashes('sda1', '0', [], policy)
+            # a new tombstone for the last object invalidates its suffix
+            df = df_mgr.get_diskfile('sda1', '0', 'a', 'c', 'o3',
+                                     policy=policy)
+            ts = self.ts()
+            df.delete(ts)
+            expected[os.path.basename(datadirs[2])] = {'ts_data': ts}
+            self.assertEqual(expected, dict(df_mgr.yield_hashes(
+                'sda1', '0', policy)))
+            # and is picked up by the manifest once rehashed
+            df_mgr.get_hashes('sda1', '0', [], policy)
+            manifest = diskfile.read_hash_manifest(part_path)
+            suffix = os.path.basename(os.path.dirname(datadirs[2]))
+            self.assertEqual(
+                [ts.internal, None, None, True],
+                manifest[suffix][1][os.path.basename(datadirs[2])])
+
+            # a suffix hash written without the manifest (e.g. by a
+            # server that doesn't have it enabled) makes it stale
+            df = df_mgr.get_diskfile('sda1', '0', 'a', 'c', 'o1',
+                                     policy=policy)
+            ts = self.ts()
+            df.delete(ts)
+            self.df_router[policy].get_hashes('sda1', '0', [], policy)
+            expected[os.path.basename(datadirs[0])] = {'ts_data': ts}
+            self.assertEqual(expected, dict(df_mgr.yield_hashes(
+                'sda1', '0', policy)))
+
+    def test_hash_manifest_reclaimable_tombstone(self):
+        conf = dict(self.conf, hash_manifest='true')
+        df_router = diskfile.DiskFileRouter(conf, self.logger)
+        for policy in self.iter_policies():
+            df_mgr = df_router[policy]
+            part_path, datadirs, expected = self._make_manifest_objects(
+                df_mgr, policy)
+            df_mgr.get_hashes('sda1', '0', [], policy)
+            # once the tombstone can be reclaimed it is not yielded...
+            tomb_hash = os.path.basename(datadirs[1])
+            del expected[tomb_hash]
+            future = time() + df_mgr.reclaim_age + 100
+            with mock.patch('swift.obj.diskfile.time.time',
+                            return_value=future):
+                self.assertEqual(expected, dict(df_mgr.yield_hashes(
+                    'sda1', '0', policy)))
+            # ... and is cleaned up as it would be by a walk
+            self.assertFalse(os.listdir(datadirs[1]))
+
+    def test_hash_manifest_built_for_existing_partition(self):
+        for policy in self.iter_policies():
+            part_path, datadirs, expected = self._make_manifest_objects(
+                self.df_router[policy], policy)
+            hashes = self.df_router[policy].get_hashes(
+                'sda1', '0', [], policy)
+            conf = dict(self.conf, hash_manifest='true')
+            df_mgr = diskfile.DiskFileRouter(conf, self.logger)[policy]
+            with mock.patch.object(df_mgr, '_hash_suffix',
+                                   wraps=df_mgr._hash_suffix) as mocked:
+                self.assertEqual(hashes, df_mgr.get_hashes(
+                    'sda1', '0', [], policy))
+            # every suffix is hashed once to build the manifest
+            self.assertEqual(len(hashes), mocked.call_count)
+            self.assertEqual(sorted(hashes), sorted(
+                diskfile.read_hash_manifest(part_path)))
+            with mock.patch.object(df_mgr, '_hash_suffix') as mocked:
+                df_mgr.get_hashes('sda1', '0', [], policy)
+            self.assertFalse(mocked.called)
+
+    def test_binary_hashes_disabled_by_default(self):
+        for policy in self.iter_policies():
+            df_mgr = self.df_router[policy]
+            self.assertFalse(df_mgr.binary_hashes)
+            part_path, _, _ = self._make_manifest_objects(df_mgr, policy)
+            df_mgr.get_hashes('sda1', '0', [], policy)
+            self.assertTrue(os.path.exists(os.path.join(
+                part_path, diskfile.HASH_FILE)))
+            self.assertFalse(os.path.exists(os.path.join(
+                part_path, diskfile.HASH_BIN_FILE)))
+
+    def test_get_hashes_binary_hashes(self):
+        conf = dict(self.conf, binary_hashes='true')
+        df_router = diskfile.DiskFileRouter(conf, self.logger)
+        for policy in self.iter_policies():
+            df_mgr = df_router[policy]
+            self.assertTrue(df_mgr.binary_hashes)
+            part_path, datadirs, _ = self._make_manifest_objects(
+                df_mgr, policy)
+            hashes = df_mgr.get_hashes('sda1', '0', [], policy)
+            hashes_file = os.path.join(part_path, diskfile.HASH_FILE)
+            bin_file = os.path.join(part_path, diskfile.HASH_BIN_FILE)
+            if policy.policy_type == EC_POLICY:
+                # fragment hashes do not fit in hashes.bin
+                self.assertTrue(os.path.exists(hashes_file))
+                self.assertFalse(os.path.exists(bin_file))
+                continue
+            self.assertFalse(os.path.exists(hashes_file))
+            self.assertEqual(diskfile.HASH_BIN_SIZE,
+                             os.path.getsize(bin_file))
+            # hashes.bin is read whether or not binary_hashes is enabled
+            self.assertEqual(hashes, self.df_router[policy].get_hashes(
+                'sda1', '0', [], policy))
+
+            # invalidations are made in place...
+            df = df_mgr.get_diskfile('sda1', '0', 'a', 'c', 'o3',
+                                     policy=policy)
+            df.delete(self.ts())
+            suffix = os.path.basename(os.path.dirname(datadirs[2]))
+            inv_file = os.path.join(part_path,
+                                    diskfile.HASH_INVALIDATIONS_FILE)
+            self.assertFalse(os.path.exists(inv_file) and
+                             os.path.getsize(inv_file))
+            self.assertIsNone(diskfile.read_hashes(part_path)[suffix])
+            # ...and only the invalidated suffix is rehashed
+            with mock.patch.object(df_mgr, '_hash_suffix',
+                                   wraps=df_mgr._hash_suffix) as mocked:
+                new_hashes = df_mgr.get_hashes('sda1', '0', [], policy)
+            self.assertEqual(1, mocked.call_count)
+            self.assertNotEqual(hashes[suffix], new_hashes[suffix])
+            self.assertEqual(new_hashes[suffix],
+                             diskfile.read_hashes(part_path)[suffix])
+
+    def test_binary_hashes_migrated_from_pickle(self):
+        policy = [p for p in POLICIES if p.policy_type == REPL_POLICY][0]
+        part_path, datadirs, _ = self._make_manifest_objects(
+            self.df_router[policy], policy)
+        hashes = self.df_router[policy].get_hashes('sda1', '0', [], policy)
+        conf = dict(self.conf, binary_hashes='true')
+        df_mgr = diskfile.DiskFileRouter(conf, self.logger)[policy]
+        # hashes.pkl is read until the hashes next change...
+        self.assertEqual(hashes, df_mgr.get_hashes('sda1', '0', [], policy))
+        self.assertTrue(os.path.exists(os.path.join(
+            part_path, diskfile.HASH_FILE)))
+        # ...when hashes.bin replaces it
+        df = df_mgr.get_diskfile('sda1', '0', 'a', 'c', 'o3', policy=policy)
+        df.delete(self.ts())
+        with mock.patch.object(df_mgr, '_hash_suffix',
+                               wraps=df_mgr._hash_suffix) as mocked:
+            new_hashes = df_mgr.get_hashes('sda1', '0', [], policy)
+        self.assertEqual(1, mocked.call_count)
+        self.assertEqual(sorted(hashes), sorted(new_hashes))
+        self.assertFalse(os.path.exists(os.path.join(
+            part_path, diskfile.HASH_FILE)))
+        self.assertTrue(os.path.exists(os.path.join(
+            part_path, diskfile.HASH_BIN_FILE)))
+
+    def test_binary_hashes_invalidated_again_during_rehash(self):
+        policy = [p for p in POLICIES if p.policy_type == REPL_POLICY][0]
+        conf = dict(self.conf, binary_hashes='true')
+        df_mgr = diskfile.DiskFileRouter(conf, self.logger)[policy]
+        part_path, datadirs, _ = self._make_manifest_objects(df_mgr, policy)
+        df_mgr.get_hashes('sda1', '0', [], policy)
+        df = df_mgr.get_diskfile('sda1', '0', 'a', 'c', 'o3', policy=policy)
+        suffix_dir = os.path.dirname(df._datadir)
+        suffix = os.path.basename(suffix_dir)
+        # the suffix is present but not valid...
+        df.delete(self.ts())
+        self.assertIsNone(diskfile.read_hashes(part_path)[suffix])
+        orig_hash_suffix = df_mgr._hash_suffix
+        calls = []
+
+        def mock_hash_suffix(path, **kwargs):
+            calls.append(path)
+            if len(calls) > 1:
+                # the stale hash was not written as valid
+                self.assertIsNone(diskfile.read_hashes(part_path)[suffix])
+            result = orig_hash_suffix(path, **kwargs)
+            if len(calls) == 1:
+                # ...and is invalidated again while it is rehashed, which
+                # leaves its bits as they were
+                df.delete(self.ts())
+            return result
+
+        with mock.patch.object(df_mgr, '_hash_suffix', mock_hash_suffix):
+            hashes = df_mgr.get_hashes('sda1', '0', [], policy)
+        # the rehash noticed and went round again, so the hash that was
+        # returned and written includes the second delete
+        self.assertEqual([suffix_dir, suffix_dir], calls)
+        self.assertEqual(orig_hash_suffix(suffix_dir), hashes[suffix])
+        self.assertEqual(hashes[suffix],
+                         diskfile.read_hashes(part_path)[suffix])
+
 
 class TestHashesHelpers(unittest.TestCase):
 
@@ -8013,6 +8891,24 @@ class TestHashesHelpers(unittest.TestCase):
     def tearDown(self):
         rmtree(self.testdir, ignore_errors=1)
 
+    def test_read_write_hash_manifest(self):
+        self.assertEqual({}, diskfile.read_hash_manifest(self.testdir))
+        manifest = {'abc': ['fake', {'a' * 29 + 'abc': [
+            Timestamp(1).internal, None, None, True]}]}
+        diskfile.write_hash_manifest(self.testdir, manifest)
+        self.assertEqual(manifest, diskfile.read_hash_manifest(self.testdir))
+        self.assertEqual([diskfile.HASH_MANIFEST_FILE],
+                         os.listdir(self.testdir))
+        # a corrupt manifest is just ignored
+        manifest_file = os.path.join(self.testdir,
+                                     diskfile.HASH_MANIFEST_FILE)
+        with open(manifest_file, 'w') as f:
+            f.write('{"abc": [')
+        self.assertEqual({}, diskfile.read_hash_manifest(self.testdir))
+        with open(manifest_file, 'w') as f:
+            f.write('[]')
+        self.assertEqual({}, diskfile.read_hash_manifest(self.testdir))
+
     def test_read_legacy_hashes(self):
         hashes = {'stub': 'fake'}
         hashes_file = os.path.join(self.testdir, diskfile.HASH_FILE)
@@ -8092,6 +8988,81 @@ class TestHashesHelpers(unittest.TestCase):
         # with the exactly the same value mutation from write_hashes
         self.assertEqual(hashes, result)
 
+    def test_read_write_binary_hashes(self):
+        hashes = {'abc': md5(b'abc').hexdigest(), '000': None,
+                  'fff': md5(b'fff').hexdigest(), 'valid': True}
+        diskfile.write_hashes(self.testdir, hashes, binary=True)
+        self.assertEqual([diskfile.HASH_BIN_FILE], os.listdir(self.testdir))
+        hashes_file = os.path.join(self.testdir, diskfile.HASH_BIN_FILE)
+        self.assertEqual(diskfile.HASH_BIN_SIZE,
+                         os.path.getsize(hashes_file))
+        self.assertIn('updated', hashes)
+        result = diskfile.read_hashes(self.testdir)
+        self.assertEqual(hashes, result)
+
+        # the whole file is fixed layout
+        with open(hashes_file, 'rb') as f:
+            data = f.read()
+        magic, version, valid, updated = \
+            diskfile.HASH_BIN_HEADER.unpack_from(data)
+        self.assertEqual((diskfile.HASH_BIN_MAGIC, diskfile.HASH_BIN_VERSION,
+                          1, hashes['updated']),
+                         (magic, version, valid, updated))
+        offset = diskfile.HASH_BIN_SLOTS_OFFSET + 0xabc * 16
+        self.assertEqual(md5(b'abc').digest(), data[offset:offset + 16])
+
+        hashes = {'valid': False}
+        diskfile.write_hashes(self.testdir, hashes, binary=True)
+        self.assertEqual(hashes, diskfile.read_hashes(self.testdir))
+
+    def test_write_binary_hashes_falls_back_to_pickle(self):
+        diskfile.write_hashes(self.testdir, {'abc': None, 'valid': True},
+                              binary=True)
+        self.assertEqual([diskfile.HASH_BIN_FILE], os.listdir(self.testdir))
+        for hashes in ({'abc': {None: md5(b'abc').hexdigest()}},
+                       {'abc': 'fake'},
+                       {'stub': None},
+                       {'ABC': None}):
+            hashes['valid'] = True
+            diskfile.write_hashes(self.testdir, hashes, binary=True)
+            self.assertEqual([diskfile.HASH_FILE], os.listdir(self.testdir))
+            self.assertEqual(hashes, diskfile.read_hashes(self.testdir))
+            os.unlink(os.path.join(self.testdir, diskfile.HASH_FILE))
+
+    def test_read_corrupt_binary_hashes(self):
+        hashes_file = os.path.join(self.testdir, diskfile.HASH_BIN_FILE)
+        # a hashes.bin is read in preference to a hashes.pkl
+        diskfile.write_hashes(self.testdir, {'valid': True})
+        for data in (b'', b'SWHS', b'\x00' * diskfile.HASH_BIN_SIZE):
+            with open(hashes_file, 'wb') as f:
+                f.write(data)
+            self.assertEqual({'valid': False},
+                             diskfile.read_hashes(self.testdir))
+
+    def test_invalidate_binary_hash(self):
+        digest = md5(b'abc').hexdigest()
+        diskfile.write_hashes(self.testdir, {
+            'abc': digest, 'abd': digest, 'valid': True}, binary=True)
+        with mock.patch('swift.obj.diskfile.write_pickle') as mocked:
+            diskfile.invalidate_hash(os.path.join(self.testdir, 'abc'))
+            diskfile.invalidate_hash(os.path.join(self.testdir, '123'))
+        self.assertFalse(mocked.called)
+        self.assertEqual([diskfile.HASH_BIN_FILE],
+                         [f for f in os.listdir(self.testdir)
+                          if not f.startswith('.lock')])
+        result = diskfile.read_hashes(self.testdir)
+        self.assertEqual({'abc': None, 'abd': digest, '123': None,
+                          'valid': True}, dict(
+                              (k, v) for k, v in result.items()
+                              if k != 'updated'))
+
+        # suffixes that do not fit in hashes.bin are left to hashes.invalid
+        diskfile.invalidate_hash(os.path.join(self.testdir, 'stub'))
+        inv_file = os.path.join(self.testdir,
+                                diskfile.HASH_INVALIDATIONS_FILE)
+        with open(inv_file, 'rb') as f:
+            self.assertEqual(b'stub\n', f.read())
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,94 @@
+# Copyright (c) 2010-2012 OpenStack Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import os
+import unittest
+from shutil import rmtree
+from tempfile import mkdtemp
+
+from swift.obj.replication_queue import ReplicationQueue, HANDOFF, \
+    REASSIGNED, INVALIDATED, REPLICATION_QUEUE_FILE
+from test.unit import debug_logger
+
+
+class TestReplicationQueue(unittest.TestCase):
+
+    def setUp(self):
+        self.testdir = mkdtemp()
+        self.logger = debug_logger()
+        self.queue = ReplicationQueue(self.testdir, self.logger)
+
+    def tearDown(self):
+        rmtree(self.testdir, ignore_errors=True)
+
+    def test_push_and_pop(self):
+        self.assertIsNone(self.queue.oldest())
+        self.queue.push('1', INVALIDATED, now=10)
+        self.queue.push('2', HANDOFF, now=20)
+        self.queue.push('3', INVALIDATED, now=5)
+        self.assertEqual(3, len(self.queue))
+        self.assertEqual(5, self.queue.oldest())
+        # a partition keeps the time it was first queued and its most urgent
+        # reason
+        self.queue.push('1', REASSIGNED, now=30)
+        self.queue.push('2', INVALIDATED, now=30)
+        self.assertEqual((1, 10), self.queue.get_priority('1'))
+        self.assertEqual((0, 20), self.queue.get_priority('2'))
+        self.assertEqual(
+            ['2', '1', '3'],
+            sorted(['1', '2', '3'], key=self.queue.get_priority))
+        self.assertIsNone(self.queue.get_priority('4'))
+
+        self.assertEqual(10, self.queue.pop('1'))
+        self.assertIsNone(self.queue.pop('1'))
+        self.assertNotIn('1', self.queue)
+        self.queue.retain(['2', '4'])
+        self.assertEqual(['2'], list(self.queue.entries))
+
+    def test_save_and_load(self):
+        path = os.path.join(self.testdir, REPLICATION_QUEUE_FILE)
+        self.queue.save()
+        self.assertFalse(os.path.exists(path))
+        self.queue.push('1', HANDOFF, now=10.5)
+        self.queue.push('2', INVALIDATED, now=20)
+        self.queue.save()
+        self.assertFalse(self.queue.dirty)
+        with open(path) as fp:
+            self.assertEqual({'1': [HANDOFF, 10.5], '2': [INVALIDATED, 20]},
+                             json.load(fp))
+        self.assertEqual([REPLICATION_QUEUE_FILE], os.listdir(self.testdir))
+
+        queue = ReplicationQueue(self.testdir, self.logger)
+        queue.load()
+        self.assertEqual(self.queue.entries, queue.entries)
+
+    def test_load_invalid(self):
+        path = os.path.join(self.testdir, REPLICATION_QUEUE_FILE)
+        for contents, warnings in (
+                ('garbage', 1),
+                ('[1, 2]', 1),
+                ('{"1": ["unknown", 1], "2": "x", "3": ["handoff", 3]}', 0)):
+            with open(path, 'w') as fp:
+                fp.write(contents)
+            self.logger.clear()
+            self.queue.load()
+            self.assertEqual(
+                warnings, len(self.logger.get_lines_for_level('warning')))
+        self.assertEqual({'3': [HANDOFF, 3]}, self.queue.entries)
+
+
+if __name__ == '__main__':
+    unittest.main()
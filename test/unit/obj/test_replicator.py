@@ -824,6 +824,89 @@ class TestObjectReplicator(unittest.TestCase):
         self.assertTrue(jobs[0]['delete'])
         self.assertEqual('1', jobs[0]['partition'])
 
+    def test_collect_jobs_prioritizes_changed_parts(self):
+        jobs = self.replicator.collect_jobs()
+        self.assertEqual(8, len(jobs))
+        # a fresh ring has nothing to prioritize
+        self.assertEqual([], self.logger.get_lines_for_level('info'))
+
+        POLICIES[1].object_ring.changed_parts = frozenset([2, 3])
+        with mock.patch('swift.obj.replicator.random.shuffle'):
+            jobs = self.replicator.collect_jobs()
+        self.assertEqual([(1, '2'), (1, '3')], sorted(
+            (int(job['policy']), job['partition']) for job in jobs[:2]))
+        self.assertEqual(8, len(jobs))
+        self.assertEqual(
+            ['Ring for policy one changed; prioritizing 2 reassigned '
+             'partitions'], self.logger.get_lines_for_level('info'))
+
+        # the same ring change is only prioritized once
+        self.logger._clear()
+        with mock.patch('swift.obj.replicator.random.shuffle'):
+            jobs = self.replicator.collect_jobs()
+        self.assertEqual([], self.logger.get_lines_for_level('info'))
+
+    def test_collect_jobs_prioritizes_changed_parts_after_handoffs(self):
+        self.replicator.handoffs_first = True
+        POLICIES[0].load_ring(self.testdir)
+        POLICIES[0].object_ring.changed_parts = frozenset([3])
+        jobs = self.replicator.collect_jobs()
+        self.assertTrue(jobs[0]['delete'])
+        self.assertTrue(jobs[1]['delete'])
+        self.assertEqual((0, '3'), (int(jobs[2]['policy']),
+                                    jobs[2]['partition']))
+
+    def test_collect_jobs_priority_queue(self):
+        self.replicator.priority_queue = True
+        with mock.patch('swift.obj.replicator.random.shuffle'):
+            jobs = self.replicator.collect_jobs()
+        # the handoffs are queued
+        self.assertEqual([(0, '1'), (1, '1')], sorted(
+            (int(job['policy']), job['partition']) for job in jobs[:2]))
+        self.assertEqual([None] * 6, [job['priority'] for job in jobs[2:]])
+        queue_file = os.path.join(self.objects, 'replication_queue.json')
+        with open(queue_file) as fp:
+            self.assertEqual(['1'], list(json.load(fp)))
+
+        POLICIES[1].object_ring.changed_parts = frozenset([3])
+        with open(os.path.join(self.parts['2'], 'hashes.invalid'), 'w') as fp:
+            fp.write('abc\n')
+        with mock.patch('swift.obj.replicator.random.shuffle'):
+            jobs = self.replicator.collect_jobs()
+        self.assertEqual(8, len(jobs))
+        self.assertEqual([(0, '1'), (1, '1')], sorted(
+            (int(job['policy']), job['partition']) for job in jobs[:2]))
+        self.assertEqual([(1, '3'), (0, '2')], [
+            (int(job['policy']), job['partition']) for job in jobs[2:4]])
+        self.assertEqual([None] * 4, [job['priority'] for job in jobs[4:]])
+
+        # the queues persist until their partitions converge
+        self._create_replicator()
+        self.replicator.priority_queue = True
+        with mock.patch('swift.obj.replicator.random.shuffle'):
+            jobs = self.replicator.collect_jobs()
+        self.assertEqual([(0, '1'), (0, '2'), (1, '1'), (1, '3')], sorted(
+            (int(job['policy']), job['partition']) for job in jobs[:4]))
+        for job in jobs[:4]:
+            self.replicator._converged(job)
+        self.assertEqual(4, len(self.replicator.convergence_times))
+        self.assertEqual(
+            4, len(self.logger.log_dict['timing_since']))
+        self.assertEqual('partition.convergence.timing',
+                         self.logger.log_dict['timing_since'][0][0][0])
+        for queue in self.replicator.replication_queues.values():
+            self.assertEqual(0, len(queue))
+            queue.save()
+        with open(queue_file) as fp:
+            self.assertEqual({}, json.load(fp))
+        # hashes.invalid will be consolidated when the partition is hashed
+        os.unlink(os.path.join(self.parts['2'], 'hashes.invalid'))
+        with mock.patch('swift.obj.replicator.random.shuffle'):
+            jobs = self.replicator.collect_jobs()
+        self.assertEqual([(0, '1'), (1, '1')], sorted(
+            (int(job['policy']), job['partition']) for job in jobs[:2]))
+        self.assertEqual([None] * 6, [job['priority'] for job in jobs[2:]])
+
     def test_handoffs_first_mode_will_process_all_jobs_after_handoffs(self):
         # make an object in the handoff & primary partition
         expected_suffix_paths = []
@@ -1798,6 +1881,19 @@ class TestObjectReplicator(unittest.TestCase):
         self.replicator.sync_method.assert_called_once_with(
             'node', 'job', 'suffixes')
 
+    def test_rsync_uses_ssync_for_slab_backend(self):
+        job = {'policy': POLICIES[0], 'path': self.objects,
+               'partition': '0', 'region': 1}
+        df_mgr = self.replicator._df_router[POLICIES[0]]
+        with mock.patch.object(self.replicator, 'ssync',
+                               return_value=(True, {})) as mock_ssync, \
+                mock.patch.object(self.replicator, '_rsync') as mock_rsync, \
+                mock.patch.object(df_mgr, 'replicate_with_ssync', True):
+            self.assertEqual((True, {}),
+                             self.replicator.rsync('node', job, ['abc']))
+        mock_ssync.assert_called_once_with('node', job, ['abc'])
+        self.assertFalse(mock_rsync.called)
+
     @mock.patch('swift.obj.replicator.tpool_reraise')
     @mock.patch('swift.obj.replicator.http_connect', autospec=True)
     @mock.patch('swift.obj.replicator._do_listdir')
@@ -1964,6 +2060,7 @@ class TestObjectReplicator(unittest.TestCase):
 
         # test for replication params on policy 0 only
         repl_job = local_job.copy()
+        repl_job['nodes'] = [dict(node) for node in repl_job['nodes']]
         for node in repl_job['nodes']:
             node['replication_ip'] = '127.0.0.11'
             node['replication_port'] = '6011'
@@ -1984,6 +2081,113 @@ class TestObjectReplicator(unittest.TestCase):
                                   '/a83', headers=self.headers))
         mock_http.assert_has_calls(reqs, any_order=True)
 
+    @mock.patch('swift.obj.replicator._do_listdir', return_value=False)
+    def test_update_hash_tree(self, mock_do_listdir):
+        self.replicator.hash_tree = True
+        job = [job for job in self.replicator.collect_jobs()
+               if job['partition'] == '0' and int(job['policy']) == 0 and
+               not job['delete']][0]
+        local_hash = {'a83': 'a' * 32, 'a84': 'b' * 32, 'b00': 'c' * 32}
+        remote_hash = dict(local_hash, a83='d' * 32, a85='e' * 32)
+        requests = []
+
+        def fake_http_connect(ip, port, device, partition, method, path,
+                              headers=None):
+            requests.append((path, headers))
+            root, groups = diskfile.get_hash_tree(remote_hash)
+            if 'X-Backend-Hash-Tree-Groups' in headers:
+                wanted = headers['X-Backend-Hash-Tree-Groups'].split('-')
+                body = dict((suffix, hash_)
+                            for suffix, hash_ in remote_hash.items()
+                            if suffix[:2] in wanted)
+            elif headers.get('X-Backend-Hash-Tree-Root') == root:
+                body = {}
+            else:
+                body = groups
+            resp = mock.MagicMock(status=200)
+            resp.getheader.return_value = root
+            resp.read.return_value = pickle.dumps(body)
+            conn = mock.MagicMock()
+            conn.getresponse.return_value = resp
+            return conn
+
+        self.replicator.sync = mock.MagicMock(return_value=(True, []))
+        with mock.patch('swift.obj.replicator.http_connect',
+                        fake_http_connect), \
+                mock.patch('swift.obj.replicator.tpool_reraise',
+                           return_value=(0, local_hash)):
+            self.replicator.update(job)
+        self.assertEqual(
+            [mock.call(node, job, ['a83']) for node in job['nodes']],
+            self.replicator.sync.call_args_list)
+        # for each node, the root, then the suffixes of the group that
+        # differs, then the recalculation of the synced suffix
+        self.assertEqual(3 * len(job['nodes']), len(requests))
+        for i in range(len(job['nodes'])):
+            root_req, group_req, recalc_req = requests[3 * i:3 * i + 3]
+            self.assertEqual(
+                ('', diskfile.get_hash_tree(local_hash)[0]),
+                (root_req[0], root_req[1]['X-Backend-Hash-Tree-Root']))
+            self.assertEqual(
+                ('', 'a8'),
+                (group_req[0], group_req[1]['X-Backend-Hash-Tree-Groups']))
+            self.assertEqual('/a83', recalc_req[0])
+            self.assertNotIn('X-Backend-Hash-Tree-Root', recalc_req[1])
+
+        # in sync partitions only need their roots compared
+        remote_hash = dict(local_hash)
+        del requests[:]
+        self.replicator.sync.reset_mock()
+        with mock.patch('swift.obj.replicator.http_connect',
+                        fake_http_connect), \
+                mock.patch('swift.obj.replicator.tpool_reraise',
+                           return_value=(0, local_hash)):
+            self.replicator.update(job)
+        self.assertFalse(self.replicator.sync.called)
+        self.assertEqual(len(job['nodes']), len(requests))
+        self.assertEqual(len(job['nodes']),
+                         self.replicator.total_stats.hashmatch)
+
+    @mock.patch('swift.obj.replicator._do_listdir', return_value=False)
+    def test_update_conn_pool(self, mock_do_listdir):
+        self.assertIsNone(self.replicator.conn_pool)
+        conf = dict(self.conf, conn_pool_size='2',
+                    conn_pool_idle_timeout='5')
+        replicator = object_replicator.ObjectReplicator(conf, self.logger)
+        replicator._zero_stats()
+        replicator.all_devs_info = set()
+        pool = replicator.conn_pool
+        self.assertEqual((2, 5), (pool.max_idle, pool.idle_timeout))
+        job = [job for job in replicator.collect_jobs()
+               if job['partition'] == '0' and int(job['policy']) == 0 and
+               not job['delete']][0]
+        local_hash = {'a83': 'a' * 32}
+        replicator.sync = mock.MagicMock(return_value=(True, []))
+        with mock.patch.object(pool, 'http_connect') as mock_http, \
+                mock.patch('swift.obj.replicator.http_connect') as mock_conn, \
+                mock.patch('swift.obj.replicator.tpool_reraise',
+                           return_value=(0, local_hash)):
+            resp = mock_http.return_value.getresponse.return_value
+            resp.status = 200
+            resp.read.return_value = pickle.dumps({'a83': 'b' * 32})
+            replicator.update(job)
+        # both the REPLICATE requests for each node were pooled
+        self.assertFalse(mock_conn.called)
+        self.assertEqual(2 * len(job['nodes']), mock_http.call_count)
+        self.assertEqual(
+            [mock.call(node, job, ['a83']) for node in job['nodes']],
+            replicator.sync.call_args_list)
+
+        pool.hits, pool.misses, pool.connect_time = 4, 2, 0.003
+        replicator.last_replication_count = 0
+        replicator.job_count = 1
+        replicator.start = time.time()
+        self.logger.clear()
+        replicator.stats_line()
+        self.assertIn('4 pooled connections reused, 2 opened '
+                      '(avg connect 1.50ms), 0 retried',
+                      self.logger.get_lines_for_level('info'))
+
     def test_rsync_compress_different_region(self):
         self.assertEqual(self.replicator.sync_method, self.replicator.rsync)
         jobs = self.replicator.collect_jobs()
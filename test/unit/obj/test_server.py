@@ -36,7 +36,8 @@ from collections import defaultdict
 from contextlib import contextmanager
 from textwrap import dedent
 
-from eventlet import sleep, spawn, wsgi, Timeout, tpool, greenthread
+from eventlet import sleep, spawn, wsgi, Timeout, tpool, greenthread, \
+    GreenPool
 from eventlet.green import httplib
 
 from swift import __version__ as swift_version
@@ -55,8 +56,8 @@ from swift.common.utils import hash_path, mkdirs, normalize_timestamp, \
     NullLogger, storage_directory, public, replication, encode_timestamps, \
     Timestamp
 from swift.common import constraints
-from swift.common.swob import Request, WsgiBytesIO
-from swift.common.splice import splice
+from swift.common.swob import Request, WsgiBytesIO, multi_range_iterator
+from swift.common.splice import splice, sendfile
 from swift.common.storage_policy import (StoragePolicy, ECStoragePolicy,
                                          POLICIES, EC_POLICY)
 from swift.common.exceptions import DiskFileDeviceUnavailable, \
@@ -132,6 +133,64 @@ class TestTpoolSize(unittest.TestCase):
         self.assertEqual([], mock_snt.mock_calls)
 
 
+class TestContainerUpdateBatcher(unittest.TestCase):
+
+    def setUp(self):
+        self.sent = []
+        self.success = True
+
+    def _send_batch(self, key, updates):
+        self.sent.append((key, list(updates)))
+        return self.success
+
+    def _update_all(self, batcher, key_updates):
+        pool = GreenPool()
+        results = [pool.spawn(batcher.update, key, update)
+                   for key, update in key_updates]
+        return [gt.wait() for gt in results]
+
+    def test_updates_batched_per_key(self):
+        batcher = object_server.ContainerUpdateBatcher(
+            self._send_batch, window=0.01, max_batch=10)
+        results = self._update_all(batcher, [
+            ('a', 1), ('b', 2), ('a', 3), ('a', 4)])
+        self.assertEqual([True] * 4, results)
+        self.assertEqual([('a', [1, 3, 4]), ('b', [2])], sorted(self.sent))
+        self.assertFalse(batcher._gathering)
+        # a new batch is started once the last has been sent
+        self.assertTrue(batcher.update('a', 5))
+        self.assertEqual(('a', [5]), self.sent[-1])
+
+    def test_full_batch_sent_without_waiting(self):
+        batcher = object_server.ContainerUpdateBatcher(
+            self._send_batch, window=10, max_batch=2)
+        with Timeout(1):
+            results = self._update_all(batcher, [
+                ('a', 1), ('a', 2), ('a', 3), ('a', 4)])
+        self.assertEqual([True] * 4, results)
+        self.assertEqual([('a', [1, 2]), ('a', [3, 4])], self.sent)
+
+        batcher.max_batch = 1
+        with Timeout(1):
+            self.assertTrue(batcher.update('a', 5))
+        self.assertEqual(('a', [5]), self.sent[-1])
+
+    def test_failed_batch(self):
+        batcher = object_server.ContainerUpdateBatcher(
+            self._send_batch, window=0.01)
+        self.success = False
+        self.assertEqual([False] * 2, self._update_all(
+            batcher, [('a', 1), ('a', 2)]))
+
+        def broken_send_batch(key, updates):
+            raise Exception('kaboom')
+
+        batcher.send_batch = broken_send_batch
+        self.assertEqual([False] * 2, self._update_all(
+            batcher, [('a', 1), ('a', 2)]))
+        self.assertFalse(batcher._gathering)
+
+
 @patch_policies(test_policies)
 class TestObjectController(unittest.TestCase):
     """Test swift.obj.server.ObjectController"""
@@ -4449,6 +4508,170 @@ class TestObjectController(unittest.TestCase):
                 self.assertEqual(errbuf.getvalue(), '')
                 self.assertEqual(outbuf.getvalue()[:4], '403 ')
 
+    def _make_limited_controller(self, **conf):
+        conf = dict(self.conf, recon_cache_path=self.tmpdir, **conf)
+        return object_server.ObjectController(conf, logger=debug_logger())
+
+    def _get_device_limit(self, controller, device='sda1'):
+        req = Request.blank('/%s/p/a/c/o' % device, method='HEAD')
+        return controller._get_device_limit(req)[1]
+
+    def test_device_concurrency_disabled_by_default(self):
+        self.assertEqual(0, self.object_controller.device_concurrency)
+        req = Request.blank('/sda1/p/a/c/o', method='HEAD')
+        self.assertEqual(404, req.get_response(
+            self.object_controller).status_int)
+        self.assertFalse(self.object_controller.device_limits)
+        self.assertEqual({}, self.object_controller.get_device_stats())
+
+    def test_device_stats_group_commit(self):
+        controller = self._make_limited_controller(
+            group_commit='true', group_commit_window='0')
+        req = Request.blank(
+            '/sda1/p/a/c/o', method='PUT', body=b'VERIFY',
+            headers={'X-Timestamp': normalize_timestamp(time()),
+                     'Content-Type': 'application/octet-stream'})
+        with mock.patch('swift.common.utils.syncfs'), \
+                mock.patch('swift.common.utils.fsync'):
+            self.assertEqual(201, req.get_response(controller).status_int)
+        stats = controller.get_device_stats()
+        self.assertEqual(['sda1'], list(stats))
+        self.assertEqual(2, stats['sda1']['group_commit']['rounds'])
+        self.assertEqual(2, stats['sda1']['group_commit']['commits'])
+
+    def test_device_concurrency_fast_fail(self):
+        controller = self._make_limited_controller(
+            device_concurrency='1', device_concurrency_timeout='0')
+        limit = self._get_device_limit(controller)
+        self.assertIsNotNone(limit.acquire(0))
+
+        req = Request.blank('/sda1/p/a/c/o', method='HEAD')
+        resp = req.get_response(controller)
+        self.assertEqual(503, resp.status_int)
+        self.assertEqual('1', resp.headers['Retry-After'])
+        self.assertEqual(
+            {'device_concurrency.sda1.rejected': 1},
+            controller.logger.get_increment_counts())
+        self.assertEqual(
+            ['device_concurrency.sda1.wait_timing'],
+            [call[0][0] for call in controller.logger.log_dict['timing']])
+
+        # other devices and replication requests are not limited, and
+        # devices that do not exist are not given limits
+        req = Request.blank('/sdb1/p/a/c/o', method='HEAD')
+        self.assertEqual(507, req.get_response(controller).status_int)
+        self.assertEqual(['sda1'], list(controller.device_limits))
+        req = Request.blank('/sda1/p/a/c/o', method='HEAD',
+                            headers={'X-Backend-Replication': 'True'})
+        self.assertEqual(404, req.get_response(controller).status_int)
+
+        limit.release()
+        req = Request.blank('/sda1/p/a/c/o', method='HEAD')
+        self.assertEqual(404, req.get_response(controller).status_int)
+        stats = controller.get_device_stats()
+        self.assertEqual(['sda1'], list(stats))
+        self.assertEqual({'limit': 1, 'in_flight': 0, 'max_in_flight': 1,
+                          'waiting': 0, 'max_waiting': 1, 'requests': 2,
+                          'rejected': 1},
+                         dict((k, v) for k, v in stats['sda1'].items()
+                              if k != 'wait_time'))
+
+    def test_device_concurrency_queue(self):
+        controller = self._make_limited_controller(
+            device_concurrency='1', device_concurrency_timeout='10')
+        limit = self._get_device_limit(controller)
+        limit.acquire(0)
+        req = Request.blank('/sda1/p/a/c/o', method='HEAD')
+        waiter = spawn(req.get_response, controller)
+        sleep(0)
+        self.assertEqual(1, controller.get_device_stats()['sda1']['waiting'])
+        limit.release()
+        self.assertEqual(404, waiter.wait().status_int)
+        stats = controller.get_device_stats()['sda1']
+        self.assertEqual(0, stats['waiting'])
+        self.assertEqual(0, stats['in_flight'])
+        self.assertEqual(0, stats['rejected'])
+        self.assertGreater(stats['wait_time'], 0)
+
+    def test_device_concurrency_slot_released_on_error(self):
+        controller = self._make_limited_controller(
+            device_concurrency='1', device_concurrency_timeout='0')
+        req = Request.blank('/sda1/p/a/c/o', method='HEAD')
+        with mock.patch.object(controller, 'HEAD',
+                               side_effect=Exception('boom')):
+            self.assertEqual(500, req.get_response(controller).status_int)
+        self.assertEqual(0, controller.device_limits['sda1'].in_flight)
+        self.assertEqual(404, req.get_response(controller).status_int)
+
+    def test_device_stats_dumped_to_recon(self):
+        controller = self._make_limited_controller(
+            device_concurrency='2', device_stats_interval='0')
+        rcache = os.path.join(self.tmpdir, 'object.recon')
+        stale = {'object_device_concurrency': {
+            '1': {'updated': 1, 'devices': {}},
+            '2': {'updated': time() + 100, 'devices': {}}}}
+        with open(rcache, 'w') as f:
+            json.dump(stale, f)
+        with mock.patch('swift.obj.server.os.getpid', return_value=1234):
+            req = Request.blank('/sdb1/p/a/c/o', method='HEAD')
+            self.assertEqual(507, req.get_response(controller).status_int)
+            req = Request.blank('/sda1/p/a/c/o', method='HEAD')
+            self.assertEqual(404, req.get_response(controller).status_int)
+            # the stats are dumped in the background, not by the request
+            with open(rcache) as f:
+                self.assertEqual(stale, json.load(f))
+            sleep(0)
+        with open(rcache) as f:
+            workers = json.load(f)['object_device_concurrency']
+        # the stale worker's stats are removed
+        self.assertEqual(['1234', '2'], sorted(workers))
+        # and the device that does not exist is not dumped
+        self.assertEqual(['sda1'], list(workers['1234']['devices']))
+        self.assertEqual(1, workers['1234']['devices']['sda1']['requests'])
+        self.assertEqual(2, workers['1234']['devices']['sda1']['limit'])
+
+    def test_metadata_cache_stats_dumped_to_recon(self):
+        controller = self._make_limited_controller(
+            metadata_cache_size='100', device_stats_interval='0')
+        self.assertEqual({'size': 0, 'max_size': 100, 'hits': 0, 'misses': 0,
+                          'evictions': 0, 'hit_ratio': 0},
+                         controller.get_metadata_cache_stats())
+        req = Request.blank('/sda1/p/a/c/o', method='HEAD')
+        with mock.patch('swift.obj.server.os.getpid', return_value=1234):
+            self.assertEqual(404, req.get_response(controller).status_int)
+            sleep(0)
+        rcache = os.path.join(self.tmpdir, 'object.recon')
+        with open(rcache) as f:
+            workers = json.load(f)['object_device_concurrency']
+        self.assertEqual({}, workers['1234']['devices'])
+        self.assertEqual(1, workers['1234']['metadata_cache']['misses'])
+        self.assertEqual(100, workers['1234']['metadata_cache']['max_size'])
+
+    def test_cache_policy_stats_dumped_to_recon(self):
+        controller = self._make_limited_controller(
+            hot_object_threshold='2', device_stats_interval='0')
+        self.assertIsNone(self.object_controller.get_cache_policy_stats())
+        req = Request.blank(
+            '/sda1/p/a/c/o', method='PUT', body=b'VERIFY',
+            headers={'X-Timestamp': normalize_timestamp(time()),
+                     'Content-Type': 'application/octet-stream'})
+        self.assertEqual(201, req.get_response(controller).status_int)
+        for _junk in range(3):
+            req = Request.blank('/sda1/p/a/c/o')
+            with mock.patch('swift.obj.server.os.getpid',
+                            return_value=1234):
+                resp = req.get_response(controller)
+                self.assertEqual(b'VERIFY', resp.body)
+                sleep(0)
+        rcache = os.path.join(self.tmpdir, 'object.recon')
+        with open(rcache) as f:
+            workers = json.load(f)['object_device_concurrency']
+        policy_stats = workers['1234']['cache_policy']
+        self.assertEqual(3, policy_stats['reads'])
+        self.assertEqual(2, policy_stats['hot_reads'])
+        self.assertEqual(1, policy_stats['promotions'])
+        self.assertEqual(6, policy_stats['hot_bytes'])
+
     def test_invalid_method_doesnt_exist(self):
         errbuf = StringIO()
         outbuf = StringIO()
@@ -5137,6 +5360,82 @@ class TestObjectController(unittest.TestCase):
             object_server.http_connect = orig_http_connect
             utils.HASH_PATH_PREFIX = _prefix
 
+    def _batched_async_updates(self, policy, statuses, updates):
+        conf = dict(self.conf, container_update_batching='true',
+                    container_update_batch_window='0.01')
+        controller = object_server.ObjectController(
+            conf, logger=debug_logger())
+        bodies = []
+
+        def capture_send(conn, data):
+            bodies.append(json.loads(data))
+
+        pool = GreenPool()
+        with mocked_http_conn(*statuses, give_send=capture_send) as fake_conn:
+            for host, obj in updates:
+                pool.spawn(
+                    controller.async_update, 'PUT', 'a', 'c', obj, host, '1',
+                    'sdc1', {'x-timestamp': '1', 'x-size': '0',
+                             'x-content-type': 'text/plain',
+                             'x-etag': 'x', 'x-trans-id': 'tx1',
+                             'X-Backend-Storage-Policy-Index': int(policy)},
+                    'sda1', policy)
+            pool.waitall()
+        return controller, fake_conn.requests, bodies
+
+    def test_async_update_batched(self):
+        policy = random.choice(list(POLICIES))
+        self._stage_tmp_dir(policy)
+        controller, requests, bodies = self._batched_async_updates(
+            policy, (204, 204), [('127.0.0.1:1234', 'o1'),
+                                 ('127.0.0.2:1234', 'o1'),
+                                 ('127.0.0.1:1234', 'o2'),
+                                 ('127.0.0.1:1234', 'o3')])
+        self.assertEqual(['MERGE', 'MERGE'],
+                         [req['method'] for req in requests])
+        self.assertEqual(['/sdc1/1/a/c'] * 2,
+                         [req['path'] for req in requests])
+        self.assertEqual('tx1', requests[0]['headers']['x-trans-id'])
+        self.assertEqual('application/json',
+                         requests[0]['headers']['Content-Type'])
+        by_ip = dict((req['ip'], body)
+                     for req, body in zip(requests, bodies))
+        self.assertEqual(['o1', 'o2', 'o3'],
+                         [update['obj'] for update in by_ip['127.0.0.1']])
+        self.assertEqual(['o1'],
+                         [update['obj'] for update in by_ip['127.0.0.2']])
+        update = by_ip['127.0.0.2'][0]
+        self.assertEqual('PUT', update['op'])
+        self.assertEqual('object-server %s' % os.getpid(),
+                         update['headers']['user-agent'])
+        self.assertEqual(int(policy), update['headers'][
+            'X-Backend-Storage-Policy-Index'])
+        self.assertEqual([1, 3], sorted(
+            controller.logger.log_dict['update_stats'][i][0][1]
+            for i in range(2)))
+        async_dir = os.path.join(self.testdir, 'sda1',
+                                 diskfile.get_async_dir(policy))
+        self.assertFalse(os.path.exists(async_dir))
+
+    def test_async_update_batch_failure_saves_each_update(self):
+        policy = random.choice(list(POLICIES))
+        self._stage_tmp_dir(policy)
+        controller, requests, bodies = self._batched_async_updates(
+            policy, (405, 204), [('127.0.0.1:1234', 'o1'),
+                                 ('127.0.0.1:1234', 'o2'),
+                                 ('127.0.0.2:1234', 'o1')])
+        # the batch of the first container replica fails
+        self.assertEqual(['127.0.0.1', '127.0.0.2'],
+                         [req['ip'] for req in requests])
+        self.assertEqual([2, 1], [len(body) for body in bodies])
+        self.assertEqual({'container_update_batch.failures': 1,
+                          'async_pendings': 2},
+                         controller.logger.get_increment_counts())
+        async_dir = os.path.join(self.testdir, 'sda1',
+                                 diskfile.get_async_dir(policy))
+        self.assertEqual(2, sum(len(files) for _junk, _junk, files in
+                                os.walk(async_dir)))
+
     def test_container_update_no_async_update(self):
         policy = random.choice(list(POLICIES))
         given_args = []
@@ -6592,6 +6891,32 @@ class TestObjectController(unittest.TestCase):
             tpool.execute = was_tpool_exe
             diskfile.DiskFileManager._get_hashes = was_get_hashes
 
+    def test_REPLICATE_hash_tree(self):
+        hashes = {'abc': 'a' * 32, 'abd': 'b' * 32, 'def': 'c' * 32}
+        root, groups = diskfile.get_hash_tree(hashes)
+        self.assertEqual(['ab', 'de'], sorted(groups))
+
+        def do_replicate(headers):
+            req = Request.blank('/sda1/p',
+                                environ={'REQUEST_METHOD': 'REPLICATE'},
+                                headers=headers)
+            with mock.patch.object(diskfile.DiskFileManager, '_get_hashes',
+                                   return_value=(0, dict(hashes))), \
+                    mock.patch('eventlet.tpool.execute',
+                               lambda func, *args, **kwargs: func(
+                                   *args, **kwargs)):
+                resp = req.get_response(self.object_controller)
+            self.assertEqual(resp.status_int, 200)
+            self.assertEqual(root, resp.headers['X-Backend-Hash-Tree-Root'])
+            return pickle.loads(resp.body)
+
+        self.assertEqual({}, do_replicate(
+            {'X-Backend-Hash-Tree-Root': root}))
+        self.assertEqual(groups, do_replicate(
+            {'X-Backend-Hash-Tree-Root': 'd' * 32}))
+        self.assertEqual({'abc': 'a' * 32, 'abd': 'b' * 32}, do_replicate(
+            {'X-Backend-Hash-Tree-Groups': 'ab-ff'}))
+
     def test_REPLICATE_timeout(self):
 
         def fake_get_hashes(*args, **kwargs):
@@ -8079,6 +8404,111 @@ class TestZeroCopy(unittest.TestCase):
         self.assertEqual(contents, '')
 
 
+@patch_policies
+class TestZeroCopyRanges(unittest.TestCase):
+    """Test the object server's zero-copy range GETs"""
+
+    def setUp(self):
+        skip_if_no_xattrs()
+        if not sendfile.available:
+            raise unittest.SkipTest("sendfile support is missing")
+
+        self.testdir = mkdtemp(suffix="obj_server_zero_copy_ranges")
+        mkdirs(os.path.join(self.testdir, 'sda1', 'tmp'))
+
+        conf = {'devices': self.testdir,
+                'mount_check': 'false',
+                'splice': 'yes',
+                'disk_chunk_size': '4096'}
+        self.object_controller = object_server.ObjectController(
+            conf, logger=debug_logger())
+
+        listener = listen_zero()
+        port = listener.getsockname()[1]
+        self.wsgi_greenlet = spawn(
+            wsgi.server, listener, self.object_controller, NullLogger())
+
+        self.http_conn = httplib.HTTPConnection('127.0.0.1', port)
+        self.http_conn.connect()
+
+        self.url_path = '/sda1/2100/a/c/o'
+        self.obj_contents = ''.join(
+            chr(ord('a') + i % 26) for i in range(4 * 1024 * 1024))
+        self.http_conn.request('PUT', self.url_path, self.obj_contents,
+                               {'X-Timestamp': '1402600322.52126',
+                                'Content-Type': 'application/test'})
+        response = self.http_conn.getresponse()
+        self.assertEqual(response.status, 201)
+        response.read()
+
+    def tearDown(self):
+        self.wsgi_greenlet.kill()
+        rmtree(self.testdir)
+
+    def _get(self, byte_range, zero_copy=True):
+        with mock.patch('swift.obj.diskfile.sendfile',
+                        side_effect=sendfile) as mock_sendfile:
+            self.http_conn.request('GET', self.url_path,
+                                   headers={'Range': byte_range})
+            response = self.http_conn.getresponse()
+            self.assertEqual(response.status, 206)
+            body = response.read()
+        self.assertEqual(zero_copy, mock_sendfile.called)
+        self.assertEqual(int(response.getheader('Content-Length')), len(body))
+        return response, body
+
+    def test_GET_range(self):
+        response, body = self._get('bytes=10-29')
+        self.assertEqual(self.obj_contents[10:30], body)
+        self.assertEqual('bytes 10-29/%d' % len(self.obj_contents),
+                         response.getheader('Content-Range'))
+
+        # large enough to fill the socket buffers
+        response, body = self._get('bytes=1-')
+        self.assertEqual(self.obj_contents[1:], body)
+
+    def test_GET_multiple_ranges(self):
+        response, body = self._get('bytes=5-9,100-199,-3000000')
+        content_type = response.getheader('Content-Type')
+        self.assertTrue(content_type.startswith(
+            'multipart/byteranges;boundary='))
+        boundary = content_type.split('=', 1)[1]
+        size = len(self.obj_contents)
+        ranges = [(5, 10), (100, 200), (size - 3000000, size)]
+
+        def sub_iter(start, stop):
+            yield self.obj_contents[start:stop]
+
+        self.assertEqual(''.join(multi_range_iterator(
+            ranges, 'application/test', boundary, size, sub_iter)), body)
+
+    def test_GET_ranges_from_start(self):
+        # reads from the start of the object are not sent with sendfile()
+        response, body = self._get('bytes=0-', zero_copy=False)
+        self.assertEqual(self.obj_contents, body)
+        response, body = self._get('bytes=0-9', zero_copy=False)
+        self.assertEqual(self.obj_contents[:10], body)
+        response, body = self._get('bytes=0-9,100-199', zero_copy=False)
+        self.assertIn(self.obj_contents[100:200], body)
+
+    def test_GET_range_from_start_quarantines_corrupt_object(self):
+        df = self.object_controller._diskfile_router[POLICIES.legacy] \
+            .get_diskfile('sda1', '2100', 'a', 'c', 'o',
+                          policy=POLICIES.legacy)
+        with df.open():
+            data_file = df._data_file
+        with open(data_file, 'r+b') as fp:
+            fp.write('X' * 10)
+
+        response, body = self._get('bytes=0-', zero_copy=False)
+        self.assertEqual('X' * 10 + self.obj_contents[10:], body)
+        self.assertFalse(os.path.exists(data_file))
+        self.http_conn.request('GET', self.url_path)
+        response = self.http_conn.getresponse()
+        self.assertEqual(response.status, 404)
+        response.read()
+
+
 class TestConfigOptionHandling(unittest.TestCase):
 
     def setUp(self):
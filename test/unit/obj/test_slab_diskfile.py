@@ -0,0 +1,411 @@
+# Copyright (c) 2010-2012 OpenStack Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for swift.obj.slab_diskfile"""
+
+import fcntl
+import os
+import unittest
+from hashlib import md5
+from shutil import rmtree
+from tempfile import mkdtemp
+
+import eventlet
+import mock
+
+from swift.common.exceptions import DiskFileDeleted, DiskFileNotExist, \
+    DiskFileQuarantined, LockTimeout
+from swift.common.storage_policy import POLICIES, StoragePolicy, \
+    PolicyError
+from swift.common import utils
+from swift.common.utils import mkdirs
+from swift.obj import diskfile, slab_diskfile
+from swift.obj.slab_diskfile import SLAB_VOLUME_FILE
+from test.unit import patch_policies, debug_logger, make_timestamp_iter, \
+    skip_if_no_xattrs
+
+
+@patch_policies([StoragePolicy(0, 'zero', is_default=True,
+                               diskfile_backend='slab'),
+                 StoragePolicy(1, 'one')])
+class TestSlabDiskFile(unittest.TestCase):
+
+    def setUp(self):
+        skip_if_no_xattrs()
+        self.tmpdir = mkdtemp()
+        self.devices = os.path.join(self.tmpdir, 'node')
+        mkdirs(os.path.join(self.devices, 'sda1'))
+        self.conf = {'devices': self.devices, 'mount_check': 'false',
+                     'slab_max_object_size': '1024'}
+        self.logger = debug_logger('test-slab')
+        self.df_router = diskfile.DiskFileRouter(self.conf, self.logger)
+        self.df_mgr = self.df_router[POLICIES[0]]
+        self.ts_iter = make_timestamp_iter()
+
+    def tearDown(self):
+        rmtree(self.tmpdir, ignore_errors=True)
+
+    def _get_diskfile(self, obj='o', policy=None, df_mgr=None):
+        policy = policy or POLICIES[0]
+        df_mgr = df_mgr or self.df_router[policy]
+        return df_mgr.get_diskfile('sda1', '0', 'a', 'c', obj, policy=policy)
+
+    def _put(self, df, data, timestamp=None, chunked=False, metadata=None):
+        timestamp = timestamp or next(self.ts_iter)
+        with df.create(size=None if chunked else len(data)) as writer:
+            writer.write(data)
+            md = {'ETag': md5(data).hexdigest(),
+                  'X-Timestamp': timestamp.internal,
+                  'Content-Length': str(len(data))}
+            md.update(metadata or {})
+            writer.put(md)
+        return timestamp
+
+    def _read(self, df):
+        with df.open():
+            metadata = df.get_metadata()
+            body = b''.join(df.reader())
+        return metadata, body
+
+    def test_router(self):
+        self.assertIsInstance(self.df_mgr,
+                              slab_diskfile.SlabDiskFileManager)
+        self.assertTrue(self.df_mgr.replicate_with_ssync)
+        self.assertIsInstance(self.df_router[POLICIES[1]],
+                              diskfile.DiskFileManager)
+        self.assertNotIsInstance(self.df_router[POLICIES[1]],
+                                 slab_diskfile.SlabDiskFileManager)
+        self.assertFalse(self.df_router[POLICIES[1]].replicate_with_ssync)
+        # managers of every backend share the device threadpools
+        self.assertIs(self.df_mgr.threadpools,
+                      self.df_router[POLICIES[1]].threadpools)
+
+    def test_router_unknown_backend(self):
+        with patch_policies([StoragePolicy(0, 'zero', is_default=True,
+                                           diskfile_backend='bogus')]):
+            with self.assertRaises(PolicyError) as cm:
+                diskfile.DiskFileRouter(self.conf, self.logger)
+        self.assertIn("No diskfile_backend 'bogus'", str(cm.exception))
+
+    def test_put_small_object(self):
+        df = self._get_diskfile()
+        ts = self._put(df, b'small', metadata={'X-Object-Meta-Color': 'red'})
+        # no object dir, the object is in its suffix's volume
+        self.assertFalse(os.path.exists(df._datadir))
+        suffix_path = os.path.dirname(df._datadir)
+        self.assertEqual([SLAB_VOLUME_FILE], os.listdir(suffix_path))
+        metadata, body = self._read(self._get_diskfile())
+        self.assertEqual(b'small', body)
+        self.assertEqual('red', metadata['X-Object-Meta-Color'])
+        self.assertEqual('/a/c/o', metadata['name'])
+        self.assertEqual(ts.internal, metadata['X-Timestamp'])
+
+    def test_put_group_commit(self):
+        conf = dict(self.conf, group_commit='true', group_commit_window='0')
+        df_mgr = diskfile.DiskFileRouter(conf, self.logger)[POLICIES[0]]
+        df = self._get_diskfile(df_mgr=df_mgr)
+        volume_path = os.path.join(os.path.dirname(df._datadir),
+                                   SLAB_VOLUME_FILE)
+        committed = []
+
+        def fake_commit(fds=(), paths=()):
+            # the volume is synced through the descriptor it was written
+            # with, and the volume's lock is not held meanwhile
+            self.assertFalse(paths)
+            committed.extend(os.fstat(fd).st_ino for fd in fds)
+            with open(volume_path, 'rb') as f:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+        committer = df_mgr.get_group_committer(df._device_path)
+        with mock.patch.object(committer, 'commit', fake_commit), \
+                mock.patch('swift.obj.slab_diskfile.fdatasync') as mock_sync:
+            self._put(df, b'small')
+        self.assertFalse(mock_sync.called)
+        self.assertEqual([os.stat(volume_path).st_ino], committed)
+        self.assertEqual(b'small', self._read(self._get_diskfile())[1])
+
+    def test_binary_metadata_format(self):
+        self.conf['metadata_format'] = 'binary'
+        self.df_router = diskfile.DiskFileRouter(self.conf, self.logger)
+        df = self._get_diskfile()
+        self._put(df, b'small', metadata={'X-Object-Meta-Color': 'red'})
+        volume = self.df_router[POLICIES[0]].get_volume(
+            os.path.dirname(df._datadir))
+        with open(volume.path, 'rb') as f:
+            self.assertIn(diskfile.METADATA_BIN_MAGIC, f.read())
+        metadata, body = self._read(self._get_diskfile())
+        self.assertEqual(b'small', body)
+        self.assertEqual('red', metadata['X-Object-Meta-Color'])
+
+    def test_put_large_or_unknown_size_object(self):
+        data = b'x' * 2048
+        df = self._get_diskfile()
+        ts = self._put(df, data)
+        self.assertEqual([ts.internal + '.data'], os.listdir(df._datadir))
+        self.assertEqual(data, self._read(self._get_diskfile())[1])
+
+        df = self._get_diskfile(obj='o2')
+        ts = self._put(df, b'chunked', chunked=True)
+        self.assertEqual([ts.internal + '.data'], os.listdir(df._datadir))
+        self.assertEqual(b'chunked', self._read(self._get_diskfile('o2'))[1])
+
+    def test_put_while_increasing_part_power(self):
+        df = self.df_mgr.get_diskfile('sda1', '0', 'a', 'c', 'o',
+                                      policy=POLICIES[0], next_part_power=11)
+        timestamp = self._put(df, b'small')
+        # the object is written as a file, which is linked into its next
+        # partition, rather than to a volume
+        self.assertFalse(os.path.exists(os.path.join(
+            os.path.dirname(df._datadir), SLAB_VOLUME_FILE)))
+        data_file = os.path.join(df._datadir, timestamp.internal + '.data')
+        self.assertTrue(os.path.isfile(data_file))
+        self.assertEqual(os.stat(data_file).st_ino, os.stat(
+            utils.replace_partition_in_path(data_file, 11)).st_ino)
+        self.assertEqual(b'small', self._read(self._get_diskfile())[1])
+
+    def test_overwrite_delete_and_post(self):
+        df = self._get_diskfile()
+        self._put(df, b'one')
+        self._put(self._get_diskfile(), b'two')
+        self.assertEqual(b'two', self._read(self._get_diskfile())[1])
+
+        ts = next(self.ts_iter)
+        df = self._get_diskfile()
+        df.write_metadata({'X-Timestamp': ts.internal,
+                           'X-Object-Meta-Shape': 'square'})
+        metadata, body = self._read(self._get_diskfile())
+        self.assertEqual(b'two', body)
+        self.assertEqual('square', metadata['X-Object-Meta-Shape'])
+
+        ts = next(self.ts_iter)
+        self._get_diskfile().delete(ts)
+        with self.assertRaises(DiskFileDeleted) as cm:
+            self._get_diskfile().open()
+        self.assertEqual(ts, cm.exception.timestamp)
+        # the older files were all cleaned up
+        volume = self.df_mgr.get_volume(os.path.dirname(df._datadir))
+        self.assertEqual({ts.internal + '.ts'},
+                         set(volume.get_files(os.path.basename(df._datadir))))
+        self.assertFalse(os.path.exists(df._datadir))
+
+    def test_volume_shared_between_processes(self):
+        df = self._get_diskfile()
+        self._put(df, b'first')
+        # another process, with its own index of the volume
+        other_mgr = slab_diskfile.SlabDiskFileManager(self.conf, self.logger)
+        self.assertEqual(b'first', self._read(
+            self._get_diskfile(df_mgr=other_mgr))[1])
+        self._put(self._get_diskfile(df_mgr=other_mgr), b'second')
+        self.assertEqual(b'second', self._read(self._get_diskfile())[1])
+
+    def test_locked_volume_does_not_block_hub(self):
+        df = self._get_diskfile()
+        self._put(df, b'data')
+        volume = self.df_mgr.get_volume(os.path.dirname(df._datadir))
+        ticks = []
+
+        def tick():
+            while True:
+                ticks.append(1)
+                eventlet.sleep(0.01)
+
+        # another process appending to the volume holds its lock
+        with open(volume.path, 'rb') as other:
+            fcntl.flock(other.fileno(), fcntl.LOCK_EX)
+            ticker = eventlet.spawn(tick)
+            try:
+                with mock.patch(
+                        'swift.obj.slab_diskfile.SLAB_LOCK_TIMEOUT', 0.1):
+                    with self.assertRaises(LockTimeout):
+                        volume.unlink(os.path.basename(df._datadir),
+                                      ['junk.meta'])
+            finally:
+                ticker.kill()
+        # other greenthreads ran while the lock was waited for
+        self.assertGreater(len(ticks), 2)
+        # and the lock is acquired once it is released
+        volume.unlink(os.path.basename(df._datadir), ['junk.meta'])
+
+    def test_torn_append_is_truncated(self):
+        df = self._get_diskfile()
+        self._put(df, b'whole')
+        volume_path = os.path.join(os.path.dirname(df._datadir),
+                                   SLAB_VOLUME_FILE)
+        size = os.path.getsize(volume_path)
+        record = slab_diskfile.pack_record(
+            slab_diskfile.SLAB_PUT, os.path.basename(df._datadir),
+            next(self.ts_iter).internal + '.data', {'name': '/a/c/o'},
+            b'torn')
+        with open(volume_path, 'ab') as f:
+            f.write(record[:-2])
+        # the incomplete record is ignored...
+        self.assertEqual(b'whole', self._read(self._get_diskfile())[1])
+        # ... and truncated by the next append
+        self._put(self._get_diskfile(), b'next')
+        self.assertEqual(b'next', self._read(self._get_diskfile())[1])
+        warnings = self.logger.get_lines_for_level('warning')
+        self.assertEqual(1, len(warnings))
+        self.assertIn('Truncating %d bytes at offset %d' % (
+            len(record) - 2, size), warnings[0])
+        volume = slab_diskfile.SlabVolume(volume_path, self.logger)
+        self.assertTrue(volume.refresh())
+        self.assertEqual(os.path.getsize(volume_path), volume.size)
+
+    def test_hashes_match_fs_backend(self):
+        fs_mgr = self.df_router[POLICIES[1]]
+        objs = ('o%d' % i for i in range(8))
+        for obj in objs:
+            ts = next(self.ts_iter)
+            for policy in POLICIES:
+                self._put(self._get_diskfile(obj, policy), b'data', ts)
+            if obj in ('o1', 'o2'):
+                ts = next(self.ts_iter)
+                for policy in POLICIES:
+                    self._get_diskfile(obj, policy).delete(ts)
+            if obj == 'o3':
+                ts = next(self.ts_iter)
+                for policy in POLICIES:
+                    self._get_diskfile(obj, policy).write_metadata(
+                        {'X-Timestamp': ts.internal})
+        slab_hashes = self.df_mgr.get_hashes('sda1', '0', [], POLICIES[0])
+        fs_hashes = fs_mgr.get_hashes('sda1', '0', [], POLICIES[1])
+        self.assertTrue(slab_hashes)
+        self.assertEqual(fs_hashes, slab_hashes)
+        self.assertEqual(
+            sorted(fs_mgr.yield_hashes('sda1', '0', POLICIES[1])),
+            sorted(self.df_mgr.yield_hashes('sda1', '0', POLICIES[0])))
+
+    def test_reclaim_compacts_and_removes_volume(self):
+        df = self._get_diskfile()
+        self._put(df, b'x' * 1000)
+        suffix_path = os.path.dirname(df._datadir)
+        volume_path = os.path.join(suffix_path, SLAB_VOLUME_FILE)
+        for _junk in range(100):
+            self._put(self._get_diskfile(), b'x' * 1000)
+        # obsolete data files are unlinked, but stay in the volume until it
+        # is compacted
+        self.assertGreater(os.path.getsize(volume_path), 100000)
+        self.df_mgr.get_hashes('sda1', '0', [os.path.basename(suffix_path)],
+                               POLICIES[0])
+        self.assertLess(os.path.getsize(volume_path), 2000)
+        self.assertEqual({'slab.compactions': 1},
+                         self.logger.get_increment_counts())
+        self.assertEqual(b'x' * 1000, self._read(self._get_diskfile())[1])
+
+        # once the tombstone is reclaimed the volume and suffix go too
+        ts = next(self.ts_iter)
+        self._get_diskfile().delete(ts)
+        self.df_mgr.reclaim_age = 0
+        with mock.patch('time.time', return_value=float(ts) + 1):
+            hashes = self.df_mgr.get_hashes(
+                'sda1', '0', [os.path.basename(suffix_path)], POLICIES[0])
+        self.assertEqual({}, hashes)
+        self.assertFalse(os.path.exists(suffix_path))
+
+    def test_audit_locations_and_get_diskfile_from_hash(self):
+        small = self._get_diskfile('small')
+        self._put(small, b'small')
+        large = self._get_diskfile('large')
+        self._put(large, b'L' * 2048)
+        locations = list(self.df_mgr.object_audit_location_generator(
+            POLICIES[0]))
+        self.assertEqual(sorted([small._datadir, large._datadir]),
+                         sorted(loc.path for loc in locations))
+        for loc in locations:
+            df = self.df_mgr.get_diskfile_from_audit_location(loc)
+            with df.open():
+                self.assertIn(df.get_metadata()['name'],
+                              ('/a/c/small', '/a/c/large'))
+        df = self.df_mgr.get_diskfile_from_hash(
+            'sda1', '0', os.path.basename(small._datadir), POLICIES[0])
+        self.assertEqual(b'small', self._read(df)[1])
+        with self.assertRaises(DiskFileNotExist):
+            self.df_mgr.get_diskfile_from_hash(
+                'sda1', '0', 'f' * 32, POLICIES[0])
+
+    def test_range_read(self):
+        df = self._get_diskfile()
+        self._put(df, b'0123456789')
+        df = self._get_diskfile()
+        with df.open():
+            reader = df.reader()
+            self.assertFalse(reader.can_zero_copy_send())
+            self.assertEqual(b'2345', b''.join(reader.app_iter_range(2, 6)))
+        df = self._get_diskfile()
+        with df.open():
+            reader = df.reader()
+            with mock.patch.object(slab_diskfile, 'drop_buffer_cache') as \
+                    mock_drop:
+                self.assertEqual(b'0123456789', b''.join(reader))
+        # the cache of the record's data is dropped
+        fd, offset, length = mock_drop.call_args[0]
+        self.assertEqual(reader._fp, None)
+        self.assertGreater(offset, slab_diskfile.SLAB_RECORD_HEADER.size)
+        self.assertEqual(10, length)
+
+    def test_readahead(self):
+        self.conf.update({'readahead_size': '4', 'disk_chunk_size': '2'})
+        self.df_router = diskfile.DiskFileRouter(self.conf, self.logger)
+        df = self._get_diskfile()
+        self._put(df, b'0123456789')
+        df = self._get_diskfile()
+        with df.open():
+            reader = df.reader()
+            with mock.patch.object(slab_diskfile, 'readahead_buffer_cache') \
+                    as mock_readahead:
+                self.assertEqual(b'0123456789', b''.join(reader))
+        # the offsets read ahead are those of the record's data
+        data_offset = mock_readahead.call_args_list[0][0][1] - 4
+        self.assertGreater(data_offset, slab_diskfile.SLAB_RECORD_HEADER.size)
+        self.assertEqual([mock.call(mock.ANY, data_offset + 4, 4),
+                          mock.call(mock.ANY, data_offset + 8, 2)],
+                         mock_readahead.call_args_list)
+
+    def test_quarantine(self):
+        df = self._get_diskfile()
+        ts = self._put(df, b'corrupt', metadata={'ETag': 'bad'})
+        df = self._get_diskfile()
+        with df.open():
+            body = b''.join(df.reader())
+        self.assertEqual(b'corrupt', body)
+        self.assertRaises(DiskFileNotExist, self._get_diskfile().open)
+        quarantined = os.path.join(
+            self.devices, 'sda1', 'quarantined', 'objects',
+            os.path.basename(df._datadir))
+        self.assertEqual([ts.internal + '.data'], os.listdir(quarantined))
+        with open(os.path.join(quarantined, ts.internal + '.data')) as f:
+            self.assertEqual(b'corrupt', f.read())
+        self.assertEqual('bad', diskfile.read_metadata(
+            os.path.join(quarantined, ts.internal + '.data'))['ETag'])
+
+    def test_corrupt_metadata_is_quarantined(self):
+        df = self._get_diskfile()
+        self._put(df, b'data')
+        volume = self.df_mgr.get_volume(os.path.dirname(df._datadir))
+        record = list(volume.get_files(
+            os.path.basename(df._datadir)).values())[0]
+        # the scan of the volume has verified the crc already; corrupt the
+        # metadata behind its back
+        with open(volume.path, 'r+b') as f:
+            f.seek(record.offset + slab_diskfile.SLAB_RECORD_HEADER.size +
+                   record.name_len)
+            f.write(b'X')
+        with self.assertRaises(DiskFileQuarantined) as cm:
+            self._get_diskfile().open()
+        self.assertIn('Metadata checksum mismatch', str(cm.exception))
+
+
+if __name__ == '__main__':
+    unittest.main()
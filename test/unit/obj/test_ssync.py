@@ -26,7 +26,9 @@ from six.moves import urllib
 from swift.common.exceptions import DiskFileNotExist, DiskFileError, \
     DiskFileDeleted, DiskFileExpired
 from swift.common import utils
+from swift.common.bufferedhttp import HTTPConnectionPool
 from swift.common.storage_policy import POLICIES, EC_POLICY
+from swift.common.swob import HTTPServiceUnavailable
 from swift.common.utils import Timestamp
 from swift.obj import ssync_sender, server
 from swift.obj.reconstructor import RebuildingECDiskFileStream, \
@@ -1201,6 +1203,249 @@ class TestSsyncReplication(TestBaseSsync):
         #    TOTAL =   80
         self.assertEqual(80, trace.get('readline_bytes'))
 
+    def _setup_pipelined_sync(self, tx_window, rx_window):
+        self.daemon.ssync_pipeline_window = tx_window
+        self.rx_controller.ssync_pipeline_window = rx_window
+        policy = POLICIES.default
+        tx_df_mgr = self.daemon._df_router[policy]
+        tx_objs = {}
+        for i in range(5):
+            name = 'o%d' % i
+            tx_objs[name] = self._create_ondisk_files(
+                tx_df_mgr, name, policy, next(self.ts_iter))
+        # a PUT and a POST for o5
+        tx_objs['o5'] = self._create_ondisk_files(
+            tx_df_mgr, 'o5', policy, next(self.ts_iter))
+        tx_objs['o5'][0].write_metadata(
+            {'X-Timestamp': next(self.ts_iter).internal,
+             'X-Object-Meta-Test': 'o5'})
+        tx_tombstones = {'o6': self._create_ondisk_files(
+            tx_df_mgr, 'o6', policy, next(self.ts_iter))}
+        tx_tombstones['o6'][0].delete(next(self.ts_iter))
+        suffixes = set()
+        for diskfiles in list(tx_objs.values()) + list(tx_tombstones.values()):
+            for df in diskfiles:
+                suffixes.add(os.path.basename(os.path.dirname(df._datadir)))
+        job = {'device': self.device,
+               'partition': self.partition,
+               'policy': policy}
+        node = dict(self.rx_node)
+        node.update({'index': 0})
+        sender = ssync_sender.Sender(self.daemon, node, job, suffixes)
+        sender.connect, trace = self.make_connect_wrapper(sender)
+        return sender, trace, tx_objs, tx_tombstones
+
+    def test_sync_pipelined(self):
+        sender, trace, tx_objs, tx_tombstones = self._setup_pipelined_sync(
+            3, 4)
+        success, in_sync_objs = sender()
+        self.assertTrue(success)
+        self.assertEqual(7, len(in_sync_objs))
+        self.assertEqual(3, sender.pipeline_window)
+        self.assertIn(('rx', ':MISSING_CHECK: START window=3'),
+                      trace['messages'])
+
+        # the sender never had more than 3 subrequests unacknowledged, and
+        # each was acknowledged
+        unacked = set()
+        max_unacked = 0
+        for direction, msg in trace['messages']:
+            first_line = msg.split('\r\n', 1)[0]
+            if direction == 'tx' and first_line.startswith(
+                    ('PUT ', 'POST ', 'DELETE ')):
+                unacked.add(tuple(first_line.split()))
+                max_unacked = max(max_unacked, len(unacked))
+            elif direction == 'rx' and msg.startswith(':ACK: '):
+                status, method, path = msg.split()[1:]
+                # the tombstone's DELETE finds nothing to delete
+                self.assertEqual(
+                    {'PUT': '201', 'POST': '202', 'DELETE': '404'}[method],
+                    status)
+                unacked.remove((method, path))
+        self.assertFalse(unacked)
+        self.assertEqual(3, max_unacked)
+        self.assertEqual(('rx', ':UPDATES: END'), trace['messages'][-1])
+
+        self._verify_ondisk_files(tx_objs, POLICIES.default)
+        self._verify_tombstones(tx_tombstones, POLICIES.default)
+        rx_df = self._open_rx_diskfile('o5', POLICIES.default)
+        self.assertEqual('o5', rx_df.get_metadata()['X-Object-Meta-Test'])
+
+    def test_sync_pipeline_not_agreed(self):
+        sender, trace, tx_objs, tx_tombstones = self._setup_pipelined_sync(
+            3, 1)
+        success, in_sync_objs = sender()
+        self.assertTrue(success)
+        self.assertEqual(1, sender.pipeline_window)
+        results = self._analyze_trace(trace)
+        self.assertEqual(8, len(results['tx_updates']))
+        self.assertFalse(results['rx_updates'])
+        self._verify_ondisk_files(tx_objs, POLICIES.default)
+        self._verify_tombstones(tx_tombstones, POLICIES.default)
+
+    def test_sync_pipelined_subrequest_failure(self):
+        sender, trace, tx_objs, tx_tombstones = self._setup_pipelined_sync(
+            2, 2)
+        orig_put = self.rx_controller.PUT
+
+        def put(req):
+            if req.path.endswith('/o2'):
+                return HTTPServiceUnavailable(request=req)
+            return orig_put(req)
+        put.publicly_accessible = True
+
+        with mock.patch.object(self.rx_controller, 'PUT', put):
+            success, in_sync_objs = sender()
+        self.assertFalse(success)
+        self.assertEqual({}, in_sync_objs)
+        self.assertEqual(1, sender.failures)
+        self.assertIn(('rx', ':ACK: 503 PUT /a/c/o2'), trace['messages'])
+        warnings = self.daemon.logger.logger.get_lines_for_level('warning')
+        self.assertEqual(1, len(warnings))
+        self.assertIn('failed with 503: PUT /a/c/o2', warnings[0])
+        # the other updates were all applied
+        self.assertRaises(DiskFileNotExist, self._open_rx_diskfile,
+                          'o2', POLICIES.default)
+        del tx_objs['o2']
+        self._verify_ondisk_files(tx_objs, POLICIES.default)
+        self._verify_tombstones(tx_tombstones, POLICIES.default)
+
+    def test_sync_pooled_connection(self):
+        pool = self.daemon.conn_pool = HTTPConnectionPool(
+            self.daemon.logger, max_idle=1)
+        policy = POLICIES.default
+        tx_df_mgr = self.daemon._df_router[policy]
+        job = {'device': self.device,
+               'partition': self.partition,
+               'policy': policy}
+        node = dict(self.rx_node)
+        node.update({'index': 0})
+        connections = []
+        for name in ('o1', 'o2'):
+            tx_objs = {name: self._create_ondisk_files(
+                tx_df_mgr, name, policy, next(self.ts_iter))}
+            suffixes = set([os.path.basename(os.path.dirname(
+                tx_objs[name][0]._datadir))])
+            sender = ssync_sender.Sender(self.daemon, node, job, suffixes)
+            success, in_sync_objs = sender()
+            self.assertTrue(success)
+            self.assertEqual(1, len(in_sync_objs))
+            self._verify_ondisk_files(tx_objs, policy)
+            connections.append(sender.connection)
+        # the second SSYNC request, and then a REPLICATE request, reused the
+        # connection of the first
+        conn = pool.http_connect(
+            self.rx_ip, self.rx_port, self.device, self.partition,
+            'REPLICATE', '', headers={
+                'X-Backend-Storage-Policy-Index': int(policy)})
+        resp = conn.getresponse()
+        self.assertEqual(200, resp.status)
+        resp.read()
+        self.assertIs(connections[0], connections[1])
+        self.assertIs(connections[0], conn)
+        self.assertEqual((2, 1, 0), (pool.hits, pool.misses, pool.retries))
+        self.assertEqual(1, len(pool.idle[
+            self.rx_ip, self.rx_port, self.device]))
+        pool.close()
+
+    def _setup_reconcile_sync(self, tx_count, rx_count, ratio):
+        # the receiver already has the first rx_count of the sender's objects
+        # and one that the sender does not have; the timestamps are fixed so
+        # that the keys, and whether a table can be decoded, are too
+        self.daemon.ssync_reconcile_ratio = ratio
+        ts_iter = (Timestamp(t) for t in itertools.count(1500000000))
+        policy = POLICIES.default
+        tx_df_mgr = self.daemon._df_router[policy]
+        rx_df_mgr = self.rx_controller._diskfile_router[policy]
+        tx_objs = {}
+        for i in range(tx_count):
+            name = 'o%d' % i
+            timestamp = next(ts_iter)
+            tx_objs[name] = self._create_ondisk_files(
+                tx_df_mgr, name, policy, timestamp)
+            if i < rx_count:
+                self._create_ondisk_files(rx_df_mgr, name, policy, timestamp)
+        rx_only = self._create_ondisk_files(
+            rx_df_mgr, 'rx_only', policy, next(ts_iter))
+        suffixes = set()
+        for diskfiles in list(tx_objs.values()) + [rx_only]:
+            for df in diskfiles:
+                suffixes.add(os.path.basename(os.path.dirname(df._datadir)))
+        job = {'device': self.device,
+               'partition': self.partition,
+               'policy': policy}
+        node = dict(self.rx_node)
+        node.update({'index': 0})
+        sender = ssync_sender.Sender(self.daemon, node, job, suffixes)
+        sender.connect, trace = self.make_connect_wrapper(sender)
+        return sender, trace, tx_objs
+
+    def _get_tx_missing_lines(self, trace):
+        messages = trace['messages']
+        start = messages.index(('tx', ':MISSING_CHECK: START'))
+        end = messages.index(('tx', ':MISSING_CHECK: END'))
+        return [msg for _junk, msg in messages[start + 1:end]]
+
+    def _get_rx_reconcile_results(self, trace):
+        return [msg for direction, msg in trace['messages']
+                if direction == 'rx' and msg in (
+                    ':RECONCILE: END', ':RECONCILE: FAILED')]
+
+    def test_sync_reconciled(self):
+        sender, trace, tx_objs = self._setup_reconcile_sync(40, 38, 0.25)
+        with mock.patch('swift.obj.ssync_sender.RECONCILE_MIN_CELLS', 4):
+            success, in_sync_objs = sender()
+        self.assertTrue(success)
+        self.assertEqual(40, len(in_sync_objs))
+        self.assertEqual([':RECONCILE: END'],
+                         self._get_rx_reconcile_results(trace))
+        # only the objects that the receiver was missing were listed
+        missing = self._get_tx_missing_lines(trace)
+        self.assertEqual(
+            sorted(os.path.basename(tx_objs[name][0]._datadir)
+                   for name in ('o38', 'o39')),
+            sorted(line.split()[0] for line in missing))
+        self._verify_ondisk_files(tx_objs, POLICIES.default)
+
+    def test_sync_reconcile_retried(self):
+        # the first table is too small for the difference but the larger
+        # one sent next is not
+        sender, trace, tx_objs = self._setup_reconcile_sync(80, 70, 0.1)
+        with mock.patch('swift.obj.ssync_sender.RECONCILE_MIN_CELLS', 4):
+            success, in_sync_objs = sender()
+        self.assertTrue(success)
+        self.assertEqual(80, len(in_sync_objs))
+        self.assertEqual([':RECONCILE: FAILED', ':RECONCILE: END'],
+                         self._get_rx_reconcile_results(trace))
+        missing = self._get_tx_missing_lines(trace)
+        self.assertEqual(
+            sorted(os.path.basename(tx_objs['o%d' % i][0]._datadir)
+                   for i in range(70, 80)),
+            sorted(line.split()[0] for line in missing))
+        self._verify_ondisk_files(tx_objs, POLICIES.default)
+
+    def test_sync_reconcile_failed(self):
+        # too few cells for the receiver to list the difference, even after
+        # a retry
+        sender, trace, tx_objs = self._setup_reconcile_sync(80, 0, 0.1)
+        with mock.patch('swift.obj.ssync_sender.RECONCILE_MIN_CELLS', 4):
+            success, in_sync_objs = sender()
+        self.assertTrue(success)
+        self.assertEqual(80, len(in_sync_objs))
+        self.assertEqual([':RECONCILE: FAILED', ':RECONCILE: FAILED'],
+                         self._get_rx_reconcile_results(trace))
+        self.assertEqual(80, len(self._get_tx_missing_lines(trace)))
+        self._verify_ondisk_files(tx_objs, POLICIES.default)
+
+    def test_sync_reconcile_small_partition(self):
+        sender, trace, tx_objs = self._setup_reconcile_sync(40, 38, 0.25)
+        success, in_sync_objs = sender()
+        self.assertTrue(success)
+        self.assertEqual(40, len(in_sync_objs))
+        self.assertNotIn(('tx', ':RECONCILE: START'), trace['messages'])
+        self.assertEqual(40, len(self._get_tx_missing_lines(trace)))
+        self._verify_ondisk_files(tx_objs, POLICIES.default)
+
     def test_meta_file_sync(self):
         policy = POLICIES.default
         rx_node_index = 0
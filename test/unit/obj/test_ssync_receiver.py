@@ -13,6 +13,7 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import binascii
 import os
 import shutil
 import tempfile
@@ -25,9 +26,11 @@ import six
 from swift.common import bufferedhttp
 from swift.common import exceptions
 from swift.common import swob
+from swift.common.iblt import IBLT
 from swift.common.storage_policy import POLICIES
 from swift.common import utils
 from swift.common.swob import HTTPException
+from swift.common.utils import Timestamp
 from swift.obj import diskfile
 from swift.obj import server
 from swift.obj import ssync_receiver, ssync_sender
@@ -1955,6 +1958,197 @@ class TestReceiver(unittest.TestCase):
         self.assertEqual(req.read_body, '1')
         self.assertEqual(_requests, [])
 
+    def _pipelined_request(self, window):
+        class _IgnoreReadlineHint(six.StringIO):
+
+            def readline(self, hint=-1):
+                return six.StringIO.readline(self)
+
+        req = swob.Request.blank(
+            '/device/partition',
+            environ={'REQUEST_METHOD': 'SSYNC'},
+            headers={'X-Backend-Ssync-Pipeline-Window': window},
+            body=':MISSING_CHECK: START\r\n:MISSING_CHECK: END\r\n'
+                 ':UPDATES: START\r\n'
+                 'PUT /a/c/o1\r\n'
+                 'Content-Length: 3\r\n'
+                 'X-Timestamp: 1364456113.00001\r\n'
+                 '\r\n'
+                 '123'
+                 'PUT /a/c/o2\r\n'
+                 'Content-Length: 1\r\n'
+                 'X-Timestamp: 1364456113.00002\r\n'
+                 '\r\n'
+                 '1'
+                 'POST /a/c/o2\r\n'
+                 'X-Timestamp: 1364456113.00003\r\n'
+                 '\r\n'
+                 ':UPDATES: END\r\n')
+        req.environ['wsgi.input'] = _IgnoreReadlineHint(req.body)
+        return req
+
+    def test_UPDATES_pipelined(self):
+        _requests = []
+
+        @server.public
+        def _PUT(request):
+            _requests.append(request)
+            if request.path.endswith('/o1'):
+                # fail without reading all the body
+                request.read_body = request.environ['wsgi.input'].read(2)
+                return swob.HTTPInternalServerError()
+            request.read_body = request.environ['wsgi.input'].read()
+            return swob.HTTPCreated()
+
+        @server.public
+        def _POST(request):
+            _requests.append(request)
+            return swob.HTTPAccepted()
+
+        self.controller.PUT = _PUT
+        self.controller.POST = _POST
+        self.controller.network_chunk_size = 2
+        self.controller.ssync_pipeline_window = 4
+        self.controller.logger = mock.MagicMock()
+        resp = self._pipelined_request('2').get_response(self.controller)
+        self.assertEqual(
+            self.body_lines(resp.body),
+            [':MISSING_CHECK: START window=2', ':MISSING_CHECK: END',
+             ':UPDATES: START',
+             ':ACK: 500 PUT /a/c/o1',
+             ':ACK: 201 PUT /a/c/o2',
+             ':ACK: 202 POST /a/c/o2',
+             ':UPDATES: END'])
+        self.assertEqual(resp.status_int, 200)
+        self.assertFalse(self.controller.logger.exception.called)
+        self.assertFalse(self.controller.logger.error.called)
+        self.assertEqual(1, self.controller.logger.warning.call_count)
+        self.assertEqual(
+            [('PUT', '/device/partition/a/c/o1', '12'),
+             ('PUT', '/device/partition/a/c/o2', '1'),
+             ('POST', '/device/partition/a/c/o2', None)],
+            [(req.method, req.path, getattr(req, 'read_body', None))
+             for req in _requests])
+
+        # updates are not pipelined unless the receiver allows it
+        del _requests[:]
+        self.controller.ssync_pipeline_window = 1
+        resp = self._pipelined_request('2').get_response(self.controller)
+        self.assertEqual(
+            self.body_lines(resp.body),
+            [':MISSING_CHECK: START', ':MISSING_CHECK: END',
+             ":ERROR: 500 'ERROR: With :UPDATES: 1 failures to 2 successes'"])
+        self.assertEqual(3, len(_requests))
+
+    def test_SSYNC_invalid_pipeline_window(self):
+        self.controller.ssync_pipeline_window = 4
+        resp = self._pipelined_request('many').get_response(self.controller)
+        self.assertEqual(resp.status_int, 400)
+        self.assertIn("Invalid X-Backend-Ssync-Pipeline-Window 'many'",
+                      resp.body)
+
+    def _reconcile_body(self, entries, cells=30):
+        table = IBLT(cells)
+        for object_hash, timestamp in entries:
+            table.insert(ssync_sender.reconcile_key(
+                object_hash, {'ts_data': Timestamp(timestamp)}))
+        return (':RECONCILE: START\r\n'
+                'suffixes %s %s\r\n'
+                'table %s\r\n'
+                ':RECONCILE: END\r\n' % (
+                    self.hash1[-3:], self.hash2[-3:], table.to_string()))
+
+    def test_MISSING_CHECK_reconciled(self):
+        object_dir = utils.storage_directory(
+            os.path.join(self.testdir, 'sda1',
+                         diskfile.get_data_dir(POLICIES[0])),
+            '1', self.hash1)
+        utils.mkdirs(object_dir)
+        with open(os.path.join(object_dir, self.ts1 + '.data'), 'w+') as fp:
+            fp.write('1')
+            fp.flush()
+            self.metadata1['Content-Length'] = '1'
+            diskfile.write_metadata(fp, self.metadata1)
+
+        self.controller.logger = mock.MagicMock()
+        req = swob.Request.blank(
+            '/sda1/1',
+            environ={'REQUEST_METHOD': 'SSYNC'},
+            body=self._reconcile_body(
+                [(self.hash1, self.ts1), (self.hash2, self.ts2)]) +
+            ':MISSING_CHECK: START\r\n' +
+            self.hash2 + ' ' + self.ts2 + '\r\n'
+            ':MISSING_CHECK: END\r\n'
+            ':UPDATES: START\r\n:UPDATES: END\r\n')
+        resp = req.get_response(self.controller)
+        self.assertEqual('iblt', resp.headers['X-Backend-Ssync-Reconcile'])
+        self.assertEqual(
+            self.body_lines(resp.body),
+            [':RECONCILE: START',
+             binascii.hexlify(ssync_sender.reconcile_key(
+                 self.hash2, {'ts_data': Timestamp(self.ts2)})),
+             ':RECONCILE: END',
+             ':MISSING_CHECK: START',
+             self.hash2 + ' dm',
+             ':MISSING_CHECK: END',
+             ':UPDATES: START', ':UPDATES: END'])
+        self.assertEqual(resp.status_int, 200)
+        self.assertFalse(self.controller.logger.error.called)
+        self.assertFalse(self.controller.logger.exception.called)
+
+    def test_MISSING_CHECK_reconcile_failed(self):
+        entries = [('%032x' % i, self.ts1) for i in range(20)]
+        req = swob.Request.blank(
+            '/sda1/1',
+            environ={'REQUEST_METHOD': 'SSYNC'},
+            body=self._reconcile_body(entries, cells=6) +
+            ':MISSING_CHECK: START\r\n:MISSING_CHECK: END\r\n'
+            ':UPDATES: START\r\n:UPDATES: END\r\n')
+        resp = req.get_response(self.controller)
+        self.assertEqual(
+            self.body_lines(resp.body),
+            [':RECONCILE: FAILED',
+             ':MISSING_CHECK: START', ':MISSING_CHECK: END',
+             ':UPDATES: START', ':UPDATES: END'])
+
+    def test_MISSING_CHECK_reconcile_retried(self):
+        # a sender whose first table was too small sends a larger one
+        entries = [('%032x' % i, self.ts1) for i in range(20)]
+        req = swob.Request.blank(
+            '/sda1/1',
+            environ={'REQUEST_METHOD': 'SSYNC'},
+            body=self._reconcile_body(entries, cells=6) +
+            self._reconcile_body(entries, cells=80) +
+            ':MISSING_CHECK: START\r\n:MISSING_CHECK: END\r\n'
+            ':UPDATES: START\r\n:UPDATES: END\r\n')
+        resp = req.get_response(self.controller)
+        lines = self.body_lines(resp.body)
+        self.assertEqual([':RECONCILE: FAILED', ':RECONCILE: START'],
+                         lines[:2])
+        self.assertEqual(
+            sorted(binascii.hexlify(ssync_sender.reconcile_key(
+                object_hash, {'ts_data': Timestamp(timestamp)}))
+                for object_hash, timestamp in entries),
+            sorted(lines[2:22]))
+        self.assertEqual(
+            [':RECONCILE: END',
+             ':MISSING_CHECK: START', ':MISSING_CHECK: END',
+             ':UPDATES: START', ':UPDATES: END'], lines[22:])
+        self.assertEqual(resp.status_int, 200)
+
+    def test_MISSING_CHECK_reconcile_invalid_table(self):
+        self.controller.logger = mock.MagicMock()
+        req = swob.Request.blank(
+            '/sda1/1',
+            environ={'REQUEST_METHOD': 'SSYNC'},
+            body=':RECONCILE: START\r\ntable junk\r\n'
+                 ':RECONCILE: END\r\n')
+        resp = req.get_response(self.controller)
+        self.assertEqual(
+            self.body_lines(resp.body),
+            [":ERROR: 0 'Invalid table length 3'"])
+        self.assertTrue(self.controller.logger.exception.called)
+
 
 @patch_policies(with_ec_default=True)
 class TestSsyncRxServer(unittest.TestCase):
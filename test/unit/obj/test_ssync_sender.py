@@ -12,6 +12,7 @@
 # implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
+import binascii
 import os
 import time
 import unittest
@@ -21,6 +22,7 @@ import mock
 import six
 
 from swift.common import exceptions, utils
+from swift.common.iblt import IBLT
 from swift.common.storage_policy import POLICIES
 from swift.common.utils import Timestamp
 from swift.obj import ssync_sender, diskfile, ssync_receiver
@@ -1341,6 +1343,171 @@ class TestSender(BaseTest):
             '11\r\n:UPDATES: START\r\n\r\n'
             'f\r\n:UPDATES: END\r\n\r\n')
 
+    def test_missing_check_pipeline_window(self):
+        self.sender.connection = FakeConnection()
+        self.sender.job = {
+            'device': 'dev',
+            'partition': '9',
+            'policy': POLICIES.legacy,
+        }
+        self.sender.suffixes = ['abc']
+        self.sender.response = FakeResponse(
+            chunk_body=(
+                ':MISSING_CHECK: START window=3\r\n'
+                ':MISSING_CHECK: END\r\n'))
+        self.sender.df_mgr.yield_hashes = lambda *args, **kwargs: iter([])
+        self.sender.missing_check()
+        self.assertEqual(3, self.sender.pipeline_window)
+
+    def _setup_reconcile(self, chunk_body, count=100):
+        self.sender.node = {'replication_ip': '1.2.3.4',
+                            'replication_port': 5678, 'device': 'sda1'}
+        self.sender.connection = FakeConnection()
+        self.sender.job = {
+            'device': 'dev',
+            'partition': '9',
+            'policy': POLICIES.legacy,
+        }
+        self.sender.suffixes = ['abc', 'def']
+        self.sender.response = FakeResponse(chunk_body=chunk_body)
+        self.daemon.ssync_reconcile_ratio = 10.0
+        entries = [('9d41d8cd98f00b204e9800998ec%05x' % i,
+                    {'ts_data': Timestamp(1380144470 + i)})
+                   for i in range(count)]
+        self.sender.df_mgr.yield_hashes = \
+            lambda *args, **kwargs: iter(entries)
+        return entries
+
+    def _get_sent_tables(self):
+        tables = []
+        for chunk in self.sender.connection.sent:
+            line = chunk.split('\r\n')[1]
+            if line == ':RECONCILE: START':
+                tables.append([])
+            elif line.startswith('table '):
+                tables[-1].append(line.split()[1])
+        return [IBLT.from_string(''.join(table)) for table in tables]
+
+    def test_reconcile(self):
+        entries = self._setup_reconcile('')
+        key = ssync_sender.reconcile_key(*entries[1])
+        self.sender.response = FakeResponse(
+            chunk_body=(
+                ':RECONCILE: START\r\n%s\r\n:RECONCILE: END\r\n' %
+                binascii.hexlify(key)))
+        with mock.patch('swift.obj.ssync_sender.RECONCILE_MIN_CELLS', 8):
+            self.assertEqual([entries[1]], self.sender.reconcile())
+        self.assertEqual(dict(entries), self.sender.available_map)
+        sent = [chunk.split('\r\n')[1] for chunk in
+                self.sender.connection.sent]
+        self.assertEqual([':RECONCILE: START', 'suffixes abc def'],
+                         sent[:2])
+        self.assertEqual(':RECONCILE: END', sent[-1])
+        # the table is sized to the suffixes being synced, not the objects
+        table, = self._get_sent_tables()
+        self.assertEqual(21, len(table))
+        others = IBLT(len(table))
+        for entry in entries[:1] + entries[2:]:
+            others.insert(ssync_sender.reconcile_key(*entry))
+        table.subtract(others)
+        self.assertEqual(([key], []), table.decode())
+
+    def test_reconcile_retried_with_larger_table(self):
+        entries = self._setup_reconcile(
+            ':RECONCILE: FAILED\r\n'
+            ':RECONCILE: START\r\n:RECONCILE: END\r\n')
+        with mock.patch('swift.obj.ssync_sender.RECONCILE_MIN_CELLS', 8):
+            self.assertEqual([], self.sender.reconcile())
+        self.assertEqual(dict(entries), self.sender.available_map)
+        self.assertEqual([21, 81], [
+            len(table) for table in self._get_sent_tables()])
+        self.assertEqual(
+            ['1.2.3.4:5678/sda1/9 could not reconcile 100 objects with 20 '
+             'cells'], self.daemon_logger.get_lines_for_level('debug'))
+
+    def test_reconcile_failed_or_small_partition(self):
+        entries = self._setup_reconcile(
+            ':RECONCILE: FAILED\r\n:RECONCILE: FAILED\r\n')
+        with mock.patch('swift.obj.ssync_sender.RECONCILE_MIN_CELLS', 8):
+            self.assertEqual(entries, self.sender.reconcile())
+        self.assertEqual([21, 81], [
+            len(table) for table in self._get_sent_tables()])
+        self.assertEqual(
+            ['1.2.3.4:5678/sda1/9 could not reconcile 100 objects with 20 '
+             'cells',
+             '1.2.3.4:5678/sda1/9 could not reconcile 100 objects with 80 '
+             'cells'], self.daemon_logger.get_lines_for_level('debug'))
+
+        # the larger table is not sent if it would be no smaller than the
+        # list
+        self.daemon_logger.clear()
+        entries = self._setup_reconcile(':RECONCILE: FAILED\r\n', count=50)
+        with mock.patch('swift.obj.ssync_sender.RECONCILE_MIN_CELLS', 8):
+            self.assertEqual(entries, self.sender.reconcile())
+        self.assertEqual([21], [
+            len(table) for table in self._get_sent_tables()])
+
+        # too few objects to be worth reconciling
+        entries = self._setup_reconcile('', count=64)
+        self.assertEqual(entries, self.sender.reconcile())
+        self.assertEqual([], self.sender.connection.sent)
+
+    def test_reconcile_unexpected_key(self):
+        self._setup_reconcile(
+            ':RECONCILE: START\r\n%s\r\n:RECONCILE: END\r\n' % ('0' * 32))
+        with mock.patch('swift.obj.ssync_sender.RECONCILE_MIN_CELLS', 8):
+            with self.assertRaises(exceptions.ReplicationException) as cm:
+                self.sender.reconcile()
+        self.assertEqual("Unexpected response: '%s'" % ('0' * 32),
+                         str(cm.exception))
+
+    def test_updates_pipelined_acks(self):
+        self.sender.node = {'replication_ip': '1.2.3.4',
+                            'replication_port': 5678, 'device': 'sda1'}
+        self.sender.job = {'partition': '9'}
+        self.sender.connection = FakeConnection()
+        self.sender.send_map = {}
+        self.sender.pipeline_window = 2
+        self.sender.unacked = {('PUT', '/a/c/o1'), ('DELETE', '/a/c/o2')}
+        self.sender.response = FakeResponse(
+            chunk_body=(
+                ':UPDATES: START\r\n'
+                ':ACK: 201 PUT /a/c/o1\r\n'
+                ':ACK: 503 DELETE /a/c/o2\r\n'
+                ':UPDATES: END\r\n'))
+        self.sender.updates()
+        self.assertEqual(set(), self.sender.unacked)
+        self.assertEqual(1, self.sender.failures)
+        self.assertEqual(
+            ['1.2.3.4:5678/sda1/9 ssync subrequest failed with 503: '
+             'DELETE /a/c/o2'],
+            self.daemon_logger.get_lines_for_level('warning'))
+
+    def test_updates_pipelined_unexpected_ack(self):
+        self.sender.connection = FakeConnection()
+        self.sender.send_map = {}
+        self.sender.pipeline_window = 2
+        self.sender.unacked = {('PUT', '/a/c/o1')}
+        self.sender.response = FakeResponse(
+            chunk_body=(
+                ':UPDATES: START\r\n'
+                ':ACK: 201 PUT /a/c/o2\r\n'
+                ':UPDATES: END\r\n'))
+        with self.assertRaises(exceptions.ReplicationException) as cm:
+            self.sender.updates()
+        self.assertEqual("Unexpected response: ':ACK: 201 PUT /a/c/o2'",
+                         str(cm.exception))
+
+        self.sender.response = FakeResponse(
+            chunk_body=(
+                ':UPDATES: START\r\n'
+                ':UPDATES: END\r\n'))
+        self.sender.response_buffer = ''
+        self.sender.response_chunk_left = 0
+        with self.assertRaises(exceptions.ReplicationException) as cm:
+            self.sender.updates()
+        self.assertEqual('1 subrequests not acknowledged', str(cm.exception))
+
     def test_updates_read_response_timeout_end(self):
         self.sender.connection = FakeConnection()
         self.sender.send_map = {}
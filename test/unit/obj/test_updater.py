@@ -33,8 +33,10 @@ from distutils.dir_util import mkpath
 from eventlet import spawn, Timeout
 
 from swift.obj import updater as object_updater
+from swift.obj.async_journal import AsyncJournal, iter_segment
 from swift.obj.diskfile import (
-    ASYNCDIR_BASE, get_async_dir, DiskFileManager, get_tmp_dir)
+    ASYNCDIR_BASE, get_async_dir, get_async_journal_dir, DiskFileManager,
+    get_tmp_dir)
 from swift.common.ring import RingData
 from swift.common import utils
 from swift.common.header_key_dict import HeaderKeyDict
@@ -463,6 +465,8 @@ class TestObjectUpdater(unittest.TestCase):
         for dev in ou.get_container_ring().devs:
             if dev is not None:
                 dev['port'] = bindsock.getsockname()[1]
+        # node dicts are cached by the ring, so refresh them
+        ou.get_container_ring()._rebuild_tier_data()
 
         ou.logger._clear()
         ou.run_once()
@@ -632,6 +636,66 @@ class TestObjectUpdater(unittest.TestCase):
             'X-Backend-Storage-Policy-Index')
         do_test(headers_out, expected)
 
+    def test_obj_put_journal_updates(self):
+        ts = (normalize_timestamp(t) for t in
+              itertools.count(int(time())))
+        policy = POLICIES.get_by_index(1)
+        conf = {
+            'devices': self.devices_dir,
+            'mount_check': 'false',
+            'swift_dir': self.testdir,
+            'recon_cache_path': self.testdir,
+            'async_journal': 'true',
+        }
+        daemon = object_updater.ObjectUpdater(conf, logger=self.logger)
+        dfmanager = DiskFileManager(conf, daemon.logger)
+        account, container = 'a', 'c'
+        # an older update of 'o' is superseded by a newer one
+        for obj in ('o', 'p', 'o'):
+            data = {'op': 'PUT', 'account': account, 'container': container,
+                    'obj': obj, 'headers': {'X-Timestamp': next(ts)}}
+            dfmanager.pickle_async_update(self.sda1, account, container, obj,
+                                          data, next(ts), policy)
+        journal_path = os.path.join(self.sda1, get_async_journal_dir(policy))
+        journal = AsyncJournal(journal_path)
+        self.assertEqual(3, journal.count_records())
+
+        request_log = []
+
+        def capture(*args, **kwargs):
+            request_log.append((args, kwargs))
+
+        # the update of 'p' reaches one container replica
+        with mocked_http_conn(201, 500, 500, 201, 201, 201,
+                              give_connect=capture):
+            daemon.run_once()
+        self.assertEqual(['/sda1/0/a/c/p'] * 3 + ['/sda1/0/a/c/o'] * 3,
+                         [args[3] for args, _kwargs in request_log])
+        self.assertEqual(daemon.logger.get_increment_counts(),
+                         {'successes': 1, 'failures': 1, 'unlinks': 2,
+                          'async_pendings': 3})
+        # the sealed segment has been compacted into the failed update
+        segments = journal.seal()
+        self.assertEqual(1, len(segments))
+        records = list(iter_segment(segments[0]))
+        self.assertEqual(1, len(records))
+        self.assertEqual(hash_path(account, container, 'p'), records[0][0])
+        self.assertEqual('p', records[0][2]['obj'])
+        self.assertEqual(1, len(records[0][2]['successes']))
+
+        # the update is only sent to the replicas that do not have it
+        daemon.logger.clear()
+        del request_log[:]
+        with mocked_http_conn(201, 201, give_connect=capture):
+            daemon.run_once()
+        self.assertEqual(2, len(request_log))
+        self.assertEqual(daemon.logger.get_increment_counts(),
+                         {'successes': 1, 'unlinks': 1})
+        self.assertEqual(0, journal.count_records())
+        self.assertEqual([], journal.seal())
+        self.assertFalse(os.path.exists(
+            os.path.join(self.sda1, get_async_dir(policy))))
+
 
 if __name__ == '__main__':
     unittest.main()
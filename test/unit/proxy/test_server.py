@@ -1246,6 +1246,42 @@ class TestProxyServerLoading(unittest.TestCase):
             self.assertEqual(policy.object_ring,
                              app.get_object_ring(int(policy)))
 
+    def test_handoff_cache_size(self):
+        conf_path = os.path.join(self.tempdir, 'proxy-server.conf')
+        conf_body = """
+        [DEFAULT]
+        swift_dir = %s
+
+        [pipeline:main]
+        pipeline = proxy-server
+
+        [app:proxy-server]
+        use = egg:swift#proxy
+        handoff_cache_size = 100
+        """ % self.tempdir
+        with open(conf_path, 'w') as f:
+            f.write(dedent(conf_body))
+        for ring_name in ['account', 'container'] + [
+                policy.ring_name for policy in POLICIES]:
+            write_fake_ring(os.path.join(self.tempdir,
+                                         ring_name + '.ring.gz'))
+        app = loadapp(conf_path)
+        # find the end of the pipeline
+        while hasattr(app, 'app'):
+            app = app.app
+        self.assertEqual(100, app.handoff_cache_size)
+        self.assertEqual(100, app.account_ring.handoff_cache_size)
+        self.assertEqual(100, app.container_ring.handoff_cache_size)
+        for policy in POLICIES:
+            self.assertEqual(100, policy.object_ring.handoff_cache_size)
+
+        # disabled by default
+        app = proxy_server.Application({}, FakeMemcache(),
+                                       container_ring=FakeRing(),
+                                       account_ring=FakeRing())
+        self.assertEqual(0, app.handoff_cache_size)
+        self.assertEqual(0, app.account_ring.handoff_cache_size)
+
     def test_missing_rings(self):
         conf_path = os.path.join(self.tempdir, 'proxy-server.conf')
         conf_body = """
@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+# Copyright (c) 2010-2012 OpenStack Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Microbenchmark of the encoding and decoding of object metadata in each of
+the formats of ``metadata_format``, for metadata with a growing number of
+user metadata items.
+
+    python tools/metadata_benchmark.py [--number N] [--repeat R]
+"""
+
+from __future__ import print_function
+
+import optparse
+import timeit
+
+from swift.common.utils import Timestamp
+from swift.obj.diskfile import METADATA_FORMATS, deserialize_metadata, \
+    serialize_metadata
+
+
+def make_metadata(user_items):
+    """
+    Make the metadata of a typical object, with the given number of user
+    metadata items.
+    """
+    metadata = {
+        'name': '/AUTH_test/container/some/pseudo/dir/object.jpg',
+        'X-Timestamp': Timestamp.now().internal,
+        'Content-Type': 'image/jpeg',
+        'ETag': 'd41d8cd98f00b204e9800998ecf8427e',
+        'Content-Length': '123456',
+        'X-Object-Sysmeta-Container-Update-Override-Etag':
+            'd41d8cd98f00b204e9800998ecf8427e',
+    }
+    for i in range(user_items):
+        metadata['X-Object-Meta-Key-%d' % i] = 'value of item %d' % i
+    return metadata
+
+
+def bench(func, number, repeat):
+    """
+    :returns: the best time of one call of func, in microseconds
+    """
+    return min(timeit.repeat(func, number=number, repeat=repeat)) * \
+        1e6 / number
+
+
+def main():
+    parser = optparse.OptionParser(usage=__doc__.strip())
+    parser.add_option('--number', type='int', default=10000,
+                      help='calls per timing run (default 10000)')
+    parser.add_option('--repeat', type='int', default=5,
+                      help='timing runs, the best is reported (default 5)')
+    options, _args = parser.parse_args()
+
+    print('%6s %8s %6s %12s %12s' % (
+        'items', 'format', 'bytes', 'encode (us)', 'decode (us)'))
+    for user_items in (0, 10, 90):
+        metadata = make_metadata(user_items)
+        for metadata_format in METADATA_FORMATS:
+            metastr = serialize_metadata(metadata, metadata_format)
+            encode = bench(
+                lambda: serialize_metadata(metadata, metadata_format),
+                options.number, options.repeat)
+            decode = bench(lambda: deserialize_metadata(metastr),
+                           options.number, options.repeat)
+            print('%6d %8s %6d %12.2f %12.2f' % (
+                len(metadata), metadata_format, len(metastr), encode, decode))
+
+
+if __name__ == '__main__':
+    main()